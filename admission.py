@@ -0,0 +1,225 @@
+"""Admission control in front of the database.
+
+Every request that touches MySQL passes two checks before its handler runs:
+
+1. Rate limit - a token bucket per (client, route class). Write routes
+   (booking/itinerary creation) and report routes get their own, smaller
+   budgets so a burst of either cannot starve normal browsing. An empty
+   bucket answers 429 with Retry-After set to when the next token is due.
+2. Concurrency - a global semaphore caps how many requests do DB work at
+   once (by default the size of one connection pool). Requests beyond the
+   cap wait in a bounded queue for up to ADMISSION_QUEUE_TIMEOUT seconds;
+   a full queue or an expired wait answers 503 with Retry-After.
+
+Overload therefore turns into fast, explicit rejections instead of
+connection storms against max_connections.
+
+Configuration (environment variables):
+    ADMISSION_MAX_CONCURRENT   requests doing DB work at once (default DB_POOL_SIZE or 10)
+    ADMISSION_QUEUE_SIZE       requests allowed to wait for a slot (default 4x the cap)
+    ADMISSION_QUEUE_TIMEOUT    seconds a queued request waits (default 2)
+    RATE_LIMIT_DEFAULT         rate/burst per client, e.g. "20/40" (tokens per second / bucket size)
+    RATE_LIMIT_WRITE           same for write routes (default "1/5")
+    RATE_LIMIT_REPORT          same for report routes (default "2/10")
+    ADMISSION_ENABLED          set to 0 to admit everything
+"""
+import math
+import os
+import threading
+import time
+
+DEFAULT_CLASS = 'default'
+WRITE_CLASS = 'write'
+REPORT_CLASS = 'report'
+
+# Idle buckets are dropped once the table grows past this many clients
+MAX_TRACKED_BUCKETS = 10000
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def _env_rate(name, default):
+    """'rate/burst' -> (tokens per second, bucket size)"""
+    rate, _, burst = os.environ.get(name, default).partition('/')
+    return float(rate), float(burst or rate)
+
+
+class Rejected(Exception):
+    """A request turned away; carries the HTTP status and Retry-After"""
+
+    def __init__(self, status, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe on its own"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Consume one token; returns 0 on success, else seconds until one is due"""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """Token buckets per (client, route class)"""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def check(self, client, route_class):
+        rate, burst = self.limits[route_class]
+        now = time.monotonic()
+        with self._lock:
+            key = (client, route_class)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= MAX_TRACKED_BUCKETS:
+                    self._evict_idle(now)
+                bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+            wait = bucket.take(now)
+        if wait:
+            raise Rejected(429, 'Too many requests, slow down', wait)
+
+    def _evict_idle(self, now):
+        # A full bucket is indistinguishable from a new one, so dropping it is free
+        for key in [key for key, bucket in self._buckets.items() if bucket.is_full(now)]:
+            del self._buckets[key]
+
+    def tracked(self):
+        return len(self._buckets)
+
+
+class ConcurrencyGate:
+    """Semaphore with a bounded number of waiters"""
+
+    def __init__(self, slots, queue_size, timeout):
+        self.slots = slots
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self):
+        if self._semaphore.acquire(blocking=False):
+            with self._lock:
+                self.active += 1
+            return
+        with self._lock:
+            if self.waiting >= self.queue_size:
+                raise Rejected(503, 'Server is busy, please retry', self.timeout)
+            self.waiting += 1
+        try:
+            acquired = self._semaphore.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not acquired:
+            raise Rejected(503, 'Server is busy, please retry', self.timeout)
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._semaphore.release()
+
+
+class AdmissionController:
+    """Rate limiting plus bounded DB concurrency for incoming requests"""
+
+    def __init__(self, max_concurrent, queue_size, queue_timeout, limits, enabled=True):
+        self.enabled = enabled
+        self.limiter = RateLimiter(limits)
+        self.gate = ConcurrencyGate(max_concurrent, queue_size, queue_timeout)
+        self._lock = threading.Lock()
+        self.counters = {'admitted': 0, 'rateLimited': 0, 'shed': 0}
+
+    @classmethod
+    def from_env(cls):
+        max_concurrent = _env_int('ADMISSION_MAX_CONCURRENT', _env_int('DB_POOL_SIZE', 10))
+        return cls(
+            max_concurrent=max_concurrent,
+            queue_size=_env_int('ADMISSION_QUEUE_SIZE', max_concurrent * 4),
+            queue_timeout=_env_float('ADMISSION_QUEUE_TIMEOUT', 2.0),
+            limits={
+                DEFAULT_CLASS: _env_rate('RATE_LIMIT_DEFAULT', '20/40'),
+                WRITE_CLASS: _env_rate('RATE_LIMIT_WRITE', '1/5'),
+                REPORT_CLASS: _env_rate('RATE_LIMIT_REPORT', '2/10'),
+            },
+            enabled=os.environ.get('ADMISSION_ENABLED', '1') != '0',
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def admit(self, client, route_class):
+        """Rate-limit, then take a DB slot; raises Rejected
+        Returns True when a slot was taken and release() must follow.
+        """
+        if not self.enabled:
+            return False
+        try:
+            self.limiter.check(client, route_class)
+        except Rejected:
+            self._count('rateLimited')
+            raise
+        try:
+            self.gate.acquire()
+        except Rejected:
+            self._count('shed')
+            raise
+        self._count('admitted')
+        return True
+
+    def release(self):
+        self.gate.release()
+
+    def status(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(
+            counters,
+            enabled=self.enabled,
+            maxConcurrent=self.gate.slots,
+            queueSize=self.gate.queue_size,
+            queueTimeoutSeconds=self.gate.timeout,
+            active=self.gate.active,
+            waiting=self.gate.waiting,
+            trackedClients=self.limiter.tracked(),
+            limits={name: {'rate': rate, 'burst': burst} for name, (rate, burst) in self.limiter.limits.items()},
+        )
+
+
+controller = AdmissionController.from_env()
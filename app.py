@@ -1,8 +1,36 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory, has_request_context, g, Response
 from flask_cors import CORS
 import mysql.connector
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+import hashlib
 import os
+import threading
+import time
+
+import activity_scheduler
+import admission
+import asset_pipeline
+import catalog_snapshots
+import catalog_sync
+import change_feed
+import circuit_breaker
+import delta_sync
+import entity_cache
+import geo_index
+import hotel_search
+import image_pipeline
+import occupancy
+import pricing
+import projection
+import queries
+import recommender
+import revenue_rollups
+import rowset
+import shards
+import transport_graph
+import trip_optimizer
+import waitlist
+from db_router import DatabaseRouter, release_connection
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here_change_this'  # Change this in production
@@ -11,27 +39,483 @@ CORS(app)
 # ============================================
 # STATIC FILES - IMAGES
 # ============================================
+# Derivatives are built offline by `python image_pipeline.py`; if they have
+# not been built yet, originals are served exactly as before.
+image_catalog = image_pipeline.ImageCatalog()
+app.jinja_env.globals['image_url'] = image_catalog.url
+
+def client_accepts_webp():
+    """True only when the client names image/webp explicitly (not via */*)"""
+    return any(mimetype == 'image/webp' and quality > 0
+               for mimetype, quality in request.accept_mimetypes)
+
 @app.route('/images/<path:filename>')
 def serve_image(filename):
-    """Serve images from the images folder"""
-    return send_from_directory('images', filename)
+    """Serve images from the images folder
+    - images/derived/<name>.<hash>.<ext>: fingerprinted, cached immutably
+    - images/<original>: best derivative for the Accept header (?w= picks width)
+    """
+    derived_prefix = image_pipeline.DERIVED_DIRNAME + '/'
+    if filename.startswith(derived_prefix):
+        variant = image_catalog.derivative(filename[len(derived_prefix):])
+        if not variant:
+            return send_from_directory('images', filename)
+        response = send_from_directory(image_pipeline.DERIVED_DIR, variant['file'],
+                                       mimetype=variant['mimetype'],
+                                       max_age=image_pipeline.IMMUTABLE_MAX_AGE,
+                                       etag=False, conditional=False)
+        response.set_etag(variant['hash'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response.make_conditional(request)
+
+    variant = image_catalog.select(filename, client_accepts_webp(),
+                                   request.args.get('w', type=int))
+    if not variant:
+        return send_from_directory('images', filename)
+
+    response = send_from_directory(image_pipeline.DERIVED_DIR, variant['file'],
+                                   mimetype=variant['mimetype'],
+                                   max_age=image_pipeline.NEGOTIATED_MAX_AGE,
+                                   etag=False, conditional=False)
+    response.set_etag(variant['hash'])
+    response.cache_control.public = True
+    response.vary.add('Accept')
+    return response.make_conditional(request)
+
+# ============================================
+# STATIC FILES - BUILT ASSETS
+# ============================================
+# Bundles are produced by `python asset_pipeline.py` from the inline blocks of
+# templates/index.html; names carry a content hash so they never go stale.
+asset_manifest = asset_pipeline.AssetManifest()
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted bundle, precompressed when the client allows"""
+    entry = asset_manifest.get(filename)
+    if not entry:
+        return jsonify({'success': False, 'message': 'Asset not found'}), 404
+
+    encoding = asset_pipeline.choose_encoding(request.accept_encodings, entry['encodings'])
+    path = filename
+    if encoding:
+        path += dict(asset_pipeline.ENCODINGS)[encoding]
+
+    response = send_from_directory(asset_pipeline.DIST_DIR, path,
+                                   mimetype=entry['mimetype'],
+                                   max_age=asset_pipeline.ASSET_MAX_AGE,
+                                   etag=False, conditional=False)
+    if encoding:
+        response.content_encoding = encoding
+    response.set_etag(f"{entry['hash']}-{encoding or 'identity'}")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
 
 # ============================================
 # DATABASE CONNECTION
 # ============================================
-def get_db_connection():
-    """Create and return a database connection"""
-    try:
-        connection = mysql.connector.connect(
-            host='localhost',           # Change if needed
-            user='root',                # Your MySQL username
-            password='Sneha@123',   # Your MySQL password
-            database='travelmanagementsystem'
-        )
-        return connection
+DB_CONFIG = {
+    'host': 'localhost',                # Change if needed
+    'user': 'root',                     # Your MySQL username
+    'password': 'Sneha@123',            # Your MySQL password
+    'database': 'travelmanagementsystem'
+}
+
+# Primary + optional read replicas (DB_REPLICAS, DB_MAX_REPLICA_LAG, ...;
+# see db_router.py). With no replicas configured everything uses DB_CONFIG.
+db_router = DatabaseRouter.from_env(DB_CONFIG)
+
+# Shard 0 is db_router and holds the catalog; DB_SHARDS adds user shards
+# (see shards.py). Without DB_SHARDS there is one shard and nothing changes.
+shard_map = shards.ShardMap.from_env(db_router)
+
+# Clients that wrote recently read from the primary for this long, so they
+# always see their own writes even through the most-lagged usable replica
+READ_YOUR_WRITES_SECONDS = db_router.max_lag + 1
+
+# POST routes that only read and therefore don't pin the client to primary
+READ_ONLY_POST_ENDPOINTS = {'login', 'calculate_booking_cost', 'optimize_trip'}
+
+def must_read_primary():
+    """True when this request has to see the client's own recent writes"""
+    if not has_request_context():
+        return True
+    if request.headers.get('X-Read-Your-Writes') == '1':
+        return True
+    return session.get('primary_until', 0) > time.time()
+
+def get_db_connection(readonly=False, shard=None):
+    """Create and return a database connection
+    readonly=True lets the router serve the request from a replica.
+    shard selects a user shard (default: shard 0, which has the catalog).
+    Raises DatabaseUnavailable (answered with a 503) when the connection
+    fails or the circuit breaker is open.
+    """
+    router = (shard or shard_map.catalog).router
+    conn = connect_router(router, readonly and not must_read_primary())
+    if has_request_context():
+        # Closed at teardown if the route bailed out before closing it
+        g.setdefault('db_connections', []).append(conn)
+    return conn
+
+def connect_router(router, readonly):
+    """get_db_connection() once the replica decision is made"""
+    circuit_breaker.breaker.before_call()
+    started = time.monotonic()
+    try:
+        conn = router.connection(readonly=readonly)
     except mysql.connector.Error as err:
+        circuit_breaker.breaker.record(time.monotonic() - started, ok=False)
         print(f"Database connection error: {err}")
+        raise circuit_breaker.DatabaseUnavailable('Database connection failed, please retry shortly') from err
+    circuit_breaker.breaker.record(time.monotonic() - started)
+    return conn
+
+# Statements failing with "server has gone away" and similar count against the breaker
+queries.error_listeners.append(circuit_breaker.breaker.record_error)
+
+@app.errorhandler(circuit_breaker.DatabaseUnavailable)
+def database_unavailable(err):
+    """Structured 503 instead of a traceback while the database is down"""
+    response = jsonify({'success': False, 'message': str(err), 'retryAfter': err.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(err.retry_after)
+    return response
+
+def snapshot_response(name, err, statement):
+    """Degraded mode: the last good copy of a catalog listing, else a 503"""
+    rows, saved_at = catalog_snapshots.load(name)
+    if rows is None:
+        return database_unavailable(err)
+    fields, compact = requested_shape(statement)
+    rows = projection.project(rows, fields or queries.projection(statement).columns)
+    return jsonify({
+        'success': True,
+        name: shaped(rows, statement, fields, compact),
+        'degraded': True,
+        'snapshotAt': datetime.fromtimestamp(saved_at).isoformat(timespec='seconds'),
+    })
+
+def cache_fill_stamp():
+    """Start of a read about to fill entity_cache
+    A replica can answer up to max_lag behind, so its rows count as that old.
+    """
+    return entity_cache.cache.clock() - (db_router.max_lag if db_router.replicas else 0)
+
+# ============================================
+# SPARSE RESPONSES (?fields= / ?format=compact)
+# ============================================
+
+def requested_shape(statement):
+    """(fields, compact) asked for by the request for a PROJECTABLE statement"""
+    return (projection.parse_fields(request.args.get('fields'), statement),
+            projection.parse_format(request.args.get('format')))
+
+def shaped(rows, statement, fields, compact):
+    """Rows as objects, or as arrays under one header row"""
+    return projection.encode(rows, fields or queries.projection(statement).columns, compact)
+
+def rowset_response(envelope, key, rows, compact):
+    """envelope plus a RowSet under key, streamed as JSON or, if the client
+    prefers it, MessagePack (see rowset.py)
+    """
+    mimetype, body = rowset.render(envelope, key, rows, compact, request.accept_mimetypes)
+    response = Response(body, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+@app.errorhandler(projection.ProjectionError)
+def invalid_projection(err):
+    return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.after_request
+def pin_writer_to_primary(response):
+    """After a successful write, route this client's reads to the primary"""
+    if (request.method in ('POST', 'PUT', 'DELETE')
+            and request.endpoint not in READ_ONLY_POST_ENDPOINTS
+            and response.status_code < 400):
+        session['primary_until'] = time.time() + READ_YOUR_WRITES_SECONDS
+    return response
+
+# ============================================
+# SHARDING (DB_SHARDS, see shards.py)
+# ============================================
+
+@app.errorhandler(shards.ShardError)
+def unknown_shard(err):
+    return jsonify({'success': False, 'message': str(err)}), 404
+
+def fan_out(fn, readonly=True, return_errors=False):
+    """fn(shard, conn) on every shard in parallel; results in shard order
+    (with return_errors, a failing shard's exception in its place)
+    """
+    # Decided here: the worker threads have no request or session to look at
+    readonly = readonly and not must_read_primary()
+    return shard_map.fan_out(fn, lambda shard: connect_router(shard.router, readonly), return_errors=return_errors)
+
+def merged_report(statement, fields, merge):
+    """Rows of a cross-user PROJECTABLE statement as a rowset.RowSet
+    Unsharded this is one projected query whose rows stay tuples. Sharded,
+    every shard returns full rows as dicts (the merges need their key
+    columns), merge(parts) combines them and the projection is applied
+    afterwards.
+    """
+    if not shard_map.sharded:
+        conn = get_db_connection(readonly=True)
+        rows = queries.fetch_rowset(conn, statement, fields)
+        conn.close()
+        return rows
+    parts = fan_out(lambda _shard, conn: queries.fetch_all(conn, statement))
+    return rowset.RowSet.from_dicts(merge(parts), fields or queries.projection(statement).columns)
+
+def popularity_status(itineraries):
+    """Same thresholds as the IsDestinationPopular function"""
+    if itineraries >= 3:
+        return 'Popular'
+    if itineraries >= 1:
+        return 'Moderate'
+    return 'Not Popular'
+
+# InventoryHolds older than this are settled by reconcile_inventory
+INVENTORY_HOLD_MINUTES = 10
+
+# Hotel-nights per UPDATE, and InventoryRelease rows per batch, of settle_inventory_releases
+INVENTORY_RELEASE_CHUNK = 500
+
+# Days shard 0 remembers an applied InventoryRelease (InventoryReleased)
+INVENTORY_RELEASED_DAYS = 7
+
+def hold_hotel_nights(user_id, stay):
+    """ReserveHotelNights on the catalog shard for a booking on another shard
+    The reservation and an InventoryHold row commit together; end_hold drops
+    the hold once the booking has committed or been given up. Holds left by
+    a crash or a failed end_hold are settled by reconcile_inventory. Returns
+    the HoldID.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.callproc('ReserveHotelNights', list(stay))
+        result = queries.execute(conn, 'inventory_hold_insert', (user_id,) + tuple(stay))
+        conn.commit()
+        return result.lastrowid
+    except mysql.connector.Error:
+        # ReserveHotelNights signals after its UPDATE; undo the partial claim
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+def drop_hold(conn, hold_id, stay, release):
+    """Delete an InventoryHold and, if release and the hold was still there,
+    give its nights back, in the caller's transaction. Deleting first makes
+    the release happen once when end_hold and reconcile_inventory race.
+    """
+    if queries.execute(conn, 'inventory_hold_delete', (hold_id,)).rowcount and release:
+        cursor = conn.cursor()
+        try:
+            cursor.callproc('ReleaseHotelNights', list(stay))
+        finally:
+            cursor.close()
+
+def end_hold(hold_id, stay, release):
+    """Drop an InventoryHold, giving its nights back when no booking came of it
+    Never raises: after a committed booking a shard-0 failure must not turn
+    it into an error; the hold is then settled by reconcile_inventory.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        drop_hold(conn, hold_id, stay, release)
+        conn.commit()
+    except (mysql.connector.Error, circuit_breaker.DatabaseUnavailable) as err:
+        print(f"InventoryHold {hold_id} left for reconciliation: {err}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def release_nights(cursor, stays):
+    """Give back the nights of many stays in HotelNightInventory, one UPDATE
+    per chunk of hotel-nights, in the caller's transaction (shard 0)
+    """
+    released = {}
+    for hotel_id, check_in, check_out in stays:
+        night = check_in
+        while night < check_out:
+            released[(hotel_id, night)] = released.get((hotel_id, night), 0) + 1
+            night += timedelta(days=1)
+    rows = [(hotel_id, night, count) for (hotel_id, night), count in sorted(released.items())]
+    for start in range(0, len(rows), INVENTORY_RELEASE_CHUNK):
+        chunk = rows[start:start + INVENTORY_RELEASE_CHUNK]
+        released_nights = ' UNION ALL '.join(
+            ['SELECT %s AS HotelID, %s AS Night, %s AS Released'] + ['SELECT %s, %s, %s'] * (len(chunk) - 1)
+        )
+        cursor.execute(
+            f"""
+            UPDATE HotelNightInventory i
+            JOIN ({released_nights}) r ON i.HotelID = r.HotelID AND i.Night = r.Night
+            SET i.Booked = GREATEST(i.Booked - r.Released, 0)
+            """,
+            [value for row in chunk for value in row]
+        )
+
+def settle_inventory_releases(shard):
+    """Give back on shard 0 the nights owed by cancellations on another shard
+    The cancelling transaction records them in that shard's InventoryRelease
+    (AdjustInventoryOnStatusChange / ReleaseInventoryOnDelete). Each release
+    is applied on shard 0 together with its InventoryReleased mark, so it is
+    applied once however often this runs, and then deleted from the shard.
+    Returns the number of releases applied.
+    """
+    applied = 0
+    conn = get_db_connection(shard=shard)
+    try:
+        while True:
+            pending = queries.fetch_all(conn, 'inventory_releases_pending', (INVENTORY_RELEASE_CHUNK,))
+            if not pending:
+                return applied
+            catalog = get_db_connection()
+            cursor = catalog.cursor()
+            try:
+                owed = [
+                    (release['HotelID'], release['CheckInDate'], release['CheckOutDate'])
+                    for release in pending
+                    if queries.execute(catalog, 'inventory_released_mark', (shard.index, release['ReleaseID'])).rowcount
+                ]
+                release_nights(cursor, owed)
+                catalog.commit()
+            except mysql.connector.Error:
+                catalog.rollback()
+                raise
+            finally:
+                cursor.close()
+                catalog.close()
+            applied += len(owed)
+            release_ids = [release['ReleaseID'] for release in pending]
+            cursor = conn.cursor()
+            cursor.execute(
+                f"DELETE FROM InventoryRelease WHERE ReleaseID IN ({', '.join(['%s'] * len(release_ids))})",
+                release_ids
+            )
+            cursor.close()
+            conn.commit()
+            if len(pending) < INVENTORY_RELEASE_CHUNK:
+                return applied
+    finally:
+        conn.close()
+
+def settle_after_cancel(shards_touched):
+    """settle_inventory_releases right after a cancellation; the cancellation
+    has committed, so a failure here is left to reconcile_inventory
+    """
+    for shard in shards_touched:
+        if shard.is_catalog:
+            continue
+        try:
+            settle_inventory_releases(shard)
+        except (mysql.connector.Error, circuit_breaker.DatabaseUnavailable) as err:
+            print(f"Inventory releases of {shard.name} left for reconciliation: {err}")
+
+def reconcile_inventory():
+    """Settle shard-0 inventory left behind by the two-shard booking paths
+    (run by the maintenance thread):
+    - InventoryHolds older than INVENTORY_HOLD_MINUTES: their nights are
+      released when the booking never reached the user's shard, otherwise
+      the hold is just dropped (cancelling that booking gives them back)
+    - InventoryRelease rows still owed by cancellations on the other shards
+    """
+    if not shard_map.sharded:
+        return
+    conn = get_db_connection()
+    holds = released = 0
+    try:
+        for hold in queries.fetch_all(conn, 'inventory_holds_stale', (INVENTORY_HOLD_MINUTES,)):
+            stay = (hold['HotelID'], hold['CheckInDate'], hold['CheckOutDate'])
+            booking_conn = get_db_connection(shard=shard_map.for_user(hold['UserID']))
+            try:
+                booked = queries.fetch_value(booking_conn, 'booking_for_stay', (hold['UserID'],) + stay)
+            finally:
+                booking_conn.close()
+            drop_hold(conn, hold['HoldID'], stay, release=not booked)
+            conn.commit()
+            holds += 1
+            released += not booked
+        queries.execute(conn, 'inventory_released_purge', (INVENTORY_RELEASED_DAYS,))
+        conn.commit()
+    finally:
+        conn.close()
+    settled = sum(settle_inventory_releases(shard) for shard in shard_map.shards if not shard.is_catalog)
+    if holds or settled:
+        print(f"Inventory reconciliation: {holds} stale holds ({released} released), {settled} cancellations settled.")
+
+def replicate_catalog():
+    """Copy catalog writes made on shard 0 to the other shards
+    Runs in the background (shard_map.request_copy) so the committed write
+    is reported as such; failed copies are retried, see /admin/shards.
+    """
+    shard_map.request_copy(lambda shard: get_db_connection(shard=shard))
+
+# ============================================
+# ADMISSION CONTROL
+# ============================================
+# Per-client rate limits and a global cap on concurrent DB work, see
+# admission.py (ADMISSION_*, RATE_LIMIT_* environment variables).
+
+# Endpoints that never touch MySQL and are not admission controlled
+ADMISSION_EXEMPT_ENDPOINTS = {
+    'static', 'serve_image', 'serve_asset', 'index',
+    'get_query_stats', 'reset_query_stats', 'get_db_routing_status',
+    'get_transport_graph_status', 'get_recommender_status', 'get_admission_status',
+    'get_db_breaker_status', 'get_change_feed_status', 'stream_user_events',
+    'get_shard_status', 'get_entity_cache_status', 'get_geo_index_status',
+    'get_waitlist_status', 'get_pricing_status',
+}
+
+# Write routes with their own, smaller per-client budget
+RATE_LIMITED_WRITE_ENDPOINTS = {'create_booking', 'create_itinerary'}
+
+def admission_class():
+    """Rate limit bucket a request is charged to"""
+    if request.endpoint in RATE_LIMITED_WRITE_ENDPOINTS:
+        return admission.WRITE_CLASS
+    if request.path.startswith('/reports/'):
+        return admission.REPORT_CLASS
+    return admission.DEFAULT_CLASS
+
+@app.before_request
+def admit_request():
+    """Reject with 429/503 + Retry-After instead of piling onto MySQL"""
+    if (request.method == 'OPTIONS' or request.endpoint is None
+            or request.endpoint in ADMISSION_EXEMPT_ENDPOINTS):
         return None
+    try:
+        g.db_slot = admission.controller.admit(request.remote_addr, admission_class())
+    except admission.Rejected as err:
+        response = jsonify({'success': False, 'message': str(err)})
+        response.status_code = err.status
+        response.headers['Retry-After'] = str(err.retry_after)
+        return response
+    return None
+
+@app.teardown_request
+def release_db_slot(_error):
+    if g.pop('db_slot', False):
+        admission.controller.release()
+
+@app.teardown_request
+def close_db_connections(_error):
+    """Give back connections a route left open (an exception before its
+    close()); pooled connections are not returned by garbage collection
+    """
+    for conn in g.pop('db_connections', ()):
+        try:
+            release_connection(conn)
+        except mysql.connector.Error as err:
+            print(f"Error closing connection: {err}")
 
 # ============================================
 # DATABASE INITIALIZATION - TRIGGERS, FUNCTIONS, PROCEDURES
@@ -42,25 +526,230 @@ def get_db_connection():
 # TRIGGERS (Execute automatically on database events):
 # 1. UpdateUserBookingCount_INSERT - Updates User.TotalBookings when booking is created
 
-# 2. PreventOverbooking - Prevents booking if hotel is already booked for those dates
+# 2. PreventOverbooking - Claims one room per night in HotelNightInventory, fails if any night is full
 # 3. AuditBookingStatusChange - Logs status changes to BookingAudit table (if created)
+#    (skipped while BulkCancelBookings runs, it writes its audit rows in one statement)
+# 4. AdjustInventoryOnStatusChange - Releases/claims room-nights when a booking is cancelled/confirmed
+# 5. ReleaseInventoryOnDelete - Releases room-nights of a deleted confirmed booking
+#    (on user shards other than 0, 2 stands down and 4 and 5 record InventoryRelease
+#    rows instead, see hold_hotel_nights and settle_inventory_releases)
+# 6. SyncInventoryCapacity - Applies Hotel.AvailableRooms changes to future nights
+# 7. HotelVersion_* / IncludesVersion_* / HotelRateVersion_* / OffersVersion_* - Bump TableVersion
+#    for the in-memory caches
+# 8. LogTransportChange_* / LogAvailabilityTransportChange_* / LogDestinationTransportChange_DELETE
+#    - Record touched TransportIDs in TransportChange for the in-memory route graph
+# 8b. LogHotelGeoChange_* / LogDestinationGeoChange_* - Record hotels/destinations whose
+#     indexed columns change in GeoChange for the nearby-hotels index
+# 9. RevenueRollup_Booking* / RevenueRollup_Payment* - Keep RevenueDaily/RevenueMonthly current
+# 10. SyncPaymentOwner / SyncTombstone_* / SyncTouchItinerary_* - Payment owner, deletion
+#     tombstones and itinerary touches for /sync/user
 #
 # FUNCTIONS (Called via SQL queries):
-# 1. CalculateBookingCost(hotelId, checkIn, checkOut) - Used in /booking/calculate-cost
+# 1. CalculateBookingCost(hotelId, checkIn, checkOut) - Used in /booking/calculate-cost and
+#    CreateNewBooking; HotelRate nightly rates minus the best standing offer (pricing.py)
 # 2. GetUserTotalSpending(userId) - Used in /reports/user-spending
 # 3. IsDestinationPopular(destId) - Used in /destination/popularity and /reports/popular-destinations
 #
 # PROCEDURES (Called via cursor.callproc):
 # 1. CreateNewBooking - Used in /booking/create (triggers fire automatically)
 # 2. CancelBooking - Used in /booking/cancel (triggers fire automatically)
+# 2b. BulkCancelBookings - Used in /bookings/cancel-bulk (one UPDATE + one audit INSERT)
 # 3. GetBookingDetails - Used in /booking/details
 # 4. GetDestinationItineraries - Used in /destination/itineraries
+# 5. ReserveHotelNights / ReleaseHotelNights - Per-night inventory, called by the booking triggers
+# 6. AddRevenueRollup - Applies a delta to the revenue rollups, called by the rollup triggers
 #
-def initialize_database_objects():
+def table_exists(cursor, schema, table):
+    """Check INFORMATION_SCHEMA for a table"""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = %s
+          AND TABLE_NAME = %s
+        """,
+        (schema, table)
+    )
+    return cursor.fetchone()[0] > 0
+
+def column_exists(cursor, schema, table, column):
+    """Check INFORMATION_SCHEMA for a column"""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = %s
+          AND TABLE_NAME = %s
+          AND COLUMN_NAME = %s
+        """,
+        (schema, table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+def index_exists(cursor, schema, table, index):
+    """Check INFORMATION_SCHEMA for a secondary index"""
+    cursor.execute(
+        """
+        SELECT COUNT(*)
+        FROM INFORMATION_SCHEMA.STATISTICS
+        WHERE TABLE_SCHEMA = %s
+          AND TABLE_NAME = %s
+          AND INDEX_NAME = %s
+        """,
+        (schema, table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+# Tables whose in-memory caches (search facets, ...) are invalidated through
+# TableVersion; each gets <Table>Version_INSERT/UPDATE/DELETE triggers
+VERSIONED_TABLES = ['Hotel', 'Includes', 'HotelRate', 'Offers']
+
+# Tables that used to be versioned; their triggers are dropped on startup.
+# Booking's serialized every booking on one TableVersion row (occupancy
+# windows expire on a TTL instead)
+UNVERSIONED_TABLES = ['Booking']
+
+# Tables whose rows carry an UpdatedAt change stamp for /sync/user
+SYNC_TABLES = ['Booking', 'Itinerary', 'Includes', 'PaymentTransaction']
+
+# Tables placed with Latitude/Longitude for the nearby-hotels index
+GEO_TABLES = ['Hotel', 'Destination']
+
+# Where the sample data's cities are; applied once, when the columns are added
+SAMPLE_CITY_COORDINATES = {
+    'Bengaluru': (12.971599, 77.594566),
+    'Mumbai': (19.076090, 72.877426),
+    'New Delhi': (28.613939, 77.209023),
+    'Hyderabad': (17.385044, 78.486671),
+    'Chennai': (13.082680, 80.270721),
+    'Agra': (27.175015, 78.042155),
+    'Goa': (15.299326, 74.123996),
+    'Kochi': (9.931233, 76.267304),
+    'Shimla': (31.104815, 77.173403),
+    'Mysore': (12.295810, 76.639381),
+}
+
+# Standing offers made from the sample data's offer texts when Offers gets its
+# discount columns: (Description LIKE, DiscountPercent, MinNights,
+# MinAdvanceDays, WeekendOnly)
+SAMPLE_OFFER_RULES = [
+    ('Early bird discount%', 20, 0, 30, False),
+    ('Weekend getaway%', 15, 0, 0, True),
+]
+
+# (table, index name, columns) created if missing
+SECONDARY_INDEXES = [
+    # Hotel search: equality on Location, then range/sort column; HotelID is
+    # the keyset tie-breaker
+    ('Hotel', 'idx_hotel_location_price', 'Location, PricePerNight, HotelID'),
+    ('Hotel', 'idx_hotel_location_rating', 'Location, Rating, HotelID'),
+    ('Hotel', 'idx_hotel_price', 'PricePerNight, HotelID'),
+    ('Hotel', 'idx_hotel_rating', 'Rating, HotelID'),
+    # Occupancy: confirmed stays overlapping a window, covered by the index
+    ('Booking', 'idx_booking_status_dates', 'BookingStatus, CheckInDate, CheckOutDate, HotelID, TotalPrice'),
+    # Delta sync: a user's rows changed after a token
+    ('Booking', 'idx_booking_user_updated', 'UserID, UpdatedAt'),
+    ('Itinerary', 'idx_itinerary_user_updated', 'UserID, UpdatedAt'),
+    ('PaymentTransaction', 'idx_payment_user_updated', 'UserID, UpdatedAt'),
+]
+
+def version_trigger_statements(table):
+    """DROP/CREATE statements for the triggers that bump a table's version"""
+    drops, creates = [], []
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        name = f"{table}Version_{event}"
+        drops.append(f"DROP TRIGGER IF EXISTS {name}")
+        creates.append(f"""
+            CREATE TRIGGER {name}
+            AFTER {event} ON {table}
+            FOR EACH ROW
+            INSERT INTO TableVersion (TableName, Version) VALUES ('{table}', 1)
+            ON DUPLICATE KEY UPDATE Version = Version + 1
+            """)
+    return drops, creates
+
+def backfill_hotel_inventory(cursor):
+    """Load HotelNightInventory from existing confirmed bookings (first run only)"""
+    cursor.execute(
+        """
+        SELECT b.HotelID, b.CheckInDate, b.CheckOutDate, h.AvailableRooms
+        FROM Booking b
+        JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE b.BookingStatus = 'Confirmed'
+        """
+    )
+    booked = {}
+    rooms = {}
+    for hotel_id, check_in, check_out, available_rooms in cursor.fetchall():
+        rooms[hotel_id] = available_rooms or 1
+        night = check_in
+        while night < check_out:
+            booked[(hotel_id, night)] = booked.get((hotel_id, night), 0) + 1
+            night += timedelta(days=1)
+
+    rows = [
+        (hotel_id, night, max(rooms[hotel_id], count), count)
+        for (hotel_id, night), count in booked.items()
+    ]
+    if rows:
+        cursor.executemany(
+            "INSERT INTO HotelNightInventory (HotelID, Night, Capacity, Booked) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+    print(f"HotelNightInventory backfilled with {len(rows)} hotel-nights.")
+
+def backfill_revenue_rollups(cursor):
+    """Fill RevenueDaily/RevenueMonthly from existing bookings and payments"""
+    cursor.execute(
+        """
+        INSERT INTO RevenueDaily (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+        SELECT
+            DATE(BookingDate),
+            COALESCE(HotelID, 0),
+            COUNT(*),
+            SUM(BookingStatus = 'Confirmed'),
+            SUM(BookingStatus = 'Cancelled'),
+            SUM(IF(BookingStatus = 'Confirmed', TotalPrice, 0)),
+            0
+        FROM Booking
+        WHERE BookingDate IS NOT NULL
+        GROUP BY DATE(BookingDate), COALESCE(HotelID, 0)
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO RevenueDaily (Period, HotelID, Paid)
+        SELECT DATE(pt.TransactionDate), COALESCE(b.HotelID, 0), SUM(pt.Amount)
+        FROM PaymentTransaction pt
+        JOIN Booking b ON pt.BookingID = b.BookingID
+        WHERE pt.PaymentStatus = 'Completed' AND pt.TransactionDate IS NOT NULL
+        GROUP BY DATE(pt.TransactionDate), COALESCE(b.HotelID, 0)
+        ON DUPLICATE KEY UPDATE Paid = VALUES(Paid)
+        """
+    )
+    cursor.execute(
+        """
+        INSERT INTO RevenueMonthly (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+        SELECT
+            DATE_SUB(Period, INTERVAL DAYOFMONTH(Period) - 1 DAY) AS Month,
+            HotelID,
+            SUM(Bookings),
+            SUM(Confirmed),
+            SUM(Cancelled),
+            SUM(Revenue),
+            SUM(Paid)
+        FROM RevenueDaily
+        GROUP BY Month, HotelID
+        """
+    )
+    print("Revenue rollups backfilled.")
+
+def initialize_database_objects(shard=None):
     """Ensure required tables, columns, functions, procedures, and triggers exist"""
     try:
-        conn = get_db_connection()
-        if not conn:
+        try:
+            conn = get_db_connection(shard=shard)
+        except circuit_breaker.DatabaseUnavailable:
             print("Database initialization skipped: unable to connect.")
             return False
 
@@ -70,8 +759,40 @@ def initialize_database_objects():
             "DROP TRIGGER IF EXISTS UpdateUserBookingCount_INSERT",
             "DROP TRIGGER IF EXISTS AuditBookingStatusChange",
             "DROP TRIGGER IF EXISTS PreventOverbooking",
+            "DROP TRIGGER IF EXISTS AdjustInventoryOnStatusChange",
+            "DROP TRIGGER IF EXISTS ReleaseInventoryOnDelete",
+            "DROP TRIGGER IF EXISTS SyncInventoryCapacity",
+            "DROP TRIGGER IF EXISTS LogTransportChange_INSERT",
+            "DROP TRIGGER IF EXISTS LogTransportChange_UPDATE",
+            "DROP TRIGGER IF EXISTS LogTransportChange_DELETE",
+            "DROP TRIGGER IF EXISTS LogAvailabilityTransportChange_UPDATE",
+            "DROP TRIGGER IF EXISTS LogAvailabilityTransportChange_DELETE",
+            "DROP TRIGGER IF EXISTS LogDestinationTransportChange_DELETE",
+            "DROP TRIGGER IF EXISTS LogHotelGeoChange_INSERT",
+            "DROP TRIGGER IF EXISTS LogHotelGeoChange_UPDATE",
+            "DROP TRIGGER IF EXISTS LogHotelGeoChange_DELETE",
+            "DROP TRIGGER IF EXISTS LogDestinationGeoChange_INSERT",
+            "DROP TRIGGER IF EXISTS LogDestinationGeoChange_UPDATE",
+            "DROP TRIGGER IF EXISTS LogDestinationGeoChange_DELETE",
+            "DROP TRIGGER IF EXISTS RevenueRollup_BookingInsert",
+            "DROP TRIGGER IF EXISTS RevenueRollup_BookingUpdate",
+            "DROP TRIGGER IF EXISTS RevenueRollup_BookingDelete",
+            "DROP TRIGGER IF EXISTS RevenueRollup_PaymentInsert",
+            "DROP TRIGGER IF EXISTS RevenueRollup_PaymentUpdate",
+            "DROP TRIGGER IF EXISTS RevenueRollup_PaymentDelete",
+            "DROP TRIGGER IF EXISTS SyncPaymentOwner",
+            "DROP TRIGGER IF EXISTS SyncTombstone_Booking",
+            "DROP TRIGGER IF EXISTS SyncTombstone_Itinerary",
+            "DROP TRIGGER IF EXISTS SyncTombstone_Payment",
+            "DROP TRIGGER IF EXISTS SyncTouchItinerary_INSERT",
+            "DROP TRIGGER IF EXISTS SyncTouchItinerary_UPDATE",
+            "DROP TRIGGER IF EXISTS SyncTouchItinerary_DELETE",
+            "DROP PROCEDURE IF EXISTS ReserveHotelNights",
+            "DROP PROCEDURE IF EXISTS ReleaseHotelNights",
+            "DROP PROCEDURE IF EXISTS AddRevenueRollup",
             "DROP PROCEDURE IF EXISTS CreateNewBooking",
             "DROP PROCEDURE IF EXISTS CancelBooking",
+            "DROP PROCEDURE IF EXISTS BulkCancelBookings",
             "DROP PROCEDURE IF EXISTS GetBookingDetails",
             "DROP PROCEDURE IF EXISTS GetDestinationItineraries",
             "DROP FUNCTION IF EXISTS CalculateBookingCost",
@@ -104,7 +825,89 @@ def initialize_database_objects():
             (conn.database,)
         )
         if cursor.fetchone()[0] == 0:
-            cursor.execute("ALTER TABLE Hotel ADD COLUMN AvailableRooms INT DEFAULT 0")
+            cursor.execute("ALTER TABLE Hotel ADD COLUMN AvailableRooms INT DEFAULT 1")
+
+        if not column_exists(cursor, conn.database, 'Activity', 'Duration'):
+            # Minutes an activity takes, used by the day scheduler
+            cursor.execute("ALTER TABLE Activity ADD COLUMN Duration INT NOT NULL DEFAULT 120")
+
+        if not column_exists(cursor, conn.database, 'Transport', 'OriginDestID'):
+            # Where a transport leg departs from; NULL = the traveller's starting point
+            cursor.execute(
+                """
+                ALTER TABLE Transport
+                ADD COLUMN OriginDestID INT NULL,
+                ADD FOREIGN KEY (OriginDestID) REFERENCES Destination(DestID) ON DELETE CASCADE ON UPDATE CASCADE
+                """
+            )
+
+        # Change stamps for delta sync; existing rows get the migration time.
+        # PaymentTransaction is created further down when it does not exist yet
+        for table in SYNC_TABLES:
+            if (table_exists(cursor, conn.database, table)
+                    and not column_exists(cursor, conn.database, table, 'UpdatedAt')):
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN UpdatedAt TIMESTAMP(6) NOT NULL "
+                    "DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)"
+                )
+
+        for table in GEO_TABLES:
+            if not column_exists(cursor, conn.database, table, 'Latitude'):
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN Latitude DECIMAL(9, 6) NULL, "
+                    "ADD COLUMN Longitude DECIMAL(9, 6) NULL"
+                )
+                cursor.executemany(
+                    f"UPDATE {table} SET Latitude = %s, Longitude = %s WHERE Location = %s AND Latitude IS NULL",
+                    [(latitude, longitude, city) for city, (latitude, longitude) in SAMPLE_CITY_COORDINATES.items()]
+                )
+
+        if not column_exists(cursor, conn.database, 'Offers', 'DiscountPercent'):
+            # Offers without a BookingID are the hotel's discount rules, see pricing.py
+            cursor.execute(
+                """
+                ALTER TABLE Offers
+                MODIFY BookingID INT NULL,
+                ADD COLUMN DiscountPercent DECIMAL(5, 2) NULL,
+                ADD COLUMN ValidFrom DATE NULL,
+                ADD COLUMN ValidTo DATE NULL,
+                ADD COLUMN MinNights INT NOT NULL DEFAULT 0,
+                ADD COLUMN MinAdvanceDays INT NOT NULL DEFAULT 0,
+                ADD COLUMN WeekendOnly BOOLEAN NOT NULL DEFAULT FALSE,
+                ADD CHECK (DiscountPercent > 0 AND DiscountPercent < 100)
+                """
+            )
+            for pattern, percent, min_nights, min_advance_days, weekend_only in SAMPLE_OFFER_RULES:
+                cursor.execute(
+                    """
+                    INSERT INTO Offers (HotelID, Description, Rating, DiscountPercent, MinNights, MinAdvanceDays, WeekendOnly)
+                    SELECT HotelID, Description, Rating, %s, %s, %s, %s
+                    FROM Offers
+                    WHERE Description LIKE %s AND BookingID IS NOT NULL
+                    """,
+                    (percent, min_nights, min_advance_days, weekend_only, pattern)
+                )
+
+        if (table_exists(cursor, conn.database, 'PaymentTransaction')
+                and not column_exists(cursor, conn.database, 'PaymentTransaction', 'UserID')):
+            # Owner copied from the booking so a user's payments are one index range
+            cursor.execute("ALTER TABLE PaymentTransaction ADD COLUMN UserID INT NULL")
+            cursor.execute(
+                """
+                UPDATE PaymentTransaction pt
+                JOIN Booking b ON pt.BookingID = b.BookingID
+                SET pt.UserID = b.UserID
+                """
+            )
+
+        # First run of the per-night inventory: every hotel used to be treated
+        # as a single room, so start from that and backfill booked nights
+        inventory_is_new = not table_exists(cursor, conn.database, 'HotelNightInventory')
+        if inventory_is_new:
+            cursor.execute("ALTER TABLE Hotel ALTER COLUMN AvailableRooms SET DEFAULT 1")
+            cursor.execute("UPDATE Hotel SET AvailableRooms = 1 WHERE AvailableRooms IS NULL OR AvailableRooms < 1")
+
+        rollups_are_new = not table_exists(cursor, conn.database, 'RevenueDaily')
 
         cursor.execute(
             """
@@ -196,25 +999,204 @@ def initialize_database_objects():
                 Amount DECIMAL(12, 2) NOT NULL,
                 PaymentStatus VARCHAR(50) DEFAULT 'Pending' CHECK (PaymentStatus IN ('Pending', 'Completed', 'Failed')),
                 TransactionDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UserID INT NULL,
+                UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
                 FOREIGN KEY (BookingID) REFERENCES Booking(BookingID) ON DELETE CASCADE ON UPDATE CASCADE
             )
             """,
+            # Deleted bookings/itineraries/payments, kept for delta sync clients
+            """
+            CREATE TABLE IF NOT EXISTS SyncTombstone (
+                TombstoneID BIGINT PRIMARY KEY AUTO_INCREMENT,
+                UserID INT NOT NULL,
+                EntityType VARCHAR(20) NOT NULL,
+                EntityID INT NOT NULL,
+                DeletedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+                INDEX idx_sync_tombstone_user (UserID, DeletedAt),
+                INDEX idx_sync_tombstone_time (DeletedAt)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS TableVersion (
+                TableName VARCHAR(64) PRIMARY KEY,
+                Version BIGINT NOT NULL DEFAULT 0
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS TransportChange (
+                ChangeID BIGINT PRIMARY KEY AUTO_INCREMENT,
+                TransportID INT NOT NULL,
+                ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_transport_change_time (ChangedAt)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS GeoChange (
+                ChangeID BIGINT PRIMARY KEY AUTO_INCREMENT,
+                TableName VARCHAR(20) NOT NULL,
+                EntityID INT NOT NULL,
+                ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_geo_change_time (ChangedAt)
+            )
+            """,
+            # Nights a cancellation on this shard (not shard 0) owes shard 0's
+            # inventory, written by the Booking triggers, see settle_inventory_releases
+            """
+            CREATE TABLE IF NOT EXISTS InventoryRelease (
+                ReleaseID BIGINT PRIMARY KEY AUTO_INCREMENT,
+                BookingID INT NOT NULL,
+                HotelID INT NOT NULL,
+                CheckInDate DATE NOT NULL,
+                CheckOutDate DATE NOT NULL,
+                CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            # InventoryReleases already applied on shard 0, so none is applied twice
+            """
+            CREATE TABLE IF NOT EXISTS InventoryReleased (
+                ShardIndex INT NOT NULL,
+                ReleaseID BIGINT NOT NULL,
+                ReleasedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (ShardIndex, ReleaseID),
+                INDEX idx_inventory_released_time (ReleasedAt)
+            )
+            """,
+            # Nights reserved on shard 0 for a booking being made on another shard
+            """
+            CREATE TABLE IF NOT EXISTS InventoryHold (
+                HoldID BIGINT PRIMARY KEY AUTO_INCREMENT,
+                UserID INT NOT NULL,
+                HotelID INT NOT NULL,
+                CheckInDate DATE NOT NULL,
+                CheckOutDate DATE NOT NULL,
+                CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_inventory_hold_time (CreatedAt)
+            )
+            """,
+            # Nightly rates that override Hotel.PricePerNight (pricing.py); RateID
+            # lets shards.py copy the table like the other catalog tables
+            """
+            CREATE TABLE IF NOT EXISTS HotelRate (
+                RateID INT PRIMARY KEY AUTO_INCREMENT,
+                HotelID INT NOT NULL,
+                Night DATE NOT NULL,
+                Price DECIMAL(10, 2) NOT NULL,
+                UNIQUE KEY uq_hotel_rate_night (HotelID, Night),
+                CHECK (Price >= 0),
+                FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+            )
+            """,
+            # Stays turned away by PreventOverbooking, booked when nights free up
+            """
+            CREATE TABLE IF NOT EXISTS Waitlist (
+                WaitlistID INT PRIMARY KEY AUTO_INCREMENT,
+                UserID INT NOT NULL,
+                HotelID INT NOT NULL,
+                CheckInDate DATE NOT NULL,
+                CheckOutDate DATE NOT NULL,
+                Priority INT NOT NULL DEFAULT 0,
+                Status VARCHAR(20) NOT NULL DEFAULT 'Waiting',
+                BookingID INT NULL,
+                CreatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+                UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+                INDEX idx_waitlist_status (Status, HotelID),
+                INDEX idx_waitlist_updated (UpdatedAt),
+                INDEX idx_waitlist_user (UserID, CreatedAt),
+                CHECK (CheckOutDate > CheckInDate),
+                CHECK (Status IN ('Waiting', 'Booking', 'Booked', 'Withdrawn', 'Expired')),
+                FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS HotelNightInventory (
+                HotelID INT NOT NULL,
+                Night DATE NOT NULL,
+                Capacity INT NOT NULL,
+                Booked INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (HotelID, Night),
+                CHECK (Booked >= 0 AND Booked <= Capacity),
+                FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+            )
+            """,
+            # One row per (day, hotel); HotelID 0 = booking without a hotel
+            """
+            CREATE TABLE IF NOT EXISTS RevenueDaily (
+                Period DATE NOT NULL,
+                HotelID INT NOT NULL,
+                Bookings INT NOT NULL DEFAULT 0,
+                Confirmed INT NOT NULL DEFAULT 0,
+                Cancelled INT NOT NULL DEFAULT 0,
+                Revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                Paid DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (Period, HotelID),
+                INDEX idx_revenue_daily_hotel (HotelID, Period)
+            )
+            """,
+            # Same measures per (first day of month, hotel)
+            """
+            CREATE TABLE IF NOT EXISTS RevenueMonthly (
+                Period DATE NOT NULL,
+                HotelID INT NOT NULL,
+                Bookings INT NOT NULL DEFAULT 0,
+                Confirmed INT NOT NULL DEFAULT 0,
+                Cancelled INT NOT NULL DEFAULT 0,
+                Revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                Paid DECIMAL(14, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (Period, HotelID),
+                INDEX idx_revenue_monthly_hotel (HotelID, Period)
+            )
+            """,
             # Functions
             """
             CREATE FUNCTION CalculateBookingCost(p_HotelID INT, p_CheckInDate DATE, p_CheckOutDate DATE)
             RETURNS DECIMAL(12, 2)
-            DETERMINISTIC
+            NOT DETERMINISTIC
             READS SQL DATA
             BEGIN
                 DECLARE v_PricePerNight DECIMAL(10, 2);
                 DECLARE v_NumberOfNights INT;
                 DECLARE v_TotalCost DECIMAL(12, 2);
+                DECLARE v_Discount DECIMAL(12, 2);
 
                 SELECT PricePerNight INTO v_PricePerNight FROM Hotel WHERE HotelID = p_HotelID;
                 SET v_NumberOfNights = DATEDIFF(p_CheckOutDate, p_CheckInDate);
-                SET v_TotalCost = v_PricePerNight * v_NumberOfNights;
 
-                RETURN v_TotalCost;
+                IF v_PricePerNight IS NULL OR v_NumberOfNights <= 0 THEN
+                    RETURN v_PricePerNight * v_NumberOfNights;
+                END IF;
+
+                -- Same rules as pricing.py: HotelRate overrides PricePerNight,
+                -- the best standing offer the stay qualifies for is taken off
+                WITH RECURSIVE StayNights (Night) AS (
+                    SELECT p_CheckInDate
+                    UNION ALL
+                    SELECT Night + INTERVAL 1 DAY FROM StayNights WHERE Night + INTERVAL 1 DAY < p_CheckOutDate
+                ),
+                Priced AS (
+                    SELECT n.Night, COALESCE(r.Price, v_PricePerNight) AS Price
+                    FROM StayNights n
+                    LEFT JOIN HotelRate r ON r.HotelID = p_HotelID AND r.Night = n.Night
+                )
+                SELECT
+                    (SELECT SUM(Price) FROM Priced),
+                    (SELECT COALESCE(MAX(OfferDiscount), 0)
+                     FROM (
+                         SELECT SUM(ROUND(p.Price * o.DiscountPercent / 100, 2)) AS OfferDiscount
+                         FROM Offers o
+                         JOIN Priced p
+                           ON (o.ValidFrom IS NULL OR p.Night >= o.ValidFrom)
+                          AND (o.ValidTo IS NULL OR p.Night <= o.ValidTo)
+                          AND (NOT o.WeekendOnly OR DAYOFWEEK(p.Night) IN (6, 7))
+                         WHERE o.HotelID = p_HotelID
+                           AND o.BookingID IS NULL
+                           AND o.DiscountPercent IS NOT NULL
+                           AND v_NumberOfNights >= o.MinNights
+                           AND DATEDIFF(p_CheckInDate, CURDATE()) >= o.MinAdvanceDays
+                         GROUP BY o.OfferID
+                     ) OfferDiscounts)
+                INTO v_TotalCost, v_Discount;
+
+                RETURN v_TotalCost - v_Discount;
             END
             """,
             """
@@ -324,6 +1306,93 @@ def initialize_database_objects():
             END
             """,
             """
+            CREATE PROCEDURE BulkCancelBookings(
+                IN p_HotelID INT,
+                IN p_FromDate DATE,
+                IN p_ToDate DATE,
+                IN p_UserID INT,
+                OUT p_Cancelled INT
+            )
+            BEGIN
+                DECLARE EXIT HANDLER FOR SQLEXCEPTION
+                BEGIN
+                    SET @audit_bulk = NULL;
+                    ROLLBACK;
+                    DROP TEMPORARY TABLE IF EXISTS BulkCancelTarget;
+                    RESIGNAL;
+                END;
+
+                IF p_HotelID IS NULL AND p_FromDate IS NULL AND p_ToDate IS NULL AND p_UserID IS NULL THEN
+                    SIGNAL SQLSTATE '45000'
+                    SET MESSAGE_TEXT = 'Bulk cancellation needs a hotel, date or user filter';
+                END IF;
+
+                DROP TEMPORARY TABLE IF EXISTS BulkCancelTarget;
+                CREATE TEMPORARY TABLE BulkCancelTarget (
+                    BookingID INT PRIMARY KEY,
+                    OldStatus VARCHAR(50)
+                ) ENGINE = MEMORY;
+
+                START TRANSACTION;
+
+                -- Bookings with a night from p_FromDate through p_ToDate; the
+                -- INSERT ... SELECT locks them until COMMIT
+                INSERT INTO BulkCancelTarget (BookingID, OldStatus)
+                SELECT BookingID, BookingStatus
+                FROM Booking
+                WHERE (p_HotelID IS NULL OR HotelID = p_HotelID)
+                AND (p_UserID IS NULL OR UserID = p_UserID)
+                AND (p_ToDate IS NULL OR CheckInDate <= p_ToDate)
+                AND (p_FromDate IS NULL OR CheckOutDate > p_FromDate);
+
+                -- One UPDATE; the audit rows are written below in one INSERT
+                -- instead of by AuditBookingStatusChange row by row
+                SET @audit_bulk = 1;
+                UPDATE Booking b
+                JOIN BulkCancelTarget t ON t.BookingID = b.BookingID
+                SET b.BookingStatus = 'Cancelled'
+                WHERE t.OldStatus = 'Confirmed';
+                SET p_Cancelled = ROW_COUNT();
+                SET @audit_bulk = NULL;
+
+                INSERT INTO BookingAudit (BookingID, ActionType, OldStatus, NewStatus, UserEmail)
+                SELECT t.BookingID, 'Status Change', t.OldStatus, 'Cancelled', u.Email
+                FROM BulkCancelTarget t
+                JOIN Booking b ON b.BookingID = t.BookingID
+                LEFT JOIN User u ON u.UserID = b.UserID
+                WHERE t.OldStatus = 'Confirmed';
+
+                COMMIT;
+
+                -- One row per matched booking (the columns of a change feed
+                -- booking row), with CancelBooking's messages
+                SELECT
+                    b.BookingID,
+                    b.UserID,
+                    b.HotelID,
+                    b.CheckInDate,
+                    b.CheckOutDate,
+                    b.TotalPrice,
+                    b.BookingStatus,
+                    b.BookingDate,
+                    h.Name AS HotelName,
+                    h.Location AS HotelLocation,
+                    h.Rating AS HotelRating,
+                    t.OldStatus,
+                    CASE t.OldStatus
+                        WHEN 'Confirmed' THEN 'Booking cancelled successfully'
+                        WHEN 'Cancelled' THEN 'Booking is already cancelled'
+                        ELSE CONCAT('Cannot cancel booking with status: ', t.OldStatus)
+                    END AS Message
+                FROM BulkCancelTarget t
+                JOIN Booking b ON b.BookingID = t.BookingID
+                LEFT JOIN Hotel h ON h.HotelID = b.HotelID
+                ORDER BY b.BookingID;
+
+                DROP TEMPORARY TABLE BulkCancelTarget;
+            END
+            """,
+            """
             CREATE PROCEDURE GetBookingDetails(
                 IN p_BookingID INT
             )
@@ -372,6 +1441,90 @@ def initialize_database_objects():
                 ORDER BY i.StartDate;
             END
             """,
+            """
+            CREATE PROCEDURE ReserveHotelNights(
+                IN p_HotelID INT,
+                IN p_CheckInDate DATE,
+                IN p_CheckOutDate DATE
+            )
+            BEGIN
+                DECLARE v_Capacity INT;
+                DECLARE v_Night DATE;
+
+                SELECT AvailableRooms INTO v_Capacity FROM Hotel WHERE HotelID = p_HotelID;
+                IF v_Capacity IS NULL OR v_Capacity < 1 THEN
+                    SET v_Capacity = 1;
+                END IF;
+
+                -- Materialise missing nights; locks are taken in night order
+                SET v_Night = p_CheckInDate;
+                WHILE v_Night < p_CheckOutDate DO
+                    INSERT INTO HotelNightInventory (HotelID, Night, Capacity, Booked)
+                    VALUES (p_HotelID, v_Night, v_Capacity, 0)
+                    ON DUPLICATE KEY UPDATE Capacity = Capacity;
+                    SET v_Night = DATE_ADD(v_Night, INTERVAL 1 DAY);
+                END WHILE;
+
+                -- Claim one room on every night of the stay in a single statement
+                UPDATE HotelNightInventory
+                SET Booked = Booked + 1
+                WHERE HotelID = p_HotelID
+                AND Night >= p_CheckInDate AND Night < p_CheckOutDate
+                AND Booked < Capacity;
+
+                IF ROW_COUNT() < DATEDIFF(p_CheckOutDate, p_CheckInDate) THEN
+                    SIGNAL SQLSTATE '45000'
+                    SET MESSAGE_TEXT = 'Hotel is not available for selected dates';
+                END IF;
+            END
+            """,
+            """
+            CREATE PROCEDURE ReleaseHotelNights(
+                IN p_HotelID INT,
+                IN p_CheckInDate DATE,
+                IN p_CheckOutDate DATE
+            )
+            BEGIN
+                UPDATE HotelNightInventory
+                SET Booked = Booked - 1
+                WHERE HotelID = p_HotelID
+                AND Night >= p_CheckInDate AND Night < p_CheckOutDate
+                AND Booked > 0;
+            END
+            """,
+            """
+            CREATE PROCEDURE AddRevenueRollup(
+                IN p_Day DATE,
+                IN p_HotelID INT,
+                IN p_Bookings INT,
+                IN p_Confirmed INT,
+                IN p_Cancelled INT,
+                IN p_Revenue DECIMAL(14, 2),
+                IN p_Paid DECIMAL(14, 2)
+            )
+            BEGIN
+                IF p_Day IS NOT NULL THEN
+                    INSERT INTO RevenueDaily (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+                    VALUES (p_Day, COALESCE(p_HotelID, 0), p_Bookings, p_Confirmed, p_Cancelled, p_Revenue, p_Paid)
+                    ON DUPLICATE KEY UPDATE
+                        Bookings = Bookings + VALUES(Bookings),
+                        Confirmed = Confirmed + VALUES(Confirmed),
+                        Cancelled = Cancelled + VALUES(Cancelled),
+                        Revenue = Revenue + VALUES(Revenue),
+                        Paid = Paid + VALUES(Paid);
+
+                    INSERT INTO RevenueMonthly (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+                    VALUES (DATE_SUB(p_Day, INTERVAL DAYOFMONTH(p_Day) - 1 DAY), COALESCE(p_HotelID, 0),
+                            p_Bookings, p_Confirmed, p_Cancelled, p_Revenue, p_Paid)
+                    ON DUPLICATE KEY UPDATE
+                        Bookings = Bookings + VALUES(Bookings),
+                        Confirmed = Confirmed + VALUES(Confirmed),
+                        Cancelled = Cancelled + VALUES(Cancelled),
+                        Revenue = Revenue + VALUES(Revenue),
+                        Paid = Paid + VALUES(Paid);
+                END IF;
+            END
+            """,
             # Triggers
             """
             CREATE TRIGGER UpdateUserBookingCount_INSERT
@@ -388,102 +1541,504 @@ def initialize_database_objects():
             BEFORE INSERT ON Booking
             FOR EACH ROW
             BEGIN
-                DECLARE v_ConflictCount INT;
-
-                SELECT COUNT(*) INTO v_ConflictCount
-                FROM Booking
-                WHERE HotelID = NEW.HotelID
-                AND BookingStatus = 'Confirmed'
-                AND ((CheckInDate < NEW.CheckOutDate AND CheckOutDate > NEW.CheckInDate));
-
-                IF v_ConflictCount > 0 THEN
-                    SIGNAL SQLSTATE '45000'
-                    SET MESSAGE_TEXT = 'Hotel is not available for selected dates';
+                IF @inventory_remote IS NULL
+                   AND NEW.BookingStatus = 'Confirmed' AND NEW.HotelID IS NOT NULL THEN
+                    CALL ReserveHotelNights(NEW.HotelID, NEW.CheckInDate, NEW.CheckOutDate);
                 END IF;
             END
             """,
             """
-            CREATE TRIGGER AuditBookingStatusChange
-            AFTER UPDATE ON Booking
+            CREATE TRIGGER AdjustInventoryOnStatusChange
+            BEFORE UPDATE ON Booking
             FOR EACH ROW
             BEGIN
-                DECLARE v_UserEmail VARCHAR(100);
-
-                IF NEW.BookingStatus <> OLD.BookingStatus THEN
-                    SELECT Email INTO v_UserEmail FROM User WHERE UserID = OLD.UserID LIMIT 1;
+                IF OLD.BookingStatus = 'Confirmed' AND OLD.HotelID IS NOT NULL
+                   AND (NEW.BookingStatus <> 'Confirmed'
+                        OR NOT (NEW.HotelID <=> OLD.HotelID)
+                        OR NEW.CheckInDate <> OLD.CheckInDate
+                        OR NEW.CheckOutDate <> OLD.CheckOutDate) THEN
+                    IF @inventory_remote IS NULL THEN
+                        CALL ReleaseHotelNights(OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+                    ELSE
+                        INSERT INTO InventoryRelease (BookingID, HotelID, CheckInDate, CheckOutDate)
+                        VALUES (OLD.BookingID, OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+                    END IF;
+                END IF;
 
-                    INSERT INTO BookingAudit (BookingID, ActionType, OldStatus, NewStatus, UserEmail)
-                    VALUES (OLD.BookingID, 'Status Change', OLD.BookingStatus, NEW.BookingStatus, v_UserEmail);
+                IF @inventory_remote IS NULL
+                   AND NEW.BookingStatus = 'Confirmed' AND NEW.HotelID IS NOT NULL
+                   AND (OLD.BookingStatus <> 'Confirmed'
+                        OR NOT (NEW.HotelID <=> OLD.HotelID)
+                        OR NEW.CheckInDate <> OLD.CheckInDate
+                        OR NEW.CheckOutDate <> OLD.CheckOutDate) THEN
+                    CALL ReserveHotelNights(NEW.HotelID, NEW.CheckInDate, NEW.CheckOutDate);
                 END IF;
             END
             """,
-        ]
-
-        for statement in drop_statements:
-            cursor.execute(statement)
-
-        for statement in create_statements:
-            cursor.execute(statement)
-
-        if not emaillog_has_column:
-            cursor.execute("ALTER TABLE EmailLog ADD COLUMN RecipientEmail VARCHAR(255)")
-        if not emaillog_has_recipient_name:
-            cursor.execute("ALTER TABLE EmailLog ADD COLUMN RecipientName VARCHAR(255)")
-        if not emaillog_has_message:
-            cursor.execute("ALTER TABLE EmailLog ADD COLUMN Message TEXT")
-        if not emaillog_has_sent_at:
-            cursor.execute("ALTER TABLE EmailLog ADD COLUMN SentAt TIMESTAMP NULL DEFAULT NULL")
-        if not emaillog_has_status:
-            cursor.execute("ALTER TABLE EmailLog ADD COLUMN Status VARCHAR(50) DEFAULT 'Pending'")
-
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print("Database routines/triggers ensured.")
-        return True
-    except mysql.connector.Error as err:
-        print(f"Database initialization error: {err}")
-        return False
-
-# Ensure database objects are present when the app starts
-initialize_database_objects()
-
-# ============================================
-# ROUTES - USER MANAGEMENT
-# ============================================
-
-@app.route('/')
-def index():
-    """Landing page - Login/Register"""
-    return render_template('index.html')
-
-@app.route('/register', methods=['POST'])
-def register():
-    """Register new user (CREATE - User table)"""
-    try:
-        data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Insert new user
-        query = """
-        INSERT INTO User (FirstName, LastName, Email, PhoneNo, Password)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (
-            data['firstName'],
-            data['lastName'],
-            data['email'],
-            data['phone'],
-            data['password']  # In production, hash this password!
-        ))
-        
-        conn.commit()
-        user_id = cursor.lastrowid
-        
-        cursor.close()
-        conn.close()
-        
+            """
+            CREATE TRIGGER ReleaseInventoryOnDelete
+            AFTER DELETE ON Booking
+            FOR EACH ROW
+            BEGIN
+                IF OLD.BookingStatus = 'Confirmed' AND OLD.HotelID IS NOT NULL THEN
+                    IF @inventory_remote IS NULL THEN
+                        CALL ReleaseHotelNights(OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+                    ELSE
+                        INSERT INTO InventoryRelease (BookingID, HotelID, CheckInDate, CheckOutDate)
+                        VALUES (OLD.BookingID, OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+                    END IF;
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER SyncInventoryCapacity
+            AFTER UPDATE ON Hotel
+            FOR EACH ROW
+            BEGIN
+                IF NOT (NEW.AvailableRooms <=> OLD.AvailableRooms) THEN
+                    UPDATE HotelNightInventory
+                    SET Capacity = GREATEST(COALESCE(NEW.AvailableRooms, 1), Booked)
+                    WHERE HotelID = NEW.HotelID AND Night >= CURDATE();
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER LogTransportChange_INSERT
+            AFTER INSERT ON Transport
+            FOR EACH ROW
+            INSERT INTO TransportChange (TransportID) VALUES (NEW.TransportID)
+            """,
+            """
+            CREATE TRIGGER LogTransportChange_UPDATE
+            AFTER UPDATE ON Transport
+            FOR EACH ROW
+            BEGIN
+                INSERT INTO TransportChange (TransportID) VALUES (NEW.TransportID);
+                IF NEW.TransportID <> OLD.TransportID THEN
+                    INSERT INTO TransportChange (TransportID) VALUES (OLD.TransportID);
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER LogTransportChange_DELETE
+            AFTER DELETE ON Transport
+            FOR EACH ROW
+            INSERT INTO TransportChange (TransportID) VALUES (OLD.TransportID)
+            """,
+            """
+            CREATE TRIGGER LogAvailabilityTransportChange_UPDATE
+            AFTER UPDATE ON Availability
+            FOR EACH ROW
+            BEGIN
+                IF NEW.DestID <> OLD.DestID THEN
+                    INSERT INTO TransportChange (TransportID)
+                    SELECT TransportID FROM Transport WHERE AvailabilityID = NEW.AvailabilityID;
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER LogAvailabilityTransportChange_DELETE
+            BEFORE DELETE ON Availability
+            FOR EACH ROW
+            INSERT INTO TransportChange (TransportID)
+            SELECT TransportID FROM Transport WHERE AvailabilityID = OLD.AvailabilityID
+            """,
+            """
+            CREATE TRIGGER LogDestinationTransportChange_DELETE
+            BEFORE DELETE ON Destination
+            FOR EACH ROW
+            INSERT INTO TransportChange (TransportID)
+            SELECT t.TransportID
+            FROM Transport t
+            JOIN Availability av ON t.AvailabilityID = av.AvailabilityID
+            WHERE av.DestID = OLD.DestID OR t.OriginDestID = OLD.DestID
+            """,
+            """
+            CREATE TRIGGER LogHotelGeoChange_INSERT
+            AFTER INSERT ON Hotel
+            FOR EACH ROW
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', NEW.HotelID)
+            """,
+            """
+            CREATE TRIGGER LogHotelGeoChange_UPDATE
+            AFTER UPDATE ON Hotel
+            FOR EACH ROW
+            BEGIN
+                IF NOT (NEW.HotelID <=> OLD.HotelID AND NEW.Name <=> OLD.Name AND NEW.Location <=> OLD.Location
+                        AND NEW.Rating <=> OLD.Rating AND NEW.PricePerNight <=> OLD.PricePerNight
+                        AND NEW.Latitude <=> OLD.Latitude AND NEW.Longitude <=> OLD.Longitude) THEN
+                    INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', NEW.HotelID);
+                    IF NEW.HotelID <> OLD.HotelID THEN
+                        INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', OLD.HotelID);
+                    END IF;
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER LogHotelGeoChange_DELETE
+            AFTER DELETE ON Hotel
+            FOR EACH ROW
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', OLD.HotelID)
+            """,
+            """
+            CREATE TRIGGER LogDestinationGeoChange_INSERT
+            AFTER INSERT ON Destination
+            FOR EACH ROW
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', NEW.DestID)
+            """,
+            """
+            CREATE TRIGGER LogDestinationGeoChange_UPDATE
+            AFTER UPDATE ON Destination
+            FOR EACH ROW
+            BEGIN
+                IF NOT (NEW.DestID <=> OLD.DestID AND NEW.Name <=> OLD.Name
+                        AND NEW.Latitude <=> OLD.Latitude AND NEW.Longitude <=> OLD.Longitude) THEN
+                    INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', NEW.DestID);
+                    IF NEW.DestID <> OLD.DestID THEN
+                        INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', OLD.DestID);
+                    END IF;
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER LogDestinationGeoChange_DELETE
+            AFTER DELETE ON Destination
+            FOR EACH ROW
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', OLD.DestID)
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_BookingInsert
+            AFTER INSERT ON Booking
+            FOR EACH ROW
+            BEGIN
+                CALL AddRevenueRollup(
+                    DATE(NEW.BookingDate), NEW.HotelID, 1,
+                    NEW.BookingStatus = 'Confirmed', NEW.BookingStatus = 'Cancelled',
+                    IF(NEW.BookingStatus = 'Confirmed', NEW.TotalPrice, 0), 0
+                );
+            END
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_BookingUpdate
+            AFTER UPDATE ON Booking
+            FOR EACH ROW
+            BEGIN
+                IF NEW.BookingStatus <> OLD.BookingStatus
+                   OR NEW.TotalPrice <> OLD.TotalPrice
+                   OR NOT (NEW.HotelID <=> OLD.HotelID)
+                   OR NOT (NEW.BookingDate <=> OLD.BookingDate) THEN
+                    CALL AddRevenueRollup(
+                        DATE(OLD.BookingDate), OLD.HotelID, -1,
+                        -(OLD.BookingStatus = 'Confirmed'), -(OLD.BookingStatus = 'Cancelled'),
+                        -IF(OLD.BookingStatus = 'Confirmed', OLD.TotalPrice, 0), 0
+                    );
+                    CALL AddRevenueRollup(
+                        DATE(NEW.BookingDate), NEW.HotelID, 1,
+                        NEW.BookingStatus = 'Confirmed', NEW.BookingStatus = 'Cancelled',
+                        IF(NEW.BookingStatus = 'Confirmed', NEW.TotalPrice, 0), 0
+                    );
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_BookingDelete
+            AFTER DELETE ON Booking
+            FOR EACH ROW
+            BEGIN
+                CALL AddRevenueRollup(
+                    DATE(OLD.BookingDate), OLD.HotelID, -1,
+                    -(OLD.BookingStatus = 'Confirmed'), -(OLD.BookingStatus = 'Cancelled'),
+                    -IF(OLD.BookingStatus = 'Confirmed', OLD.TotalPrice, 0), 0
+                );
+            END
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_PaymentInsert
+            AFTER INSERT ON PaymentTransaction
+            FOR EACH ROW
+            BEGIN
+                DECLARE v_HotelID INT;
+
+                IF NEW.PaymentStatus = 'Completed' THEN
+                    SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = NEW.BookingID;
+                    CALL AddRevenueRollup(DATE(NEW.TransactionDate), v_HotelID, 0, 0, 0, 0, NEW.Amount);
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_PaymentUpdate
+            AFTER UPDATE ON PaymentTransaction
+            FOR EACH ROW
+            BEGIN
+                DECLARE v_HotelID INT;
+
+                IF (OLD.PaymentStatus = 'Completed' OR NEW.PaymentStatus = 'Completed')
+                   AND (NEW.PaymentStatus <> OLD.PaymentStatus
+                        OR NEW.Amount <> OLD.Amount
+                        OR NOT (NEW.TransactionDate <=> OLD.TransactionDate)) THEN
+                    SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = NEW.BookingID;
+                    IF OLD.PaymentStatus = 'Completed' THEN
+                        CALL AddRevenueRollup(DATE(OLD.TransactionDate), v_HotelID, 0, 0, 0, 0, -OLD.Amount);
+                    END IF;
+                    IF NEW.PaymentStatus = 'Completed' THEN
+                        CALL AddRevenueRollup(DATE(NEW.TransactionDate), v_HotelID, 0, 0, 0, 0, NEW.Amount);
+                    END IF;
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER RevenueRollup_PaymentDelete
+            AFTER DELETE ON PaymentTransaction
+            FOR EACH ROW
+            BEGIN
+                DECLARE v_HotelID INT;
+
+                IF OLD.PaymentStatus = 'Completed' THEN
+                    SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = OLD.BookingID;
+                    CALL AddRevenueRollup(DATE(OLD.TransactionDate), v_HotelID, 0, 0, 0, 0, -OLD.Amount);
+                END IF;
+            END
+            """,
+            """
+            CREATE TRIGGER SyncPaymentOwner
+            BEFORE INSERT ON PaymentTransaction
+            FOR EACH ROW
+            SET NEW.UserID = (SELECT UserID FROM Booking WHERE BookingID = NEW.BookingID)
+            """,
+            """
+            CREATE TRIGGER SyncTombstone_Booking
+            AFTER DELETE ON Booking
+            FOR EACH ROW
+            INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+            VALUES (OLD.UserID, 'Booking', OLD.BookingID)
+            """,
+            """
+            CREATE TRIGGER SyncTombstone_Itinerary
+            AFTER DELETE ON Itinerary
+            FOR EACH ROW
+            INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+            VALUES (OLD.UserID, 'Itinerary', OLD.ItineraryID)
+            """,
+            """
+            CREATE TRIGGER SyncTombstone_Payment
+            AFTER DELETE ON PaymentTransaction
+            FOR EACH ROW
+            BEGIN
+                IF OLD.UserID IS NOT NULL THEN
+                    INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+                    VALUES (OLD.UserID, 'Payment', OLD.TransactionID);
+                END IF;
+            END
+            """,
+            # Itineraries are synced together with their destinations
+            """
+            CREATE TRIGGER SyncTouchItinerary_INSERT
+            AFTER INSERT ON Includes
+            FOR EACH ROW
+            UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID = NEW.ItineraryID
+            """,
+            """
+            CREATE TRIGGER SyncTouchItinerary_UPDATE
+            AFTER UPDATE ON Includes
+            FOR EACH ROW
+            UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID IN (OLD.ItineraryID, NEW.ItineraryID)
+            """,
+            """
+            CREATE TRIGGER SyncTouchItinerary_DELETE
+            AFTER DELETE ON Includes
+            FOR EACH ROW
+            UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID = OLD.ItineraryID
+            """,
+            """
+            CREATE TRIGGER AuditBookingStatusChange
+            AFTER UPDATE ON Booking
+            FOR EACH ROW
+            BEGIN
+                DECLARE v_UserEmail VARCHAR(100);
+
+                -- BulkCancelBookings writes its audit rows itself (@audit_bulk)
+                IF @audit_bulk IS NULL AND NEW.BookingStatus <> OLD.BookingStatus THEN
+                    SELECT Email INTO v_UserEmail FROM User WHERE UserID = OLD.UserID LIMIT 1;
+
+                    INSERT INTO BookingAudit (BookingID, ActionType, OldStatus, NewStatus, UserEmail)
+                    VALUES (OLD.BookingID, 'Status Change', OLD.BookingStatus, NEW.BookingStatus, v_UserEmail);
+                END IF;
+            END
+            """,
+        ]
+
+        for table in VERSIONED_TABLES:
+            drops, creates = version_trigger_statements(table)
+            drop_statements.extend(drops)
+            create_statements.extend(creates)
+        for table in UNVERSIONED_TABLES:
+            drop_statements.extend(version_trigger_statements(table)[0])
+
+        for statement in drop_statements:
+            cursor.execute(statement)
+
+        for statement in create_statements:
+            cursor.execute(statement)
+
+        if inventory_is_new:
+            backfill_hotel_inventory(cursor)
+
+        if rollups_are_new:
+            backfill_revenue_rollups(cursor)
+
+        cursor.execute(
+            "DELETE FROM TransportChange WHERE ChangedAt < NOW() - INTERVAL %s HOUR",
+            (transport_graph.CHANGE_LOG_RETENTION_HOURS,)
+        )
+        cursor.execute(
+            "DELETE FROM GeoChange WHERE ChangedAt < NOW() - INTERVAL %s HOUR",
+            (geo_index.CHANGE_LOG_RETENTION_HOURS,)
+        )
+        cursor.execute(
+            "DELETE FROM SyncTombstone WHERE DeletedAt < NOW(6) - INTERVAL %s DAY",
+            (delta_sync.TOMBSTONE_DAYS,)
+        )
+
+        for table, index, columns in SECONDARY_INDEXES:
+            if not index_exists(cursor, conn.database, table, index):
+                cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+
+        if not emaillog_has_column:
+            cursor.execute("ALTER TABLE EmailLog ADD COLUMN RecipientEmail VARCHAR(255)")
+        if not emaillog_has_recipient_name:
+            cursor.execute("ALTER TABLE EmailLog ADD COLUMN RecipientName VARCHAR(255)")
+        if not emaillog_has_message:
+            cursor.execute("ALTER TABLE EmailLog ADD COLUMN Message TEXT")
+        if not emaillog_has_sent_at:
+            cursor.execute("ALTER TABLE EmailLog ADD COLUMN SentAt TIMESTAMP NULL DEFAULT NULL")
+        if not emaillog_has_status:
+            cursor.execute("ALTER TABLE EmailLog ADD COLUMN Status VARCHAR(50) DEFAULT 'Pending'")
+
+        if shard is not None:
+            shard_map.prepare(cursor, shard)
+
+        conn.commit()
+        cursor.close()
+        conn.close()
+        print("Database routines/triggers ensured.")
+        return True
+    except mysql.connector.Error as err:
+        print(f"Database initialization error: {err}")
+        return False
+
+# Ensure database objects are present when the app starts (on every shard)
+for database_shard in shard_map.shards:
+    initialize_database_objects(database_shard)
+
+# ============================================
+# PERIODIC MAINTENANCE
+# ============================================
+# Repairs that must not wait for a restart run on a daemon thread, right
+# away and then every MAINTENANCE_INTERVAL_SECONDS (environment variable).
+# Every job is safe to run from several worker processes at once.
+
+MAINTENANCE_INTERVAL_SECONDS = float(os.environ.get('MAINTENANCE_INTERVAL_SECONDS', 60))
+
+def return_stale_waitlist_claims():
+    """Hand back waitlist claims of a worker that died between claiming and booking"""
+    conn = get_db_connection()
+    try:
+        returned = waitlist.waitlist.return_stale_claims(conn)
+    finally:
+        conn.close()
+    if returned:
+        print(f"Waitlist: {returned} stale claims handed back.")
+
+# (name, job) in run order; a failing job does not stop the others
+MAINTENANCE_JOBS = [
+    ('inventory reconciliation', reconcile_inventory),
+    ('waitlist claims', return_stale_waitlist_claims),
+]
+
+def run_maintenance():
+    for name, job in MAINTENANCE_JOBS:
+        try:
+            job()
+        except Exception as err:
+            # Keep the thread alive; the job runs again next interval
+            print(f"Maintenance job {name} failed: {err}")
+
+def maintenance_loop():
+    while True:
+        run_maintenance()
+        time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
+threading.Thread(target=maintenance_loop, name='maintenance', daemon=True).start()
+
+# ============================================
+# ROUTES - USER MANAGEMENT
+# ============================================
+
+# Rendered landing page, keyed by (template name, mtime): Jinja runs once per
+# template change and every hit after that is served from these bytes.
+index_page_cache = {}
+
+def get_index_page():
+    """Return the cached rendered landing page and its compressed variants"""
+    key = asset_pipeline.current_template()
+    page = index_page_cache.get('page')
+    if page is None or page['key'] != key:
+        html = render_template(key[0]).encode('utf-8')
+        page = {
+            'key': key,
+            'etag': hashlib.sha256(html).hexdigest()[:16],
+            'identity': html,
+            'encodings': asset_pipeline.compress_variants(html),
+        }
+        index_page_cache['page'] = page
+    return page
+
+@app.route('/')
+def index():
+    """Landing page - Login/Register"""
+    page = get_index_page()
+    encoding = asset_pipeline.choose_encoding(request.accept_encodings, page['encodings'])
+    body = page['encodings'][encoding] if encoding else page['identity']
+
+    response = app.response_class(body, mimetype='text/html')
+    if encoding:
+        response.content_encoding = encoding
+    response.set_etag(f"{page['etag']}-{encoding or 'identity'}")
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+@app.route('/register', methods=['POST'])
+def register():
+    """Register new user (CREATE - User table)"""
+    try:
+        data = request.json
+        shard = shard_map.for_new_user(data['email'])
+        
+        # Accounts from before sharding stay on shard 0; emails are unique across both
+        if not shard.is_catalog:
+            conn = get_db_connection()
+            existing = queries.fetch_value(conn, 'user_id_by_email', (data['email'],))
+            conn.close()
+            if existing:
+                return jsonify({'success': False, 'message': 'Error: Email is already registered'}), 400
+        
+        conn = get_db_connection(shard=shard)
+        
+        # Insert new user
+        result = queries.execute(conn, 'user_insert', (
+            data['firstName'],
+            data['lastName'],
+            data['email'],
+            data['phone'],
+            data['password']  # In production, hash this password!
+        ))
+        
+        conn.commit()
+        user_id = result.lastrowid
+        
+        conn.close()
+        
         return jsonify({
             'success': True,
             'message': 'Registration successful!',
@@ -501,17 +2056,20 @@ def login():
     """User login (READ - User table)"""
     try:
         data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        shard = shard_map.for_new_user(data['email'])
+        conn = get_db_connection(shard=shard)
         
         # Check user credentials
-        query = "SELECT * FROM User WHERE Email = %s AND Password = %s"
-        cursor.execute(query, (data['email'], data['password']))
-        user = cursor.fetchone()
+        user = queries.fetch_one(conn, 'user_login', (data['email'], data['password']))
         
-        cursor.close()
         conn.close()
         
+        if not user and not shard.is_catalog:
+            # Accounts created before sharding stayed on shard 0
+            conn = get_db_connection()
+            user = queries.fetch_one(conn, 'user_login', (data['email'], data['password']))
+            conn.close()
+        
         if user:
             # Store user info in session
             session['user_id'] = user['UserID']
@@ -543,32 +2101,27 @@ def get_user_profile(user_id):
     """Get user profile details (READ)
     Note: TotalBookings is calculated as count of confirmed bookings only
     """
+    user = entity_cache.cache.get(entity_cache.USER, user_id)
+    if user is not None:
+        return jsonify({'success': True, 'user': user})
+    started = cache_fill_stamp()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_user(user_id))
         
         # Get user details
-        query = "SELECT UserID, FirstName, LastName, Email, PhoneNo FROM User WHERE UserID = %s"
-        cursor.execute(query, (user_id,))
-        user = cursor.fetchone()
+        user = queries.fetch_one(conn, 'user_profile', (user_id,))
         
         if user:
             # Calculate confirmed bookings count
-            count_query = """
-                SELECT COUNT(*) as ConfirmedBookings 
-                FROM Booking 
-                WHERE UserID = %s AND BookingStatus = 'Confirmed'
-            """
-            cursor.execute(count_query, (user_id,))
-            booking_count = cursor.fetchone()
+            booking_count = queries.fetch_one(conn, 'user_confirmed_booking_count', (user_id,))
             
             # Add confirmed bookings count to user data
             user['TotalBookings'] = booking_count['ConfirmedBookings'] if booking_count else 0
         
-        cursor.close()
         conn.close()
         
         if user:
+            entity_cache.cache.fill(entity_cache.USER, user_id, user, started)
             return jsonify({'success': True, 'user': user})
         else:
             return jsonify({'success': False, 'message': 'User not found'}), 404
@@ -581,15 +2134,9 @@ def update_user(user_id):
     """Update user profile (UPDATE - User table)"""
     try:
         data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_db_connection(shard=shard_map.for_user(user_id))
         
-        query = """
-        UPDATE User 
-        SET FirstName = %s, LastName = %s, PhoneNo = %s
-        WHERE UserID = %s
-        """
-        cursor.execute(query, (
+        queries.execute(conn, 'user_update', (
             data['firstName'],
             data['lastName'],
             data['phone'],
@@ -597,14 +2144,77 @@ def update_user(user_id):
         ))
         
         conn.commit()
-        cursor.close()
+        # Booking details carry the user's name
+        booking_ids = [row['BookingID'] for row in queries.fetch_all(conn, 'user_booking_ids', (user_id,))]
         conn.close()
         
+        entity_cache.cache.patch(entity_cache.USER, user_id, {
+            'FirstName': data['firstName'],
+            'LastName': data['lastName'],
+            'PhoneNo': data['phone'],
+        })
+        entity_cache.cache.invalidate(entity_cache.BOOKING, *booking_ids)
+        
         return jsonify({'success': True, 'message': 'Profile updated successfully'})
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+# ============================================
+# ROUTES - CHANGE FEED (Server-Sent Events)
+# ============================================
+
+def publish_booking(conn, event_type, booking_id):
+    """Push a booking row (shaped like /bookings/user) to its owner's streams"""
+    booking = queries.fetch_one(conn, 'booking_feed_row', (booking_id,))
+    if booking:
+        change_feed.feed.publish(event_type, booking, user_id=booking['UserID'])
+
+@app.route('/events/user/<int:user_id>')
+def stream_user_events(user_id):
+    """SSE stream of the user's booking/itinerary changes and catalog changes
+    Resumes after the Last-Event-ID header (or ?lastEventId=) when the event
+    is still buffered; otherwise sends one `reset` event.
+    """
+    # Every open stream holds a request thread (see change_feed.py)
+    if not change_feed.feed.acquire():
+        response = jsonify({'success': False, 'message': 'Too many open event streams, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(change_feed.RETRY_MILLISECONDS // 1000)
+        return response
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    response = Response(change_feed.feed.stream(user_id, last_event_id), mimetype='text/event-stream')
+    # Runs even when the client leaves before the first chunk
+    response.call_on_close(change_feed.feed.release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ============================================
+# ROUTES - DELTA SYNC (mobile clients)
+# ============================================
+
+@app.route('/sync/user/<int:user_id>')
+def sync_user_changes(user_id):
+    """Bookings, itineraries and payments changed since ?since=<token>
+    Without a token, or with one older than the tombstone retention, the
+    answer is a full sync (`full: true`). Pass `token` to the next call.
+    """
+    try:
+        # Primary only: a lagging replica would issue a token past rows it has not applied
+        conn = get_db_connection(shard=shard_map.for_user(user_id))
+        
+        result = delta_sync.changes(conn, user_id, request.args.get('since'))
+        
+        conn.close()
+        
+        return jsonify(dict(result, success=True))
+        
+    except delta_sync.SyncTokenError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
 # ============================================
 # ROUTES - BOOKING MANAGEMENT (CRUD + Procedures)
 # ============================================
@@ -612,19 +2222,79 @@ def update_user(user_id):
 @app.route('/hotels')
 def get_hotels():
     """Get all hotels for booking dropdown"""
+    fields, compact = requested_shape('hotels_all')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True)
         
-        query = "SELECT * FROM Hotel ORDER BY Name"
-        cursor.execute(query)
-        hotels = cursor.fetchall()
+        hotels = queries.fetch_projected(conn, 'hotels_all', fields)
+        
+        conn.close()
+        
+        if fields is None:
+            catalog_snapshots.save('hotels', hotels)
+        return jsonify({'success': True, 'hotels': shaped(hotels, 'hotels_all', fields, compact)})
+        
+    except circuit_breaker.DatabaseUnavailable as err:
+        return snapshot_response('hotels', err, 'hotels_all')
+    except mysql.connector.Error as err:
+        if circuit_breaker.is_connectivity_error(err):
+            return snapshot_response('hotels', err, 'hotels_all')
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/hotels/search')
+def search_hotels():
+    """Filtered, sorted, keyset-paginated hotel search with facet counts
+    Query params: location, minPrice, maxPrice, minRating, checkIn, checkOut,
+    sort (price_asc|price_desc|rating_desc|rating_asc|name), limit, cursor
+    """
+    try:
+        min_price = request.args.get('minPrice', type=float)
+        max_price = request.args.get('maxPrice', type=float)
+        min_rating = request.args.get('minRating', type=int)
+        check_in = request.args.get('checkIn')
+        check_out = request.args.get('checkOut')
+        if check_in:
+            check_in = datetime.strptime(check_in, '%Y-%m-%d').date()
+        if check_out:
+            check_out = datetime.strptime(check_out, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    location = request.args.get('location') or None
+
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        hotels, next_cursor = hotel_search.search(
+            conn,
+            location=location,
+            min_price=min_price,
+            max_price=max_price,
+            min_rating=min_rating,
+            check_in=check_in or None,
+            check_out=check_out or None,
+            sort=request.args.get('sort', hotel_search.DEFAULT_SORT),
+            limit=request.args.get('limit', hotel_search.DEFAULT_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
+        facets = hotel_search.facet_cache.facets(
+            conn,
+            location=location,
+            min_rating=min_rating,
+            min_price=min_price,
+            max_price=max_price
+        )
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'hotels': hotels})
+        return jsonify({
+            'success': True,
+            'hotels': hotels,
+            'nextCursor': next_cursor,
+            'facets': facets
+        })
         
+    except hotel_search.SearchError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
@@ -633,21 +2303,17 @@ def calculate_booking_cost():
     """Calculate booking cost using FUNCTION (CalculateBookingCost)"""
     try:
         data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # CalculateBookingCost walks the nights with a recursive CTE
+        check_in, check_out = pricing.check_stay(data['checkInDate'], data['checkOutDate'])
+        conn = get_db_connection(readonly=True)
         
         # Call the MySQL function
-        query = "SELECT CalculateBookingCost(%s, %s, %s) as total_cost"
-        cursor.execute(query, (
+        total_cost = queries.fetch_value(conn, 'calculate_booking_cost', (
             data['hotelId'],
-            data['checkInDate'],
-            data['checkOutDate']
-        ))
-        
-        result = cursor.fetchone()
-        total_cost = result[0] if result else 0
+            check_in,
+            check_out
+        )) or 0
         
-        cursor.close()
         conn.close()
         
         return jsonify({
@@ -655,40 +2321,210 @@ def calculate_booking_cost():
             'totalCost': float(total_cost)
         })
         
+    except pricing.PricingError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
-@app.route('/booking/create', methods=['POST'])
-def create_booking():
-    """Create new booking using STORED PROCEDURE (CreateNewBooking)
-    Triggers will execute automatically:
-    - PreventOverbooking: Checks hotel availability BEFORE insert
-    - UpdateUserBookingCount_INSERT: Updates user's total bookings AFTER insert
+@app.route('/booking/quote-batch', methods=['POST'])
+def quote_batch():
+    """Price many hotels for many stays in one call (pricing.py)
+    Body: {hotelIds: [...], ranges: [{checkInDate, checkOutDate}, ...]}
+    Every hotel gets one price per range, in the order given, with the
+    same rates and offers CalculateBookingCost applies.
     """
+    data = request.get_json(silent=True) or {}
+    try:
+        hotel_ids = pricing.check_hotels(data.get('hotelIds'))
+        stays = pricing.check_stays(data.get('ranges'))
+    except pricing.PricingError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        quotes = pricing.engine.quote(conn, hotel_ids, stays)
+        
+        conn.close()
+        
+        return jsonify({
+            'success': True,
+            'ranges': [
+                {'checkInDate': check_in.isoformat(), 'checkOutDate': check_out.isoformat()}
+                for check_in, check_out in stays
+            ],
+            'quotes': quotes
+        })
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/hotel/rates/<int:hotel_id>')
+def get_hotel_rates(hotel_id):
+    """Nightly rates overriding PricePerNight (READ - HotelRate)
+    Query params: from, to (YYYY-MM-DD, to exclusive, default: next 30 nights)
+    """
+    try:
+        start = datetime.strptime(request.args.get('from') or date.today().isoformat(), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('to') or (start + timedelta(days=30)).isoformat(), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'from/to must be YYYY-MM-DD'}), 400
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        rates = queries.fetch_all(conn, 'hotel_rates_range', (hotel_id, start, end))
+        
+        conn.close()
+        
+        return jsonify({
+            'success': True,
+            'hotelId': hotel_id,
+            'rates': [{'night': rate['Night'].isoformat(), 'price': float(rate['Price'])} for rate in rates]
+        })
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/hotel/rates/<int:hotel_id>', methods=['PUT'])
+def set_hotel_rates(hotel_id):
+    """Set the rate of the nights [fromDate, toDate) (UPDATE - HotelRate)
+    Body: {fromDate, toDate, price}; price null puts the nights back on PricePerNight
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        start = datetime.strptime(data['fromDate'], '%Y-%m-%d').date()
+        end = datetime.strptime(data['toDate'], '%Y-%m-%d').date()
+        price = None if data.get('price') is None else float(data['price'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'fromDate/toDate (YYYY-MM-DD) and price are required'}), 400
+    nights = (end - start).days
+    if nights <= 0 or nights > pricing.MAX_NIGHTS:
+        return jsonify({
+            'success': False,
+            'message': f"toDate must be 1 to {pricing.MAX_NIGHTS} nights after fromDate"
+        }), 400
+    if price is not None and price < 0:
+        return jsonify({'success': False, 'message': 'price must not be negative'}), 400
     try:
-        data = request.json
         conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': False,
-                'message': 'Database connection failed'
-            }), 500
         
+        if price is None:
+            queries.execute(conn, 'hotel_rate_clear', (hotel_id, start, end))
+        else:
+            queries.execute(conn, 'hotel_rate_set', (start, end, hotel_id, price, price))
+        
+        conn.commit()
+        conn.close()
+        pricing.engine.invalidate()
+        replicate_catalog()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Rates cleared' if price is None else 'Rates updated',
+            'nights': nights
+        })
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/hotel/availability/<int:hotel_id>')
+def get_hotel_availability(hotel_id):
+    """Rooms left per night from HotelNightInventory (READ)
+    Query params: checkIn, checkOut (YYYY-MM-DD, default: next 30 nights)
+    """
+    try:
+        check_in = request.args.get('checkIn') or date.today().isoformat()
+        check_in_date = datetime.strptime(check_in, '%Y-%m-%d').date()
+        check_out = request.args.get('checkOut') or (check_in_date + timedelta(days=30)).isoformat()
+        check_out_date = datetime.strptime(check_out, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD'}), 400
+    if check_out_date <= check_in_date:
+        return jsonify({'success': False, 'message': 'checkOut must be after checkIn'}), 400
+
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        hotel = queries.fetch_one(conn, 'hotel_rooms', (hotel_id,))
+        if not hotel:
+            conn.close()
+            return jsonify({'success': False, 'message': 'Hotel not found'}), 404
+        
+        rows = queries.fetch_all(conn, 'hotel_inventory_range', (hotel_id, check_in_date, check_out_date))
+        
+        conn.close()
+        
+        # Nights without an inventory row have never been booked
+        rooms = hotel['AvailableRooms'] or 1
+        inventory = {row['Night']: row for row in rows}
+        nights = []
+        night = check_in_date
+        while night < check_out_date:
+            row = inventory.get(night)
+            capacity = row['Capacity'] if row else rooms
+            booked = row['Booked'] if row else 0
+            nights.append({
+                'date': night.strftime('%Y-%m-%d'),
+                'capacity': capacity,
+                'booked': booked,
+                'available': capacity - booked
+            })
+            night += timedelta(days=1)
+        
+        return jsonify({
+            'success': True,
+            'hotelId': hotel_id,
+            'rooms': rooms,
+            'availableForStay': all(n['available'] > 0 for n in nights),
+            'nights': nights
+        })
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+def book_stay(user_id, hotel_id, check_in, check_out):
+    """CreateNewBooking on the user's shard -> (BookingID or 0, TotalPrice, message)
+    Triggers will execute automatically:
+    - PreventOverbooking: Claims a room for every night in HotelNightInventory BEFORE insert
+    - UpdateUserBookingCount_INSERT: Updates user's total bookings AFTER insert
+    On a shard other than 0 the nights are claimed on shard 0 first, under
+    an InventoryHold, and handed back if no booking comes of it (see
+    hold_hotel_nights). Raises
+    mysql.connector.Error when the nights are taken. Shared by
+    /booking/create and the waitlist.
+    """
+    shard = shard_map.for_user(user_id)
+    remote_inventory = not shard.is_catalog
+    stay = (hotel_id, check_in, check_out)
+    if remote_inventory:
+        hold_id = hold_hotel_nights(user_id, stay)
+    
+    try:
+        conn = get_db_connection(shard=shard)
+    except circuit_breaker.DatabaseUnavailable:
+        if remote_inventory:
+            end_hold(hold_id, stay, release=True)
+        raise
+    try:
         cursor = conn.cursor()
         
         # Call stored procedure
         # Note: PreventOverbooking trigger will fire BEFORE insert and prevent overbooking
         args = [
-            data['userId'],
-            data['hotelId'],
-            data['checkInDate'],
-            data['checkOutDate'],
+            user_id,
+            hotel_id,
+            check_in,
+            check_out,
             0,  # OUT parameter: BookingID
             0,  # OUT parameter: TotalPrice
             ''  # OUT parameter: Message
         ]
         
-        result = cursor.callproc('CreateNewBooking', args)
+        try:
+            result = cursor.callproc('CreateNewBooking', args)
+        except mysql.connector.Error:
+            if remote_inventory:
+                end_hold(hold_id, stay, release=True)
+            raise
         
         # Get OUT parameters
         booking_id = result[4]
@@ -697,7 +2533,35 @@ def create_booking():
         
         conn.commit()
         cursor.close()
+        if remote_inventory:
+            end_hold(hold_id, stay, release=booking_id <= 0)
+        if booking_id > 0:
+            # TotalBookings of the profile
+            entity_cache.cache.invalidate(entity_cache.USER, user_id)
+            publish_booking(conn, 'booking.created', booking_id)
+    finally:
         conn.close()
+    return booking_id, total_price, message
+
+def is_unavailable_error(err):
+    """True for the PreventOverbooking rejection (SQLSTATE 45000)"""
+    error_msg = str(err)
+    return '45000' in error_msg or 'Hotel is not available' in error_msg or 'not available for selected dates' in error_msg
+
+@app.route('/booking/create', methods=['POST'])
+def create_booking():
+    """Create new booking using STORED PROCEDURE (CreateNewBooking), see book_stay
+    With "waitlist": true (and optional "priority") a stay whose nights
+    are taken goes on the waitlist instead of failing.
+    """
+    try:
+        data = request.json
+        # Stays past pricing.MAX_NIGHTS would also outrun the recursive CTE
+        # of CalculateBookingCost (cte_max_recursion_depth)
+        check_in, check_out = pricing.check_stay(data['checkInDate'], data['checkOutDate'])
+        booking_id, total_price, message = book_stay(
+            data['userId'], data['hotelId'], check_in, check_out
+        )
         
         return jsonify({
             'success': booking_id > 0,
@@ -706,12 +2570,19 @@ def create_booking():
             'totalPrice': float(total_price)
         })
         
+    except pricing.PricingError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
     except mysql.connector.Error as err:
         error_msg = str(err)
         error_code = err.errno if hasattr(err, 'errno') else None
         
         # Handle trigger errors (PreventOverbooking trigger raises SQLSTATE 45000)
-        if '45000' in error_msg or 'Hotel is not available' in error_msg or 'not available for selected dates' in error_msg:
+        if is_unavailable_error(err):
+            if data.get('waitlist'):
+                try:
+                    return join_waitlist_response(data)
+                except mysql.connector.Error as join_err:
+                    return jsonify({'success': False, 'message': str(join_err)}), 400
             return jsonify({
                 'success': False,
                 'message': 'Hotel is not available for selected dates. Please choose different dates.'
@@ -722,6 +2593,8 @@ def create_booking():
             'success': False,
             'message': f'Error: {error_msg}'
         }), 400
+    except circuit_breaker.DatabaseUnavailable:
+        raise
     except Exception as e:
         return jsonify({
             'success': False,
@@ -731,8 +2604,12 @@ def create_booking():
 @app.route('/booking/details/<int:booking_id>')
 def get_booking_details(booking_id):
     """Get booking details using STORED PROCEDURE (GetBookingDetails)"""
+    booking = entity_cache.cache.get(entity_cache.BOOKING, booking_id)
+    if booking is not None:
+        return jsonify({'success': True, 'booking': booking})
+    started = cache_fill_stamp()
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(readonly=True, shard=shard_map.for_id(booking_id))
         cursor = conn.cursor(dictionary=True)
         
         # Call stored procedure
@@ -746,6 +2623,7 @@ def get_booking_details(booking_id):
         conn.close()
         
         if booking:
+            entity_cache.cache.fill(entity_cache.BOOKING, booking_id, booking, started)
             return jsonify({'success': True, 'booking': booking})
         else:
             return jsonify({'success': False, 'message': 'Booking not found'}), 404
@@ -753,88 +2631,45 @@ def get_booking_details(booking_id):
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+def format_booking_date(value):
+    """YYYY-MM-DD for a booking date (date, datetime or string), else None"""
+    if not value:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, str) and value.strip() not in ('None', 'null', 'NULL', ''):
+        # Try to parse and reformat if it's a string
+        try:
+            # Try ISO format first
+            if len(value) >= 10:
+                return datetime.strptime(value[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+            return None
+        except ValueError:
+            try:
+                # Try parsing as datetime string
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+            except ValueError:
+                return None
+    return None
+
 @app.route('/bookings/user/<int:user_id>')
 def get_user_bookings(user_id):
     """Get all bookings for a user (READ - with JOIN)"""
+    fields, compact = requested_shape('user_bookings')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_user(user_id))
         
-        query = """
-        SELECT 
-            b.BookingID,
-            b.CheckInDate,
-            b.CheckOutDate,
-            b.TotalPrice,
-            b.BookingStatus,
-            b.BookingDate,
-            h.Name AS HotelName,
-            h.Location AS HotelLocation,
-            h.Rating AS HotelRating
-        FROM Booking b
-        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
-        WHERE b.UserID = %s
-        ORDER BY b.BookingDate DESC
-        """
-        cursor.execute(query, (user_id,))
-        bookings = cursor.fetchall()
+        bookings = queries.fetch_projected(conn, 'user_bookings', fields, (user_id,))
         
         # Format dates to ensure consistent YYYY-MM-DD format
         for booking in bookings:
-            # Format CheckInDate
-            if booking['CheckInDate']:
-                if isinstance(booking['CheckInDate'], (datetime, date)):
-                    booking['CheckInDate'] = booking['CheckInDate'].strftime('%Y-%m-%d')
-                elif isinstance(booking['CheckInDate'], str) and booking['CheckInDate'].strip() not in ('None', 'null', 'NULL', ''):
-                    # Try to parse and reformat if it's a string
-                    try:
-                        # Try ISO format first
-                        if len(booking['CheckInDate']) >= 10:
-                            date_obj = datetime.strptime(booking['CheckInDate'][:10], '%Y-%m-%d')
-                            booking['CheckInDate'] = date_obj.strftime('%Y-%m-%d')
-                        else:
-                            booking['CheckInDate'] = None
-                    except:
-                        try:
-                            # Try parsing as datetime string
-                            date_obj = datetime.fromisoformat(booking['CheckInDate'].replace('Z', '+00:00'))
-                            booking['CheckInDate'] = date_obj.strftime('%Y-%m-%d')
-                        except:
-                            booking['CheckInDate'] = None
-                else:
-                    booking['CheckInDate'] = None
-            else:
-                booking['CheckInDate'] = None
-                
-            # Format CheckOutDate
-            if booking['CheckOutDate']:
-                if isinstance(booking['CheckOutDate'], (datetime, date)):
-                    booking['CheckOutDate'] = booking['CheckOutDate'].strftime('%Y-%m-%d')
-                elif isinstance(booking['CheckOutDate'], str) and booking['CheckOutDate'].strip() not in ('None', 'null', 'NULL', ''):
-                    # Try to parse and reformat if it's a string
-                    try:
-                        # Try ISO format first
-                        if len(booking['CheckOutDate']) >= 10:
-                            date_obj = datetime.strptime(booking['CheckOutDate'][:10], '%Y-%m-%d')
-                            booking['CheckOutDate'] = date_obj.strftime('%Y-%m-%d')
-                        else:
-                            booking['CheckOutDate'] = None
-                    except:
-                        try:
-                            # Try parsing as datetime string
-                            date_obj = datetime.fromisoformat(booking['CheckOutDate'].replace('Z', '+00:00'))
-                            booking['CheckOutDate'] = date_obj.strftime('%Y-%m-%d')
-                        except:
-                            booking['CheckOutDate'] = None
-                else:
-                    booking['CheckOutDate'] = None
-            else:
-                booking['CheckOutDate'] = None
+            for column in ('CheckInDate', 'CheckOutDate'):
+                if column in booking:
+                    booking[column] = format_booking_date(booking[column])
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'bookings': bookings})
+        return jsonify({'success': True, 'bookings': shaped(bookings, 'user_bookings', fields, compact)})
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -843,7 +2678,8 @@ def get_user_bookings(user_id):
 def cancel_booking(booking_id):
     """Cancel booking using STORED PROCEDURE (CancelBooking) - Triggers will execute automatically"""
     try:
-        conn = get_db_connection()
+        shard = shard_map.for_id(booking_id)
+        conn = get_db_connection(shard=shard)
         cursor = conn.cursor()
         
         # Call stored procedure
@@ -855,11 +2691,25 @@ def cancel_booking(booking_id):
         
         conn.commit()
         cursor.close()
+        if 'successfully' in message.lower():
+            stay = queries.fetch_one(conn, 'booking_stay', (booking_id,))
+            # Nights the cancellation owes shard 0 (InventoryRelease)
+            settle_after_cancel([shard])
+            entity_cache.cache.patch(entity_cache.BOOKING, booking_id, {'BookingStatus': 'Cancelled'})
+            entity_cache.cache.invalidate(entity_cache.PAYMENT, booking_id)
+            if stay:
+                entity_cache.cache.invalidate(entity_cache.USER, stay['UserID'])
+            publish_booking(conn, 'booking.cancelled', booking_id)
         conn.close()
         
+        waitlisted = []
+        if 'successfully' in message.lower() and stay and stay['HotelID'] is not None:
+            waitlisted = reallocate_waitlist([(stay['HotelID'], stay['CheckInDate'], stay['CheckOutDate'])])
+        
         return jsonify({
             'success': 'successfully' in message.lower(),
-            'message': message
+            'message': message,
+            'waitlistBooked': waitlisted
         })
         
     except mysql.connector.Error as err:
@@ -872,36 +2722,231 @@ def cancel_booking(booking_id):
             }), 400
         return jsonify({'success': False, 'message': error_msg}), 400
 
+# Columns of a 'booking.cancelled' event (same as the booking_feed_row query)
+BOOKING_FEED_COLUMNS = (
+    'BookingID', 'UserID', 'CheckInDate', 'CheckOutDate', 'TotalPrice', 'BookingStatus',
+    'BookingDate', 'HotelName', 'HotelLocation', 'HotelRating',
+)
+
+@app.route('/bookings/cancel-bulk', methods=['POST'])
+def bulk_cancel_bookings():
+    """Cancel every Confirmed booking matching a filter (STORED PROCEDURE BulkCancelBookings)
+    Body: {hotelId, fromDate, toDate, userId, includePast}, at least one of
+    the first four; a booking matches when it has a night from fromDate
+    through toDate. Without fromDate only stays that have not ended yet
+    match, unless includePast is true.
+    One UPDATE and one BookingAudit INSERT per shard instead of a
+    CancelBooking call per booking. Returns one result per matched booking.
+    Sharded, the procedure runs on the user's shard (userId) or on every
+    shard, and nights of bookings cancelled outside shard 0 are released
+    there afterwards (see settle_inventory_releases). Shards that fail are
+    listed under failedShards; the others' cancellations are reported as
+    usual, since they have committed.
+    """
+    data = request.get_json(silent=True) or {}
+    args = [data.get(key) or None for key in ('hotelId', 'fromDate', 'toDate', 'userId')]
+    if not any(args):
+        return jsonify({
+            'success': False,
+            'message': 'Give at least one of hotelId, fromDate, toDate, userId'
+        }), 400
+    if args[1] is None and not data.get('includePast'):
+        # Same as CheckOutDate > CURDATE() in the procedure
+        args[1] = date.today().isoformat()
+
+    def cancel_on(shard, conn):
+        cursor = conn.cursor(dictionary=True)
+        cursor.callproc('BulkCancelBookings', args + [0])
+        rows = []
+        for result in cursor.stored_results():
+            rows = result.fetchall()
+        cursor.close()
+        return shard, rows
+
+    failed = []
+    try:
+        if args[3] is not None:
+            shard = shard_map.for_user(args[3])
+            conn = get_db_connection(shard=shard)
+            try:
+                parts = [cancel_on(shard, conn)]
+            finally:
+                conn.close()
+        else:
+            # Every shard commits on its own: one failing must not hide the others
+            parts = []
+            for shard, part in zip(shard_map.shards, fan_out(cancel_on, readonly=False, return_errors=True)):
+                if isinstance(part, Exception):
+                    print(f"Bulk cancellation failed on {shard.name}: {part}")
+                    failed.append((shard, part))
+                else:
+                    parts.append(part)
+            if not parts:
+                # Nothing committed anywhere: answered like the unsharded call
+                raise failed[0][1]
+
+        results = []
+        cancelled_users = set()
+        for shard, rows in parts:
+            for row in rows:
+                cancelled = row.pop('OldStatus') == 'Confirmed'
+                if cancelled:
+                    entity_cache.cache.patch(entity_cache.BOOKING, row['BookingID'], {'BookingStatus': 'Cancelled'})
+                    entity_cache.cache.invalidate(entity_cache.PAYMENT, row['BookingID'])
+                    cancelled_users.add(row['UserID'])
+                    change_feed.feed.publish(
+                        'booking.cancelled',
+                        {column: row[column] for column in BOOKING_FEED_COLUMNS},
+                        user_id=row['UserID']
+                    )
+                results.append({
+                    'BookingID': row['BookingID'],
+                    'UserID': row['UserID'],
+                    'HotelID': row['HotelID'],
+                    'CheckInDate': row['CheckInDate'],
+                    'CheckOutDate': row['CheckOutDate'],
+                    'BookingStatus': row['BookingStatus'],
+                    'success': cancelled,
+                    'message': row['Message'],
+                })
+        entity_cache.cache.invalidate(entity_cache.USER, *cancelled_users)
+        # Nights of bookings cancelled outside shard 0, one transaction per batch there
+        settle_after_cancel([shard for shard, _rows in parts])
+        results.sort(key=lambda result: result['BookingID'])
+
+        waitlisted = reallocate_waitlist([
+            (result['HotelID'], result['CheckInDate'], result['CheckOutDate'])
+            for result in results if result['success'] and result['HotelID'] is not None
+        ])
+
+        cancelled_count = sum(1 for result in results if result['success'])
+        message = f'{cancelled_count} of {len(results)} matching bookings cancelled'
+        if failed:
+            message += (f"; failed on {', '.join(shard.name for shard, _err in failed)}"
+                        " (retry with the same filter)")
+        return jsonify({
+            'success': not failed,
+            'message': message,
+            'cancelled': cancelled_count,
+            'results': results,
+            'failedShards': [{'shard': shard.name, 'message': str(err)} for shard, err in failed],
+            'waitlistBooked': waitlisted
+        })
+
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
 # ============================================
-# ROUTES - AUDIT LOGS & PAYMENT TRANSACTIONS (Trigger Results)
+# ROUTES - WAITLIST
 # ============================================
+# Stays turned away by PreventOverbooking wait on the catalog shard and are
+# booked through book_stay when cancellations free their nights, see
+# waitlist.py (WAITLIST_ORDER environment variable).
 
-@app.route('/audit/bookings')
-def get_booking_audit_logs():
-    """Get booking audit logs created by AuditBookingStatusChange trigger"""
+def reallocate_waitlist(stays):
+    """Book waitlisted requests fitting the freed (hotel, check-in, check-out)
+    stays; the waitlist failing never fails the cancellation itself
+    """
+    try:
+        return waitlist.waitlist.freed(stays, get_db_connection, book_stay)
+    except (mysql.connector.Error, circuit_breaker.DatabaseUnavailable, shards.ShardError) as err:
+        print(f"Waitlist allocation failed: {err}")
+        return []
+
+def join_waitlist_response(data):
+    """Put a stay on the waitlist; 202 with its WaitlistID"""
+    try:
+        user_id, hotel_id = int(data['userId']), int(data['hotelId'])
+        check_in, check_out = waitlist.check_stay(data['checkInDate'], data['checkOutDate'])
+        priority = int(data.get('priority') or 0)
+    except waitlist.WaitlistError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'userId, hotelId, checkInDate and checkOutDate are required'
+        }), 400
+    
+    conn = get_db_connection()
+    try:
+        waitlist_id = waitlist.waitlist.join(conn, user_id, hotel_id, check_in, check_out, priority)
+    finally:
+        conn.close()
+    # Nights freed between the rejection and the join would be missed otherwise
+    booked = reallocate_waitlist([(hotel_id, check_in, check_out)])
+    booking = next((entry for entry in booked if entry['WaitlistID'] == waitlist_id), None)
+    if booking is not None:
+        return jsonify({
+            'success': True,
+            'message': booking['message'],
+            'bookingId': booking['BookingID'],
+            'totalPrice': float(booking['TotalPrice'])
+        })
+    return jsonify({
+        'success': False,
+        'waitlisted': True,
+        'waitlistId': waitlist_id,
+        'message': 'Hotel is not available for selected dates. You are on the waitlist and will be booked if the nights free up.'
+    }), 202
+
+@app.route('/waitlist/join', methods=['POST'])
+def join_waitlist():
+    """Waitlist a stay without trying to book it first
+    Body: {userId, hotelId, checkInDate, checkOutDate, priority (optional)}
+    """
+    try:
+        return join_waitlist_response(request.get_json(silent=True) or {})
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/waitlist/user/<int:user_id>')
+def get_user_waitlist(user_id):
+    """A user's waitlisted stays, newest first, with their outcome"""
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        entries = queries.fetch_all(conn, 'waitlist_by_user', (user_id,))
+        
+        conn.close()
+        
+        return jsonify({'success': True, 'waitlist': entries})
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/waitlist/<int:waitlist_id>', methods=['DELETE'])
+def withdraw_from_waitlist(waitlist_id):
+    """Take a waiting stay off the waitlist (query param: userId)"""
+    user_id = request.args.get('userId', type=int)
+    if user_id is None:
+        return jsonify({'success': False, 'message': 'userId is required'}), 400
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
         
-        query = """
-        SELECT 
-            AuditID,
-            BookingID,
-            ActionType,
-            OldStatus,
-            NewStatus,
-            ChangeDate,
-            UserEmail
-        FROM BookingAudit
-        ORDER BY ChangeDate DESC
-        LIMIT 100
-        """
-        cursor.execute(query)
-        audit_logs = cursor.fetchall()
+        withdrawn = waitlist.waitlist.withdraw(conn, waitlist_id, user_id)
         
-        cursor.close()
         conn.close()
         
+        if not withdrawn:
+            return jsonify({'success': False, 'message': 'No waiting request with this ID for this user'}), 404
+        return jsonify({'success': True, 'message': 'Removed from the waitlist'})
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+# ============================================
+# ROUTES - AUDIT LOGS & PAYMENT TRANSACTIONS (Trigger Results)
+# ============================================
+
+@app.route('/audit/bookings')
+def get_booking_audit_logs():
+    """Get booking audit logs created by AuditBookingStatusChange trigger"""
+    try:
+        audit_logs = shards.merge_sorted(
+            fan_out(lambda _shard, conn: queries.fetch_all(conn, 'audit_recent')),
+            key=lambda row: row['ChangeDate'], reverse=True, limit=100
+        )
+        
         return jsonify({'success': True, 'auditLogs': audit_logs})
         
     except mysql.connector.Error as err:
@@ -911,26 +2956,10 @@ def get_booking_audit_logs():
 def get_booking_audit_by_id(booking_id):
     """Get audit logs for a specific booking"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_id(booking_id))
         
-        query = """
-        SELECT 
-            AuditID,
-            BookingID,
-            ActionType,
-            OldStatus,
-            NewStatus,
-            ChangeDate,
-            UserEmail
-        FROM BookingAudit
-        WHERE BookingID = %s
-        ORDER BY ChangeDate DESC
-        """
-        cursor.execute(query, (booking_id,))
-        audit_logs = cursor.fetchall()
+        audit_logs = queries.fetch_all(conn, 'audit_by_booking', (booking_id,))
         
-        cursor.close()
         conn.close()
         
         return jsonify({'success': True, 'auditLogs': audit_logs})
@@ -941,32 +2970,13 @@ def get_booking_audit_by_id(booking_id):
 @app.route('/payments/transactions')
 def get_payment_transactions():
     """Get payment transactions created by CreatePaymentOnBooking trigger"""
+    fields, compact = requested_shape('payments_recent')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT 
-            pt.TransactionID,
-            pt.BookingID,
-            pt.Amount,
-            pt.PaymentStatus,
-            pt.TransactionDate,
-            b.UserID,
-            h.Name AS HotelName
-        FROM PaymentTransaction pt
-        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
-        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
-        ORDER BY pt.TransactionDate DESC
-        LIMIT 100
-        """
-        cursor.execute(query)
-        transactions = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        transactions = merged_report('payments_recent', fields, lambda parts: shards.merge_sorted(
+            parts, key=lambda row: row['TransactionDate'], reverse=True, limit=100
+        ))
         
-        return jsonify({'success': True, 'transactions': transactions})
+        return rowset_response({'success': True}, 'transactions', transactions, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -974,32 +2984,19 @@ def get_payment_transactions():
 @app.route('/payments/transactions/booking/<int:booking_id>')
 def get_payment_by_booking(booking_id):
     """Get payment transaction for a specific booking"""
+    transaction = entity_cache.cache.get(entity_cache.PAYMENT, booking_id)
+    if transaction is not None:
+        return jsonify({'success': True, 'transaction': transaction})
+    started = cache_fill_stamp()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_id(booking_id))
         
-        query = """
-        SELECT 
-            pt.TransactionID,
-            pt.BookingID,
-            pt.Amount,
-            pt.PaymentStatus,
-            pt.TransactionDate,
-            b.UserID,
-            h.Name AS HotelName
-        FROM PaymentTransaction pt
-        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
-        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
-        WHERE pt.BookingID = %s
-        ORDER BY pt.TransactionDate DESC
-        """
-        cursor.execute(query, (booking_id,))
-        transaction = cursor.fetchone()
+        transaction = queries.fetch_one(conn, 'payment_by_booking', (booking_id,))
         
-        cursor.close()
         conn.close()
         
         if transaction:
+            entity_cache.cache.fill(entity_cache.PAYMENT, booking_id, transaction, started)
             return jsonify({'success': True, 'transaction': transaction})
         else:
             return jsonify({'success': False, 'message': 'Payment transaction not found'}), 404
@@ -1010,33 +3007,15 @@ def get_payment_by_booking(booking_id):
 @app.route('/payments/transactions/user/<int:user_id>')
 def get_user_payments(user_id):
     """Get all payment transactions for a user"""
+    fields, compact = requested_shape('payments_by_user')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_user(user_id))
         
-        query = """
-        SELECT 
-            pt.TransactionID,
-            pt.BookingID,
-            pt.Amount,
-            pt.PaymentStatus,
-            pt.TransactionDate,
-            h.Name AS HotelName,
-            b.CheckInDate,
-            b.CheckOutDate
-        FROM PaymentTransaction pt
-        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
-        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
-        WHERE b.UserID = %s
-        ORDER BY pt.TransactionDate DESC
-        """
-        cursor.execute(query, (user_id,))
-        transactions = cursor.fetchall()
+        transactions = queries.fetch_projected(conn, 'payments_by_user', fields, (user_id,))
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'transactions': transactions})
+        return jsonify({'success': True, 'transactions': shaped(transactions, 'payments_by_user', fields, compact)})
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -1055,29 +3034,24 @@ def update_payment_status(transaction_id):
                 'message': 'Invalid status. Must be Pending, Completed, or Failed'
             }), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_db_connection(shard=shard_map.for_id(transaction_id))
         
-        query = """
-        UPDATE PaymentTransaction 
-        SET PaymentStatus = %s 
-        WHERE TransactionID = %s
-        """
-        cursor.execute(query, (new_status, transaction_id))
+        result = queries.execute(conn, 'payment_update_status', (new_status, transaction_id))
         
-        if cursor.rowcount == 0:
+        if result.rowcount == 0:
             conn.rollback()
-            cursor.close()
             conn.close()
             return jsonify({
                 'success': False,
                 'message': 'Transaction not found'
             }), 404
         
+        booking_id = queries.fetch_value(conn, 'payment_booking_id', (transaction_id,))
         conn.commit()
-        cursor.close()
         conn.close()
         
+        entity_cache.cache.invalidate(entity_cache.PAYMENT, booking_id)
+        
         return jsonify({
             'success': True,
             'message': 'Payment status updated successfully'
@@ -1093,20 +3067,23 @@ def update_payment_status(transaction_id):
 @app.route('/destinations')
 def get_destinations():
     """Get all destinations (READ)"""
+    fields, compact = requested_shape('destinations_all')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True)
         
-        query = "SELECT * FROM Destination ORDER BY Name"
-        cursor.execute(query)
-        destinations = cursor.fetchall()
+        destinations = queries.fetch_projected(conn, 'destinations_all', fields)
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'destinations': destinations})
+        if fields is None:
+            catalog_snapshots.save('destinations', destinations)
+        return jsonify({'success': True, 'destinations': shaped(destinations, 'destinations_all', fields, compact)})
         
+    except circuit_breaker.DatabaseUnavailable as err:
+        return snapshot_response('destinations', err, 'destinations_all')
     except mysql.connector.Error as err:
+        if circuit_breaker.is_connectivity_error(err):
+            return snapshot_response('destinations', err, 'destinations_all')
         return jsonify({'success': False, 'message': str(err)}), 400
 
 @app.route('/destination/create', methods=['POST'])
@@ -1115,26 +3092,34 @@ def create_destination():
     try:
         data = request.json
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        query = """
-        INSERT INTO Destination (Name, Location, Type, Description, Rating)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (
+        result = queries.execute(conn, 'destination_insert', (
             data['name'],
             data['location'],
             data['type'],
             data['description'],
-            data['rating']
+            data['rating'],
+            data.get('latitude'),
+            data.get('longitude')
         ))
         
         conn.commit()
-        dest_id = cursor.lastrowid
+        dest_id = result.lastrowid
         
-        cursor.close()
         conn.close()
         
+        change_feed.feed.publish('destination.created', {
+            'DestID': dest_id,
+            'Name': data['name'],
+            'Location': data['location'],
+            'Type': data['type'],
+            'Description': data['description'],
+            'Rating': data['rating'],
+            'Latitude': data.get('latitude'),
+            'Longitude': data.get('longitude'),
+        })
+        replicate_catalog()
+        
         return jsonify({
             'success': True,
             'message': 'Destination created successfully',
@@ -1149,37 +3134,106 @@ def delete_destination(dest_id):
     """Delete a destination and related itinerary references"""
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
 
-        cursor.execute("DELETE FROM Includes WHERE DestID = %s", (dest_id,))
-        cursor.execute("DELETE FROM Destination WHERE DestID = %s", (dest_id,))
+        includes = queries.execute(conn, 'includes_delete_by_destination', (dest_id,))
+        queries.execute(conn, 'destination_delete', (dest_id,))
 
         conn.commit()
-        cursor.close()
+        recommender.recommender.destination_removed(conn, dest_id, includes.rowcount)
         conn.close()
+        
+        change_feed.feed.publish('destination.deleted', {'DestID': dest_id})
+        replicate_catalog()
 
         return jsonify({'success': True, 'message': 'Destination deleted successfully'})
 
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
-@app.route('/destination/popularity/<int:dest_id>')
-def check_destination_popularity(dest_id):
-    """Check destination popularity using FUNCTION (IsDestinationPopular)"""
+@app.route('/admin/catalog/sync', methods=['POST'])
+def sync_catalog():
+    """Apply a full supplier feed to Destination/Availability/Activity/Transport
+    Body: {destinations: [...], availability: [...], activities: [...], transport: [...]}
+    (see catalog_sync.py). Query params: dryRun=1, prune=0 (keep rows missing from the feed)
+    """
     try:
         conn = get_db_connection()
-        cursor = conn.cursor()
         
-        query = "SELECT IsDestinationPopular(%s) as popularity"
-        cursor.execute(query, (dest_id,))
-        result = cursor.fetchone()
+        summary = catalog_sync.sync(
+            conn,
+            request.get_json(silent=True),
+            prune=request.args.get('prune', '1') != '0',
+            dry_run=request.args.get('dryRun', '0') == '1'
+        )
+        
+        conn.close()
+        if not summary['dryRun']:
+            replicate_catalog()
+        
+        return jsonify({'success': True, 'summary': summary})
+        
+    except catalog_sync.CatalogSyncError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/destinations/recommend')
+def recommend_destinations():
+    """Destinations to add to a partial itinerary
+    Query params: destinations (comma separated DestIDs), limit (default 5)
+    """
+    try:
+        selected = request.args.get('destinations', '')
+        dest_ids = [int(dest_id) for dest_id in selected.split(',') if dest_id.strip()]
+    except ValueError:
+        return jsonify({'success': False, 'message': 'destinations must be comma separated DestIDs'}), 400
+
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        picks = recommender.recommender.recommend(
+            conn, dest_ids, request.args.get('limit', recommender.DEFAULT_LIMIT, type=int)
+        )
+        details = {}
+        if picks:
+            placeholders = ', '.join(['%s'] * len(picks))
+            rows = queries.fetch_dynamic(
+                conn, 'destinations_by_ids',
+                f"SELECT * FROM Destination WHERE DestID IN ({placeholders})",
+                tuple(dest_id for dest_id, _score, _reason in picks)
+            )
+            details = {row['DestID']: row for row in rows}
         
-        cursor.close()
         conn.close()
         
+        recommendations = [
+            dict(details[dest_id], Score=score, Reason=reason)
+            for dest_id, score, reason in picks
+            if dest_id in details
+        ]
+        return jsonify({'success': True, 'recommendations': recommendations})
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/destination/popularity/<int:dest_id>')
+def check_destination_popularity(dest_id):
+    """Check destination popularity using FUNCTION (IsDestinationPopular)"""
+    try:
+        if shard_map.sharded:
+            # The function only sees its own shard's itineraries
+            counts = fan_out(lambda _shard, conn: queries.fetch_value(conn, 'destination_include_count', (dest_id,)))
+            popularity = popularity_status(sum(counts))
+        else:
+            conn = get_db_connection(readonly=True)
+            
+            popularity = queries.fetch_value(conn, 'destination_popularity', (dest_id,))
+            
+            conn.close()
+        
         return jsonify({
             'success': True,
-            'popularity': result[0]
+            'popularity': popularity
         })
         
     except mysql.connector.Error as err:
@@ -1188,8 +3242,7 @@ def check_destination_popularity(dest_id):
 @app.route('/destination/itineraries/<int:dest_id>')
 def get_destination_itineraries(dest_id):
     """Get itineraries for destination using STORED PROCEDURE"""
-    try:
-        conn = get_db_connection()
+    def shard_itineraries(_shard, conn):
         cursor = conn.cursor(dictionary=True)
         
         cursor.callproc('GetDestinationItineraries', [dest_id])
@@ -1199,7 +3252,10 @@ def get_destination_itineraries(dest_id):
             itineraries = result.fetchall()
         
         cursor.close()
-        conn.close()
+        return itineraries
+    
+    try:
+        itineraries = shards.merge_sorted(fan_out(shard_itineraries), key=lambda row: row['StartDate'])
         
         return jsonify({'success': True, 'itineraries': itineraries})
         
@@ -1213,17 +3269,18 @@ def get_destination_itineraries(dest_id):
 @app.route('/itinerary/create', methods=['POST'])
 def create_itinerary():
     """Create new itinerary (CREATE - Itinerary + Includes tables)"""
+    data = request.json
     try:
-        data = request.json
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        # The SPA sends option values (strings); the recommender keys on ints
+        dest_ids = [int(dest_id) for dest_id in data.get('destinations') or []]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'destinations must be DestIDs'}), 400
+    try:
+        shard = shard_map.for_user(data['userId'])
+        conn = get_db_connection(shard=shard)
         
         # Insert itinerary
-        query = """
-        INSERT INTO Itinerary (UserID, Title, StartDate, EndDate, TotalCost)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(query, (
+        result = queries.execute(conn, 'itinerary_insert', (
             data['userId'],
             data['title'],
             data['startDate'],
@@ -1231,18 +3288,22 @@ def create_itinerary():
             data['totalCost']
         ))
         
-        itinerary_id = cursor.lastrowid
+        itinerary_id = result.lastrowid
         
         # Insert destinations into Includes table
-        if 'destinations' in data and len(data['destinations']) > 0:
-            includes_query = "INSERT INTO Includes (ItineraryID, DestID) VALUES (%s, %s)"
-            for dest_id in data['destinations']:
-                cursor.execute(includes_query, (itinerary_id, dest_id))
+        for dest_id in dest_ids:
+            queries.execute(conn, 'includes_insert', (itinerary_id, dest_id))
         
         conn.commit()
-        cursor.close()
+        # The recommender models shard 0's Includes only
+        if shard.is_catalog:
+            recommender.recommender.itinerary_added(conn, dest_ids)
+        itinerary = queries.fetch_one(conn, 'itinerary_feed_row', (itinerary_id,))
         conn.close()
         
+        if itinerary:
+            change_feed.feed.publish('itinerary.created', itinerary, user_id=itinerary['UserID'])
+        
         return jsonify({
             'success': True,
             'message': 'Itinerary created successfully',
@@ -1255,50 +3316,41 @@ def create_itinerary():
 @app.route('/itineraries/user/<int:user_id>')
 def get_user_itineraries(user_id):
     """Get all itineraries for a user (READ with JOIN)"""
+    fields, compact = requested_shape('itineraries_by_user')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True, shard=shard_map.for_user(user_id))
         
-        query = """
-        SELECT 
-            i.ItineraryID,
-            i.Title,
-            i.StartDate,
-            i.EndDate,
-            i.TotalCost,
-            GROUP_CONCAT(d.Name SEPARATOR ', ') AS Destinations
-        FROM Itinerary i
-        LEFT JOIN Includes inc ON i.ItineraryID = inc.ItineraryID
-        LEFT JOIN Destination d ON inc.DestID = d.DestID
-        WHERE i.UserID = %s
-        GROUP BY i.ItineraryID
-        ORDER BY i.StartDate DESC
-        """
-        cursor.execute(query, (user_id,))
-        itineraries = cursor.fetchall()
+        itineraries = queries.fetch_projected(conn, 'itineraries_by_user', fields, (user_id,))
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'itineraries': itineraries})
+        return jsonify({'success': True, 'itineraries': shaped(itineraries, 'itineraries_by_user', fields, compact)})
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
 @app.route('/itinerary/delete/<int:itinerary_id>', methods=['DELETE'])
 def delete_itinerary(itinerary_id):
-    """Delete itinerary (DELETE - cascades to Includes)"""
+    """Delete itinerary and its Includes rows"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        shard = shard_map.for_id(itinerary_id)
+        conn = get_db_connection(shard=shard)
         
-        query = "DELETE FROM Itinerary WHERE ItineraryID = %s"
-        cursor.execute(query, (itinerary_id,))
+        # Includes rows are deleted explicitly (not by cascade) so their
+        # triggers fire and the recommender can be updated in place
+        itinerary = queries.fetch_one(conn, 'itinerary_by_id', (itinerary_id,))
+        dest_ids = [row['DestID'] for row in queries.fetch_all(conn, 'includes_by_itinerary', (itinerary_id,))]
+        queries.execute(conn, 'includes_delete_by_itinerary', (itinerary_id,))
+        queries.execute(conn, 'itinerary_delete', (itinerary_id,))
         
         conn.commit()
-        cursor.close()
+        if shard.is_catalog:
+            recommender.recommender.itinerary_removed(conn, dest_ids)
         conn.close()
         
+        if itinerary:
+            change_feed.feed.publish('itinerary.deleted', {'ItineraryID': itinerary_id}, user_id=itinerary['UserID'])
+        
         return jsonify({
             'success': True,
             'message': 'Itinerary deleted successfully'
@@ -1307,6 +3359,256 @@ def delete_itinerary(itinerary_id):
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+@app.route('/itinerary/<int:itinerary_id>/schedule')
+def schedule_itinerary(itinerary_id):
+    """Pack the itinerary's destination activities into days
+    Query params: dailyMinutes (default 480), budget (default TotalCost)
+    """
+    try:
+        conn = get_db_connection(readonly=True, shard=shard_map.for_id(itinerary_id))
+        
+        itinerary = queries.fetch_one(conn, 'itinerary_by_id', (itinerary_id,))
+        if not itinerary:
+            conn.close()
+            return jsonify({'success': False, 'message': 'Itinerary not found'}), 404
+        
+        activities = queries.fetch_all(conn, 'itinerary_activities', (itinerary_id,))
+        
+        conn.close()
+        
+        plan = activity_scheduler.schedule(
+            activities,
+            itinerary['StartDate'],
+            itinerary['EndDate'],
+            budget=request.args.get('budget', itinerary['TotalCost'], type=float),
+            daily_minutes=request.args.get(
+                'dailyMinutes', activity_scheduler.DEFAULT_DAILY_MINUTES, type=int)
+        )
+        
+        return jsonify({
+            'success': True,
+            'itineraryId': itinerary_id,
+            'title': itinerary['Title'],
+            'schedule': plan
+        })
+        
+    except activity_scheduler.ScheduleError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+def optimizer_hotels(conn, dest_ids, radius_km=None):
+    """Hotel rows nearest to the candidate destinations: up to
+    trip_optimizer.HOTELS_PER_DESTINATION each, within radius_km if given.
+    None (every hotel) when none of the destinations has coordinates.
+    """
+    geo_index.geo_index.refresh(conn)
+    hotels = {}
+    located = False
+    for dest_id in dest_ids:
+        nearby = geo_index.geo_index.near_destination(
+            dest_id, k=trip_optimizer.HOTELS_PER_DESTINATION, radius_km=radius_km
+        )
+        if nearby is not None:
+            located = True
+            for hotel in nearby['hotels']:
+                hotels[hotel['HotelID']] = hotel
+    return [hotels[hotel_id] for hotel_id in sorted(hotels)] if located else None
+
+@app.route('/trip/optimize', methods=['POST'])
+def optimize_trip():
+    """Top-K hotel + destination plans by total rating within a budget
+    Body: budget, checkIn, checkOut, destinations (DestIDs), topK,
+    transportTypes (optional), includeActivities (default true),
+    minDestinations (default 1), hotelRadiusKm (optional; hotels are the
+    nearest ones to the destinations, see optimizer_hotels)
+    """
+    try:
+        data = request.json
+        check_in = datetime.strptime(data['checkIn'], '%Y-%m-%d').date()
+        check_out = datetime.strptime(data['checkOut'], '%Y-%m-%d').date()
+        dest_ids = [int(dest_id) for dest_id in data.get('destinations', [])]
+        budget = float(data['budget'])
+        radius_km = None if data.get('hotelRadiusKm') is None else float(data['hotelRadiusKm'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'budget, checkIn/checkOut (YYYY-MM-DD) and destinations are required'
+        }), 400
+
+    try:
+        trip_optimizer.check_destinations(dest_ids)
+        conn = get_db_connection(readonly=True)
+        
+        hotels, options, activities = trip_optimizer.load_candidates(
+            conn, dest_ids, data.get('transportTypes'), optimizer_hotels(conn, dest_ids, radius_km)
+        )
+        
+        conn.close()
+        
+        plans, search_stats = trip_optimizer.optimize(
+            hotels,
+            options,
+            activities,
+            budget=budget,
+            nights=(check_out - check_in).days,
+            top_k=int(data.get('topK', trip_optimizer.DEFAULT_TOP_K)),
+            include_activities=bool(data.get('includeActivities', True)),
+            min_destinations=int(data.get('minDestinations', 1))
+        )
+        reachable = {row['DestID'] for row in options}
+        
+        return jsonify({
+            'success': True,
+            'plans': plans,
+            'unreachable': [dest_id for dest_id in dest_ids if dest_id not in reachable],
+            'stats': search_stats
+        })
+        
+    except (trip_optimizer.OptimizerError, geo_index.GeoError) as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+# ============================================
+# ROUTES - TRANSPORT ROUTING
+# ============================================
+
+def parse_transport_types():
+    """?types=Train,Bus -> ['Train', 'Bus'] (None when absent)"""
+    types = request.args.get('types')
+    return [value.strip() for value in types.split(',') if value.strip()] if types else None
+
+def route_response(route):
+    if route is None:
+        return jsonify({'success': False, 'message': 'No transport route connects these stops'}), 404
+    return jsonify({'success': True, 'route': route})
+
+@app.route('/transport/route')
+def find_transport_route():
+    """Cheapest or fewest-leg route between destinations
+    Query params: from (DestID, 0 or omitted = starting point), to, via
+    (comma separated DestIDs), mode (cheapest|fewest), types, optimize
+    """
+    try:
+        stops = [request.args.get('from', transport_graph.ORIGIN, type=int)]
+        via = request.args.get('via')
+        if via:
+            stops.extend(int(dest_id) for dest_id in via.split(','))
+        stops.append(int(request.args['to']))
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'to (and optional from/via) must be DestIDs'}), 400
+
+    try:
+        conn = get_db_connection(readonly=True)
+        transport_graph.transport_graph.refresh(conn)
+        conn.close()
+        
+        route = transport_graph.transport_graph.route(
+            stops,
+            mode=request.args.get('mode', 'cheapest'),
+            types=parse_transport_types(),
+            optimize_order=request.args.get('optimize') == '1'
+        )
+        return route_response(route)
+        
+    except transport_graph.RouteError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/itinerary/<int:itinerary_id>/transport')
+def plan_itinerary_transport(itinerary_id):
+    """Multi-stop transport plan through an itinerary's destinations
+    Starts at the traveller's starting point unless fromOrigin=0; the
+    visiting order is optimized unless order=given.
+    """
+    try:
+        shard = shard_map.for_id(itinerary_id)
+        conn = get_db_connection(readonly=True, shard=shard)
+        
+        dest_ids = [row['DestID'] for row in queries.fetch_all(conn, 'itinerary_destination_ids', (itinerary_id,))]
+        if not shard.is_catalog:
+            # The graph follows shard 0's transport change log
+            conn.close()
+            conn = get_db_connection(readonly=True)
+        transport_graph.transport_graph.refresh(conn)
+        
+        conn.close()
+        
+        stops = dest_ids
+        if request.args.get('fromOrigin', '1') != '0':
+            stops = [transport_graph.ORIGIN] + dest_ids
+        if len(stops) < 2:
+            return jsonify({'success': False, 'message': 'Itinerary needs at least two stops'}), 400
+        
+        route = transport_graph.transport_graph.route(
+            stops,
+            mode=request.args.get('mode', 'cheapest'),
+            types=parse_transport_types(),
+            optimize_order=(request.args.get('order', 'optimal') == 'optimal'
+                            and len(stops) - 1 <= transport_graph.MAX_REORDER_STOPS)
+        )
+        return route_response(route)
+        
+    except transport_graph.RouteError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+# ============================================
+# ROUTES - NEARBY HOTELS
+# ============================================
+
+def geo_arg(name, convert):
+    """Optional numeric query parameter; GeoError when it does not parse"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise geo_index.GeoError(f"{name} must be a number") from None
+
+@app.route('/hotels/nearby')
+def find_nearby_hotels():
+    """Hotels nearest to each of some destinations, from the in-memory geo index
+    Query params: destIds (comma separated), k (nearest, default 10),
+    radiusKm (only hotels within; without k every hotel within, up to 500),
+    minPrice, maxPrice, minRating
+    """
+    try:
+        dest_ids = [int(dest_id) for dest_id in request.args['destIds'].split(',') if dest_id.strip()]
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'message': 'destIds must be comma separated DestIDs'}), 400
+    if not dest_ids:
+        return jsonify({'success': False, 'message': 'destIds must be comma separated DestIDs'}), 400
+
+    try:
+        options = {
+            'k': geo_arg('k', int),
+            'radius_km': geo_arg('radiusKm', float),
+            'min_price': geo_arg('minPrice', float),
+            'max_price': geo_arg('maxPrice', float),
+            'min_rating': geo_arg('minRating', int),
+        }
+        conn = get_db_connection(readonly=True)
+        geo_index.geo_index.refresh(conn)
+        conn.close()
+        
+        destinations = []
+        for dest_id in dest_ids:
+            nearby = geo_index.geo_index.near_destination(dest_id, **options)
+            if nearby is None:
+                raise geo_index.GeoError(f"Destination {dest_id} does not exist or has no coordinates")
+            destinations.append(nearby)
+        return jsonify({'success': True, 'destinations': destinations})
+        
+    except geo_index.GeoError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
 # ============================================
 # ROUTES - REPORTS & ANALYTICS
 # ============================================
@@ -1315,91 +3617,150 @@ def delete_itinerary(itinerary_id):
 def get_user_spending(user_id):
     """Get user total spending using FUNCTION (GetUserTotalSpending)"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        conn = get_db_connection(readonly=True, shard=shard_map.for_user(user_id))
         
-        query = "SELECT GetUserTotalSpending(%s) as total_spending"
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
+        total_spending = queries.fetch_value(conn, 'user_total_spending', (user_id,))
         
-        cursor.close()
         conn.close()
         
         return jsonify({
             'success': True,
-            'totalSpending': float(result[0]) if result[0] else 0
+            'totalSpending': float(total_spending) if total_spending else 0
         })
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+def merge_popular_destinations(parts):
+    """Itinerary counts added up per destination, status from the total"""
+    destinations = shards.sum_by(parts, 'DestID', ['TotalItineraries'])
+    for destination in destinations:
+        destination['PopularityStatus'] = popularity_status(destination['TotalItineraries'])
+    return sorted(destinations, key=lambda row: row['TotalItineraries'], reverse=True)
+
 @app.route('/reports/popular-destinations')
 def get_popular_destinations():
     """Get all destinations with popularity status (Complex Query)"""
+    fields, compact = requested_shape('report_popular_destinations')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        query = """
-        SELECT 
-            d.DestID,
-            d.Name,
-            d.Location,
-            d.Type,
-            d.Rating,
-            IsDestinationPopular(d.DestID) as PopularityStatus,
-            COUNT(inc.ItineraryID) as TotalItineraries
-        FROM Destination d
-        LEFT JOIN Includes inc ON d.DestID = inc.DestID
-        GROUP BY d.DestID
-        ORDER BY TotalItineraries DESC
-        """
-        cursor.execute(query)
-        destinations = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        destinations = merged_report('report_popular_destinations', fields, merge_popular_destinations)
         
-        return jsonify({'success': True, 'destinations': destinations})
+        return rowset_response({'success': True}, 'destinations', destinations, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
 @app.route('/reports/dashboard-stats')
 def get_dashboard_stats():
-    """Get dashboard statistics (Aggregate Queries)"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
+    """Get dashboard statistics (Aggregate Queries)
+    Users, bookings and revenue are added up over the shards; the catalog
+    figures come from shard 0.
+    """
+    def shard_stats(shard, conn):
         stats = {}
         
         # Total bookings
-        cursor.execute("SELECT COUNT(*) as count FROM Booking")
-        stats['totalBookings'] = cursor.fetchone()['count']
+        stats['totalBookings'] = queries.fetch_value(conn, 'stats_booking_count')
         
         # Total users
-        cursor.execute("SELECT COUNT(*) as count FROM User")
-        stats['totalUsers'] = cursor.fetchone()['count']
+        stats['totalUsers'] = queries.fetch_value(conn, 'stats_user_count')
         
-        # Total destinations
-        cursor.execute("SELECT COUNT(*) as count FROM Destination")
-        stats['totalDestinations'] = cursor.fetchone()['count']
+        # Total revenue
+        total_revenue = queries.fetch_value(conn, 'stats_confirmed_revenue')
+        stats['totalRevenue'] = float(total_revenue) if total_revenue else 0
         
-        # Average hotel rating
-        cursor.execute("SELECT AVG(Rating) as avg FROM Hotel")
-        stats['avgHotelRating'] = round(cursor.fetchone()['avg'], 2)
+        if shard.is_catalog:
+            # Total destinations
+            stats['totalDestinations'] = queries.fetch_value(conn, 'stats_destination_count')
+            
+            # Average hotel rating
+            stats['avgHotelRating'] = round(queries.fetch_value(conn, 'stats_avg_hotel_rating'), 2)
+        return stats
+    
+    try:
+        parts = fan_out(shard_stats)
         
-        # Total revenue
-        cursor.execute("SELECT SUM(TotalPrice) as total FROM Booking WHERE BookingStatus = 'Confirmed'")
-        result = cursor.fetchone()
-        stats['totalRevenue'] = float(result['total']) if result['total'] else 0
+        stats = dict(parts[0])
+        for measure in ('totalBookings', 'totalUsers', 'totalRevenue'):
+            stats[measure] = sum(part[measure] for part in parts)
+        stats['totalRevenue'] = round(stats['totalRevenue'], 2)
+        
+        return jsonify({'success': True, 'stats': stats})
+        
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/reports/revenue')
+def get_revenue_series():
+    """Bookings and revenue time series from the rollup tables
+    Query params: start, end (YYYY-MM-DD, end exclusive), granularity
+    (daily|monthly), groupBy (none|hotel|location), hotelId (comma separated)
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+        hotel_ids = [int(hotel_id) for hotel_id in request.args.get('hotelId', '').split(',') if hotel_id.strip()]
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'start/end (YYYY-MM-DD) are required; hotelId must be comma separated HotelIDs'
+        }), 400
+
+    try:
+        points, totals = revenue_rollups.merge(fan_out(lambda _shard, conn: revenue_rollups.series(
+            conn,
+            start,
+            end,
+            granularity=request.args.get('granularity', 'daily'),
+            group_by=request.args.get('groupBy', 'none'),
+            hotel_ids=hotel_ids
+        )))
+        
+        return jsonify({'success': True, 'series': points, 'totals': totals})
+        
+    except revenue_rollups.RollupError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+    except mysql.connector.Error as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
+
+@app.route('/reports/occupancy')
+def get_occupancy_report():
+    """Occupancy and ADR by night or week, per hotel or per location
+    Query params: start, end (YYYY-MM-DD, end exclusive), granularity
+    (daily|weekly), groupBy (hotel|location), hotelId (comma separated),
+    location, offset, limit (default 100)
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date()
+        hotel_ids = [int(hotel_id) for hotel_id in request.args.get('hotelId', '').split(',') if hotel_id.strip()]
+    except (KeyError, ValueError):
+        return jsonify({
+            'success': False,
+            'message': 'start/end (YYYY-MM-DD) are required; hotelId must be comma separated HotelIDs'
+        }), 400
+
+    try:
+        conn = get_db_connection(readonly=True)
+        
+        # Stays are read from every shard, hotels from shard 0
+        window = occupancy.engine.window(conn, start, end, fan_out if shard_map.sharded else None)
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'stats': stats})
+        report = window.report(
+            granularity=request.args.get('granularity', 'daily'),
+            group_by=request.args.get('groupBy', 'hotel'),
+            hotel_ids=hotel_ids,
+            location=request.args.get('location'),
+            offset=max(request.args.get('offset', 0, type=int), 0),
+            limit=max(1, min(request.args.get('limit', 100, type=int), 1000))
+        )
         
+        return jsonify({'success': True, 'report': report})
+        
+    except occupancy.OccupancyError as err:
+        return jsonify({'success': False, 'message': str(err)}), 400
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
@@ -1410,32 +3771,15 @@ def get_dashboard_stats():
 @app.route('/reports/hotels-above-average-price')
 def get_hotels_above_average_price():
     """Get hotels with price above average (NESTED QUERY - Subquery in WHERE clause)"""
+    fields, compact = requested_shape('report_hotels_above_average_price')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        conn = get_db_connection(readonly=True)
         
-        # NESTED QUERY: Subquery in WHERE clause
-        query = """
-        SELECT 
-            HotelID,
-            Name,
-            Location,
-            PricePerNight,
-            Rating
-        FROM Hotel
-        WHERE PricePerNight > (
-            SELECT AVG(PricePerNight) 
-            FROM Hotel
-        )
-        ORDER BY PricePerNight DESC
-        """
-        cursor.execute(query)
-        hotels = cursor.fetchall()
+        hotels = queries.fetch_projected(conn, 'report_hotels_above_average_price', fields)
         
-        cursor.close()
         conn.close()
         
-        return jsonify({'success': True, 'hotels': hotels})
+        return jsonify({'success': True, 'hotels': shaped(hotels, 'report_hotels_above_average_price', fields, compact)})
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -1443,33 +3787,13 @@ def get_hotels_above_average_price():
 @app.route('/reports/users-with-bookings')
 def get_users_with_bookings():
     """Get users who have made bookings (NESTED QUERY - Subquery with IN clause)"""
+    fields, compact = requested_shape('report_users_with_bookings')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # NESTED QUERY: Subquery with IN clause
-        query = """
-        SELECT 
-            UserID,
-            FirstName,
-            LastName,
-            Email,
-            PhoneNo
-        FROM User
-        WHERE UserID IN (
-            SELECT DISTINCT UserID 
-            FROM Booking 
-            WHERE BookingStatus = 'Confirmed'
-        )
-        ORDER BY LastName, FirstName
-        """
-        cursor.execute(query)
-        users = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        users = merged_report('report_users_with_bookings', fields, lambda parts: shards.merge_sorted(
+            parts, key=lambda row: (row['LastName'].casefold(), row['FirstName'].casefold())
+        ))
         
-        return jsonify({'success': True, 'users': users})
+        return rowset_response({'success': True}, 'users', users, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -1477,33 +3801,13 @@ def get_users_with_bookings():
 @app.route('/reports/destinations-not-in-itineraries')
 def get_destinations_not_in_itineraries():
     """Get destinations that are not included in any itinerary (NESTED QUERY - Subquery with NOT IN)"""
+    fields, compact = requested_shape('report_destinations_not_in_itineraries')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # NESTED QUERY: Subquery with NOT IN clause
-        query = """
-        SELECT 
-            DestID,
-            Name,
-            Location,
-            Type,
-            Rating
-        FROM Destination
-        WHERE DestID NOT IN (
-            SELECT DISTINCT DestID 
-            FROM Includes
-            WHERE DestID IS NOT NULL
-        )
-        ORDER BY Name
-        """
-        cursor.execute(query)
-        destinations = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        # Not in any itinerary = not in an itinerary on any shard
+        destinations = merged_report('report_destinations_not_in_itineraries', fields,
+                                     lambda parts: shards.common_to_all(parts, 'DestID'))
         
-        return jsonify({'success': True, 'destinations': destinations})
+        return rowset_response({'success': True}, 'destinations', destinations, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -1511,40 +3815,13 @@ def get_destinations_not_in_itineraries():
 @app.route('/reports/bookings-with-hotel-details')
 def get_bookings_with_hotel_details():
     """Get bookings with hotel details where hotel rating is above average (CORRELATED QUERY)"""
+    fields, compact = requested_shape('report_bookings_with_hotel_details')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # CORRELATED QUERY: Subquery references outer query
-        query = """
-        SELECT 
-            b.BookingID,
-            b.CheckInDate,
-            b.CheckOutDate,
-            b.TotalPrice,
-            b.BookingStatus,
-            h.Name AS HotelName,
-            h.Location AS HotelLocation,
-            h.PricePerNight,
-            h.Rating AS HotelRating,
-            CONCAT(u.FirstName, ' ', u.LastName) AS UserName
-        FROM Booking b
-        INNER JOIN Hotel h ON b.HotelID = h.HotelID
-        INNER JOIN User u ON b.UserID = u.UserID
-        WHERE h.Rating > (
-            SELECT AVG(Rating) 
-            FROM Hotel h2 
-            WHERE h2.Location = h.Location
-        )
-        ORDER BY b.BookingDate DESC
-        """
-        cursor.execute(query)
-        bookings = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        bookings = merged_report('report_bookings_with_hotel_details', fields, lambda parts: shards.merge_sorted(
+            parts, key=lambda row: row['BookingDate'], reverse=True
+        ))
         
-        return jsonify({'success': True, 'bookings': bookings})
+        return rowset_response({'success': True}, 'bookings', bookings, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
@@ -1552,79 +3829,111 @@ def get_bookings_with_hotel_details():
 @app.route('/reports/users-booking-count')
 def get_users_booking_count():
     """Get users with their booking counts (CORRELATED QUERY - Subquery in SELECT)"""
+    fields, compact = requested_shape('report_users_booking_count')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # CORRELATED QUERY: Subquery in SELECT clause that references outer query
-        query = """
-        SELECT 
-            u.UserID,
-            CONCAT(u.FirstName, ' ', u.LastName) AS UserName,
-            u.Email,
-            (
-                SELECT COUNT(*) 
-                FROM Booking b 
-                WHERE b.UserID = u.UserID 
-                AND b.BookingStatus = 'Confirmed'
-            ) AS ConfirmedBookings,
-            (
-                SELECT COALESCE(SUM(b2.TotalPrice), 0)
-                FROM Booking b2
-                WHERE b2.UserID = u.UserID
-                AND b2.BookingStatus = 'Confirmed'
-            ) AS TotalSpending
-        FROM User u
-        ORDER BY ConfirmedBookings DESC, TotalSpending DESC
-        """
-        cursor.execute(query)
-        users = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        users = merged_report('report_users_booking_count', fields, lambda parts: shards.merge_sorted(
+            parts, key=lambda row: (row['ConfirmedBookings'], row['TotalSpending']), reverse=True
+        ))
         
-        return jsonify({'success': True, 'users': users})
+        return rowset_response({'success': True}, 'users', users, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+def merge_hotel_booking_stats(parts):
+    """Per-hotel counts and revenue added up; the average recomputed from them"""
+    hotels = shards.sum_by(parts, 'HotelID', ['TotalBookings', 'ConfirmedBookings', 'CancelledBookings', 'TotalRevenue'])
+    for hotel in hotels:
+        confirmed = hotel['ConfirmedBookings']
+        hotel['AvgBookingValue'] = round(hotel['TotalRevenue'] / confirmed, 6) if confirmed else 0
+    return sorted(hotels, key=lambda row: (row['TotalRevenue'], row['ConfirmedBookings']), reverse=True)
+
 @app.route('/reports/hotels-booking-stats')
 def get_hotels_booking_stats():
     """Get hotels with booking statistics using aggregate and join (AGGREGATE + JOIN QUERY)"""
+    fields, compact = requested_shape('report_hotels_booking_stats')
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # AGGREGATE + JOIN QUERY: Multiple aggregates with GROUP BY and JOINs
-        query = """
-        SELECT 
-            h.HotelID,
-            h.Name AS HotelName,
-            h.Location,
-            h.PricePerNight,
-            h.Rating,
-            COUNT(b.BookingID) AS TotalBookings,
-            COUNT(CASE WHEN b.BookingStatus = 'Confirmed' THEN 1 END) AS ConfirmedBookings,
-            COUNT(CASE WHEN b.BookingStatus = 'Cancelled' THEN 1 END) AS CancelledBookings,
-            COALESCE(SUM(CASE WHEN b.BookingStatus = 'Confirmed' THEN b.TotalPrice ELSE 0 END), 0) AS TotalRevenue,
-            COALESCE(AVG(CASE WHEN b.BookingStatus = 'Confirmed' THEN b.TotalPrice END), 0) AS AvgBookingValue
-        FROM Hotel h
-        LEFT JOIN Booking b ON h.HotelID = b.HotelID
-        GROUP BY h.HotelID, h.Name, h.Location, h.PricePerNight, h.Rating
-        HAVING TotalBookings > 0
-        ORDER BY TotalRevenue DESC, ConfirmedBookings DESC
-        """
-        cursor.execute(query)
-        hotels = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        hotels = merged_report('report_hotels_booking_stats', fields, merge_hotel_booking_stats)
         
-        return jsonify({'success': True, 'hotels': hotels})
+        return rowset_response({'success': True}, 'hotels', hotels, compact)
         
     except mysql.connector.Error as err:
         return jsonify({'success': False, 'message': str(err)}), 400
 
+# ============================================
+# ROUTES - QUERY STATISTICS
+# ============================================
+
+@app.route('/admin/query-stats')
+def get_query_stats():
+    """Per-statement execution stats from the SQL registry (queries.py)"""
+    return jsonify({
+        'success': True,
+        'preparedEnabled': queries.PREPARED_ENABLED,
+        'statements': queries.stats.snapshot()
+    })
+
+@app.route('/admin/db-routing')
+def get_db_routing_status():
+    """Primary/replica routing state: lag, health and read counts"""
+    return jsonify({'success': True, 'routing': db_router.status()})
+
+@app.route('/admin/transport-graph')
+def get_transport_graph_status():
+    """Size and refresh counters of the in-memory transport graph"""
+    return jsonify({'success': True, 'graph': transport_graph.transport_graph.status()})
+
+@app.route('/admin/geo-index')
+def get_geo_index_status():
+    """Size and refresh counters of the nearby-hotels index"""
+    return jsonify({'success': True, 'geoIndex': geo_index.geo_index.status()})
+
+@app.route('/admin/waitlist')
+def get_waitlist_status():
+    """Waiting requests in the interval index and allocation counters"""
+    return jsonify({'success': True, 'waitlist': waitlist.waitlist.status()})
+
+@app.route('/admin/pricing')
+def get_pricing_status():
+    """Size and rebuild counters of the in-memory price book"""
+    return jsonify({'success': True, 'pricing': pricing.engine.status()})
+
+@app.route('/admin/recommender')
+def get_recommender_status():
+    """Size and rebuild counter of the co-occurrence model"""
+    return jsonify({'success': True, 'recommender': recommender.recommender.status()})
+
+@app.route('/admin/admission')
+def get_admission_status():
+    """Admission control state: active/queued requests, rejections, limits"""
+    return jsonify({'success': True, 'admission': admission.controller.status()})
+
+@app.route('/admin/db-breaker')
+def get_db_breaker_status():
+    """Database circuit breaker state and counters"""
+    return jsonify({'success': True, 'breaker': circuit_breaker.breaker.status()})
+
+@app.route('/admin/shards')
+def get_shard_status():
+    """Shard map: databases, id ranges, fan-out counters"""
+    return jsonify({'success': True, 'shards': shard_map.status()})
+
+@app.route('/admin/entity-cache')
+def get_entity_cache_status():
+    """Entity cache backend, size and per-kind hit/miss/fill counters"""
+    return jsonify({'success': True, 'cache': entity_cache.cache.status()})
+
+@app.route('/admin/change-feed')
+def get_change_feed_status():
+    """Change feed counters: published/buffered events, open streams"""
+    return jsonify({'success': True, 'feed': change_feed.feed.status()})
+
+@app.route('/admin/query-stats/reset', methods=['POST'])
+def reset_query_stats():
+    """Clear the per-statement stats, e.g. before an A/B run"""
+    queries.stats.reset()
+    return jsonify({'success': True, 'message': 'Query stats reset'})
+
 # ============================================
 # RUN THE APP
 # ============================================
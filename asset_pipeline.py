@@ -0,0 +1,340 @@
+"""Asset build step for the single-page frontend.
+
+templates/index.html stays the file you edit. This command pulls its inline
+<style> and <script> blocks out into minified, content-hashed bundles under
+static/dist/, writes gzip/brotli copies next to them, and generates
+templates/index.built.html that links the bundles instead:
+
+    python asset_pipeline.py
+
+app.py serves the bundles from /assets/<file> with far-future caching and
+renders index.built.html (when present) once per change instead of per hit.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+SOURCE_TEMPLATE = 'index.html'
+BUILT_TEMPLATE = 'index.built.html'
+DIST_DIR = os.path.join(BASE_DIR, 'static', 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+ASSET_URL_PREFIX = '/assets/'
+
+ASSET_MAX_AGE = 31536000
+
+# Preference order when the client accepts several encodings
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MIMETYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'application/javascript; charset=utf-8',
+}
+
+STYLE_BLOCK = re.compile(r'<style>(.*?)</style>', re.S)
+SCRIPT_BLOCK = re.compile(r'<script>(.*?)</script>', re.S)
+
+
+# ============================================
+# MINIFICATION
+# ============================================
+
+def minify_css(source):
+    """Strip comments and redundant whitespace from a stylesheet"""
+    css = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+    return css.strip()
+
+
+# Words after which a / starts a regular expression instead of dividing
+REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await',
+}
+REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+JS_BLANK_LINES = re.compile(r'[ \t]*\n\s*')
+
+
+def _skip_quoted(source, i, quote):
+    """Index after the string or regex body starting at i (just past its quote)"""
+    in_class = False
+    while i < len(source):
+        ch = source[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '\n' and quote != '`':
+            break
+        if quote == '/' and ch in '[]':
+            in_class = ch == '['
+        elif ch == quote and not in_class:
+            return i + 1
+        elif quote == '`' and source.startswith('${', i):
+            _pieces, i = _tokenize_js(source, i + 2, nested=True)
+            continue
+        i += 1
+    raise ValueError(f"Unterminated {quote} literal in script at offset {i}")
+
+
+def _tokenize_js(source, i=0, nested=False):
+    """Split a script into ('code' | 'comment' | 'literal', text) pieces
+    Strings, template literals (with their ${...} expressions) and regular
+    expressions are 'literal' and never touched by the minifier. With
+    nested, scanning stops after the } closing a template expression;
+    returns (pieces, end index).
+    """
+    pieces = []
+    depth = 0
+    start = i
+    previous = ''      # last code character that is not whitespace
+    word = ''          # identifier it ends, if any
+
+    def flush(end, kind=None, text=None):
+        if end > start:
+            pieces.append(('code', source[start:end]))
+        if kind:
+            pieces.append((kind, text))
+
+    while i < len(source):
+        ch = source[i]
+        if source.startswith('//', i):
+            end = source.find('\n', i)
+            end = len(source) if end < 0 else end
+            flush(i, 'comment', source[i:end])
+            start = i = end
+            continue
+        if source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = len(source) if end < 0 else end + 2
+            flush(i, 'comment', source[i:end])
+            start = i = end
+            continue
+        if ch in '\'"`' or (ch == '/' and (previous in REGEX_AFTER or word in REGEX_KEYWORDS or not previous)):
+            end = _skip_quoted(source, i + 1, ch)
+            if ch == '/':
+                while end < len(source) and (source[end].isalnum() or source[end] == '_'):
+                    end += 1
+            flush(i, 'literal', source[i:end])
+            start = i = end
+            previous, word = ')', ''
+            continue
+        if nested and ch == '{':
+            depth += 1
+        elif nested and ch == '}':
+            if depth == 0:
+                flush(i)
+                return pieces, i + 1
+            depth -= 1
+        if not ch.isspace():
+            word = word + ch if ch.isalnum() or ch in '_$' else ''
+            previous = ch
+        i += 1
+    if nested:
+        raise ValueError('Unterminated ${ in template literal')
+    flush(i)
+    return pieces, i
+
+
+def minify_js(source):
+    """Conservative tokenizer-aware JS minifier
+    Removes comments, indentation and blank lines outside of strings,
+    template literals and regular expressions. Line breaks between
+    statements stay, so automatic semicolon insertion is untouched.
+    """
+    pieces, _end = _tokenize_js(source)
+    parts = []
+    run = []
+    for kind, text in pieces:
+        if kind == 'literal':
+            parts.append(JS_BLANK_LINES.sub('\n', ''.join(run)))
+            parts.append(text)
+            run = []
+        elif kind == 'comment':
+            # A block comment spanning lines can end a statement like a line break
+            run.append('\n' if '\n' in text else ' ' if text.startswith('/*') else '')
+        else:
+            run.append(text)
+    parts.append(JS_BLANK_LINES.sub('\n', ''.join(run)))
+    return ''.join(parts).strip()
+
+
+def check_minified_js(source, minified):
+    """ValueError unless the bundle keeps every string, template literal and
+    regular expression of the inline script, in order
+    """
+    def literals(script):
+        return [text for kind, text in _tokenize_js(script)[0] if kind == 'literal']
+
+    expected, found = literals(source), literals(minified)
+    for index, (before, after) in enumerate(zip(expected, found)):
+        if before != after:
+            raise ValueError(f"Minified script changed literal {index}: {before[:60]!r}")
+    if len(expected) != len(found):
+        raise ValueError(f"Minified script has {len(found)} literals, the inline script {len(expected)}")
+
+
+# ============================================
+# COMPRESSION
+# ============================================
+
+def compress_variants(data):
+    """Return {encoding: bytes} for every precompressed encoding available"""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        return variants
+    variants['br'] = brotli.compress(data, quality=11)
+    return variants
+
+
+def choose_encoding(accept_encodings, available):
+    """Pick the best precompressed encoding the client accepts, or None"""
+    for encoding, _suffix in ENCODINGS:
+        if encoding in available and accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+# ============================================
+# BUILD
+# ============================================
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as handle:
+        handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def _emit_bundle(stem, ext, text):
+    """Write a hashed bundle plus its compressed copies; return manifest entry"""
+    data = text.encode('utf-8')
+    content_hash = hashlib.sha256(data).hexdigest()[:16]
+    name = f"{stem}.{content_hash}{ext}"
+    _write_atomic(os.path.join(DIST_DIR, name), data)
+
+    encodings = {}
+    for encoding, compressed in compress_variants(data).items():
+        suffix = dict(ENCODINGS)[encoding]
+        _write_atomic(os.path.join(DIST_DIR, name + suffix), compressed)
+        encodings[encoding] = len(compressed)
+
+    return name, {
+        'hash': content_hash,
+        'mimetype': MIMETYPES[ext],
+        'bytes': len(data),
+        'encodings': encodings,
+    }
+
+
+def build():
+    """Extract, minify, fingerprint and precompress the index.html assets"""
+    os.makedirs(DIST_DIR, exist_ok=True)
+    with open(os.path.join(TEMPLATES_DIR, SOURCE_TEMPLATE), 'r', encoding='utf-8') as handle:
+        html = handle.read()
+
+    styles = STYLE_BLOCK.findall(html)
+    scripts = SCRIPT_BLOCK.findall(html)
+
+    manifest = {}
+    css_name = js_name = None
+    if styles:
+        css_name, manifest[css_name] = _emit_bundle('app', '.css', minify_css('\n'.join(styles)))
+    if scripts:
+        script = ';\n'.join(scripts)
+        minified = minify_js(script)
+        check_minified_js(script, minified)
+        js_name, manifest[js_name] = _emit_bundle('app', '.js', minified)
+
+    # First block of each kind becomes the link/script tag, the rest are dropped
+    def replace_blocks(pattern, text, tag):
+        state = {'first': True}
+
+        def substitute(_match):
+            if state['first']:
+                state['first'] = False
+                return tag
+            return ''
+        return pattern.sub(substitute, text)
+
+    built = html
+    if css_name:
+        built = replace_blocks(STYLE_BLOCK, built,
+                               f'<link rel="stylesheet" href="{ASSET_URL_PREFIX}{css_name}">')
+    if js_name:
+        built = replace_blocks(SCRIPT_BLOCK, built,
+                               f'<script src="{ASSET_URL_PREFIX}{js_name}"></script>')
+    _write_atomic(os.path.join(TEMPLATES_DIR, BUILT_TEMPLATE), built.encode('utf-8'))
+
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    # Remove bundles from previous builds
+    keep = {os.path.basename(MANIFEST_PATH)}
+    for name in manifest:
+        keep.add(name)
+        keep.update(name + suffix for _encoding, suffix in ENCODINGS)
+    for name in os.listdir(DIST_DIR):
+        if name not in keep:
+            os.remove(os.path.join(DIST_DIR, name))
+
+    for name, entry in manifest.items():
+        sizes = ', '.join(f"{enc} {size}" for enc, size in sorted(entry['encodings'].items()))
+        print(f"{name}: {entry['bytes']} bytes ({sizes})")
+    print(f"Built template written to templates/{BUILT_TEMPLATE}")
+    return manifest
+
+
+# ============================================
+# RUNTIME LOOKUP (used by app.py)
+# ============================================
+
+class AssetManifest:
+    """Lazily loaded view of static/dist/manifest.json"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._mtime = None
+        self._entries = {}
+
+    def get(self, name):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self._mtime:
+            entries = {}
+            if mtime:
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as handle:
+                        entries = json.load(handle)
+                except (OSError, ValueError):
+                    entries = {}
+            self._entries = entries
+            self._mtime = mtime
+        return self._entries.get(name)
+
+
+def current_template():
+    """Return (template name, mtime) for the landing page
+    index.built.html is used only while it is newer than index.html, so an
+    edit to the source template is never hidden by a stale build.
+    """
+    source_mtime = os.stat(os.path.join(TEMPLATES_DIR, SOURCE_TEMPLATE)).st_mtime
+    try:
+        built_mtime = os.stat(os.path.join(TEMPLATES_DIR, BUILT_TEMPLATE)).st_mtime
+    except OSError:
+        built_mtime = None
+    if built_mtime is not None and built_mtime >= source_mtime:
+        return BUILT_TEMPLATE, built_mtime
+    return SOURCE_TEMPLATE, source_mtime
+
+
+if __name__ == '__main__':
+    build()
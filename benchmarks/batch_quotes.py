@@ -0,0 +1,116 @@
+"""Latency of pricing batch quotes vs pricing stays one at a time.
+
+Builds a PriceBook for synthetic hotels with seasonal HotelRate overrides
+(about a sixth of the hotel-nights) and two or three standing offers per hotel
+(early bird, weekend, long stay, date-limited), then times results pages:
+
+    batch         PriceBook.quote(50 hotels, M ranges), the /booking/quote-batch path
+    one by one    PriceBook.quote_stay per hotel and range, night by night
+                  (the work CalculateBookingCost does per call, without
+                  the round trip)
+
+Every batch answer is checked against the one-by-one one first.
+
+    python benchmarks/batch_quotes.py [hotels] [pages]
+"""
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pricing  # noqa: E402
+
+PAGE_HOTELS = 50
+REPEATS = 5
+
+
+def synthetic(rng, hotel_count, today, days):
+    hotels = [{'HotelID': hotel_id, 'PricePerNight': Decimal(rng.randint(1000, 20000))}
+              for hotel_id in range(1, hotel_count + 1)]
+    rates = []
+    for hotel in hotels:
+        for _ in range(rng.randint(2, 6)):
+            first = rng.randrange(-30, days + 30)
+            price = (hotel['PricePerNight'] * Decimal(rng.choice(('0.8', '1.25', '1.5')))).quantize(Decimal('0.01'))
+            for day in range(rng.randint(7, 30)):
+                rates.append({'HotelID': hotel['HotelID'], 'Night': today + timedelta(days=first + day), 'Price': price})
+    # Later seasons win, like the ON DUPLICATE KEY UPDATE of a rate write
+    rates = list({(rate['HotelID'], rate['Night']): rate for rate in rates}.values())
+
+    offers = []
+    kinds = [
+        {'MinAdvanceDays': 30},
+        {'WeekendOnly': True},
+        {'MinNights': 5},
+        {'ValidFrom': today + timedelta(days=60), 'ValidTo': today + timedelta(days=120)},
+    ]
+    for hotel in hotels:
+        for kind in rng.sample(kinds, rng.randint(2, 3)):
+            offers.append({
+                'OfferID': len(offers) + 1, 'HotelID': hotel['HotelID'], 'Description': 'Synthetic',
+                'DiscountPercent': Decimal(rng.choice(('5', '10', '12.5', '15', '20'))),
+                'ValidFrom': kind.get('ValidFrom'), 'ValidTo': kind.get('ValidTo'),
+                'MinNights': kind.get('MinNights', 0), 'MinAdvanceDays': kind.get('MinAdvanceDays', 0),
+                'WeekendOnly': kind.get('WeekendOnly', False),
+            })
+    return hotels, rates, offers
+
+
+def pages(rng, hotel_count, page_count, range_count, today):
+    for _ in range(page_count):
+        hotel_ids = rng.sample(range(1, hotel_count + 1), PAGE_HOTELS)
+        stays = []
+        for _ in range(range_count):
+            check_in = today + timedelta(days=rng.randrange(0, 360))
+            stays.append((check_in, check_in + timedelta(days=rng.randint(1, 14))))
+        yield hotel_ids, stays
+
+
+def one_by_one(book, hotel_ids, stays, today):
+    return [[book.quote_stay(book.rows[hotel_id], check_in, check_out, today) for check_in, check_out in stays]
+            for hotel_id in hotel_ids]
+
+
+def main():
+    hotel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    page_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(42)
+    today = date.today()
+    hotels, rates, offers = synthetic(rng, hotel_count, today, pricing.HORIZON_DAYS)
+
+    started = time.perf_counter()
+    book = pricing.PriceBook(today, pricing.HORIZON_DAYS, hotels, rates, offers)
+    print(f"{hotel_count} hotels, {len(rates)} rates, {len(offers)} offers, built in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms, {book.nbytes() / 2 ** 20:.0f} MiB")
+
+    for range_count in (1, 4, 10):
+        requests = list(pages(rng, hotel_count, page_count, range_count, today))
+        for hotel_ids, stays in requests[:20]:
+            _found, base, discount, offer = book.quote(hotel_ids, stays, today)
+            expected = one_by_one(book, hotel_ids, stays, today)
+            for position, row in enumerate(expected):
+                for stay, expected_quote in enumerate(row):
+                    got = (base[position, stay], discount[position, stay], offer[position, stay])
+                    assert got == expected_quote, (hotel_ids[position], stays[stay])
+
+        best = None
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            for hotel_ids, stays in requests:
+                book.quote(hotel_ids, stays, today)
+            elapsed = (time.perf_counter() - started) / len(requests)
+            best = elapsed if best is None else min(best, elapsed)
+        started = time.perf_counter()
+        for hotel_ids, stays in requests[:20]:
+            one_by_one(book, hotel_ids, stays, today)
+        slow = (time.perf_counter() - started) / 20
+        print(f"{PAGE_HOTELS} hotels x {range_count:>2} ranges   batch {best * 1000:>7.2f} ms/page   "
+              f"one by one {slow * 1000:>8.1f} ms/page ({slow / best:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Bulk cancellation (BulkCancelBookings) vs one CancelBooking call per booking.
+
+Creates one-night confirmed bookings for a hotel on nights in FIRST_NIGHT's
+year, cancels them with a CancelBooking call each (what a client looping
+over /booking/cancel/<id> causes, minus HTTP), creates them again and
+cancels them with a single BulkCancelBookings call. Afterwards the
+bookings, their audit rows, tombstones and inventory nights are deleted.
+
+It writes through every booking trigger (inventory, audit, rollups, change
+counters), so run it against a scratch copy of the database. The user and
+hotel must exist on shard 0.
+
+    python benchmarks/bulk_cancel.py [bookings] [hotelId] [userId]
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import get_db_connection  # noqa: E402
+
+# Far enough ahead that no real booking shares the nights
+FIRST_NIGHT = date(2099, 1, 1)
+
+
+def create_bookings(conn, count, hotel_id, user_id):
+    cursor = conn.cursor()
+    ids = []
+    for offset in range(count):
+        night = FIRST_NIGHT + timedelta(days=offset)
+        cursor.execute(
+            "INSERT INTO Booking (UserID, HotelID, CheckInDate, CheckOutDate, TotalPrice, BookingStatus) "
+            "VALUES (%s, %s, %s, %s, %s, 'Confirmed')",
+            (user_id, hotel_id, night, night + timedelta(days=1), 100)
+        )
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    cursor.close()
+    return ids
+
+
+def cancel_one_by_one(conn, ids):
+    cursor = conn.cursor()
+    for booking_id in ids:
+        result = cursor.callproc('CancelBooking', [booking_id, ''])
+        assert 'successfully' in result[1], result[1]
+        conn.commit()
+    cursor.close()
+
+
+def cancel_in_bulk(conn, ids, hotel_id, user_id):
+    cursor = conn.cursor()
+    last_night = FIRST_NIGHT + timedelta(days=len(ids) - 1)
+    result = cursor.callproc('BulkCancelBookings', [hotel_id, FIRST_NIGHT, last_night, user_id, 0])
+    for rows in cursor.stored_results():
+        rows.fetchall()
+    conn.commit()
+    cursor.close()
+    assert result[4] == len(ids), result[4]
+
+
+def clean_up(conn, ids, hotel_id):
+    cursor = conn.cursor()
+    marks = ', '.join(['%s'] * len(ids))
+    cursor.execute(f"DELETE FROM BookingAudit WHERE BookingID IN ({marks})", ids)
+    cursor.execute(f"DELETE FROM Booking WHERE BookingID IN ({marks})", ids)
+    cursor.execute(f"DELETE FROM SyncTombstone WHERE EntityType = 'Booking' AND EntityID IN ({marks})", ids)
+    cursor.execute("DELETE FROM HotelNightInventory WHERE HotelID = %s AND Night >= %s", (hotel_id, FIRST_NIGHT))
+    conn.commit()
+    cursor.close()
+
+
+def measure(conn, label, count, hotel_id, user_id, cancel):
+    ids = create_bookings(conn, count, hotel_id, user_id)
+    try:
+        started = time.perf_counter()
+        cancel(ids)
+        elapsed = time.perf_counter() - started
+    finally:
+        clean_up(conn, ids, hotel_id)
+    print(f"{label:28} {elapsed * 1000:>10.1f} ms {count / elapsed:>12,.0f} bookings/s")
+    return elapsed
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    hotel_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    user_id = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    conn = get_db_connection()
+    try:
+        print(f"{count} bookings, hotel {hotel_id}, user {user_id}")
+        loop = measure(conn, 'CancelBooking per booking', count, hotel_id, user_id,
+                       lambda ids: cancel_one_by_one(conn, ids))
+        bulk = measure(conn, 'BulkCancelBookings', count, hotel_id, user_id,
+                       lambda ids: cancel_in_bulk(conn, ids, hotel_id, user_id))
+        print(f"bulk is {loop / bulk:.1f}x faster")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Latency of geo_index lookups vs scanning every hotel.
+
+Places synthetic hotels around random cities (90%, a few km apart) and
+anywhere on land-ish latitudes (10%), then times, per destination:
+
+    k nearest       lookup(k=10)
+    radius          lookup(radius_km=10)
+    filtered        lookup(k=10, min_rating=5, max_price=1500)
+    brute force     haversine to every hotel and a sort (what a query
+                    without a spatial index does)
+
+Every index answer is checked against the brute-force one first.
+
+    python benchmarks/nearby_hotels.py [hotels] [destinations]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_index  # noqa: E402
+
+REPEATS = 5
+
+
+def synthetic(rng, hotel_count, city_count):
+    cities = [(rng.uniform(8, 34), rng.uniform(68, 97)) for _ in range(city_count)]
+    hotels = []
+    for hotel_id in range(1, hotel_count + 1):
+        if hotel_id % 10 == 0:
+            latitude, longitude = rng.uniform(-60, 70), rng.uniform(-180, 180)
+        else:
+            city = rng.choice(cities)
+            latitude, longitude = city[0] + rng.gauss(0, 0.2), city[1] + rng.gauss(0, 0.2)
+        hotels.append({
+            'HotelID': hotel_id, 'Name': f"Hotel {hotel_id}", 'Location': 'Synthetic',
+            'Rating': rng.randint(1, 5), 'PricePerNight': rng.randint(1000, 20000),
+            'Latitude': round(latitude, 6), 'Longitude': round(longitude, 6),
+        })
+    destinations = [{'DestID': dest_id, 'Name': f"Destination {dest_id}", 'Latitude': latitude, 'Longitude': longitude}
+                    for dest_id, (latitude, longitude) in enumerate(cities, 1)]
+    return hotels, destinations
+
+
+def brute_force(hotels, latitude, longitude, k=None, radius_km=None, min_rating=None, max_price=None):
+    found = []
+    for hotel in hotels:
+        if min_rating is not None and hotel['Rating'] < min_rating:
+            continue
+        if max_price is not None and hotel['PricePerNight'] > max_price:
+            continue
+        distance = geo_index.haversine_km(latitude, longitude, hotel['Latitude'], hotel['Longitude'])
+        if radius_km is not None and distance > radius_km:
+            continue
+        found.append((distance, hotel['HotelID']))
+    found.sort()
+    return found[:k or geo_index.MAX_RESULTS]
+
+
+CASES = [
+    ('k nearest', {'k': 10}),
+    ('radius 10 km', {'radius_km': 10}),
+    ('filtered k nearest', {'k': 10, 'min_rating': 5, 'max_price': 1500}),
+]
+
+
+def main():
+    hotel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    city_count = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    rng = random.Random(42)
+    hotels, destinations = synthetic(rng, hotel_count, city_count)
+
+    index = geo_index.HotelGeoIndex()
+    started = time.perf_counter()
+    index.load_rows(hotels, destinations)
+    print(f"{hotel_count} hotels, {city_count} destinations, "
+          f"{index.status()['cells']} cells, loaded in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    points = [(destination['Latitude'], destination['Longitude']) for destination in destinations]
+    for label, options in CASES:
+        for latitude, longitude in points:
+            got = index.lookup(latitude, longitude, **options)
+            expected = brute_force(hotels, latitude, longitude, **options)
+            # The index computes the same haversine from precomputed radians
+            assert len(got) == len(expected) and all(
+                row['HotelID'] == hotel_id and abs(distance - expected_distance) < 1e-6
+                for (distance, row), (expected_distance, hotel_id) in zip(got, expected)
+            ), (label, latitude, longitude)
+
+        best = None
+        for _ in range(REPEATS):
+            started = time.perf_counter()
+            for latitude, longitude in points:
+                index.lookup(latitude, longitude, **options)
+            elapsed = (time.perf_counter() - started) / len(points)
+            best = elapsed if best is None else min(best, elapsed)
+        started = time.perf_counter()
+        brute_force(hotels, *points[0], **options)
+        brute = time.perf_counter() - started
+        print(f"{label:22} {best * 1e6:>10.1f} us/lookup   brute force {brute * 1000:>8.1f} ms "
+              f"({brute / best:,.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Response bytes and JSON encode time for ?fields= and ?format=compact.
+
+Builds synthetic result sets shaped like the /destinations, /bookings/user
+and /reports/hotels-booking-stats rows and encodes them the way Flask does
+(sorted keys, no whitespace), full and sparse, as objects and compact.
+Encode time is Python only; the projected SELECT also saves the MySQL read
+and transfer of the dropped columns, which this does not measure.
+
+    python benchmarks/projection_sizes.py [rows]
+"""
+import gzip
+import json
+import os
+import random
+import string
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import projection  # noqa: E402
+from json_encoding import json_default  # noqa: E402
+
+REPEATS = 5
+
+
+def _dumps(payload):
+    return json.dumps(payload, default=json_default, sort_keys=True, separators=(',', ':'))
+
+
+def _words(rng, count):
+    return ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(count))
+
+
+def destinations(rng, count):
+    return [{
+        'DestID': i,
+        'Name': f"{_words(rng, 2).title()} {i}",
+        'Location': _words(rng, 1).title(),
+        'Type': rng.choice(['Beach', 'Mountain', 'City', 'Heritage', 'Adventure', 'Religious']),
+        'Description': _words(rng, 25)[:255],
+        'Rating': rng.randint(1, 5),
+    } for i in range(1, count + 1)]
+
+
+def bookings(rng, count):
+    start = date(2024, 1, 1)
+    rows = []
+    for i in range(1, count + 1):
+        check_in = start + timedelta(days=rng.randint(0, 700))
+        rows.append({
+            'BookingID': i,
+            'CheckInDate': check_in.isoformat(),
+            'CheckOutDate': (check_in + timedelta(days=rng.randint(1, 9))).isoformat(),
+            'TotalPrice': Decimal(rng.randint(2000, 90000)) / 100 * 100,
+            'BookingStatus': rng.choice(['Confirmed', 'Confirmed', 'Cancelled']),
+            'BookingDate': check_in - timedelta(days=rng.randint(1, 60)),
+            'HotelName': f"{_words(rng, 2).title()} Hotel",
+            'HotelLocation': _words(rng, 1).title(),
+            'HotelRating': rng.randint(1, 5),
+        })
+    return rows
+
+
+def hotel_stats(rng, count):
+    return [{
+        'HotelID': i,
+        'HotelName': f"{_words(rng, 2).title()} Hotel {i}",
+        'Location': _words(rng, 1).title(),
+        'PricePerNight': Decimal(rng.randint(1500, 40000)) / 100 * 100,
+        'Rating': rng.randint(1, 5),
+        'TotalBookings': rng.randint(1, 900),
+        'ConfirmedBookings': rng.randint(1, 700),
+        'CancelledBookings': rng.randint(0, 200),
+        'TotalRevenue': Decimal(rng.randint(10 ** 5, 10 ** 8)) / 100,
+        'AvgBookingValue': Decimal(rng.randint(10 ** 5, 10 ** 7)) / 10000,
+    } for i in range(1, count + 1)]
+
+
+CASES = [
+    ('/destinations', destinations, ['DestID', 'Name']),
+    ('/bookings/user', bookings, ['BookingStatus']),
+    ('/reports/hotels-booking-stats', hotel_stats, ['HotelName', 'TotalRevenue']),
+]
+
+
+def measure(rows, fields, compact):
+    columns = fields or list(rows[0])
+    best, body = None, None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        # Projection itself happens in SQL; only the encoding is timed here
+        body = _dumps({'success': True, 'rows': projection.encode(rows, columns, compact)})
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    data = body.encode('utf-8')
+    return len(data), len(gzip.compress(data, 6)), best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    print(f"{count} rows, best of {REPEATS}")
+    print(f"{'endpoint':32} {'variant':28} {'bytes':>12} {'gzip':>10} {'encode ms':>10}")
+    for endpoint, build, fields in CASES:
+        rows = build(rng, count)
+        sparse = projection.project(rows, fields)
+        baseline = None
+        for label, data, chosen, compact in (
+            ('all columns', rows, None, False),
+            ('all columns, compact', rows, None, True),
+            (f"fields={','.join(fields)}", sparse, fields, False),
+            ('fields=..., compact', sparse, fields, True),
+        ):
+            size, zipped, seconds = measure(data, chosen, compact)
+            baseline = baseline or (size, seconds)
+            print(f"{endpoint:32} {label:28} {size:>12,} {zipped:>10,} {seconds * 1000:>10.1f}"
+                  f"   ({size / baseline[0]:.0%} bytes, {seconds / baseline[1]:.0%} time)")
+
+
+if __name__ == '__main__':
+    main()
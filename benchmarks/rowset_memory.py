@@ -0,0 +1,140 @@
+"""Time and peak memory of the dict path vs rowset.RowSet for large reports.
+
+Builds synthetic cursor output (tuples) shaped like the
+/reports/bookings-with-hotel-details and /payments/transactions rows and
+turns it into a response body both ways:
+
+    dicts     a dict per row (what queries.fetch_all builds), then one
+              json.dumps of the whole document (what jsonify does)
+    rowset    RowSet over the same tuples, streamed by rowset.json_chunks
+              (and rowset.msgpack_chunks when msgpack is installed)
+
+The tuples themselves are built beforehand and are not counted; peak
+memory is what each path allocates on top of them (tracemalloc, measured
+in a separate run from the timing). The streamed chunks are consumed one
+by one the way the WSGI server writes them, not joined.
+
+    python benchmarks/rowset_memory.py [rows]
+"""
+import json
+import os
+import random
+import string
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rowset  # noqa: E402
+from json_encoding import json_default  # noqa: E402
+
+REPEATS = 3
+
+
+def _words(rng, count):
+    return ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(count))
+
+
+BOOKING_COLUMNS = (
+    'BookingID', 'CheckInDate', 'CheckOutDate', 'TotalPrice', 'BookingStatus', 'HotelName',
+    'HotelLocation', 'PricePerNight', 'HotelRating', 'UserName', 'BookingDate',
+)
+
+
+def bookings_with_hotel_details(rng, count):
+    start = date(2024, 1, 1)
+    rows = []
+    for i in range(1, count + 1):
+        check_in = start + timedelta(days=rng.randint(0, 700))
+        rows.append((
+            i,
+            check_in,
+            check_in + timedelta(days=rng.randint(1, 9)),
+            Decimal(rng.randint(2000, 90000)),
+            rng.choice(['Confirmed', 'Confirmed', 'Cancelled']),
+            f"{_words(rng, 2).title()} Hotel",
+            _words(rng, 1).title(),
+            Decimal(rng.randint(1500, 40000)),
+            rng.randint(1, 5),
+            _words(rng, 2).title(),
+            datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 6 * 10 ** 7)),
+        ))
+    return rows
+
+
+PAYMENT_COLUMNS = ('TransactionID', 'BookingID', 'Amount', 'PaymentStatus', 'TransactionDate', 'UserID', 'HotelName')
+
+
+def payment_transactions(rng, count):
+    return [(
+        i,
+        rng.randint(1, count),
+        Decimal(rng.randint(2000, 90000)),
+        rng.choice(['Pending', 'Completed', 'Completed', 'Failed']),
+        datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 6 * 10 ** 7)),
+        rng.randint(1, 5000),
+        f"{_words(rng, 2).title()} Hotel",
+    ) for i in range(1, count + 1)]
+
+
+CASES = [
+    ('/reports/bookings-with-hotel-details', 'bookings', BOOKING_COLUMNS, bookings_with_hotel_details),
+    ('/payments/transactions', 'transactions', PAYMENT_COLUMNS, payment_transactions),
+]
+
+
+def dict_path(key, columns, rows, compact):
+    dicts = [dict(zip(columns, row)) for row in rows]
+    if compact:
+        dicts = [list(columns)] + [[row[column] for column in columns] for row in dicts]
+    body = json.dumps({'success': True, key: dicts}, default=json_default, sort_keys=True, separators=(',', ':'))
+    return len(body)
+
+
+def rowset_path(key, columns, rows, compact):
+    return sum(len(chunk) for chunk in rowset.json_chunks({'success': True}, key, rowset.RowSet(columns, rows), compact))
+
+
+def msgpack_path(key, columns, rows, compact):
+    return sum(len(chunk) for chunk in rowset.msgpack_chunks({'success': True}, key, rowset.RowSet(columns, rows), compact))
+
+
+def measure(build):
+    best = None
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        size = build()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, best, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    paths = [('dicts', dict_path), ('rowset json', rowset_path)]
+    if rowset.msgpack is not None:
+        paths.append(('rowset msgpack', msgpack_path))
+    print(f"{count} rows, best of {REPEATS}")
+    print(f"{'endpoint':38} {'path':24} {'bytes':>12} {'ms':>9} {'peak MiB':>9}")
+    for endpoint, key, columns, build in CASES:
+        rows = build(rng, count)
+        for compact in (False, True):
+            baseline = None
+            for label, path in paths:
+                size, seconds, peak = measure(lambda: path(key, columns, rows, compact))
+                baseline = baseline or (seconds, peak)
+                label = f"{label}{', compact' if compact else ''}"
+                print(f"{endpoint:38} {label:24} {size:>12,} {seconds * 1000:>9.1f} {peak / 2 ** 20:>9.1f}"
+                      f"   ({seconds / baseline[0]:.0%} time, {peak / baseline[1]:.0%} memory)")
+
+
+if __name__ == '__main__':
+    main()
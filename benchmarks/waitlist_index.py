@@ -0,0 +1,58 @@
+"""Overlap lookups in waitlist.IntervalTreap vs scanning every waiting request.
+
+Fills one hotel's treap with synthetic waiting stays (check-in within
+DAYS days, 1-7 nights), then times the lookup a cancellation does: the
+requests sharing a night with a freed stay. Each answer is checked against
+the linear scan first.
+
+    python benchmarks/waitlist_index.py [requests]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import waitlist  # noqa: E402
+
+DAYS = 3650
+LOOKUPS = 2000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(42)
+    stays = {}
+    tree = waitlist.IntervalTreap(random.Random(7))
+    started = time.perf_counter()
+    for entry_id in range(1, count + 1):
+        check_in = rng.randrange(DAYS)
+        stays[entry_id] = (check_in, check_in + rng.randint(1, 7))
+        tree.insert(*stays[entry_id], entry_id)
+    print(f"{count} waiting requests, built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    freed = []
+    for _ in range(LOOKUPS):
+        check_in = rng.randrange(DAYS)
+        freed.append((check_in, check_in + rng.randint(1, 3)))
+
+    def scan(start, end):
+        return [entry_id for entry_id, (check_in, check_out) in stays.items() if check_in < end and check_out > start]
+
+    for start, end in freed[:50]:
+        assert sorted(tree.overlapping(start, end)) == scan(start, end), (start, end)
+
+    started = time.perf_counter()
+    found = sum(len(tree.overlapping(start, end)) for start, end in freed)
+    treap = (time.perf_counter() - started) / LOOKUPS
+    started = time.perf_counter()
+    for start, end in freed[:50]:
+        scan(start, end)
+    linear = (time.perf_counter() - started) / 50
+    print(f"{found / LOOKUPS:,.0f} matches per freed stay")
+    print(f"treap {treap * 1e6:>10.1f} us/lookup   scan {linear * 1e6:>10.1f} us/lookup ({linear / treap:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
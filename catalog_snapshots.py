@@ -0,0 +1,73 @@
+"""Last known good copies of catalog listings for degraded mode.
+
+Catalog routes (/hotels, /destinations) save every successful result here;
+while the database is unavailable they serve the saved copy instead of an
+error, so browsing keeps working during an outage. Copies live in memory
+and in CATALOG_SNAPSHOT_DIR (JSON, replaced atomically) so they survive a
+restart. Disk writes are skipped when the listing did not change and are
+throttled to one per SNAPSHOT_MIN_INTERVAL seconds per listing.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from json_encoding import json_default
+
+SNAPSHOT_DIR = os.environ.get(
+    'CATALOG_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'snapshots')
+)
+SNAPSHOT_MIN_INTERVAL = 30
+
+_lock = threading.Lock()
+_snapshots = {}     # name -> {'rows', 'savedAt', 'digest', 'writtenAt'}
+
+
+def _path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.json")
+
+
+def save(name, rows):
+    """Remember rows as the latest good copy of a listing"""
+    body = json.dumps(rows, default=json_default, sort_keys=True)
+    digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+    now = time.time()
+    with _lock:
+        current = _snapshots.get(name)
+        if current and current['digest'] == digest:
+            current['savedAt'] = now
+            return
+        stored = json.loads(body)
+        if current and now - current['writtenAt'] < SNAPSHOT_MIN_INTERVAL:
+            # Keep the newest copy in memory; disk catches up on a later save
+            _snapshots[name] = dict(current, rows=stored, savedAt=now, digest=None)
+            return
+        _snapshots[name] = {'rows': stored, 'savedAt': now, 'digest': digest, 'writtenAt': now}
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        temp = f"{_path(name)}.{os.getpid()}.tmp"
+        with open(temp, 'w', encoding='utf-8') as handle:
+            json.dump({'savedAt': now, 'rows': stored}, handle)
+        os.replace(temp, _path(name))
+    except OSError as err:
+        print(f"Could not write catalog snapshot {name}: {err}")
+
+
+def load(name):
+    """(rows, saved at epoch seconds) of the latest good copy, or (None, None)"""
+    with _lock:
+        current = _snapshots.get(name)
+        if current:
+            return current['rows'], current['savedAt']
+    try:
+        with open(_path(name), encoding='utf-8') as handle:
+            stored = json.load(handle)
+    except (OSError, ValueError):
+        return None, None
+    with _lock:
+        _snapshots.setdefault(name, {
+            'rows': stored['rows'], 'savedAt': stored['savedAt'], 'digest': None, 'writtenAt': 0.0,
+        })
+    return stored['rows'], stored['savedAt']
@@ -0,0 +1,312 @@
+"""Catalog sync from full supplier feeds.
+
+A feed is a JSON object with any of these lists, rows keyed by column name
+and identified by their primary key:
+
+    destinations  DestID, Name, Location, Type, Description, Rating,
+                  Latitude, Longitude
+    availability  AvailabilityID, DestID, Cost
+    activities    ActivityID, DestID, Name, Description, Cost, Duration
+    transport     TransportID, AvailabilityID, OriginDestID, Type, Provider, Cost
+
+Every list present is the complete truth for its table: rows are diffed in
+Python against one SELECT per table, and only the differences are written.
+
+    deletes  child tables first, set-based DELETE ... WHERE pk IN (...)
+    upserts  parent tables first, multi-row INSERT ... ON DUPLICATE KEY UPDATE
+
+Writes go out in chunks of CHUNK_SIZE rows, one transaction per chunk, so a
+100k-row feed is a few hundred statements. Row triggers still fire, which
+keeps TransportChange (route graph), GeoChange (nearby hotels) and
+TableVersion current; Includes rows of deleted destinations are removed
+explicitly for the same reason.
+
+Run from the command line with:
+
+    python catalog_sync.py feed.json [--dry-run] [--keep-missing]
+"""
+import argparse
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+CHUNK_SIZE = 1000
+DEFAULT_DURATION = 120
+CENTS = Decimal('0.01')
+# DECIMAL(9, 6) coordinates
+MICRODEGREES = Decimal('0.000001')
+
+
+class CatalogSyncError(ValueError):
+    """Invalid feed (reported to the client as a 400)"""
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+def _integer(value):
+    return None if value is None else int(value)
+
+
+def _money(value):
+    return None if value is None else Decimal(str(value)).quantize(CENTS)
+
+
+def _coordinate(value):
+    return None if value is None else Decimal(str(value)).quantize(MICRODEGREES)
+
+
+def _day(value):
+    if value is None or (isinstance(value, date) and not isinstance(value, datetime)):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _flag(value):
+    return None if value is None else int(bool(value))
+
+
+class TableSpec:
+    """How one feed list maps onto a table"""
+
+    def __init__(self, feed_key, table, key, columns, required, defaults=None, unique=None, where=None):
+        self.feed_key = feed_key
+        self.table = table
+        self.key = key
+        self.columns = columns          # [(column, converter)], key excluded
+        self.required = set(required)
+        self.defaults = defaults or {}
+        self.unique = unique            # a UNIQUE column other than the key
+        self.where = where              # the rows of the table this spec owns
+
+    def normalize(self, row, position):
+        try:
+            key = int(row[self.key])
+        except (KeyError, TypeError, ValueError):
+            raise CatalogSyncError(f"{self.feed_key}[{position}]: {self.key} must be an integer") from None
+        values = []
+        for column, convert in self.columns:
+            if column in row:
+                value = row[column]
+            elif column in self.required:
+                raise CatalogSyncError(f"{self.feed_key}[{position}]: {column} is required")
+            else:
+                value = self.defaults.get(column)
+            try:
+                values.append(convert(value))
+            except (TypeError, ValueError, InvalidOperation):
+                raise CatalogSyncError(f"{self.feed_key}[{position}]: invalid {column}") from None
+        return key, tuple(values)
+
+    def select_sql(self):
+        names = ', '.join([self.key] + [column for column, _convert in self.columns])
+        if self.where:
+            return f"SELECT {names} FROM {self.table} WHERE {self.where}"
+        return f"SELECT {names} FROM {self.table}"
+
+    def upsert_sql(self):
+        names = [self.key] + [column for column, _convert in self.columns]
+        updates = ', '.join(f"{column} = VALUES({column})" for column, _convert in self.columns)
+        return (f"INSERT INTO {self.table} ({', '.join(names)}) "
+                f"VALUES ({', '.join(['%s'] * len(names))}) "
+                f"ON DUPLICATE KEY UPDATE {updates}")
+
+
+# Parent tables first
+TABLES = [
+    TableSpec('destinations', 'Destination', 'DestID', [
+        ('Name', _text), ('Location', _text), ('Type', _text), ('Description', _text), ('Rating', _integer),
+        ('Latitude', _coordinate), ('Longitude', _coordinate),
+    ], required=['Name', 'Location'], unique='Name'),
+    TableSpec('availability', 'Availability', 'AvailabilityID', [
+        ('DestID', _integer), ('Cost', _money),
+    ], required=['DestID', 'Cost']),
+    TableSpec('activities', 'Activity', 'ActivityID', [
+        ('DestID', _integer), ('Name', _text), ('Description', _text), ('Cost', _money), ('Duration', _integer),
+    ], required=['DestID', 'Name', 'Cost'], defaults={'Duration': DEFAULT_DURATION}),
+    TableSpec('transport', 'Transport', 'TransportID', [
+        ('AvailabilityID', _integer), ('OriginDestID', _integer), ('Type', _text), ('Provider', _text), ('Cost', _money),
+    ], required=['AvailabilityID', 'Type', 'Provider', 'Cost']),
+]
+
+# Not part of supplier feeds; shards.py copies hotels from the catalog shard
+HOTELS = TableSpec('hotels', 'Hotel', 'HotelID', [
+    ('Name', _text), ('Location', _text), ('Rating', _integer), ('PricePerNight', _money), ('AvailableRooms', _integer),
+    ('Latitude', _coordinate), ('Longitude', _coordinate),
+], required=['Name', 'Location', 'PricePerNight'], unique='Name')
+
+# Pricing (pricing.py), copied with the hotels: nightly rates, and the standing
+# offers that are discount rules (offers of a booking stay on its shard)
+RATES = TableSpec('rates', 'HotelRate', 'RateID', [
+    ('HotelID', _integer), ('Night', _day), ('Price', _money),
+], required=['HotelID', 'Night', 'Price'])
+OFFERS = TableSpec('offers', 'Offers', 'OfferID', [
+    ('HotelID', _integer), ('Description', _text), ('Rating', _integer), ('DiscountPercent', _money),
+    ('ValidFrom', _day), ('ValidTo', _day), ('MinNights', _integer), ('MinAdvanceDays', _integer),
+    ('WeekendOnly', _flag),
+], required=['HotelID', 'DiscountPercent'], where='BookingID IS NULL')
+
+
+# ============================================
+# DIFF
+# ============================================
+
+def _chunks(items, size=CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _load_existing(cursor, spec):
+    cursor.execute(spec.select_sql())
+    existing = {}
+    for row in cursor.fetchall():
+        values = tuple(convert(value) for (_column, convert), value in zip(spec.columns, row[1:]))
+        existing[row[0]] = values
+    return existing
+
+
+def diff_table(spec, feed_rows, existing, prune=True):
+    """(upserts, deletes, counts, incoming rows by key) turning existing into feed_rows"""
+    incoming = {}
+    for position, row in enumerate(feed_rows):
+        key, values = spec.normalize(row, position)
+        if key in incoming:
+            raise CatalogSyncError(f"{spec.feed_key}: duplicate {spec.key} {key}")
+        incoming[key] = values
+
+    upserts, inserted, updated = [], 0, 0
+    for key, values in incoming.items():
+        current = existing.get(key)
+        if current == values:
+            continue
+        upserts.append((key,) + values)
+        if current is None:
+            inserted += 1
+        else:
+            updated += 1
+    deletes = sorted(key for key in existing if key not in incoming) if prune else []
+    counts = {
+        'inserted': inserted,
+        'updated': updated,
+        'deleted': len(deletes),
+        'unchanged': len(incoming) - inserted - updated,
+    }
+    return upserts, deletes, counts, incoming
+
+
+def _unique_conflicts(spec, upserts, existing, deletes, incoming):
+    """Surviving rows whose unique value is being taken over by another row
+    They are parked under a placeholder first, otherwise ON DUPLICATE KEY
+    would update the old holder instead of the intended row.
+    """
+    position = [column for column, _convert in spec.columns].index(spec.unique)
+    deleted = set(deletes)
+    wanted = {}
+    for key, values in incoming.items():
+        value = values[position]
+        if value in wanted:
+            raise CatalogSyncError(f"{spec.feed_key}: duplicate {spec.unique} {value!r}")
+        wanted[value] = key
+    holders = {values[position]: key for key, values in existing.items() if key not in deleted}
+    changing = {row[0] for row in upserts}
+    parked = []
+    for row in upserts:
+        holder = holders.get(row[1 + position])
+        if holder is None or holder == row[0]:
+            continue
+        if holder not in changing:
+            raise CatalogSyncError(
+                f"{spec.feed_key}: {spec.unique} {row[1 + position]!r} is already used by {spec.key} {holder}"
+            )
+        parked.append(holder)
+    return sorted(set(parked))
+
+
+# ============================================
+# APPLY
+# ============================================
+
+def sync(conn, feed, prune=True, dry_run=False, tables=TABLES):
+    """Apply a feed; returns a per-table change summary"""
+    if not isinstance(feed, dict):
+        raise CatalogSyncError('Feed must be a JSON object')
+    specs = [spec for spec in tables if spec.feed_key in feed]
+    if not specs:
+        raise CatalogSyncError(f"Feed has none of: {', '.join(spec.feed_key for spec in tables)}")
+    started = time.perf_counter()
+
+    cursor = conn.cursor()
+    plans = []
+    for spec in specs:
+        rows = feed[spec.feed_key]
+        if not isinstance(rows, list):
+            raise CatalogSyncError(f"{spec.feed_key} must be a list")
+        existing = _load_existing(cursor, spec)
+        upserts, deletes, counts, incoming = diff_table(spec, rows, existing, prune)
+        parked = _unique_conflicts(spec, upserts, existing, deletes, incoming) if spec.unique else []
+        plans.append((spec, upserts, deletes, counts, parked))
+    # The SELECTs above opened a read snapshot; writes start from a fresh one
+    conn.commit()
+
+    summary = {spec.table: counts for spec, _upserts, _deletes, counts, _parked in plans}
+    chunks = 0
+    if not dry_run:
+        # Children first, so parents are never deleted out from under them
+        for spec, _upserts, deletes, _counts, _parked in reversed(plans):
+            for chunk in _chunks(deletes):
+                marks = ', '.join(['%s'] * len(chunk))
+                if spec.table == 'Destination':
+                    # Includes cascades would bypass the recommender's version trigger
+                    cursor.execute(f"DELETE FROM Includes WHERE DestID IN ({marks})", chunk)
+                cursor.execute(f"DELETE FROM {spec.table} WHERE {spec.key} IN ({marks})", chunk)
+                conn.commit()
+                chunks += 1
+
+        for spec, upserts, _deletes, _counts, parked in plans:
+            for chunk in _chunks(parked):
+                marks = ', '.join(['%s'] * len(chunk))
+                cursor.execute(
+                    f"UPDATE {spec.table} SET {spec.unique} = CONCAT('#sync-', {spec.key}) "
+                    f"WHERE {spec.key} IN ({marks})",
+                    chunk
+                )
+                conn.commit()
+                chunks += 1
+            sql = spec.upsert_sql()
+            for chunk in _chunks(upserts):
+                # executemany folds these into one multi-row INSERT
+                cursor.executemany(sql, chunk)
+                conn.commit()
+                chunks += 1
+    cursor.close()
+
+    return {
+        'tables': summary,
+        'dryRun': dry_run,
+        'pruned': prune,
+        'chunks': chunks,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sync Destination/Activity/Availability/Transport from a feed')
+    parser.add_argument('feed', help='JSON feed file')
+    parser.add_argument('--dry-run', action='store_true', help='report changes without writing')
+    parser.add_argument('--keep-missing', action='store_true', help='do not delete rows absent from the feed')
+    args = parser.parse_args()
+
+    with open(args.feed, encoding='utf-8') as handle:
+        feed_data = json.load(handle)
+
+    # Same connection settings (and environment overrides) as the app
+    from app import get_db_connection
+
+    connection = get_db_connection()
+    try:
+        result = sync(connection, feed_data, prune=not args.keep_missing, dry_run=args.dry_run)
+    finally:
+        connection.close()
+    print(json.dumps(result, indent=2))
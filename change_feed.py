@@ -0,0 +1,164 @@
+"""In-process change feed pushed to the SPA over Server-Sent Events.
+
+Write routes publish the entity they changed (booking created/cancelled,
+itinerary created/deleted, destination created/deleted). Booking and
+itinerary events go to their owner only; destination events go to everyone.
+
+Published events are kept in a bounded ring buffer with increasing ids, so a
+reconnecting EventSource resumes from its Last-Event-ID. An id that fell out
+of the buffer (or comes from before a restart) gets a single `reset` event,
+telling the client to reload its lists once.
+
+A connected stream sleeps on a per-connection Event that publish() sets,
+with a heartbeat comment every HEARTBEAT_SECONDS, so idle streams do not
+poll. It still holds its WSGI request thread for as long as the client
+stays connected. Cooperative workers (gevent) are not a supported
+deployment: mysql-connector's C extension and the shards.fan_out thread
+pool would block the event loop. The number of open streams per process is
+capped instead, so streams cannot take every request thread; a client over
+the cap gets a 503 and retries. Events are per process; with several
+workers each client still sees the writes handled by its own worker only.
+
+Configuration (environment variables):
+    CHANGE_FEED_MAX_STREAMS   open streams per process (default 32); keep it
+                              below the server's request threads
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from json_encoding import json_default
+
+RING_SIZE = 10000
+HEARTBEAT_SECONDS = 15
+RETRY_MILLISECONDS = 3000
+MAX_STREAMS = int(os.environ.get('CHANGE_FEED_MAX_STREAMS', 32))
+
+
+def _format(event_id, event_type, data):
+    return f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+class ChangeFeed:
+    """Ring buffer of change events plus the streams waiting on them"""
+
+    def __init__(self, size=RING_SIZE, max_streams=MAX_STREAMS):
+        # Ids carry a boot token so ids from before a restart are recognised
+        self.boot = format(int(time.time()), 'x')
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=size)   # (seq, user_id or None, type, json)
+        self._seq = 0
+        self._waiters = {}                  # user_id -> set of threading.Event
+        self.published = 0
+        self.max_streams = max_streams
+        self._open = 0                      # streams admitted and not yet closed
+        self.refused = 0
+
+    def acquire(self):
+        """Admit one more stream, False when max_streams are open; every
+        admitted stream must be release()d when its response closes
+        """
+        with self._lock:
+            if self._open >= self.max_streams:
+                self.refused += 1
+                return False
+            self._open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._open -= 1
+
+    def _event_id(self, seq):
+        return f"{self.boot}-{seq}"
+
+    def _parse_id(self, event_id):
+        """Sequence number after which to resume, or None if unknown"""
+        boot, _, seq = (event_id or '').partition('-')
+        if boot != self.boot or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def publish(self, event_type, payload, user_id=None):
+        """Record an event for user_id (None = every user) and wake its streams"""
+        data = json.dumps(payload, default=json_default, separators=(',', ':'))
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, user_id, event_type, data))
+            self.published += 1
+            if user_id is None:
+                waiters = [waiter for group in self._waiters.values() for waiter in group]
+            else:
+                waiters = list(self._waiters.get(user_id, ()))
+        for waiter in waiters:
+            waiter.set()
+
+    def _pending(self, user_id, after):
+        """(events for user_id with seq > after, new position, reset needed)"""
+        with self._lock:
+            latest = self._seq
+            oldest = self._events[0][0] if self._events else latest + 1
+            if after is None or after > latest or after < oldest - 1:
+                return [], latest, True
+            events = []
+            # Newest first, stopping at the resume point
+            for event in reversed(self._events):
+                if event[0] <= after:
+                    break
+                if event[1] is None or event[1] == user_id:
+                    events.append(event)
+        events.reverse()
+        return events, latest, False
+
+    def _register(self, user_id, waiter):
+        with self._lock:
+            self._waiters.setdefault(user_id, set()).add(waiter)
+
+    def _unregister(self, user_id, waiter):
+        with self._lock:
+            group = self._waiters.get(user_id)
+            if group is not None:
+                group.discard(waiter)
+                if not group:
+                    del self._waiters[user_id]
+
+    def stream(self, user_id, last_event_id=None):
+        """SSE text chunks for one connection; runs until the client goes away"""
+        waiter = threading.Event()
+        self._register(user_id, waiter)
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            with self._lock:
+                current = self._seq
+            after = self._parse_id(last_event_id) if last_event_id else current
+            while True:
+                waiter.clear()
+                events, after, reset = self._pending(user_id, after)
+                if reset:
+                    yield _format(self._event_id(after), 'reset', '{}')
+                    continue
+                if events:
+                    yield ''.join(_format(self._event_id(seq), event_type, data)
+                                  for seq, _user, event_type, data in events)
+                    continue
+                if not waiter.wait(HEARTBEAT_SECONDS):
+                    yield ': keepalive\n\n'
+        finally:
+            self._unregister(user_id, waiter)
+
+    def status(self):
+        with self._lock:
+            return {
+                'published': self.published,
+                'buffered': len(self._events),
+                'lastEventId': self._event_id(self._seq),
+                'streams': sum(len(group) for group in self._waiters.values()),
+                'maxStreams': self.max_streams,
+                'refused': self.refused,
+                'users': len(self._waiters),
+            }
+
+
+feed = ChangeFeed()
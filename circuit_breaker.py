@@ -0,0 +1,150 @@
+"""Circuit breaker around database access.
+
+Every connection checkout (pool ping or new connect, replica lag probe
+included) is timed and reported to the breaker; so are query errors that
+mean the server is unreachable (client-side CR_* errors such as "server has
+gone away"). A checkout slower than DB_BREAKER_SLOW_SECONDS counts as a
+failure too.
+
+    closed     calls go through; once at least MIN_CALLS of the last WINDOW
+               outcomes are recorded and FAILURE_RATE of them failed, the
+               breaker opens
+    open       get_db_connection() raises DatabaseUnavailable immediately
+               (the app answers 503 with Retry-After) for OPEN_SECONDS
+    half-open  one probe request at a time is let through; success closes
+               the breaker, failure opens it again
+
+Configuration (environment variables):
+    DB_BREAKER_ENABLED        set to 0 to disable (default 1)
+    DB_BREAKER_WINDOW         outcomes kept (default 20)
+    DB_BREAKER_MIN_CALLS      outcomes needed before tripping (default 10)
+    DB_BREAKER_FAILURE_RATE   failure share that trips it (default 0.5)
+    DB_BREAKER_SLOW_SECONDS   checkout latency counted as a failure (default 1)
+    DB_BREAKER_OPEN_SECONDS   time before a probe is allowed (default 10)
+"""
+import os
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# MySQL client errors (CR_*) are 2000-2999: the server could not be reached
+# or the connection broke, as opposed to a bad statement
+CLIENT_ERROR_RANGE = range(2000, 3000)
+
+
+class DatabaseUnavailable(Exception):
+    """The database is known to be down; answered with a 503"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+def is_connectivity_error(err):
+    return getattr(err, 'errno', None) in CLIENT_ERROR_RANGE
+
+
+class CircuitBreaker:
+    """Failure-rate and latency based breaker with half-open probing"""
+
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, slow_seconds=1.0,
+                 open_seconds=10.0, enabled=True):
+        self.enabled = enabled
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)
+        self.state = CLOSED
+        self._opened_until = 0.0
+        self._probing = False
+        self.trips = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            window=int(os.environ.get('DB_BREAKER_WINDOW', 20)),
+            min_calls=int(os.environ.get('DB_BREAKER_MIN_CALLS', 10)),
+            failure_rate=float(os.environ.get('DB_BREAKER_FAILURE_RATE', 0.5)),
+            slow_seconds=float(os.environ.get('DB_BREAKER_SLOW_SECONDS', 1.0)),
+            open_seconds=float(os.environ.get('DB_BREAKER_OPEN_SECONDS', 10.0)),
+            enabled=os.environ.get('DB_BREAKER_ENABLED', '1') != '0',
+        )
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_until = now + self.open_seconds
+        self._probing = False
+        self._outcomes.clear()
+        self.trips += 1
+        print(f"Database circuit opened for {self.open_seconds:g}s")
+
+    def before_call(self):
+        """Raise DatabaseUnavailable unless a DB call may be attempted now"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._opened_until:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            retry_after = self._opened_until - now if self.state == OPEN else 1
+        raise DatabaseUnavailable('Database is unavailable, please retry shortly', retry_after)
+
+    def record(self, elapsed, ok=True):
+        """Report the outcome of a call let through by before_call()"""
+        if not self.enabled:
+            return
+        failed = not ok or elapsed > self.slow_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == HALF_OPEN:
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._probing = False
+                    print("Database circuit closed")
+                return
+            if self.state == OPEN:
+                return
+            self._outcomes.append(failed)
+            if (len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) >= self.failure_rate * len(self._outcomes)):
+                self._open(now)
+
+    def record_error(self, err):
+        """Report a query error; only connectivity errors count"""
+        if is_connectivity_error(err):
+            self.record(0.0, ok=False)
+
+    def status(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                'enabled': self.enabled,
+                'state': self.state,
+                'recentCalls': len(outcomes),
+                'recentFailures': sum(outcomes),
+                'failureRateThreshold': self.failure_rate,
+                'slowSeconds': self.slow_seconds,
+                'openSeconds': self.open_seconds,
+                'retryInSeconds': round(max(0.0, self._opened_until - time.monotonic()), 1)
+                if self.state == OPEN else 0,
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+breaker = CircuitBreaker.from_env()
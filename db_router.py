@@ -0,0 +1,240 @@
+"""Read/write splitting between a primary MySQL server and its replicas.
+
+Writes, and reads that must see the caller's own recent writes, go to the
+primary. Other reads go to a replica whose replication lag is within the
+configured staleness bound; when no replica qualifies (lagging, broken or
+unreachable) reads fall back to the primary automatically.
+
+Configuration (environment variables, primary defaults match app.py):
+    DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME   primary server
+    DB_REPLICAS            comma separated host[:port] list, same credentials
+    DB_MAX_REPLICA_LAG     staleness bound in seconds (default 5)
+    DB_LAG_CHECK_INTERVAL  seconds between lag probes per replica (default 2)
+    DB_REPLICA_LAG_CHECK   set to 0 to trust replicas without probing lag
+    DB_POOL_SIZE           connections per server pool (default 10)
+    DB_CONNECT_TIMEOUT     seconds to wait for a new connection (default 3)
+"""
+import itertools
+import os
+import threading
+import time
+
+import mysql.connector
+import mysql.connector.pooling
+
+# How long a replica that failed to connect is skipped before retrying
+REPLICA_RETRY_AFTER = 10
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def _parse_host(spec, default_port):
+    host, _, port = spec.strip().partition(':')
+    return host, int(port) if port else default_port
+
+
+class DatabaseNode:
+    """One MySQL server with its own lazily created connection pool"""
+
+    def __init__(self, name, config, pool_size):
+        self.name = name
+        self.config = config
+        self.pool_size = pool_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Replica health, refreshed by DatabaseRouter
+        self.lag = None
+        self.lag_checked_at = 0.0
+        self.down_until = 0.0
+        self.reads = 0
+        self.errors = 0
+        # One-off connections opened because the pool was exhausted
+        self.overflows = 0
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # pool_reset_session=False keeps prepared statements
+                    # (queries.py) alive between requests
+                    self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name=f"travel_{self.name}",
+                        pool_size=self.pool_size,
+                        pool_reset_session=False,
+                        **self.config
+                    )
+        return self._pool
+
+    def connect(self):
+        """Check a connection out of the pool (one-off connection if exhausted)"""
+        try:
+            connection = self._get_pool().get_connection()
+        except mysql.connector.errors.PoolError:
+            self.overflows += 1
+            print(f"Connection pool {self.name} exhausted ({self.pool_size}), "
+                  f"opening a one-off connection ({self.overflows} so far)")
+            return mysql.connector.connect(**self.config)
+        # Sessions are not reset on return to the pool, so make sure no
+        # read snapshot from the previous request is still open
+        if connection.in_transaction:
+            connection.rollback()
+        return connection
+
+    def status(self):
+        return {
+            'name': self.name,
+            'host': self.config['host'],
+            'port': self.config.get('port', 3306),
+            'lagSeconds': self.lag,
+            'down': self.down_until > time.monotonic(),
+            'reads': self.reads,
+            'errors': self.errors,
+            'poolOverflows': self.overflows,
+        }
+
+
+def release_connection(connection):
+    """Close a connection unless that already happened
+    A pooled connection must not be closed twice: the second close() would
+    hand a fresh connection to the pool (or fail on a full one).
+    """
+    if isinstance(connection, mysql.connector.pooling.PooledMySQLConnection):
+        # close() sets _cnx to None once the connection is back in its pool
+        if connection._cnx is None:
+            return
+    connection.close()
+
+
+class DatabaseRouter:
+    """Routes connections to the primary or a sufficiently fresh replica"""
+
+    def __init__(self, primary_config, replica_configs=(), max_lag=5.0,
+                 lag_check_interval=2.0, check_lag=True, pool_size=10):
+        self.primary = DatabaseNode('primary', primary_config, pool_size)
+        self.replicas = [
+            DatabaseNode(f"replica{index}", config, pool_size)
+            for index, config in enumerate(replica_configs, start=1)
+        ]
+        self.max_lag = max_lag
+        self.lag_check_interval = lag_check_interval
+        self.check_lag = check_lag
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self.primary_fallbacks = 0
+
+    @classmethod
+    def from_env(cls, defaults):
+        """Build a router from environment variables over app defaults"""
+        primary = dict(defaults)
+        primary['host'] = os.environ.get('DB_HOST', primary['host'])
+        primary['port'] = _env_int('DB_PORT', primary.get('port', 3306))
+        primary['user'] = os.environ.get('DB_USER', primary['user'])
+        primary['password'] = os.environ.get('DB_PASSWORD', primary['password'])
+        primary['database'] = os.environ.get('DB_NAME', primary['database'])
+        # Fail fast instead of hanging on an unreachable server
+        primary['connection_timeout'] = _env_int('DB_CONNECT_TIMEOUT', primary.get('connection_timeout', 3))
+
+        replicas = []
+        for spec in filter(None, os.environ.get('DB_REPLICAS', '').split(',')):
+            host, port = _parse_host(spec, 3306)
+            replica = dict(primary)
+            replica['host'] = host
+            replica['port'] = port
+            replicas.append(replica)
+
+        return cls(
+            primary,
+            replicas,
+            max_lag=_env_float('DB_MAX_REPLICA_LAG', 5),
+            lag_check_interval=_env_float('DB_LAG_CHECK_INTERVAL', 2),
+            check_lag=os.environ.get('DB_REPLICA_LAG_CHECK', '1') != '0',
+            pool_size=_env_int('DB_POOL_SIZE', 10),
+        )
+
+    # ---------------- lag tracking ----------------
+
+    @staticmethod
+    def _measure_lag(connection):
+        """Seconds behind the source, or None if replication is not running"""
+        cursor = connection.cursor(dictionary=True)
+        try:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except mysql.connector.Error:
+                # MySQL < 8.0.22
+                cursor.execute("SHOW SLAVE STATUS")
+            row = cursor.fetchone()
+            cursor.fetchall()
+        finally:
+            cursor.close()
+        if not row:
+            return None
+        lag = row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+        return float(lag) if lag is not None else None
+
+    def _lag_ok(self, node, connection):
+        if not self.check_lag:
+            return True
+        now = time.monotonic()
+        if now - node.lag_checked_at >= self.lag_check_interval:
+            node.lag = self._measure_lag(connection)
+            node.lag_checked_at = now
+        return node.lag is not None and node.lag <= self.max_lag
+
+    def _candidate_replicas(self):
+        """Replicas in round-robin order, skipping known-bad ones"""
+        if not self.replicas:
+            return []
+        start = next(self._round_robin)
+        ordered = self.replicas[start % len(self.replicas):] + self.replicas[:start % len(self.replicas)]
+        now = time.monotonic()
+        return [
+            node for node in ordered
+            if node.down_until <= now
+            and (not self.check_lag
+                 or node.lag_checked_at == 0.0
+                 or now - node.lag_checked_at >= self.lag_check_interval
+                 or (node.lag is not None and node.lag <= self.max_lag))
+        ]
+
+    # ---------------- routing ----------------
+
+    def connection(self, readonly=False):
+        """Return a connection: a fresh-enough replica for reads, else primary"""
+        if readonly:
+            for node in self._candidate_replicas():
+                try:
+                    connection = node.connect()
+                except mysql.connector.Error as err:
+                    node.errors += 1
+                    node.down_until = time.monotonic() + REPLICA_RETRY_AFTER
+                    print(f"Replica {node.name} unavailable: {err}")
+                    continue
+                try:
+                    if self._lag_ok(node, connection):
+                        node.reads += 1
+                        return connection
+                except mysql.connector.Error as err:
+                    node.errors += 1
+                    node.down_until = time.monotonic() + REPLICA_RETRY_AFTER
+                    print(f"Replica {node.name} lag check failed: {err}")
+                connection.close()
+            if self.replicas:
+                with self._lock:
+                    self.primary_fallbacks += 1
+        return self.primary.connect()
+
+    def status(self):
+        return {
+            'maxLagSeconds': self.max_lag,
+            'lagCheckEnabled': self.check_lag,
+            'primaryFallbacks': self.primary_fallbacks,
+            'primary': self.primary.status(),
+            'replicas': [node.status() for node in self.replicas],
+        }
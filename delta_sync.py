@@ -0,0 +1,92 @@
+"""Delta sync of a user's bookings, itineraries and payments.
+
+Booking, Itinerary, Includes and PaymentTransaction carry an UpdatedAt
+column (TIMESTAMP(6), maintained by MySQL on insert and update). Deleted
+bookings, itineraries and payments leave a row in SyncTombstone. Includes
+changes touch their itinerary, so an itinerary comes back whenever its
+destinations change.
+
+    GET /sync/user/<id>              everything, plus a token
+    GET /sync/user/<id>?since=<tok>  rows changed and ids deleted since then
+
+Every query is a range scan on (UserID, UpdatedAt) or (UserID, DeletedAt),
+so the work and payload grow with the number of changes, not with the
+size of the history. Clients apply the rows as upserts and the deletions
+as removals; a deleted booking takes its payments with it.
+
+The next token is the database clock at the start of the sync minus
+SYNC_OVERLAP_SECONDS. Rows that were written just before the sync but
+committed just after it are therefore sent on the next sync too, which is
+harmless for upserts. A token older than the tombstone retention
+(SYNC_TOMBSTONE_DAYS) cannot prove nothing was deleted, so the answer is
+a full sync (`full: true`) that replaces the client's copy.
+
+Configuration (environment variables):
+    SYNC_OVERLAP_SECONDS   re-sent window covering in-flight commits (default 5)
+    SYNC_TOMBSTONE_DAYS    how long deletions are remembered (default 30)
+"""
+import os
+from datetime import datetime, timedelta
+
+import queries
+
+OVERLAP_SECONDS = float(os.environ.get('SYNC_OVERLAP_SECONDS', 5))
+TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 30))
+
+# Older than any UpdatedAt (existing rows get the time the column was added)
+BEGINNING = datetime(2000, 1, 1)
+EPOCH = datetime(1970, 1, 1)
+
+ENTITY_LISTS = {'Booking': 'bookings', 'Itinerary': 'itineraries', 'Payment': 'payments'}
+
+
+class SyncTokenError(ValueError):
+    """Malformed since token (reported to the client as a 400)"""
+
+
+def encode_token(moment):
+    """Opaque token for a database timestamp (microseconds since 1970)"""
+    return format((moment - EPOCH) // timedelta(microseconds=1), 'x')
+
+
+def decode_token(token):
+    try:
+        micros = int(token, 16)
+    except (TypeError, ValueError):
+        raise SyncTokenError('Invalid since token') from None
+    if micros < 0:
+        raise SyncTokenError('Invalid since token')
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def changes(conn, user_id, since_token=None):
+    """Rows changed since the token, deleted ids, and the next token"""
+    since = decode_token(since_token) if since_token else None
+
+    # First statement of the transaction: the clock and the read view agree
+    now = queries.fetch_value(conn, 'sync_clock')
+    full = since is None or since < now - timedelta(days=TOMBSTONE_DAYS)
+    after = BEGINNING if full else since
+
+    result = {
+        'full': full,
+        'bookings': queries.fetch_all(conn, 'sync_bookings', (user_id, after)),
+        'itineraries': queries.fetch_all(conn, 'sync_itineraries', (user_id, after)),
+        'payments': queries.fetch_all(conn, 'sync_payments', (user_id, after)),
+        'deleted': {name: [] for name in ENTITY_LISTS.values()},
+    }
+    for itinerary in result['itineraries']:
+        dest_ids = itinerary.pop('DestIDs')
+        itinerary['DestIDs'] = [int(dest_id) for dest_id in dest_ids.split(',')] if dest_ids else []
+    if not full:
+        for row in queries.fetch_all(conn, 'sync_tombstones', (user_id, after)):
+            result['deleted'][ENTITY_LISTS[row['EntityType']]].append(row['EntityID'])
+    conn.commit()
+
+    next_from = now - timedelta(seconds=OVERLAP_SECONDS)
+    if since is not None and not full:
+        next_from = max(next_from, since)
+    result['token'] = encode_token(next_from)
+    result['changes'] = (len(result['bookings']) + len(result['itineraries']) + len(result['payments'])
+                         + sum(len(ids) for ids in result['deleted'].values()))
+    return result
@@ -0,0 +1,313 @@
+"""Write-through cache of single rows looked up by primary key.
+
+    booking  /booking/details/<BookingID>                 GetBookingDetails row
+    user     /user/profile/<UserID>                       profile + TotalBookings
+    payment  /payments/transactions/booking/<BookingID>   payment row
+
+Entries are filled on a miss and kept for ENTITY_CACHE_TTL seconds, at most
+ENTITY_CACHE_SIZE of them (least recently used first out). The write
+routes keep them current: update_user and update_payment_status patch the
+cached row in place, booking create/cancel patch or drop the rows they make
+stale. Hotel columns inside booking and payment rows are only refreshed
+by the TTL (hotels are not edited through the app).
+
+A fill carries the time its read started; a row invalidated after that
+moment is not overwritten with what the read returned, so a slow read
+racing a write cannot put the old row back.
+
+Backends (ENTITY_CACHE_BACKEND):
+    memory  per-process LRU (default). Writes only reach the cache of the
+            worker that handled them; other workers catch up within the TTL.
+    sqlite  one SQLite file (ENTITY_CACHE_PATH) shared by every worker on
+            the host, so a patch or invalidation is seen by all of them.
+            Expired rows are swept and the file trimmed back to
+            ENTITY_CACHE_SIZE every SWEEP_EVERY fills. Values are pickled;
+            the file must not be writable by others.
+
+Configuration (environment variables):
+    ENTITY_CACHE_BACKEND  memory | sqlite (default memory)
+    ENTITY_CACHE_SIZE     entries kept, 0 disables the cache (default 10000)
+    ENTITY_CACHE_TTL      seconds an entry is served (default 300)
+    ENTITY_CACHE_PATH     SQLite file (default instance/entity_cache.sqlite3)
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+BOOKING = 'booking'
+USER = 'user'
+PAYMENT = 'payment'
+KINDS = (BOOKING, USER, PAYMENT)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'entity_cache.sqlite3')
+
+# SQLite backend: expired rows are swept every this many fills
+SWEEP_EVERY = 200
+
+
+class MemoryBackend:
+    """Per-process LRU: (kind, key) -> [value or None, expires_at, invalidated_at]"""
+
+    name = 'memory'
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, kind, key, now):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[(kind, key)]
+                return None
+            self._entries.move_to_end((kind, key))
+            return entry[0]
+
+    def fill(self, kind, key, value, started, expires_at):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is not None and entry[2] is not None and entry[2] >= started:
+                return False
+            self._entries[(kind, key)] = [value, expires_at, entry[2] if entry else None]
+            self._entries.move_to_end((kind, key))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+            return True
+
+    def patch(self, kind, key, changes, now):
+        with self._lock:
+            entry = self._entries.get((kind, key))
+            if entry is None or entry[0] is None or entry[1] <= now:
+                return False
+            entry[0] = dict(entry[0], **changes)
+            # Fills from reads that started before this write are refused
+            entry[2] = now
+            return True
+
+    def invalidate(self, kind, key, now, expires_at):
+        # Kept as a tombstone so that older in-flight fills are refused
+        with self._lock:
+            self._entries[(kind, key)] = [None, expires_at, now]
+            self._entries.move_to_end((kind, key))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def entries(self):
+        with self._lock:
+            return sum(1 for entry in self._entries.values() if entry[0] is not None)
+
+
+class SqliteBackend:
+    """Entries in a SQLite file shared by the worker processes of one host"""
+
+    name = 'sqlite'
+
+    def __init__(self, size, path):
+        self.size = size
+        self.path = path
+        self._local = threading.local()
+        self._fills = 0
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entity_cache (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB,
+                expires_at REAL NOT NULL,
+                invalidated_at REAL,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS entity_cache_expiry ON entity_cache (expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; every statement is its own short transaction
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, kind, key, now):
+        row = self._conn().execute(
+            "SELECT value FROM entity_cache WHERE kind = ? AND key = ? AND expires_at > ? AND value IS NOT NULL",
+            (kind, str(key), now)
+        ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def fill(self, kind, key, value, started, expires_at):
+        cursor = self._conn().execute("""
+            INSERT INTO entity_cache (kind, key, value, expires_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+            WHERE entity_cache.invalidated_at IS NULL OR entity_cache.invalidated_at < ?
+        """, (kind, str(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires_at, started))
+        self._fills += 1
+        if self._fills % SWEEP_EVERY == 0:
+            self._sweep(started)
+        return cursor.rowcount > 0
+
+    def _sweep(self, now):
+        conn = self._conn()
+        conn.execute("DELETE FROM entity_cache WHERE expires_at <= ?", (now,))
+        (count,) = conn.execute("SELECT COUNT(*) FROM entity_cache").fetchone()
+        if count > self.size:
+            # Soonest to expire = least recently filled
+            conn.execute("""
+                DELETE FROM entity_cache WHERE (kind, key) IN (
+                    SELECT kind, key FROM entity_cache ORDER BY expires_at LIMIT ?
+                )
+            """, (count - self.size,))
+
+    def patch(self, kind, key, changes, now):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM entity_cache WHERE kind = ? AND key = ? AND expires_at > ? AND value IS NOT NULL",
+                (kind, str(key), now)
+            ).fetchone()
+            if row:
+                value = dict(pickle.loads(row[0]), **changes)
+                conn.execute(
+                    "UPDATE entity_cache SET value = ?, invalidated_at = ? WHERE kind = ? AND key = ?",
+                    (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now, kind, str(key))
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def invalidate(self, kind, key, now, expires_at):
+        self._conn().execute("""
+            INSERT INTO entity_cache (kind, key, value, expires_at, invalidated_at) VALUES (?, ?, NULL, ?, ?)
+            ON CONFLICT (kind, key) DO UPDATE SET
+                value = NULL, expires_at = excluded.expires_at, invalidated_at = excluded.invalidated_at
+        """, (kind, str(key), expires_at, now))
+
+    def entries(self):
+        (count,) = self._conn().execute(
+            "SELECT COUNT(*) FROM entity_cache WHERE value IS NOT NULL AND expires_at > ?", (time.time(),)
+        ).fetchone()
+        return count
+
+
+class EntityCache:
+    """Backend plus per-kind counters; backend failures count as misses"""
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.counters = {kind: {'hits': 0, 'misses': 0, 'fills': 0, 'patches': 0, 'invalidations': 0}
+                         for kind in KINDS}
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        size = int(os.environ.get('ENTITY_CACHE_SIZE', 10000))
+        ttl = float(os.environ.get('ENTITY_CACHE_TTL', 300))
+        if size <= 0:
+            return cls(None, ttl)
+        if os.environ.get('ENTITY_CACHE_BACKEND', 'memory') == 'sqlite':
+            try:
+                return cls(SqliteBackend(size, os.environ.get('ENTITY_CACHE_PATH', DEFAULT_PATH)), ttl)
+            except (OSError, sqlite3.Error) as err:
+                print(f"Entity cache: SQLite backend unavailable ({err}), using memory")
+        return cls(MemoryBackend(size), ttl)
+
+    @staticmethod
+    def clock():
+        """Wall clock: the SQLite backend compares stamps across processes"""
+        return time.time()
+
+    def _count(self, kind, counter, amount=1):
+        with self._lock:
+            self.counters[kind][counter] += amount
+
+    def _failed(self, err):
+        with self._lock:
+            self.errors += 1
+        print(f"Entity cache error: {err}")
+
+    def get(self, kind, key):
+        """Cached row or None"""
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(kind, key, self.clock())
+        except sqlite3.Error as err:
+            self._failed(err)
+            value = None
+        self._count(kind, 'hits' if value is not None else 'misses')
+        return value
+
+    def fill(self, kind, key, value, started):
+        """Store a row read from the database; started = clock() before the read"""
+        if self.backend is None:
+            return
+        try:
+            if self.backend.fill(kind, key, value, started, self.clock() + self.ttl):
+                self._count(kind, 'fills')
+        except sqlite3.Error as err:
+            self._failed(err)
+
+    def patch(self, kind, key, changes):
+        """Write-through: apply column changes to a cached row, if there is one
+        Without one the key is invalidated instead, so that a read which
+        started before the write cannot fill the old row afterwards.
+        """
+        if self.backend is None:
+            return
+        try:
+            if self.backend.patch(kind, key, changes, self.clock()):
+                self._count(kind, 'patches')
+            else:
+                self.invalidate(kind, key)
+        except sqlite3.Error as err:
+            # The cached row may now be stale; make sure it is not served
+            self._failed(err)
+            self.invalidate(kind, key)
+
+    def invalidate(self, kind, *keys):
+        """Drop rows (and refuse fills from reads that started earlier)"""
+        if self.backend is None:
+            return
+        now = self.clock()
+        for key in keys:
+            try:
+                self.backend.invalidate(kind, key, now, now + self.ttl)
+            except sqlite3.Error as err:
+                self._failed(err)
+        self._count(kind, 'invalidations', len(keys))
+
+    def status(self):
+        if self.backend is None:
+            return {'enabled': False}
+        try:
+            entries = self.backend.entries()
+        except sqlite3.Error as err:
+            self._failed(err)
+            entries = None
+        with self._lock:
+            return {
+                'enabled': True,
+                'backend': self.backend.name,
+                'size': self.backend.size,
+                'ttlSeconds': self.ttl,
+                'entries': entries,
+                'errors': self.errors,
+                'kinds': {kind: dict(counters) for kind, counters in self.counters.items()},
+            }
+
+
+cache = EntityCache.from_env()
@@ -0,0 +1,424 @@
+"""In-memory spatial index of hotels for "hotels near this destination".
+
+Hotel and Destination carry Latitude/Longitude (DECIMAL(9, 6), NULL = not
+placed). The index buckets every placed hotel into a fixed grid of
+GEO_CELL_DEGREES x GEO_CELL_DEGREES cells and answers from memory:
+
+    k nearest      rings of cells around the destination are scanned
+                   outwards until the next ring is provably farther away
+                   than the k-th hotel found
+    within radius  the same scan, stopping at the radius
+
+Distances are great-circle (haversine) kilometres. Price and rating filters
+are applied while scanning, so k results are k matching hotels.
+
+Like the transport graph, the index is loaded once and then kept current
+incrementally: triggers created by app.py append the id of every hotel or
+destination whose name, location, rating, price or coordinates change (or
+that is inserted or deleted) to GeoChange, and the index re-reads just
+those rows, copying only the grid cells they touch. The change log is
+polled at most once per `poll_interval` seconds with an overlap window.
+
+Configuration (environment variables):
+    GEO_CELL_DEGREES   grid cell size in degrees (default 0.1, about 11 km)
+"""
+import heapq
+import math
+import os
+import threading
+import time
+
+import queries
+
+CELL_DEGREES = float(os.environ.get('GEO_CELL_DEGREES', 0.1))
+
+EARTH_RADIUS_KM = 6371.0088
+
+DEFAULT_K = 10
+MAX_K = 100
+# Hotels returned for a radius-only lookup
+MAX_RESULTS = 500
+
+# Re-read changes logged this many seconds before the newest one seen
+CHANGE_OVERLAP_SECONDS = 10
+
+# GeoChange rows older than this are purged at startup (app.py); an index
+# that has not polled for that long reloads from scratch
+CHANGE_LOG_RETENTION_HOURS = 24
+
+
+class GeoError(ValueError):
+    """Invalid lookup parameters (reported to the client as a 400)"""
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in degrees"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return _a_to_km(a)
+
+
+def _a_to_km(a):
+    """Distance for the haversine term a = sin^2(d / 2R)"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _Snapshot:
+    """One consistent version of the index; replaced, never modified"""
+
+    __slots__ = ('hotels', 'cells', 'destinations')
+
+    def __init__(self, hotels, cells, destinations):
+        self.hotels = hotels              # HotelID -> (cell, point, output row)
+        self.cells = cells                # (row, col) -> tuple of points
+        self.destinations = destinations  # DestID -> (latitude, longitude, name)
+
+
+class HotelGeoIndex:
+    """Grid of hotel points, refreshed from GeoChange"""
+
+    def __init__(self, cell_degrees=CELL_DEGREES, poll_interval=1.0):
+        self.cell_degrees = cell_degrees
+        self.rows = math.ceil(180 / cell_degrees)
+        self.cols = math.ceil(360 / cell_degrees)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._snapshot = _Snapshot({}, {}, {})
+        self._loaded = False
+        self._change_mark = None
+        self._seen_changes = set()
+        self._polled_at = 0.0
+        self._polled_wall = 0.0
+        self.full_loads = 0
+        self.incremental_updates = 0
+
+    # ---------------- grid ----------------
+
+    def _cell(self, latitude, longitude):
+        row = min(int((latitude + 90) / self.cell_degrees), self.rows - 1)
+        col = int((longitude + 180) / self.cell_degrees) % self.cols
+        return row, col
+
+    def _hotel_entry(self, row):
+        """(cell, point, output row) of a Hotel row, or None if it has no coordinates"""
+        if row['Latitude'] is None or row['Longitude'] is None:
+            return None
+        latitude, longitude = float(row['Latitude']), float(row['Longitude'])
+        phi = math.radians(latitude)
+        price = float(row['PricePerNight']) if row['PricePerNight'] is not None else None
+        # Points are tuples: radians and cos(latitude) precomputed for haversine
+        point = (phi, math.radians(longitude), math.cos(phi), price, row['Rating'] or 0, row['HotelID'])
+        output = {
+            'HotelID': row['HotelID'],
+            'Name': row['Name'],
+            'Location': row['Location'],
+            'Rating': row['Rating'],
+            'PricePerNight': row['PricePerNight'],
+            'Latitude': row['Latitude'],
+            'Longitude': row['Longitude'],
+        }
+        return self._cell(latitude, longitude), point, output
+
+    @staticmethod
+    def _destination_entry(row):
+        if row['Latitude'] is None or row['Longitude'] is None:
+            return None
+        return float(row['Latitude']), float(row['Longitude']), row['Name']
+
+    def load_rows(self, hotel_rows, destination_rows):
+        """Replace the whole index (rows as returned by geo_hotels/geo_destinations)"""
+        hotels, buckets = {}, {}
+        for row in hotel_rows:
+            entry = self._hotel_entry(row)
+            if entry is not None:
+                hotels[row['HotelID']] = entry
+                buckets.setdefault(entry[0], []).append(entry[1])
+        destinations = {}
+        for row in destination_rows:
+            entry = self._destination_entry(row)
+            if entry is not None:
+                destinations[row['DestID']] = entry
+        cells = {cell: tuple(points) for cell, points in buckets.items()}
+        self._snapshot = _Snapshot(hotels, cells, destinations)
+
+    def _apply_rows(self, hotel_ids, hotel_rows, dest_ids, destination_rows):
+        """Replace the given ids with their current rows (missing = deleted)"""
+        snapshot = self._snapshot
+        hotels = dict(snapshot.hotels)
+        cells = dict(snapshot.cells)
+        touched = {}
+
+        def bucket(cell):
+            if cell not in touched:
+                touched[cell] = list(cells.get(cell, ()))
+            return touched[cell]
+
+        for hotel_id in hotel_ids:
+            entry = hotels.pop(hotel_id, None)
+            if entry is not None:
+                points = bucket(entry[0])
+                points.remove(entry[1])
+        for row in hotel_rows:
+            entry = self._hotel_entry(row)
+            if entry is not None:
+                hotels[row['HotelID']] = entry
+                bucket(entry[0]).append(entry[1])
+        for cell, points in touched.items():
+            if points:
+                cells[cell] = tuple(points)
+            else:
+                cells.pop(cell, None)
+
+        destinations = snapshot.destinations
+        if dest_ids:
+            destinations = dict(destinations)
+            for dest_id in dest_ids:
+                destinations.pop(dest_id, None)
+            for row in destination_rows:
+                entry = self._destination_entry(row)
+                if entry is not None:
+                    destinations[row['DestID']] = entry
+
+        self._snapshot = _Snapshot(hotels, cells, destinations)
+
+    # ---------------- maintenance ----------------
+
+    def _load(self, conn):
+        mark = queries.fetch_one(conn, 'geo_change_mark')
+        self.load_rows(queries.fetch_all(conn, 'geo_hotels'), queries.fetch_all(conn, 'geo_destinations'))
+        self._change_mark = mark['LastChange']
+        self._seen_changes = set()
+        self._loaded = True
+        self.full_loads += 1
+
+    def _apply_changes(self, conn):
+        changes = queries.fetch_all(conn, 'geo_changes_since', (self._change_mark, CHANGE_OVERLAP_SECONDS))
+        # Rows inside the overlap window come back on every poll
+        fresh = [row for row in changes if row['ChangeID'] not in self._seen_changes]
+        self._seen_changes = {row['ChangeID'] for row in changes}
+        if not fresh:
+            return
+        hotel_ids = sorted({row['EntityID'] for row in fresh if row['TableName'] == 'Hotel'})
+        dest_ids = sorted({row['EntityID'] for row in fresh if row['TableName'] == 'Destination'})
+        hotel_rows, destination_rows = [], []
+        if hotel_ids:
+            placeholders = ', '.join(['%s'] * len(hotel_ids))
+            hotel_rows = queries.fetch_dynamic(conn, 'geo_hotels_by_id', f"""
+                SELECT HotelID, Name, Location, Rating, PricePerNight, Latitude, Longitude
+                FROM Hotel
+                WHERE HotelID IN ({placeholders})
+            """, tuple(hotel_ids))
+        if dest_ids:
+            placeholders = ', '.join(['%s'] * len(dest_ids))
+            destination_rows = queries.fetch_dynamic(conn, 'geo_destinations_by_id', f"""
+                SELECT DestID, Name, Latitude, Longitude
+                FROM Destination
+                WHERE DestID IN ({placeholders})
+            """, tuple(dest_ids))
+        self._apply_rows(hotel_ids, hotel_rows, dest_ids, destination_rows)
+        self._change_mark = max(self._change_mark or changes[0]['ChangedAt'],
+                                max(row['ChangedAt'] for row in changes))
+        self.incremental_updates += 1
+
+    def refresh(self, conn):
+        """Load the index on first use, then apply logged changes"""
+        now = time.monotonic()
+        if self._loaded and now - self._polled_at < self.poll_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._polled_at < self.poll_interval:
+                return
+            stale = time.time() - self._polled_wall > CHANGE_LOG_RETENTION_HOURS * 3600 - 60
+            if not self._loaded or stale:
+                self._load(conn)
+            else:
+                self._apply_changes(conn)
+            self._polled_at = now
+            self._polled_wall = time.time()
+
+    def invalidate(self):
+        """Force a full reload on the next refresh()"""
+        with self._lock:
+            self._loaded = False
+
+    def status(self):
+        snapshot = self._snapshot
+        return {
+            'hotels': len(snapshot.hotels),
+            'destinations': len(snapshot.destinations),
+            'cells': len(snapshot.cells),
+            'cellDegrees': self.cell_degrees,
+            'fullLoads': self.full_loads,
+            'incrementalUpdates': self.incremental_updates,
+        }
+
+    # ---------------- lookups ----------------
+
+    def _ring(self, row0, col0, ring):
+        """Cells at Chebyshev distance `ring` from (row0, col0); columns wrap"""
+        if ring == 0:
+            yield row0, col0
+            return
+        wide = 2 * ring + 1 >= self.cols
+        seen = set() if wide else None
+        for row in range(max(row0 - ring, 0), min(row0 + ring, self.rows - 1) + 1):
+            if row in (row0 - ring, row0 + ring):
+                cols = range(col0 - ring, col0 + ring + 1)
+            else:
+                cols = (col0 - ring, col0 + ring)
+            for col in cols:
+                col %= self.cols
+                if seen is not None:
+                    if (row, col) in seen:
+                        continue
+                    seen.add((row, col))
+                yield row, col
+
+    @staticmethod
+    def _along_km(degrees, pole):
+        """Shortest distance between two points `degrees` of longitude apart
+        whose latitudes are both within `pole` degrees of the equator
+        """
+        step = math.radians(min(degrees, 180.0))
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(math.radians(pole)) * math.sin(step / 2)))
+
+    def _gap_km(self, latitude, longitude, row0, col0, ring):
+        """Lower bound on the distance to any hotel outside rings 0..ring"""
+        size = self.cell_degrees
+        south = (row0 - ring) * size - 90
+        north = (row0 + ring + 1) * size - 90
+        across = [side for side, open_side in ((latitude - south, south > -90), (north - latitude, north < 90))
+                  if open_side]
+        gap = EARTH_RADIUS_KM * math.radians(min(across)) if across else math.inf
+        if 2 * ring + 1 < self.cols:
+            # Outside in longitude only: inside the rows scanned, whose
+            # poleward edge is where a degree of longitude is shortest
+            west = (col0 - ring) * size - 180
+            east = (col0 + ring + 1) * size - 180
+            pole = min(90.0, max(abs(south), abs(north)))
+            gap = min(gap, self._along_km(min(longitude - west, east - longitude), pole))
+        return gap
+
+    def _cell_km(self, cell, latitude, longitude):
+        """Lower bound on the distance to any point of a cell"""
+        row, col = cell
+        size = self.cell_degrees
+        south = row * size - 90
+        north = south + size
+        across = max(0.0, south - latitude, latitude - north)
+        centre = col * size - 180 + size / 2
+        along = max(0.0, abs((longitude - centre + 180) % 360 - 180) - size / 2)
+        pole = min(90.0, max(abs(south), abs(north), abs(latitude)))
+        return max(EARTH_RADIUS_KM * math.radians(across), self._along_km(along, pole))
+
+    def lookup(self, latitude, longitude, k=None, radius_km=None,
+               min_price=None, max_price=None, min_rating=None):
+        """[(distance km, hotel row)] nearest first: the k nearest (within
+        radius_km if given), or every hotel within radius_km (up to MAX_RESULTS);
+        DEFAULT_K nearest when neither is given
+        """
+        if k is None and radius_km is None:
+            k = DEFAULT_K
+        if k is not None and not 1 <= k <= MAX_K:
+            raise GeoError(f"k must be between 1 and {MAX_K}")
+        if radius_km is not None and not radius_km > 0:
+            raise GeoError("radiusKm must be positive")
+        if not -90 <= latitude <= 90:
+            raise GeoError("latitude must be between -90 and 90")
+        limit = k or MAX_RESULTS
+        longitude = (longitude + 180) % 360 - 180
+        snapshot = self._snapshot
+        cells = snapshot.cells
+        phi = math.radians(latitude)
+        lam = math.radians(longitude)
+        cos_phi = math.cos(phi)
+        # Hotels are ranked by the haversine term a = sin^2(d / 2R), which
+        # grows with the distance d; asin/sqrt only run for the results
+        a_max = math.sin(min(radius_km / (2 * EARTH_RADIUS_KM), math.pi / 2)) ** 2 if radius_km is not None else 1.0
+        filtered = min_rating is not None or min_price is not None or max_price is not None
+        best = []           # max-heap of (-a, HotelID)
+        sin = math.sin
+        heappush, heapreplace = heapq.heappush, heapq.heapreplace
+
+        def scan(points):
+            for p_phi, p_lam, p_cos, price, rating, hotel_id in points:
+                if filtered:
+                    if min_rating is not None and rating < min_rating:
+                        continue
+                    if min_price is not None and (price is None or price < min_price):
+                        continue
+                    if max_price is not None and (price is None or price > max_price):
+                        continue
+                a = sin((p_phi - phi) / 2) ** 2 + cos_phi * p_cos * sin((p_lam - lam) / 2) ** 2
+                if len(best) < limit:
+                    if a <= a_max:
+                        heappush(best, (-a, hotel_id))
+                elif a < -best[0][0]:
+                    heapreplace(best, (-a, hotel_id))
+
+        def worst_km():
+            """Distance a hotel must beat to get in; None while there is room"""
+            return _a_to_km(-best[0][0]) if len(best) == limit else None
+
+        def visit(cell, points):
+            # Skip cells that cannot hold anything closer than what we have
+            worst = worst_km()
+            if radius_km is not None or worst is not None:
+                bound = self._cell_km(cell, latitude, longitude)
+                if radius_km is not None and bound > radius_km:
+                    return
+                if worst is not None and bound > worst:
+                    return
+            scan(points)
+
+        row0, col0 = self._cell(latitude, longitude)
+        ring = 0
+        while True:
+            gap = self._gap_km(latitude, longitude, row0, col0, ring - 1) if ring else 0.0
+            if radius_km is not None and gap > radius_km:
+                break
+            worst = worst_km()
+            if worst is not None and gap > worst:
+                break
+            if ring and (2 * ring + 1) ** 2 > 4 * len(cells):
+                # Sparse grid (or few matches): visiting the occupied cells
+                # beats walking more, mostly empty, rings
+                for cell, points in cells.items():
+                    if not self._within(cell, row0, col0, ring - 1):
+                        visit(cell, points)
+                break
+            for cell in self._ring(row0, col0, ring):
+                points = cells.get(cell)
+                if points:
+                    visit(cell, points)
+            ring += 1
+        hotels = snapshot.hotels
+        return [(_a_to_km(-negative), hotels[hotel_id][2])
+                for negative, hotel_id in sorted(best, key=lambda item: (-item[0], item[1]))]
+
+    def _within(self, cell, row0, col0, ring):
+        """True if a cell is inside rings 0..ring around (row0, col0)"""
+        row, col = cell
+        offset = abs(col - col0) % self.cols
+        return abs(row - row0) <= ring and min(offset, self.cols - offset) <= ring
+
+    def near_destination(self, dest_id, **options):
+        """lookup() around a destination; None if it is unknown or has no coordinates"""
+        destination = self._snapshot.destinations.get(dest_id)
+        if destination is None:
+            return None
+        latitude, longitude, name = destination
+        return {
+            'DestID': dest_id,
+            'Name': name,
+            'Latitude': latitude,
+            'Longitude': longitude,
+            'hotels': [
+                dict(row, DistanceKm=round(distance, 3))
+                for distance, row in self.lookup(latitude, longitude, **options)
+            ],
+        }
+
+
+geo_index = HotelGeoIndex()
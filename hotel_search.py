@@ -0,0 +1,255 @@
+"""Faceted hotel search.
+
+Search filters (location, price range, minimum rating, date availability)
+are pushed into one SELECT that the composite Hotel indexes created by
+app.py can serve, and paged with keyset cursors instead of OFFSET.
+
+Facet counts come from an in-memory cube of hotel counts per
+(Location, rating bucket, price band), built with a single GROUP BY and
+rebuilt only when the Hotel table's TableVersion changes. Each facet is
+counted with every *other* active filter applied (disjunctive faceting);
+price filters are applied to the cube at price-band granularity and date
+availability is not reflected in facet counts.
+"""
+import base64
+import json
+import threading
+from decimal import Decimal
+
+import queries
+from table_versions import VersionWatcher
+
+# Upper bounds of the price bands; the last band is open-ended
+PRICE_BAND_EDGES = (2000, 4000, 6000, 8000, 10000)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+HOTEL_COLUMNS = "h.HotelID, h.Name, h.Location, h.Rating, h.PricePerNight, h.AvailableRooms"
+
+# sort key -> (column, direction)
+SORTS = {
+    'price_asc': ('PricePerNight', 'ASC'),
+    'price_desc': ('PricePerNight', 'DESC'),
+    'rating_desc': ('Rating', 'DESC'),
+    'rating_asc': ('Rating', 'ASC'),
+    'name': ('Name', 'ASC'),
+}
+DEFAULT_SORT = 'rating_desc'
+
+
+class SearchError(ValueError):
+    """Invalid search parameters (reported to the client as a 400)"""
+
+
+def price_band_label(band):
+    lower = PRICE_BAND_EDGES[band - 1] if band > 0 else 0
+    if band < len(PRICE_BAND_EDGES):
+        return f"{lower}-{PRICE_BAND_EDGES[band]}"
+    return f"{lower}+"
+
+
+def price_band_sql():
+    """CASE expression that maps PricePerNight onto a band index"""
+    cases = ' '.join(
+        f"WHEN PricePerNight < {edge} THEN {index}"
+        for index, edge in enumerate(PRICE_BAND_EDGES)
+    )
+    return f"CASE {cases} ELSE {len(PRICE_BAND_EDGES)} END"
+
+
+def band_overlaps(band, min_price, max_price):
+    lower = PRICE_BAND_EDGES[band - 1] if band > 0 else 0
+    upper = PRICE_BAND_EDGES[band] if band < len(PRICE_BAND_EDGES) else None
+    if max_price is not None and lower > max_price:
+        return False
+    if min_price is not None and upper is not None and upper <= min_price:
+        return False
+    return True
+
+
+# ============================================
+# CURSORS
+# ============================================
+
+def encode_cursor(sort_value, hotel_id):
+    if isinstance(sort_value, Decimal):
+        sort_value = str(sort_value)
+    raw = json.dumps([sort_value, hotel_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, column):
+    """(sort value, HotelID) of a cursor for a sort on column
+    The sort value is checked against the column's type: a string for Name,
+    a finite number (or numeric string) for PricePerNight, and for Rating
+    also None.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, hotel_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(hotel_id, bool) or not isinstance(hotel_id, int):
+            raise TypeError
+        return _cursor_value(column, sort_value), hotel_id
+    except (ValueError, TypeError, ArithmeticError):
+        raise SearchError('Invalid cursor')
+
+
+def _cursor_value(column, value):
+    if column == 'Name':
+        if not isinstance(value, str):
+            raise TypeError
+        return value
+    if value is None and column == 'Rating':
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError
+    # decimal.InvalidOperation is an ArithmeticError
+    value = Decimal(str(value))
+    if not value.is_finite():
+        raise ValueError
+    return value
+
+
+# ============================================
+# FACET CACHE
+# ============================================
+
+class FacetCache:
+    """Hotel counts per (location, rating, price band), kept per Hotel version"""
+
+    def __init__(self):
+        self.watcher = VersionWatcher(['Hotel'])
+        self._lock = threading.Lock()
+        self._version = None
+        self._cells = []
+
+    def _cube(self, conn):
+        version = self.watcher.current(conn)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    rows = queries.fetch_dynamic(conn, 'hotel_facet_cube', f"""
+                        SELECT Location, COALESCE(Rating, 0) AS Rating,
+                               {price_band_sql()} AS PriceBand, COUNT(*) AS Hotels
+                        FROM Hotel
+                        GROUP BY Location, COALESCE(Rating, 0), PriceBand
+                    """)
+                    self._cells = [
+                        (row['Location'], int(row['Rating']), int(row['PriceBand']), row['Hotels'])
+                        for row in rows
+                    ]
+                    self._version = version
+        return self._cells
+
+    def invalidate(self):
+        self.watcher.expire()
+
+    def facets(self, conn, location=None, min_rating=None, min_price=None, max_price=None):
+        cells = self._cube(conn)
+        locations, ratings, bands = {}, {}, {}
+        for cell_location, rating, band, count in cells:
+            location_ok = location is None or cell_location == location
+            rating_ok = min_rating is None or rating >= min_rating
+            price_ok = band_overlaps(band, min_price, max_price)
+            if rating_ok and price_ok:
+                locations[cell_location] = locations.get(cell_location, 0) + count
+            if location_ok and price_ok:
+                ratings[rating] = ratings.get(rating, 0) + count
+            if location_ok and rating_ok:
+                bands[band] = bands.get(band, 0) + count
+
+        return {
+            'location': [
+                {'value': name, 'count': count}
+                for name, count in sorted(locations.items(), key=lambda item: (-item[1], item[0]))
+            ],
+            'rating': [
+                {'value': rating, 'label': f"{rating} star" if rating else 'Unrated', 'count': count}
+                for rating, count in sorted(ratings.items(), reverse=True)
+            ],
+            'priceBand': [
+                {'value': band, 'label': price_band_label(band), 'count': count}
+                for band, count in sorted(bands.items())
+            ],
+        }
+
+
+facet_cache = FacetCache()
+
+
+# ============================================
+# SEARCH
+# ============================================
+
+def _keyset_condition(column, direction, cursor, params):
+    """WHERE fragment that continues after (sort value, HotelID)"""
+    value, hotel_id = cursor
+    op = '>' if direction == 'ASC' else '<'
+    if column == 'Rating':
+        # Rating is nullable: MySQL sorts NULLs first ascending, last descending
+        if value is None:
+            params.append(hotel_id)
+            if direction == 'ASC':
+                return f"((h.Rating IS NULL AND h.HotelID {op} %s) OR h.Rating IS NOT NULL)"
+            return f"(h.Rating IS NULL AND h.HotelID {op} %s)"
+        params.extend([value, value, hotel_id])
+        condition = f"(h.Rating {op} %s OR (h.Rating = %s AND h.HotelID {op} %s)"
+        return condition + (" OR h.Rating IS NULL)" if direction == 'DESC' else ")")
+    if column == 'Name':
+        params.append(value)
+        return f"h.Name {op} %s"
+    params.extend([value, value, hotel_id])
+    return f"(h.{column} {op} %s OR (h.{column} = %s AND h.HotelID {op} %s))"
+
+
+def search(conn, location=None, min_price=None, max_price=None, min_rating=None,
+           check_in=None, check_out=None, sort=DEFAULT_SORT, limit=DEFAULT_PAGE_SIZE,
+           cursor=None):
+    """Return (hotels, next_cursor) for the given filters"""
+    if sort not in SORTS:
+        raise SearchError(f"sort must be one of: {', '.join(SORTS)}")
+    if (check_in is None) != (check_out is None):
+        raise SearchError('checkIn and checkOut must be given together')
+    if check_in is not None and check_out <= check_in:
+        raise SearchError('checkOut must be after checkIn')
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+    column, direction = SORTS[sort]
+    conditions, params = [], []
+    if location:
+        conditions.append("h.Location = %s")
+        params.append(location)
+    if min_price is not None:
+        conditions.append("h.PricePerNight >= %s")
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append("h.PricePerNight <= %s")
+        params.append(max_price)
+    if min_rating is not None:
+        conditions.append("h.Rating >= %s")
+        params.append(min_rating)
+    if check_in is not None:
+        # A hotel is available unless some night of the stay is fully booked
+        conditions.append("""NOT EXISTS (
+            SELECT 1 FROM HotelNightInventory inv
+            WHERE inv.HotelID = h.HotelID
+              AND inv.Night >= %s AND inv.Night < %s
+              AND inv.Booked >= inv.Capacity
+        )""")
+        params.extend([check_in, check_out])
+    if cursor:
+        conditions.append(_keyset_condition(column, direction, decode_cursor(cursor, column), params))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    order = f"h.{column} {direction}" if column == 'Name' else f"h.{column} {direction}, h.HotelID {direction}"
+    sql = f"SELECT {HOTEL_COLUMNS} FROM Hotel h {where} ORDER BY {order} LIMIT %s"
+    params.append(limit + 1)
+
+    rows = queries.fetch_dynamic(conn, 'hotel_search', sql, tuple(params))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[column], last['HotelID'])
+    return rows, next_cursor
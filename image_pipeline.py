@@ -0,0 +1,253 @@
+"""Image derivative pipeline for the images/ folder.
+
+Derivatives (resized JPEG + WebP at fixed widths) are generated ahead of time
+by running:
+
+    python image_pipeline.py [--workers N] [--force]
+
+Every derivative is named after a hash of its own bytes, so its URL never
+changes meaning and can be cached forever. A manifest written next to the
+derivatives maps each original image to its variants; app.py reads that
+manifest to pick a format/width per request. Requests never resize anything.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGES_DIR = os.path.join(BASE_DIR, 'images')
+DERIVED_DIRNAME = 'derived'
+DERIVED_DIR = os.path.join(IMAGES_DIR, DERIVED_DIRNAME)
+MANIFEST_PATH = os.path.join(DERIVED_DIR, 'manifest.json')
+
+# Fixed widths; the original width is always added as the largest variant
+WIDTHS = (320, 640, 1280, 1920)
+SOURCE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# format key -> (Pillow format, save options, mimetype)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}, 'image/webp'),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}, 'image/jpeg'),
+}
+
+# Fingerprinted files are immutable; negotiated originals are revalidated daily
+IMMUTABLE_MAX_AGE = 31536000
+NEGOTIATED_MAX_AGE = 86400
+
+
+# ============================================
+# BUILD (runs offline, in worker processes)
+# ============================================
+
+def _file_digest(path):
+    """Return the sha256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path, data):
+    """Write bytes to path via a temp file so readers never see partial files"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as handle:
+        handle.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_derivatives(filename, source_hash):
+    """Generate every width/format derivative for one image (worker process)"""
+    from PIL import Image, ImageOps
+
+    source_path = os.path.join(IMAGES_DIR, filename)
+    stem = os.path.splitext(filename)[0]
+
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        width, height = image.size
+
+        targets = sorted({w for w in WIDTHS if w < width} | {width})
+        variants = []
+        for target_width in targets:
+            if target_width == width:
+                resized = image
+            else:
+                target_height = max(1, round(height * target_width / width))
+                resized = image.resize((target_width, target_height), Image.LANCZOS)
+
+            for ext, (pil_format, options, mimetype) in FORMATS.items():
+                frame = resized
+                if pil_format == 'JPEG' and frame.mode != 'RGB':
+                    frame = frame.convert('RGB')
+                buffer = io.BytesIO()
+                frame.save(buffer, pil_format, **options)
+                data = buffer.getvalue()
+
+                content_hash = hashlib.sha256(data).hexdigest()[:16]
+                name = f"{stem}-{target_width}.{content_hash}.{ext}"
+                path = os.path.join(DERIVED_DIR, name)
+                if not os.path.exists(path):
+                    _write_atomic(path, data)
+
+                variants.append({
+                    'width': target_width,
+                    'format': ext,
+                    'mimetype': mimetype,
+                    'file': name,
+                    'hash': content_hash,
+                    'bytes': len(data),
+                })
+
+    return filename, {
+        'sourceHash': source_hash,
+        'width': width,
+        'height': height,
+        'variants': variants,
+    }
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the derivative manifest, or an empty one if it was never built"""
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_all(workers=None, force=False):
+    """Rebuild derivatives for new/changed images using a process pool"""
+    os.makedirs(DERIVED_DIR, exist_ok=True)
+    manifest = {} if force else load_manifest()
+
+    sources = sorted(
+        name for name in os.listdir(IMAGES_DIR)
+        if name.lower().endswith(SOURCE_EXTENSIONS)
+        and os.path.isfile(os.path.join(IMAGES_DIR, name))
+    )
+
+    jobs = []
+    for name in sources:
+        source_hash = _file_digest(os.path.join(IMAGES_DIR, name))
+        entry = manifest.get(name)
+        up_to_date = (
+            entry is not None
+            and entry.get('sourceHash') == source_hash
+            and all(os.path.exists(os.path.join(DERIVED_DIR, v['file'])) for v in entry['variants'])
+        )
+        if not up_to_date:
+            jobs.append((name, source_hash))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(build_derivatives, name, source_hash) for name, source_hash in jobs]
+            for future in futures:
+                name, entry = future.result()
+                manifest[name] = entry
+                print(f"Built {len(entry['variants'])} derivatives for {name}")
+
+    # Drop originals that were removed from images/
+    manifest = {name: manifest[name] for name in sources if name in manifest}
+
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+
+    # Remove derivatives that are no longer referenced
+    referenced = {v['file'] for entry in manifest.values() for v in entry['variants']}
+    for name in os.listdir(DERIVED_DIR):
+        if name != os.path.basename(MANIFEST_PATH) and name not in referenced:
+            os.remove(os.path.join(DERIVED_DIR, name))
+
+    print(f"Image manifest written: {len(manifest)} images, {len(jobs)} rebuilt")
+    return manifest
+
+
+# ============================================
+# RUNTIME LOOKUP (used by app.py)
+# ============================================
+
+class ImageCatalog:
+    """Reads the manifest and picks the best derivative for a request"""
+
+    def __init__(self, manifest_path=MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._manifest = {}
+        self._by_file = {}
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            manifest = load_manifest(self.manifest_path) if mtime else {}
+            self._by_file = {
+                variant['file']: variant
+                for entry in manifest.values()
+                for variant in entry['variants']
+            }
+            self._manifest = manifest
+            self._mtime = mtime
+
+    def derivative(self, name):
+        """Return the manifest record for a fingerprinted derivative file"""
+        self._refresh()
+        return self._by_file.get(name)
+
+    def select(self, filename, accepts_webp, width=None):
+        """Pick the variant of an original for the client's formats and width"""
+        self._refresh()
+        entry = self._manifest.get(filename)
+        if not entry:
+            return None
+
+        fmt = 'webp' if accepts_webp else 'jpg'
+        candidates = sorted(
+            (v for v in entry['variants'] if v['format'] == fmt),
+            key=lambda v: v['width']
+        )
+        if not candidates:
+            return None
+        if width:
+            for variant in candidates:
+                if variant['width'] >= width:
+                    return variant
+        return candidates[-1]
+
+    def url(self, filename, width=None, fmt='jpg'):
+        """Fingerprinted URL for templates; falls back to the original"""
+        self._refresh()
+        entry = self._manifest.get(filename)
+        if entry:
+            candidates = sorted(
+                (v for v in entry['variants'] if v['format'] == fmt),
+                key=lambda v: v['width']
+            )
+            chosen = None
+            for variant in candidates:
+                chosen = variant
+                if width and variant['width'] >= width:
+                    break
+            if chosen:
+                return f"/images/{DERIVED_DIRNAME}/{chosen['file']}"
+        return f"/images/{filename}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build resized/WebP image derivatives')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='rebuild every image')
+    args = parser.parse_args()
+    build_all(workers=args.workers, force=args.force)
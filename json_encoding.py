@@ -0,0 +1,11 @@
+"""JSON encoding of query results outside jsonify.
+
+Change feed events, rowset documents, catalog snapshots and the benchmarks
+serialize rows themselves. They all pass json_default as the `default` hook
+so dates (as HTTP dates), decimals and Flask's other extra types come out
+exactly as jsonify writes them.
+"""
+from flask.json.provider import DefaultJSONProvider
+
+# The hook Flask's own JSON provider uses
+json_default = DefaultJSONProvider.default
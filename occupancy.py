@@ -0,0 +1,244 @@
+"""Hotel occupancy calendar computed with NumPy.
+
+Confirmed stays overlapping a date window are loaded as flat arrays
+(hotel row, first night, last night + 1, nightly rate) and turned into a
+hotel x night matrix with a difference array: +1 at each stay's first night,
+-1 after its last, one bincount over the flattened (row, night) indexes and
+a cumsum along the night axis. Revenue per night is accumulated the same
+way with each stay's nightly rate (TotalPrice / nights) as the weight.
+
+From the two matrices:
+    occupancy = rooms sold / Hotel.AvailableRooms
+    ADR       = revenue / rooms sold (average daily rate)
+per hotel or per location, by night or by week.
+
+Matrices are cached per window until the Hotel TableVersion changes or
+OCCUPANCY_TTL_SECONDS (default 60) pass; bookings are not versioned, a
+counter bumped by every booking would serialize them on one row. The cache
+holds at most OCCUPANCY_CACHE_BYTES (default 256 MiB) of matrices, least
+recently used windows go first. With several shards (shards.py) the stays
+of every shard are combined, and a Hotel change on any shard invalidates
+the window.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+
+import queries
+from table_versions import VersionWatcher
+
+MAX_WINDOW_DAYS = 731
+GRANULARITIES = ('daily', 'weekly')
+GROUPINGS = ('hotel', 'location')
+TTL_SECONDS = float(os.environ.get('OCCUPANCY_TTL_SECONDS', 60))
+CACHE_BYTES = int(os.environ.get('OCCUPANCY_CACHE_BYTES', 256 * 1024 * 1024))
+
+
+class OccupancyError(ValueError):
+    """Invalid occupancy parameters (reported to the client as a 400)"""
+
+
+class OccupancyWindow:
+    """Rooms-sold and revenue matrices for one date window"""
+
+    def __init__(self, start, end, hotels, stays):
+        self.start = start
+        self.end = end
+        self.days = (end - start).days
+        self.hotel_ids = np.array([row['HotelID'] for row in hotels], dtype=np.int64)
+        self.names = [row['Name'] for row in hotels]
+        self.locations = np.array([row['Location'] for row in hotels], dtype=object)
+        self.capacity = np.array([max(row['AvailableRooms'] or 1, 1) for row in hotels], dtype=np.float64)
+
+        hotel_count, days = len(hotels), self.days
+        width = days + 1
+        if stays:
+            stay_hotels = np.array([row['HotelID'] for row in stays], dtype=np.int64)
+            check_in = np.array([(row['CheckInDate'] - start).days for row in stays], dtype=np.int64)
+            check_out = np.array([(row['CheckOutDate'] - start).days for row in stays], dtype=np.int64)
+            nights = np.maximum(check_out - check_in, 1)
+            rate = np.array([float(row['TotalPrice']) for row in stays], dtype=np.float64) / nights
+
+            # hotel_ids comes sorted from the query
+            rows = np.searchsorted(self.hotel_ids, stay_hotels)
+            known = (rows < hotel_count) & (self.hotel_ids[np.minimum(rows, hotel_count - 1)] == stay_hotels)
+            rows, rate = rows[known], rate[known]
+            first = np.clip(check_in[known], 0, days)
+            last = np.clip(check_out[known], 0, days)
+
+            index = np.concatenate([rows * width + first, rows * width + last])
+            sign = np.concatenate([np.ones(len(rows)), -np.ones(len(rows))])
+            size = hotel_count * width
+            sold = np.bincount(index, weights=sign, minlength=size).reshape(hotel_count, width)
+            revenue = np.bincount(index, weights=np.concatenate([rate, -rate]), minlength=size)
+            revenue = revenue.reshape(hotel_count, width)
+            self.sold = np.cumsum(sold, axis=1)[:, :days]
+            self.revenue = np.cumsum(revenue, axis=1)[:, :days]
+        else:
+            self.sold = np.zeros((hotel_count, days))
+            self.revenue = np.zeros((hotel_count, days))
+
+    @property
+    def nbytes(self):
+        return self.sold.nbytes + self.revenue.nbytes + self.capacity.nbytes + self.hotel_ids.nbytes
+
+    def _periods(self, granularity):
+        """Column start offsets of each reported period"""
+        if granularity == 'weekly':
+            return np.arange(0, self.days, 7)
+        return np.arange(self.days)
+
+    def report(self, granularity='daily', group_by='hotel', hotel_ids=None, location=None,
+               offset=0, limit=100):
+        if granularity not in GRANULARITIES:
+            raise OccupancyError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        if group_by not in GROUPINGS:
+            raise OccupancyError(f"groupBy must be one of: {', '.join(GROUPINGS)}")
+
+        mask = np.ones(len(self.hotel_ids), dtype=bool)
+        if hotel_ids:
+            mask &= np.isin(self.hotel_ids, np.array(hotel_ids, dtype=np.int64))
+        if location:
+            mask &= self.locations == location
+        selected = np.flatnonzero(mask)
+        total = len(selected)
+        if group_by == 'hotel':
+            # Page before aggregating: hotels are independent rows
+            selected = selected[offset:offset + limit]
+
+        starts = self._periods(granularity)
+        lengths = np.diff(np.append(starts, self.days))
+        sold = np.add.reduceat(self.sold[selected], starts, axis=1) if len(selected) else np.zeros((0, len(starts)))
+        revenue = np.add.reduceat(self.revenue[selected], starts, axis=1) if len(selected) else np.zeros((0, len(starts)))
+        capacity = self.capacity[selected]
+
+        if group_by == 'location':
+            keys = []
+            if len(selected):
+                labels, inverse = np.unique(self.locations[selected].astype(str), return_inverse=True)
+                order = np.argsort(inverse, kind='stable')
+                bounds = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+                sold = np.add.reduceat(sold[order], bounds, axis=0)
+                revenue = np.add.reduceat(revenue[order], bounds, axis=0)
+                capacity = np.add.reduceat(capacity[order], bounds)
+                keys = [
+                    {'location': str(label), 'hotels': int(count)}
+                    for label, count in zip(labels, np.bincount(inverse))
+                ]
+            total = len(keys)
+            page = slice(offset, offset + limit)
+        else:
+            keys = [
+                {'hotelId': int(self.hotel_ids[row]), 'name': self.names[row],
+                 'location': self.locations[row], 'rooms': int(self.capacity[row])}
+                for row in selected
+            ]
+            page = slice(0, len(keys))
+
+        room_nights = capacity[:, None] * lengths[None, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            occupancy = np.where(room_nights > 0, sold / room_nights, 0.0)
+            adr = np.where(sold > 0, revenue / sold, 0.0)
+            overall_occupancy = np.where(room_nights.sum(axis=1) > 0, sold.sum(axis=1) / room_nights.sum(axis=1), 0.0)
+            overall_adr = np.where(sold.sum(axis=1) > 0, revenue.sum(axis=1) / sold.sum(axis=1), 0.0)
+
+        rows = []
+        for index, key in list(enumerate(keys))[page]:
+            rows.append(dict(
+                key,
+                occupancy=np.round(occupancy[index], 4).tolist(),
+                adr=np.round(adr[index], 2).tolist(),
+                roomNightsSold=int(round(sold[index].sum())),
+                revenue=round(float(revenue[index].sum()), 2),
+                averageOccupancy=round(float(overall_occupancy[index]), 4),
+                averageAdr=round(float(overall_adr[index]), 2),
+            ))
+
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'granularity': granularity,
+            'groupBy': group_by,
+            'periods': [(self.start + timedelta(days=int(day))).isoformat() for day in starts],
+            'total': total,
+            'rows': rows,
+        }
+
+
+class OccupancyEngine:
+    """Builds OccupancyWindows and caches them per (window, Hotel versions)
+    for TTL_SECONDS, within CACHE_BYTES
+    """
+
+    def __init__(self):
+        self.watcher = VersionWatcher(['Hotel'])
+        self._shard_watchers = {}
+        self._lock = threading.Lock()
+        self._windows = OrderedDict()
+        self._bytes = 0
+        self.builds = 0
+
+    def _evict(self, key):
+        _built_at, window = self._windows.pop(key)
+        self._bytes -= window.nbytes
+
+    def _watcher(self, shard):
+        if shard.is_catalog:
+            return self.watcher
+        with self._lock:
+            return self._shard_watchers.setdefault(shard.index, VersionWatcher(['Hotel']))
+
+    def window(self, conn, start, end, fan_out=None):
+        """Window over conn's database, or over every shard when fan_out
+        (app.fan_out) is given; hotels are read from conn either way
+        """
+        days = (end - start).days
+        if days <= 0:
+            raise OccupancyError('end must be after start')
+        if days > MAX_WINDOW_DAYS:
+            raise OccupancyError(f"Window is limited to {MAX_WINDOW_DAYS} days")
+
+        if fan_out is None:
+            versions = self.watcher.current(conn)
+        else:
+            versions = tuple(fan_out(lambda shard, shard_conn: self._watcher(shard).current(shard_conn)))
+        key = (start, end, versions)
+        with self._lock:
+            cached = self._windows.get(key)
+            if cached is not None:
+                built_at, cached = cached
+                if time.monotonic() - built_at < TTL_SECONDS:
+                    self._windows.move_to_end(key)
+                    return cached
+                self._evict(key)
+
+        hotels = queries.fetch_all(conn, 'occupancy_hotels')
+        if fan_out is None:
+            stays = queries.fetch_all(conn, 'occupancy_stays', (end, start))
+        else:
+            stays = [stay for part in fan_out(
+                lambda _shard, shard_conn: queries.fetch_all(shard_conn, 'occupancy_stays', (end, start))
+            ) for stay in part]
+        built = OccupancyWindow(start, end, hotels, stays)
+
+        with self._lock:
+            self.builds += 1
+            if key in self._windows:
+                self._evict(key)
+            # Windows of older versions are dead weight once a newer one exists
+            for stale in [other for other in self._windows if other[2] != key[2]]:
+                self._evict(stale)
+            if built.nbytes > CACHE_BYTES:
+                return built
+            while self._bytes + built.nbytes > CACHE_BYTES:
+                self._evict(next(iter(self._windows)))
+            self._windows[key] = (time.monotonic(), built)
+            self._bytes += built.nbytes
+        return built
+
+
+engine = OccupancyEngine()
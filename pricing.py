@@ -0,0 +1,355 @@
+"""Hotel pricing: per-night rate calendars and Offer discounts, quoted in batches.
+
+The rate of a night is HotelRate.Price for that hotel and night, else the
+hotel's PricePerNight. Standing offers (Offers rows without a BookingID and
+with a DiscountPercent) are the hotel's discount rules:
+
+    DiscountPercent   taken off the rate of every qualifying night, rounded
+                      to the paisa per night
+    ValidFrom/ValidTo nights the offer covers, inclusive (NULL = open)
+    WeekendOnly       only Friday and Saturday nights qualify
+    MinNights         the stay has at least this many nights
+    MinAdvanceDays    check-in is at least this many days after today
+
+Offers do not stack: a stay gets the one offer that takes the most off.
+CalculateBookingCost (and so CreateNewBooking) applies the same rules in
+MySQL, so a quote is what the booking will charge.
+
+Quotes come from a PriceBook built in memory with NumPy. Amounts are int64
+paise over HORIZON_DAYS nights starting today:
+
+    P[h, i]   rate of hotel h summed over the first i nights (prefix sums)
+    O[k, i]   discount of offer k summed the same way
+
+so the base price of nights [a, b) is P[h, b] - P[h, a] and the discount of
+an offer O[k, b] - O[k, a]. N hotels x M stays are two gathers and a
+subtraction for the base prices, the same over the offers of those hotels,
+an eligibility mask (MinNights, MinAdvanceDays) and a running maximum per
+hotel. Stays reaching outside the horizon are priced night by night from
+the same data.
+
+The book is rebuilt when the Hotel, HotelRate or Offers TableVersion moves,
+and when the date changes. It takes 8 bytes per hotel (and per offer) per
+night of the horizon.
+
+Configuration (environment variables):
+    PRICING_HORIZON_DAYS   nights covered by the prefix sums (default 400)
+"""
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+import queries
+from table_versions import VersionWatcher
+
+HORIZON_DAYS = int(os.environ.get('PRICING_HORIZON_DAYS', 400))
+
+MAX_HOTELS = 200
+MAX_STAYS = 20
+MAX_NIGHTS = 365
+
+# Python weekday() of Friday and Saturday nights (DAYOFWEEK 6 and 7)
+WEEKEND = (4, 5)
+
+PAISE = Decimal(100)
+
+
+class PricingError(ValueError):
+    """Invalid quote request (reported to the client as a 400)"""
+
+
+def _day(value):
+    """date from a date, datetime or YYYY-MM-DD string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise PricingError('Dates must be YYYY-MM-DD') from None
+
+
+def _paise(amount):
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+    return int((amount * PAISE).to_integral_value())
+
+
+def _rupees(paise):
+    return float(Decimal(int(paise)) / PAISE)
+
+
+def check_stays(ranges):
+    """[(check_in, check_out)] from [{checkInDate, checkOutDate}]"""
+    if not isinstance(ranges, list) or not ranges:
+        raise PricingError('ranges must be a non-empty list of {checkInDate, checkOutDate}')
+    if len(ranges) > MAX_STAYS:
+        raise PricingError(f"At most {MAX_STAYS} date ranges per request")
+    stays = []
+    for stay in ranges:
+        try:
+            stays.append(check_stay(stay['checkInDate'], stay['checkOutDate']))
+        except (KeyError, TypeError):
+            raise PricingError('Every range needs checkInDate and checkOutDate') from None
+    return stays
+
+
+def check_stay(check_in, check_out):
+    """(check_in, check_out) as dates, 1 to MAX_NIGHTS nights apart"""
+    check_in, check_out = _day(check_in), _day(check_out)
+    nights = (check_out - check_in).days
+    if nights <= 0:
+        raise PricingError('checkOutDate must be after checkInDate')
+    if nights > MAX_NIGHTS:
+        raise PricingError(f"Stays are limited to {MAX_NIGHTS} nights")
+    return check_in, check_out
+
+
+def check_hotels(hotel_ids):
+    if not isinstance(hotel_ids, list) or not hotel_ids:
+        raise PricingError('hotelIds must be a non-empty list')
+    if len(hotel_ids) > MAX_HOTELS:
+        raise PricingError(f"At most {MAX_HOTELS} hotels per request")
+    try:
+        return [int(hotel_id) for hotel_id in hotel_ids]
+    except (TypeError, ValueError):
+        raise PricingError('hotelIds must be HotelIDs') from None
+
+
+class PriceBook:
+    """Prefix sums of nightly rates and offer discounts from `start`"""
+
+    def __init__(self, start, days, hotels, rates, offers):
+        self.start = start
+        self.days = days
+        self.hotel_ids = np.array([row['HotelID'] for row in hotels], dtype=np.int64)
+        self.rows = {int(hotel_id): row for row, hotel_id in enumerate(self.hotel_ids)}
+        base = np.array([_paise(row['PricePerNight'] or 0) for row in hotels], dtype=np.int64)
+        self.base = base
+
+        # Overrides inside the horizon go into the dense rates, the rest
+        # are only needed by the night-by-night path
+        nightly = np.repeat(base[:, None], days, axis=1)
+        self.far_rates = {}
+        override_rows, override_days, override_prices = [], [], []
+        for rate in rates:
+            row = self.rows.get(rate['HotelID'])
+            if row is None:
+                continue
+            day = (rate['Night'] - start).days
+            if 0 <= day < days:
+                override_rows.append(row)
+                override_days.append(day)
+                override_prices.append(_paise(rate['Price']))
+            else:
+                self.far_rates[(row, rate['Night'])] = _paise(rate['Price'])
+        if override_rows:
+            nightly[override_rows, override_days] = override_prices
+        self.P = np.zeros((len(hotels), days + 1), dtype=np.int64)
+        np.cumsum(nightly, axis=1, out=self.P[:, 1:])
+
+        offers = [offer for offer in offers if offer['HotelID'] in self.rows]
+        self.offer_ids = [offer['OfferID'] for offer in offers]
+        self.offer_descriptions = [offer['Description'] for offer in offers]
+        self.offer_rows = np.array([self.rows[offer['HotelID']] for offer in offers], dtype=np.int64)
+        # Hundredths of a percent, DECIMAL(5, 2)
+        self.percent = np.array([_paise(offer['DiscountPercent']) for offer in offers], dtype=np.int64)
+        self.valid_from = [offer['ValidFrom'] for offer in offers]
+        self.valid_to = [offer['ValidTo'] for offer in offers]
+        self.weekend_only = np.array([bool(offer['WeekendOnly']) for offer in offers], dtype=bool)
+        self.min_nights = np.array([offer['MinNights'] or 0 for offer in offers], dtype=np.int64)
+        self.min_advance = np.array([offer['MinAdvanceDays'] or 0 for offer in offers], dtype=np.int64)
+        self.by_row = {}
+        for index, row in enumerate(self.offer_rows):
+            self.by_row.setdefault(int(row), []).append(index)
+
+        # Discount of every offer on every night: rate x percent, rounded
+        # half up to the paisa like MySQL's ROUND(..., 2)
+        nights = np.arange(days)
+        weekend = np.isin((start.weekday() + nights) % 7, WEEKEND)
+        first = np.array([0 if day is None else (day - start).days for day in self.valid_from], dtype=np.int64)
+        last = np.array([days if day is None else (day - start).days for day in self.valid_to], dtype=np.int64)
+        covered = (nights >= first[:, None]) & (nights <= last[:, None]) & (~self.weekend_only[:, None] | weekend)
+        discounts = (nightly[self.offer_rows] * self.percent[:, None] + 5000) // 10000
+        self.O = np.zeros((len(offers), days + 1), dtype=np.int64)
+        np.cumsum(np.where(covered, discounts, 0), axis=1, out=self.O[:, 1:])
+
+    def nbytes(self):
+        return self.P.nbytes + self.O.nbytes
+
+    # ---------------- night by night ----------------
+
+    def _rate(self, row, night):
+        day = (night - self.start).days
+        if 0 <= day < self.days:
+            return int(self.P[row, day + 1] - self.P[row, day])
+        return self.far_rates.get((row, night), int(self.base[row]))
+
+    def _offer_applies(self, index, night):
+        if self.valid_from[index] is not None and night < self.valid_from[index]:
+            return False
+        if self.valid_to[index] is not None and night > self.valid_to[index]:
+            return False
+        return not self.weekend_only[index] or night.weekday() in WEEKEND
+
+    def quote_stay(self, row, check_in, check_out, today):
+        """(base, discount, offer index or -1) in paise, one night at a time"""
+        nights = (check_out - check_in).days
+        advance = (check_in - today).days
+        rates = [self._rate(row, check_in + timedelta(days=day)) for day in range(nights)]
+        best, best_offer = 0, -1
+        for index in self.by_row.get(row, ()):
+            if nights < self.min_nights[index] or advance < self.min_advance[index]:
+                continue
+            discount = sum(
+                (rate * int(self.percent[index]) + 5000) // 10000
+                for day, rate in enumerate(rates)
+                if self._offer_applies(index, check_in + timedelta(days=day))
+            )
+            if discount > best:
+                best, best_offer = discount, index
+        return sum(rates), best, best_offer
+
+    # ---------------- batch ----------------
+
+    def quote(self, hotel_ids, stays, today):
+        """Price every hotel for every stay
+        Returns (found, base, discount, offer): found is a bool per hotel,
+        the others hotels x stays arrays in paise (offer = index into
+        offer_ids or -1). Unknown hotels are priced 0.
+        """
+        found = np.array([hotel_id in self.rows for hotel_id in hotel_ids], dtype=bool)
+        rows = np.array([self.rows.get(hotel_id, 0) for hotel_id in hotel_ids], dtype=np.int64)
+        starts = np.array([(check_in - self.start).days for check_in, _ in stays], dtype=np.int64)
+        ends = np.array([(check_out - self.start).days for _, check_out in stays], dtype=np.int64)
+        nights = ends - starts
+        advance = np.array([(check_in - today).days for check_in, _ in stays], dtype=np.int64)
+        inside = (starts >= 0) & (ends <= self.days)
+        a, b = np.where(inside, starts, 0), np.where(inside, ends, 0)
+
+        base = self.P[rows[:, None], b] - self.P[rows[:, None], a]
+        discount = np.zeros_like(base)
+        offer = np.full(base.shape, -1, dtype=np.int64)
+
+        # Offers of the requested hotels, grouped by the position of their hotel
+        positions, starts_of, indexes = [], [], []
+        for position, (hotel_id, known) in enumerate(zip(hotel_ids, found)):
+            hotel_offers = self.by_row.get(self.rows[hotel_id], ()) if known else ()
+            if hotel_offers:
+                positions.append(position)
+                starts_of.append(len(indexes))
+                indexes.extend(hotel_offers)
+        if indexes:
+            indexes = np.array(indexes, dtype=np.int64)
+            amounts = self.O[indexes[:, None], b] - self.O[indexes[:, None], a]
+            eligible = (nights >= self.min_nights[indexes, None]) & (advance >= self.min_advance[indexes, None])
+            # One maximum per hotel and stay over amount * scale + tie-breaker,
+            # so the winning offer comes out with it (lowest OfferID on ties)
+            scale = len(self.offer_ids) + 1
+            keys = np.where(eligible, amounts, 0) * scale + (scale - 1 - indexes[:, None])
+            best = np.maximum.reduceat(keys, starts_of, axis=0)
+            discount[positions] = best // scale
+            offer[positions] = np.where(best >= scale, scale - 1 - best % scale, -1)
+
+        # Stays reaching outside the horizon
+        for stay in np.flatnonzero(~inside):
+            check_in, check_out = stays[stay]
+            for position in np.flatnonzero(found):
+                base[position, stay], discount[position, stay], offer[position, stay] = self.quote_stay(
+                    rows[position], check_in, check_out, today
+                )
+
+        base[~found] = 0
+        discount[~found] = 0
+        return found, base, discount, offer
+
+
+class PricingEngine:
+    """Keeps a PriceBook of the current Hotel/HotelRate/Offers versions"""
+
+    def __init__(self, horizon_days=HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self.watcher = VersionWatcher(['Hotel', 'HotelRate', 'Offers'])
+        self._lock = threading.Lock()
+        self._book = None
+        self._key = None
+        self.builds = 0
+        self.build_ms = 0.0
+        self.quotes = 0
+        self.batches = 0
+
+    def book(self, conn, today=None):
+        today = today or date.today()
+        key = (self.watcher.current(conn), today)
+        if key != self._key:
+            with self._lock:
+                if key != self._key:
+                    started = time.perf_counter()
+                    self._book = self.load(conn, today)
+                    self._key = key
+                    self.builds += 1
+                    self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+        return self._book
+
+    def load(self, conn, today):
+        return PriceBook(
+            today,
+            self.horizon_days,
+            queries.fetch_all(conn, 'pricing_hotels'),
+            queries.fetch_all(conn, 'pricing_rates'),
+            queries.fetch_all(conn, 'pricing_offers'),
+        )
+
+    def invalidate(self):
+        self.watcher.expire()
+
+    def quote(self, conn, hotel_ids, stays, today=None):
+        """Quotes of every hotel for every stay (already validated)"""
+        today = today or date.today()
+        book = self.book(conn, today)
+        found, base, discount, offer = book.quote(hotel_ids, stays, today)
+        with self._lock:
+            self.batches += 1
+            self.quotes += len(hotel_ids) * len(stays)
+
+        nights = [(check_out - check_in).days for check_in, check_out in stays]
+        quotes = []
+        for position, hotel_id in enumerate(hotel_ids):
+            if not found[position]:
+                quotes.append({'hotelId': hotel_id, 'found': False, 'prices': None})
+                continue
+            prices = []
+            for stay, count in enumerate(nights):
+                index = int(offer[position, stay])
+                prices.append({
+                    'nights': count,
+                    'baseCost': _rupees(base[position, stay]),
+                    'discount': _rupees(discount[position, stay]),
+                    'totalCost': _rupees(base[position, stay] - discount[position, stay]),
+                    'offerId': book.offer_ids[index] if index >= 0 else None,
+                    'offer': book.offer_descriptions[index] if index >= 0 else None,
+                })
+            quotes.append({'hotelId': hotel_id, 'found': True, 'prices': prices})
+        return quotes
+
+    def status(self):
+        book = self._book
+        return {
+            'horizonDays': self.horizon_days,
+            'start': book.start.isoformat() if book else None,
+            'hotels': len(book.hotel_ids) if book else 0,
+            'offers': len(book.offer_ids) if book else 0,
+            'bytes': book.nbytes() if book else 0,
+            'builds': self.builds,
+            'lastBuildMs': self.build_ms,
+            'batches': self.batches,
+            'quotes': self.quotes,
+        }
+
+
+engine = PricingEngine()
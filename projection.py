@@ -0,0 +1,57 @@
+"""Sparse responses for list and report endpoints.
+
+    ?fields=DestID,Name   only these columns; checked against the columns the
+                          endpoint's statement returns and pushed down into
+                          its SELECT list (queries.fetch_projected)
+    ?format=compact       rows as arrays under a single header row:
+                          [["DestID", "Name"], [1, "Taj Mahal"], ...]
+
+Both are optional and combine; without them responses are unchanged.
+benchmarks/projection_sizes.py measures the bytes and encode time saved.
+"""
+import queries
+
+COMPACT = 'compact'
+
+
+class ProjectionError(ValueError):
+    """Unknown field or format (reported to the client as a 400)"""
+
+
+def parse_fields(raw, name):
+    """Requested columns of a PROJECTABLE statement, in request order (None = all)"""
+    if raw is None or not raw.strip():
+        return None
+    allowed = queries.projection(name).columns
+    fields = []
+    for field in raw.split(','):
+        field = field.strip()
+        if not field or field in fields:
+            continue
+        if field not in allowed:
+            raise ProjectionError(f"Unknown field {field!r}; choose from: {', '.join(allowed)}")
+        fields.append(field)
+    return fields
+
+
+def parse_format(raw):
+    """True for the compact encoding"""
+    if raw in (None, '', 'objects'):
+        return False
+    if raw == COMPACT:
+        return True
+    raise ProjectionError("format must be 'objects' or 'compact'")
+
+
+def project(rows, fields):
+    """Apply a projection in Python (rows not read through fetch_projected)"""
+    if not fields:
+        return rows
+    return [{field: row.get(field) for field in fields} for row in rows]
+
+
+def encode(rows, columns, compact):
+    """rows unchanged, or a header row followed by one array per row"""
+    if not compact:
+        return rows
+    return [list(columns)] + [[row[column] for column in columns] for row in rows]
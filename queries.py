@@ -0,0 +1,921 @@
+"""Central registry of the SQL statements used by the routes in app.py.
+
+Routes refer to statements by name instead of carrying inline SQL, so every
+query can be tuned in one place. Statements listed in PREPARED are run
+through server-side prepared cursors that are cached per pooled connection,
+so MySQL parses them once per connection instead of once per request.
+
+Statements listed in PROJECTABLE can be narrowed to some of their output
+columns (fetch_projected): the top-level SELECT list is rewritten, so
+unused columns are never read or sent by MySQL. fetch_rowset does the same
+but keeps the rows as tuples under one header (rowset.RowSet).
+
+Every execution is recorded in `stats` (calls, errors, total time, rows),
+split by execution mode, so prepared and text execution can be compared
+(set DB_PREPARED_STATEMENTS=0 to run everything as plain text).
+"""
+import os
+import re
+import threading
+import time
+import weakref
+from collections import namedtuple
+
+import mysql.connector
+
+from rowset import RowSet
+
+QUERIES = {
+    # ---------------- Cache invalidation ----------------
+    'table_versions': "SELECT TableName, Version FROM TableVersion",
+
+    # ---------------- Users ----------------
+    'user_insert': """
+        INSERT INTO User (FirstName, LastName, Email, PhoneNo, Password)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'user_login': "SELECT * FROM User WHERE Email = %s AND Password = %s",
+    'user_id_by_email': "SELECT UserID FROM User WHERE Email = %s",
+    'user_booking_ids': "SELECT BookingID FROM Booking WHERE UserID = %s",
+    'user_profile': "SELECT UserID, FirstName, LastName, Email, PhoneNo FROM User WHERE UserID = %s",
+    'user_confirmed_booking_count': """
+        SELECT COUNT(*) as ConfirmedBookings
+        FROM Booking
+        WHERE UserID = %s AND BookingStatus = 'Confirmed'
+    """,
+    'user_update': """
+        UPDATE User
+        SET FirstName = %s, LastName = %s, PhoneNo = %s
+        WHERE UserID = %s
+    """,
+
+    # ---------------- Hotels & bookings ----------------
+    'hotels_all': """
+        SELECT HotelID, Name, Location, Rating, PricePerNight, AvailableRooms, Latitude, Longitude
+        FROM Hotel
+        ORDER BY Name
+    """,
+    'hotel_rooms': "SELECT HotelID, Name, AvailableRooms FROM Hotel WHERE HotelID = %s",
+    'hotel_inventory_range': """
+        SELECT Night, Capacity, Booked
+        FROM HotelNightInventory
+        WHERE HotelID = %s AND Night >= %s AND Night < %s
+        ORDER BY Night
+    """,
+    'calculate_booking_cost': "SELECT CalculateBookingCost(%s, %s, %s) as total_cost",
+    # Every hotel, for when no candidate destination has coordinates (app.optimizer_hotels)
+    'optimizer_hotels': "SELECT HotelID, Name, Location, Rating, PricePerNight FROM Hotel",
+    'user_bookings': """
+        SELECT
+            b.BookingID,
+            b.CheckInDate,
+            b.CheckOutDate,
+            b.TotalPrice,
+            b.BookingStatus,
+            b.BookingDate,
+            h.Name AS HotelName,
+            h.Location AS HotelLocation,
+            h.Rating AS HotelRating
+        FROM Booking b
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE b.UserID = %s
+        ORDER BY b.BookingDate DESC
+    """,
+    # One row shaped like 'user_bookings', for the change feed
+    'booking_feed_row': """
+        SELECT
+            b.BookingID,
+            b.UserID,
+            b.CheckInDate,
+            b.CheckOutDate,
+            b.TotalPrice,
+            b.BookingStatus,
+            b.BookingDate,
+            h.Name AS HotelName,
+            h.Location AS HotelLocation,
+            h.Rating AS HotelRating
+        FROM Booking b
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE b.BookingID = %s
+    """,
+    # Shard-0 reservations of bookings made on other shards (app.hold_hotel_nights)
+    'inventory_hold_insert': """
+        INSERT INTO InventoryHold (UserID, HotelID, CheckInDate, CheckOutDate)
+        VALUES (%s, %s, %s, %s)
+    """,
+    'inventory_hold_delete': "DELETE FROM InventoryHold WHERE HoldID = %s",
+    'inventory_holds_stale': """
+        SELECT HoldID, UserID, HotelID, CheckInDate, CheckOutDate
+        FROM InventoryHold
+        WHERE CreatedAt < NOW() - INTERVAL %s MINUTE
+        ORDER BY HoldID
+    """,
+    'inventory_released_mark': "INSERT IGNORE INTO InventoryReleased (ShardIndex, ReleaseID) VALUES (%s, %s)",
+    'inventory_released_purge': "DELETE FROM InventoryReleased WHERE ReleasedAt < NOW() - INTERVAL %s DAY",
+    # Nights owed to shard 0 by cancellations on this shard (app.settle_inventory_releases)
+    'inventory_releases_pending': """
+        SELECT ReleaseID, HotelID, CheckInDate, CheckOutDate
+        FROM InventoryRelease
+        ORDER BY ReleaseID
+        LIMIT %s
+    """,
+    'booking_for_stay': """
+        SELECT COUNT(*)
+        FROM Booking
+        WHERE UserID = %s AND HotelID = %s AND CheckInDate = %s AND CheckOutDate = %s
+    """,
+    # Owner and nights of a cancelled booking (cache invalidation, shards.py)
+    'booking_stay': "SELECT UserID, HotelID, CheckInDate, CheckOutDate FROM Booking WHERE BookingID = %s",
+
+    # ---------------- Pricing ----------------
+    'pricing_hotels': "SELECT HotelID, PricePerNight FROM Hotel ORDER BY HotelID",
+    'pricing_rates': "SELECT HotelID, Night, Price FROM HotelRate",
+    # Standing offers are the discount rules; booking-linked rows record a deal
+    'pricing_offers': """
+        SELECT OfferID, HotelID, Description, DiscountPercent, ValidFrom, ValidTo,
+               MinNights, MinAdvanceDays, WeekendOnly
+        FROM Offers
+        WHERE BookingID IS NULL AND DiscountPercent IS NOT NULL
+        ORDER BY OfferID
+    """,
+    # Nights [from, to) of a hotel at one rate (to - from <= 1000 nights, the
+    # default cte_max_recursion_depth)
+    'hotel_rate_set': """
+        INSERT INTO HotelRate (HotelID, Night, Price)
+        WITH RECURSIVE Nights (Night) AS (
+            SELECT CAST(%s AS DATE)
+            UNION ALL
+            SELECT Night + INTERVAL 1 DAY FROM Nights WHERE Night + INTERVAL 1 DAY < %s
+        )
+        SELECT %s, Night, %s FROM Nights
+        ON DUPLICATE KEY UPDATE Price = %s
+    """,
+    'hotel_rate_clear': "DELETE FROM HotelRate WHERE HotelID = %s AND Night >= %s AND Night < %s",
+    'hotel_rates_range': """
+        SELECT Night, Price
+        FROM HotelRate
+        WHERE HotelID = %s AND Night >= %s AND Night < %s
+        ORDER BY Night
+    """,
+
+    # ---------------- Waitlist ----------------
+    'waitlist_insert': """
+        INSERT INTO Waitlist (UserID, HotelID, CheckInDate, CheckOutDate, Priority)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'waitlist_waiting': """
+        SELECT WaitlistID, UserID, HotelID, CheckInDate, CheckOutDate, Priority, Status, CreatedAt, UpdatedAt
+        FROM Waitlist
+        WHERE Status = 'Waiting'
+    """,
+    'waitlist_change_mark': "SELECT COALESCE(MAX(UpdatedAt), NOW(6)) AS LastChange FROM Waitlist",
+    'waitlist_changes_since': """
+        SELECT WaitlistID, UserID, HotelID, CheckInDate, CheckOutDate, Priority, Status, CreatedAt, UpdatedAt
+        FROM Waitlist
+        WHERE UpdatedAt >= %s - INTERVAL %s SECOND
+    """,
+    'waitlist_claim': "UPDATE Waitlist SET Status = 'Booking' WHERE WaitlistID = %s AND Status = 'Waiting'",
+    'waitlist_unclaim': "UPDATE Waitlist SET Status = 'Waiting' WHERE WaitlistID = %s AND Status = 'Booking'",
+    'waitlist_unclaim_stale': """
+        UPDATE Waitlist SET Status = 'Waiting'
+        WHERE Status = 'Booking' AND UpdatedAt < NOW(6) - INTERVAL %s MINUTE
+    """,
+    'waitlist_booked': "UPDATE Waitlist SET Status = 'Booked', BookingID = %s WHERE WaitlistID = %s",
+    'waitlist_expire': """
+        UPDATE Waitlist SET Status = 'Expired'
+        WHERE HotelID = %s AND Status = 'Waiting' AND CheckInDate <= CURDATE()
+    """,
+    'waitlist_withdraw': """
+        UPDATE Waitlist SET Status = 'Withdrawn'
+        WHERE WaitlistID = %s AND UserID = %s AND Status = 'Waiting'
+    """,
+    'waitlist_by_user': """
+        SELECT
+            w.WaitlistID,
+            w.HotelID,
+            h.Name AS HotelName,
+            w.CheckInDate,
+            w.CheckOutDate,
+            w.Priority,
+            w.Status,
+            w.BookingID,
+            w.CreatedAt
+        FROM Waitlist w
+        LEFT JOIN Hotel h ON w.HotelID = h.HotelID
+        WHERE w.UserID = %s
+        ORDER BY w.CreatedAt DESC
+    """,
+
+    # ---------------- Audit & payments ----------------
+    'audit_recent': """
+        SELECT
+            AuditID,
+            BookingID,
+            ActionType,
+            OldStatus,
+            NewStatus,
+            ChangeDate,
+            UserEmail
+        FROM BookingAudit
+        ORDER BY ChangeDate DESC
+        LIMIT 100
+    """,
+    'audit_by_booking': """
+        SELECT
+            AuditID,
+            BookingID,
+            ActionType,
+            OldStatus,
+            NewStatus,
+            ChangeDate,
+            UserEmail
+        FROM BookingAudit
+        WHERE BookingID = %s
+        ORDER BY ChangeDate DESC
+    """,
+    'payments_recent': """
+        SELECT
+            pt.TransactionID,
+            pt.BookingID,
+            pt.Amount,
+            pt.PaymentStatus,
+            pt.TransactionDate,
+            b.UserID,
+            h.Name AS HotelName
+        FROM PaymentTransaction pt
+        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        ORDER BY pt.TransactionDate DESC
+        LIMIT 100
+    """,
+    'payment_by_booking': """
+        SELECT
+            pt.TransactionID,
+            pt.BookingID,
+            pt.Amount,
+            pt.PaymentStatus,
+            pt.TransactionDate,
+            b.UserID,
+            h.Name AS HotelName
+        FROM PaymentTransaction pt
+        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE pt.BookingID = %s
+        ORDER BY pt.TransactionDate DESC
+    """,
+    'payments_by_user': """
+        SELECT
+            pt.TransactionID,
+            pt.BookingID,
+            pt.Amount,
+            pt.PaymentStatus,
+            pt.TransactionDate,
+            h.Name AS HotelName,
+            b.CheckInDate,
+            b.CheckOutDate
+        FROM PaymentTransaction pt
+        LEFT JOIN Booking b ON pt.BookingID = b.BookingID
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE b.UserID = %s
+        ORDER BY pt.TransactionDate DESC
+    """,
+    'payment_update_status': """
+        UPDATE PaymentTransaction
+        SET PaymentStatus = %s
+        WHERE TransactionID = %s
+    """,
+    'payment_booking_id': "SELECT BookingID FROM PaymentTransaction WHERE TransactionID = %s",
+
+    # ---------------- Destinations ----------------
+    'destinations_all': """
+        SELECT DestID, Name, Location, Type, Description, Rating, Latitude, Longitude
+        FROM Destination
+        ORDER BY Name
+    """,
+    'destination_insert': """
+        INSERT INTO Destination (Name, Location, Type, Description, Rating, Latitude, Longitude)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """,
+    'includes_delete_by_destination': "DELETE FROM Includes WHERE DestID = %s",
+    'destination_delete': "DELETE FROM Destination WHERE DestID = %s",
+    'destination_popularity': "SELECT IsDestinationPopular(%s) as popularity",
+    # Per-shard part of IsDestinationPopular when itineraries are sharded
+    'destination_include_count': "SELECT COUNT(*) AS Itineraries FROM Includes WHERE DestID = %s",
+
+    # ---------------- Transport graph ----------------
+    'transport_edges': """
+        SELECT t.TransportID, t.OriginDestID, av.DestID, t.Cost, t.Type, t.Provider
+        FROM Transport t
+        JOIN Availability av ON t.AvailabilityID = av.AvailabilityID
+    """,
+    'transport_change_mark': "SELECT COALESCE(MAX(ChangedAt), NOW()) AS LastChange FROM TransportChange",
+    'transport_changes_since': """
+        SELECT ChangeID, TransportID, ChangedAt
+        FROM TransportChange
+        WHERE ChangedAt >= %s - INTERVAL %s SECOND
+    """,
+    'itinerary_destination_ids': "SELECT DestID FROM Includes WHERE ItineraryID = %s ORDER BY DestID",
+
+    # ---------------- Geo index ----------------
+    'geo_hotels': """
+        SELECT HotelID, Name, Location, Rating, PricePerNight, Latitude, Longitude
+        FROM Hotel
+        WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+    """,
+    'geo_destinations': """
+        SELECT DestID, Name, Latitude, Longitude
+        FROM Destination
+        WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL
+    """,
+    'geo_change_mark': "SELECT COALESCE(MAX(ChangedAt), NOW()) AS LastChange FROM GeoChange",
+    'geo_changes_since': """
+        SELECT ChangeID, TableName, EntityID, ChangedAt
+        FROM GeoChange
+        WHERE ChangedAt >= %s - INTERVAL %s SECOND
+    """,
+
+    # ---------------- Recommendations ----------------
+    'destination_itinerary_counts': """
+        SELECT DestID, COUNT(*) AS Itineraries
+        FROM Includes
+        GROUP BY DestID
+    """,
+    'destination_pair_counts': """
+        SELECT a.DestID AS FirstDestID, b.DestID AS SecondDestID, COUNT(*) AS Itineraries
+        FROM Includes a
+        JOIN Includes b ON a.ItineraryID = b.ItineraryID AND a.DestID < b.DestID
+        GROUP BY a.DestID, b.DestID
+    """,
+
+    # ---------------- Itineraries ----------------
+    'itinerary_insert': """
+        INSERT INTO Itinerary (UserID, Title, StartDate, EndDate, TotalCost)
+        VALUES (%s, %s, %s, %s, %s)
+    """,
+    'includes_insert': "INSERT INTO Includes (ItineraryID, DestID) VALUES (%s, %s)",
+    'itineraries_by_user': """
+        SELECT
+            i.ItineraryID,
+            i.Title,
+            i.StartDate,
+            i.EndDate,
+            i.TotalCost,
+            GROUP_CONCAT(d.Name SEPARATOR ', ') AS Destinations
+        FROM Itinerary i
+        LEFT JOIN Includes inc ON i.ItineraryID = inc.ItineraryID
+        LEFT JOIN Destination d ON inc.DestID = d.DestID
+        WHERE i.UserID = %s
+        GROUP BY i.ItineraryID
+        ORDER BY i.StartDate DESC
+    """,
+    # One row shaped like 'itineraries_by_user', for the change feed
+    'itinerary_feed_row': """
+        SELECT
+            i.ItineraryID,
+            i.UserID,
+            i.Title,
+            i.StartDate,
+            i.EndDate,
+            i.TotalCost,
+            GROUP_CONCAT(d.Name SEPARATOR ', ') AS Destinations
+        FROM Itinerary i
+        LEFT JOIN Includes inc ON i.ItineraryID = inc.ItineraryID
+        LEFT JOIN Destination d ON inc.DestID = d.DestID
+        WHERE i.ItineraryID = %s
+        GROUP BY i.ItineraryID
+    """,
+    'includes_by_itinerary': "SELECT DestID FROM Includes WHERE ItineraryID = %s",
+    'includes_delete_by_itinerary': "DELETE FROM Includes WHERE ItineraryID = %s",
+    'itinerary_delete': "DELETE FROM Itinerary WHERE ItineraryID = %s",
+    'itinerary_by_id': """
+        SELECT ItineraryID, UserID, Title, StartDate, EndDate, TotalCost
+        FROM Itinerary
+        WHERE ItineraryID = %s
+    """,
+    'itinerary_activities': """
+        SELECT
+            a.ActivityID,
+            a.DestID,
+            d.Name AS Destination,
+            a.Name,
+            a.Description,
+            a.Cost,
+            a.Duration,
+            d.Rating AS DestinationRating
+        FROM Includes inc
+        JOIN Activity a ON inc.DestID = a.DestID
+        JOIN Destination d ON inc.DestID = d.DestID
+        WHERE inc.ItineraryID = %s
+        ORDER BY inc.DestID, a.ActivityID
+    """,
+
+    # ---------------- Delta sync ----------------
+    'sync_clock': "SELECT NOW(6) AS Now",
+    # Each one a range on the (UserID, UpdatedAt) index
+    'sync_bookings': """
+        SELECT
+            b.BookingID,
+            b.HotelID,
+            b.CheckInDate,
+            b.CheckOutDate,
+            b.TotalPrice,
+            b.BookingStatus,
+            b.BookingDate,
+            h.Name AS HotelName,
+            h.Location AS HotelLocation,
+            h.Rating AS HotelRating
+        FROM Booking b
+        LEFT JOIN Hotel h ON b.HotelID = h.HotelID
+        WHERE b.UserID = %s AND b.UpdatedAt > %s
+    """,
+    'sync_itineraries': """
+        SELECT
+            i.ItineraryID,
+            i.Title,
+            i.StartDate,
+            i.EndDate,
+            i.TotalCost,
+            GROUP_CONCAT(inc.DestID ORDER BY inc.DestID) AS DestIDs,
+            GROUP_CONCAT(d.Name ORDER BY inc.DestID SEPARATOR ', ') AS Destinations
+        FROM Itinerary i
+        LEFT JOIN Includes inc ON i.ItineraryID = inc.ItineraryID
+        LEFT JOIN Destination d ON inc.DestID = d.DestID
+        WHERE i.UserID = %s AND i.UpdatedAt > %s
+        GROUP BY i.ItineraryID
+    """,
+    'sync_payments': """
+        SELECT TransactionID, BookingID, Amount, PaymentStatus, TransactionDate
+        FROM PaymentTransaction
+        WHERE UserID = %s AND UpdatedAt > %s
+    """,
+    'sync_tombstones': """
+        SELECT EntityType, EntityID
+        FROM SyncTombstone
+        WHERE UserID = %s AND DeletedAt > %s
+    """,
+
+    # ---------------- Reports ----------------
+    'user_total_spending': "SELECT GetUserTotalSpending(%s) as total_spending",
+    'report_popular_destinations': """
+        SELECT
+            d.DestID,
+            d.Name,
+            d.Location,
+            d.Type,
+            d.Rating,
+            IsDestinationPopular(d.DestID) as PopularityStatus,
+            COUNT(inc.ItineraryID) as TotalItineraries
+        FROM Destination d
+        LEFT JOIN Includes inc ON d.DestID = inc.DestID
+        GROUP BY d.DestID
+        ORDER BY TotalItineraries DESC
+    """,
+    'occupancy_hotels': "SELECT HotelID, Name, Location, AvailableRooms FROM Hotel ORDER BY HotelID",
+    'occupancy_stays': """
+        SELECT HotelID, CheckInDate, CheckOutDate, TotalPrice
+        FROM Booking
+        WHERE BookingStatus = 'Confirmed'
+          AND HotelID IS NOT NULL
+          AND CheckInDate < %s
+          AND CheckOutDate > %s
+    """,
+    'stats_booking_count': "SELECT COUNT(*) as count FROM Booking",
+    'stats_user_count': "SELECT COUNT(*) as count FROM User",
+    'stats_destination_count': "SELECT COUNT(*) as count FROM Destination",
+    'stats_avg_hotel_rating': "SELECT AVG(Rating) as avg FROM Hotel",
+    'stats_confirmed_revenue': "SELECT SUM(Revenue) as total FROM RevenueMonthly",  # rollup of confirmed TotalPrice
+    # NESTED QUERY: Subquery in WHERE clause
+    'report_hotels_above_average_price': """
+        SELECT
+            HotelID,
+            Name,
+            Location,
+            PricePerNight,
+            Rating
+        FROM Hotel
+        WHERE PricePerNight > (
+            SELECT AVG(PricePerNight)
+            FROM Hotel
+        )
+        ORDER BY PricePerNight DESC
+    """,
+    # NESTED QUERY: Subquery with IN clause
+    'report_users_with_bookings': """
+        SELECT
+            UserID,
+            FirstName,
+            LastName,
+            Email,
+            PhoneNo
+        FROM User
+        WHERE UserID IN (
+            SELECT DISTINCT UserID
+            FROM Booking
+            WHERE BookingStatus = 'Confirmed'
+        )
+        ORDER BY LastName, FirstName
+    """,
+    # NESTED QUERY: Subquery with NOT IN clause
+    'report_destinations_not_in_itineraries': """
+        SELECT
+            DestID,
+            Name,
+            Location,
+            Type,
+            Rating
+        FROM Destination
+        WHERE DestID NOT IN (
+            SELECT DISTINCT DestID
+            FROM Includes
+            WHERE DestID IS NOT NULL
+        )
+        ORDER BY Name
+    """,
+    # CORRELATED QUERY: Subquery references outer query
+    'report_bookings_with_hotel_details': """
+        SELECT
+            b.BookingID,
+            b.CheckInDate,
+            b.CheckOutDate,
+            b.TotalPrice,
+            b.BookingStatus,
+            h.Name AS HotelName,
+            h.Location AS HotelLocation,
+            h.PricePerNight,
+            h.Rating AS HotelRating,
+            CONCAT(u.FirstName, ' ', u.LastName) AS UserName,
+            b.BookingDate
+        FROM Booking b
+        INNER JOIN Hotel h ON b.HotelID = h.HotelID
+        INNER JOIN User u ON b.UserID = u.UserID
+        WHERE h.Rating > (
+            SELECT AVG(Rating)
+            FROM Hotel h2
+            WHERE h2.Location = h.Location
+        )
+        ORDER BY b.BookingDate DESC
+    """,
+    # CORRELATED QUERY: Subquery in SELECT clause that references outer query
+    'report_users_booking_count': """
+        SELECT
+            u.UserID,
+            CONCAT(u.FirstName, ' ', u.LastName) AS UserName,
+            u.Email,
+            (
+                SELECT COUNT(*)
+                FROM Booking b
+                WHERE b.UserID = u.UserID
+                AND b.BookingStatus = 'Confirmed'
+            ) AS ConfirmedBookings,
+            (
+                SELECT COALESCE(SUM(b2.TotalPrice), 0)
+                FROM Booking b2
+                WHERE b2.UserID = u.UserID
+                AND b2.BookingStatus = 'Confirmed'
+            ) AS TotalSpending
+        FROM User u
+        ORDER BY ConfirmedBookings DESC, TotalSpending DESC
+    """,
+    # AGGREGATE + JOIN QUERY: Multiple aggregates with GROUP BY and JOINs
+    'report_hotels_booking_stats': """
+        SELECT
+            h.HotelID,
+            h.Name AS HotelName,
+            h.Location,
+            h.PricePerNight,
+            h.Rating,
+            COUNT(b.BookingID) AS TotalBookings,
+            COUNT(CASE WHEN b.BookingStatus = 'Confirmed' THEN 1 END) AS ConfirmedBookings,
+            COUNT(CASE WHEN b.BookingStatus = 'Cancelled' THEN 1 END) AS CancelledBookings,
+            COALESCE(SUM(CASE WHEN b.BookingStatus = 'Confirmed' THEN b.TotalPrice ELSE 0 END), 0) AS TotalRevenue,
+            COALESCE(AVG(CASE WHEN b.BookingStatus = 'Confirmed' THEN b.TotalPrice END), 0) AS AvgBookingValue
+        FROM Hotel h
+        LEFT JOIN Booking b ON h.HotelID = b.HotelID
+        GROUP BY h.HotelID, h.Name, h.Location, h.PricePerNight, h.Rating
+        HAVING TotalBookings > 0
+        ORDER BY TotalRevenue DESC, ConfirmedBookings DESC
+    """,
+}
+
+# Hot statements that run through cached server-side prepared cursors
+PREPARED = {
+    'table_versions',
+    'user_login',
+    'user_profile',
+    'user_confirmed_booking_count',
+    'calculate_booking_cost',
+    'hotel_inventory_range',
+    'user_bookings',
+    'booking_feed_row',
+    'itinerary_feed_row',
+    'sync_bookings',
+    'sync_itineraries',
+    'sync_payments',
+    'sync_tombstones',
+    'payment_by_booking',
+    'payments_by_user',
+    'destination_popularity',
+    'destination_include_count',
+    'itineraries_by_user',
+    'itinerary_activities',
+    'transport_changes_since',
+    'geo_changes_since',
+    'waitlist_changes_since',
+    'itinerary_destination_ids',
+    'user_total_spending',
+}
+
+# List and report statements whose columns can be chosen with ?fields=
+PROJECTABLE = {
+    'hotels_all',
+    'destinations_all',
+    'user_bookings',
+    'itineraries_by_user',
+    'payments_recent',
+    'payments_by_user',
+    'report_popular_destinations',
+    'report_hotels_above_average_price',
+    'report_users_with_bookings',
+    'report_destinations_not_in_itineraries',
+    'report_bookings_with_hotel_details',
+    'report_users_booking_count',
+    'report_hotels_booking_stats',
+}
+
+PREPARED_ENABLED = os.environ.get('DB_PREPARED_STATEMENTS', '1') != '0'
+
+# MySQL error raised when a cached statement handle is gone (e.g. reconnect)
+ER_UNKNOWN_STMT_HANDLER = 1243
+
+WriteResult = namedtuple('WriteResult', ['rowcount', 'lastrowid'])
+
+# Callables notified of every mysql.connector.Error a statement raises
+# (app.py registers the DB circuit breaker here)
+error_listeners = []
+
+
+# ============================================
+# STATISTICS
+# ============================================
+
+class StatementStats:
+    """Thread-safe per-statement counters, keyed by (name, mode)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, mode, elapsed, rows, error=False):
+        with self._lock:
+            entry = self._stats.get((name, mode))
+            if entry is None:
+                entry = self._stats[(name, mode)] = {
+                    'calls': 0, 'errors': 0, 'totalTime': 0.0, 'maxTime': 0.0, 'rows': 0,
+                }
+            entry['calls'] += 1
+            entry['totalTime'] += elapsed
+            entry['maxTime'] = max(entry['maxTime'], elapsed)
+            entry['rows'] += rows
+            if error:
+                entry['errors'] += 1
+
+    def snapshot(self):
+        """Return stats as a list of dicts, slowest total time first"""
+        with self._lock:
+            items = [(key, dict(entry)) for key, entry in self._stats.items()]
+        result = []
+        for (name, mode), entry in items:
+            calls = entry['calls']
+            result.append({
+                'statement': name,
+                'mode': mode,
+                'calls': calls,
+                'errors': entry['errors'],
+                'rows': entry['rows'],
+                'totalMs': round(entry['totalTime'] * 1000, 3),
+                'avgMs': round(entry['totalTime'] * 1000 / calls, 3) if calls else 0,
+                'maxMs': round(entry['maxTime'] * 1000, 3),
+            })
+        result.sort(key=lambda item: item['totalMs'], reverse=True)
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+stats = StatementStats()
+
+
+# ============================================
+# EXECUTION
+# ============================================
+
+# Underlying connection -> {statement name: prepared cursor}. Keyed weakly so
+# cursors disappear together with the connection that owns them.
+_prepared_cursors = weakref.WeakKeyDictionary()
+_prepared_lock = threading.Lock()
+
+
+def _raw_connection(conn):
+    """Pooled connections wrap the real connection in ._cnx"""
+    return getattr(conn, '_cnx', conn)
+
+
+def _prepared_cursor(conn, name):
+    raw = _raw_connection(conn)
+    with _prepared_lock:
+        cursors = _prepared_cursors.get(raw)
+        if cursors is None:
+            cursors = _prepared_cursors[raw] = {}
+    cursor = cursors.get(name)
+    if cursor is None:
+        cursor = raw.cursor(prepared=True)
+        cursors[name] = cursor
+    return cursor
+
+
+def _discard_prepared(conn, name):
+    cursors = _prepared_cursors.get(_raw_connection(conn))
+    if cursors:
+        cursors.pop(name, None)
+
+
+def is_prepared(name):
+    return PREPARED_ENABLED and name in PREPARED
+
+
+def _run(conn, name, params, fetch, sql=None, as_rowset=False):
+    if sql is None:
+        sql = QUERIES[name]
+        prepared = is_prepared(name)
+    else:
+        prepared = False
+    mode = 'prepared' if prepared else 'text'
+    started = time.perf_counter()
+    try:
+        if prepared:
+            try:
+                cursor = _prepared_cursor(conn, name)
+                cursor.execute(sql, params)
+            except mysql.connector.Error as err:
+                if err.errno != ER_UNKNOWN_STMT_HANDLER:
+                    raise
+                # Statement handle was lost (reconnect/reset): prepare again
+                _discard_prepared(conn, name)
+                cursor = _prepared_cursor(conn, name)
+                cursor.execute(sql, params)
+        else:
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+
+        if fetch:
+            columns = cursor.column_names
+            if as_rowset:
+                result = RowSet(columns, cursor.fetchall())
+            else:
+                result = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            row_count = len(result)
+        else:
+            result = WriteResult(cursor.rowcount, cursor.lastrowid)
+            row_count = max(cursor.rowcount, 0)
+
+        if not prepared:
+            cursor.close()
+    except mysql.connector.Error as err:
+        if prepared:
+            _discard_prepared(conn, name)
+        stats.record(name, mode, time.perf_counter() - started, 0, error=True)
+        for listener in error_listeners:
+            listener(err)
+        raise
+
+    stats.record(name, mode, time.perf_counter() - started, row_count)
+    return result
+
+
+def fetch_all(conn, name, params=()):
+    """Run a named SELECT and return every row as a dict"""
+    return _run(conn, name, params, fetch=True)
+
+
+def fetch_one(conn, name, params=()):
+    """Run a named SELECT and return the first row as a dict (or None)"""
+    rows = _run(conn, name, params, fetch=True)
+    return rows[0] if rows else None
+
+
+def fetch_value(conn, name, params=()):
+    """Run a named SELECT and return the first column of the first row"""
+    row = fetch_one(conn, name, params)
+    return next(iter(row.values())) if row else None
+
+
+def fetch_dynamic(conn, name, sql, params=()):
+    """Run SQL assembled at runtime (e.g. optional filters), recorded under name"""
+    return _run(conn, name, params, fetch=True, sql=sql)
+
+
+def execute(conn, name, params=()):
+    """Run a named INSERT/UPDATE/DELETE; returns WriteResult(rowcount, lastrowid)"""
+    return _run(conn, name, params, fetch=False)
+
+
+# ============================================
+# PROJECTION
+# ============================================
+
+Projection = namedtuple('Projection', ['columns', 'expressions', 'rest', 'sort_aliases'])
+
+_projections = {}
+_projections_lock = threading.Lock()
+
+
+def _split_select(sql):
+    """(top-level SELECT list items, SQL from the top-level FROM on)"""
+    upper = sql.upper()
+    position = upper.index('SELECT') + len('SELECT')
+    items, start, depth, quote = [], position, 0, None
+    while position < len(sql):
+        char = sql[position]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and char == ',':
+            items.append(sql[start:position])
+            start = position + 1
+        elif (depth == 0 and upper.startswith('FROM', position)
+              and not (sql[position - 1].isalnum() or sql[position - 1] == '_')
+              and not (sql[position + 4:position + 5].isalnum() or sql[position + 4:position + 5] == '_')):
+            items.append(sql[start:position])
+            return [item.strip() for item in items], sql[position:]
+        position += 1
+    raise ValueError('Statement has no top-level FROM')
+
+
+def _output_column(item):
+    """(output column name, expression) of one SELECT list item"""
+    match = re.search(r'\s+AS\s+(\w+)$', item, re.IGNORECASE)
+    if match:
+        return match.group(1), item[:match.start()].strip()
+    return item.rsplit('.', 1)[-1], item
+
+
+def projection(name):
+    """Output columns of a PROJECTABLE statement and how to rebuild it"""
+    with _projections_lock:
+        cached = _projections.get(name)
+    if cached is not None:
+        return cached
+    items, rest = _split_select(QUERIES[name])
+    columns, expressions, sort_aliases = [], {}, set()
+    for item in items:
+        column, expression = _output_column(item)
+        columns.append(column)
+        expressions[column] = item
+        # ORDER BY / HAVING on a computed alias needs that column selected
+        if (not re.fullmatch(rf'(\w+\.)?{column}', expression)
+                and re.search(rf'\b{column}\b', rest)):
+            sort_aliases.add(column)
+    cached = Projection(columns, expressions, rest, sort_aliases)
+    with _projections_lock:
+        _projections[name] = cached
+    return cached
+
+
+def fetch_projected(conn, name, fields=None, params=()):
+    """Like fetch_all() for a PROJECTABLE statement, selecting only `fields`
+    fields=None runs the registered statement unchanged. Columns must come
+    from projection(name).columns.
+    """
+    if not fields:
+        return fetch_all(conn, name, params)
+    label, sql, selected = _projected_sql(name, fields)
+    rows = fetch_dynamic(conn, label, sql, params)
+    if len(selected) > len(fields):
+        rows = [{column: row[column] for column in fields} for row in rows]
+    return rows
+
+
+def fetch_rowset(conn, name, fields=None, params=()):
+    """fetch_projected() without a dict per row: a RowSet of `fields` (None = all)"""
+    if not fields:
+        return _run(conn, name, params, fetch=True, as_rowset=True)
+    label, sql, selected = _projected_sql(name, fields)
+    return _run(conn, label, params, fetch=True, sql=sql, as_rowset=True).project(fields)
+
+
+def _projected_sql(name, fields):
+    """(stats label, SQL, selected columns) of a PROJECTABLE statement narrowed to fields"""
+    spec = projection(name)
+    # ORDER BY on a computed alias needs that column too; dropped after the fetch
+    selected = list(fields) + [column for column in spec.columns
+                               if column in spec.sort_aliases and column not in fields]
+    sql = 'SELECT ' + ', '.join(spec.expressions[column] for column in selected) + '\n        ' + spec.rest
+    return f"{name}[{','.join(fields)}]", sql, selected
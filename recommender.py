@@ -0,0 +1,200 @@
+"""Destination recommendations from itinerary co-occurrence.
+
+Two destinations co-occur when some itinerary includes both. The recommender
+keeps, in memory:
+
+    pairs       sparse symmetric counts {DestID: {DestID: itineraries}}
+    popularity  itineraries per destination
+    top         per destination, its TOP_K neighbours by cosine similarity
+                (pair count / sqrt(popularity a * popularity b))
+
+Recommendations for a partial itinerary sum the precomputed top lists of its
+destinations, so a request never touches Includes. The counts are built
+with one GROUP BY and then updated in place by the itinerary/destination
+write routes; a top list is rebuilt lazily the next time it is read after a
+change touched it.
+
+Writes from other processes are detected through the Includes TableVersion:
+each local update checks that the version moved by exactly its own row
+count, and any other movement triggers a full rebuild.
+"""
+import math
+import threading
+
+import mysql.connector
+
+import queries
+from table_versions import VersionWatcher
+
+TOP_K = 20
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 50
+
+
+class CoOccurrenceRecommender:
+    """In-memory co-occurrence model over Includes"""
+
+    def __init__(self):
+        self.watcher = VersionWatcher(['Includes'])
+        self._lock = threading.RLock()
+        self._version = None
+        self._pairs = {}
+        self._popularity = {}
+        self._top = {}
+        self._dirty = set()
+        self._popular = []
+        self._popular_dirty = True
+        self.rebuilds = 0
+
+    # ---------------- loading ----------------
+
+    def _rebuild(self, conn):
+        version = self.watcher.current(conn)
+        pairs, popularity = {}, {}
+        for row in queries.fetch_all(conn, 'destination_itinerary_counts'):
+            popularity[row['DestID']] = row['Itineraries']
+        for row in queries.fetch_all(conn, 'destination_pair_counts'):
+            first, second, count = row['FirstDestID'], row['SecondDestID'], row['Itineraries']
+            pairs.setdefault(first, {})[second] = count
+            pairs.setdefault(second, {})[first] = count
+        self._pairs = pairs
+        self._popularity = popularity
+        self._top = {}
+        self._dirty = set(popularity)
+        self._popular_dirty = True
+        self._version = version
+        self.rebuilds += 1
+
+    def _ensure_current(self, conn):
+        with self._lock:
+            if self._version is None or self.watcher.current(conn) != self._version:
+                self._rebuild(conn)
+
+    def _sync_version(self, conn, delta):
+        """Accept the new version if it moved only by our own `delta` rows"""
+        if self._version is None:
+            return
+        self.watcher.expire()
+        try:
+            version = self.watcher.current(conn)
+        except mysql.connector.Error:
+            # The write itself is committed; just rebuild on the next read
+            self._version = None
+            return
+        if version[0] == self._version[0] + delta:
+            self._version = version
+        else:
+            self._version = None
+
+    # ---------------- incremental updates ----------------
+
+    def _touch(self, dest_id):
+        self._dirty.add(dest_id)
+        self._dirty.update(self._pairs.get(dest_id, ()))
+        self._popular_dirty = True
+
+    def _adjust(self, dest_ids, step):
+        # A '3' next to a 3 would break the sorted() of _popular_list
+        dest_ids = sorted({int(dest_id) for dest_id in dest_ids})
+        for dest_id in dest_ids:
+            count = self._popularity.get(dest_id, 0) + step
+            if count > 0:
+                self._popularity[dest_id] = count
+            else:
+                self._popularity.pop(dest_id, None)
+        for index, first in enumerate(dest_ids):
+            for second in dest_ids[index + 1:]:
+                for a, b in ((first, second), (second, first)):
+                    neighbours = self._pairs.setdefault(a, {})
+                    count = neighbours.get(b, 0) + step
+                    if count > 0:
+                        neighbours[b] = count
+                    else:
+                        neighbours.pop(b, None)
+                        if not neighbours:
+                            del self._pairs[a]
+        for dest_id in dest_ids:
+            self._touch(dest_id)
+
+    def itinerary_added(self, conn, dest_ids):
+        """Call after committing a new itinerary with these destinations"""
+        with self._lock:
+            self._adjust(dest_ids, 1)
+            self._sync_version(conn, len(dest_ids))
+
+    def itinerary_removed(self, conn, dest_ids):
+        """Call after committing the deletion of an itinerary's Includes rows"""
+        with self._lock:
+            self._adjust(dest_ids, -1)
+            self._sync_version(conn, len(dest_ids))
+
+    def destination_removed(self, conn, dest_id, includes_deleted):
+        """Call after committing a destination delete"""
+        with self._lock:
+            self._touch(dest_id)
+            for neighbour in self._pairs.pop(dest_id, {}):
+                neighbours = self._pairs.get(neighbour)
+                if neighbours is not None:
+                    neighbours.pop(dest_id, None)
+                    if not neighbours:
+                        del self._pairs[neighbour]
+            self._popularity.pop(dest_id, None)
+            self._top.pop(dest_id, None)
+            self._dirty.discard(dest_id)
+            self._sync_version(conn, includes_deleted)
+
+    # ---------------- serving ----------------
+
+    def _top_list(self, dest_id):
+        if dest_id in self._dirty:
+            base = self._popularity.get(dest_id, 0)
+            scored = [
+                (count / math.sqrt(base * self._popularity[other]), other)
+                for other, count in self._pairs.get(dest_id, {}).items()
+                if base and self._popularity.get(other)
+            ]
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            self._top[dest_id] = scored[:TOP_K]
+            self._dirty.discard(dest_id)
+        return self._top.get(dest_id, [])
+
+    def _popular_list(self):
+        if self._popular_dirty:
+            self._popular = sorted(self._popularity, key=lambda dest_id: (-self._popularity[dest_id], dest_id))[:TOP_K]
+            self._popular_dirty = False
+        return self._popular
+
+    def recommend(self, conn, dest_ids, limit=DEFAULT_LIMIT):
+        """[(DestID, score, reason)] to add to an itinerary containing dest_ids"""
+        limit = max(1, min(limit or DEFAULT_LIMIT, MAX_LIMIT))
+        self._ensure_current(conn)
+        chosen = set(dest_ids)
+        with self._lock:
+            scores = {}
+            for dest_id in chosen:
+                for score, other in self._top_list(dest_id):
+                    if other not in chosen:
+                        scores[other] = scores.get(other, 0.0) + score
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            results = [(dest_id, round(score, 4), 'co-occurrence') for dest_id, score in ranked]
+
+            # Not enough co-occurrence signal: fill up with popular destinations
+            if len(results) < limit:
+                seen = chosen | {dest_id for dest_id, _score, _reason in results}
+                for dest_id in self._popular_list():
+                    if len(results) >= limit:
+                        break
+                    if dest_id not in seen:
+                        results.append((dest_id, 0.0, 'popular'))
+        return results
+
+    def status(self):
+        return {
+            'destinations': len(self._popularity),
+            'pairs': sum(len(neighbours) for neighbours in self._pairs.values()) // 2,
+            'rebuilds': self.rebuilds,
+            'version': self._version,
+        }
+
+
+recommender = CoOccurrenceRecommender()
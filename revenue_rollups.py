@@ -0,0 +1,129 @@
+"""Revenue and booking time series served from rollup tables.
+
+RevenueDaily and RevenueMonthly hold one row per (period, HotelID) with
+
+    Bookings   bookings made in the period (any status)
+    Confirmed  of those, currently confirmed
+    Cancelled  of those, currently cancelled
+    Revenue    TotalPrice of the confirmed ones
+    Paid       completed PaymentTransaction amounts dated in the period
+
+Bookings are attributed to DATE(BookingDate), payments to
+DATE(TransactionDate); bookings without a hotel roll up under HotelID 0.
+The tables are filled once from Booking/PaymentTransaction and then kept
+current by the RevenueRollup_* triggers (booking create, cancel and any
+other status change, payment inserts and status updates), so a series never
+scans Booking.
+"""
+from datetime import date
+
+import queries
+
+GRANULARITIES = {'daily': 'RevenueDaily', 'monthly': 'RevenueMonthly'}
+GROUPINGS = ('none', 'hotel', 'location')
+MAX_DAILY_DAYS = 3 * 366
+
+
+class RollupError(ValueError):
+    """Invalid time-series parameters (reported to the client as a 400)"""
+
+
+def _in_list(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def series(conn, start, end, granularity='daily', group_by='none', hotel_ids=None):
+    """Rows of (period, group key, measures) for start <= period < end
+    Periods without any bookings or payments are omitted.
+    """
+    table = GRANULARITIES.get(granularity)
+    if table is None:
+        raise RollupError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+    if group_by not in GROUPINGS:
+        raise RollupError(f"groupBy must be one of: {', '.join(GROUPINGS)}")
+    if end <= start:
+        raise RollupError('end must be after start')
+    if granularity == 'daily' and (end - start).days > MAX_DAILY_DAYS:
+        raise RollupError(f"Daily series are limited to {MAX_DAILY_DAYS} days; use granularity=monthly")
+    if granularity == 'monthly':
+        # Month rows are keyed by their first day
+        start = date(start.year, start.month, 1)
+
+    key_column = {
+        'none': "NULL",
+        'hotel': "r.HotelID",
+        'location': "COALESCE(h.Location, 'Unknown')",
+    }[group_by]
+    join = "LEFT JOIN Hotel h ON r.HotelID = h.HotelID" if group_by == 'location' else ""
+    params = [start, end]
+    hotel_filter = ''
+    if hotel_ids:
+        hotel_filter = f"AND r.HotelID IN ({_in_list(hotel_ids)})"
+        params.extend(hotel_ids)
+
+    rows = queries.fetch_dynamic(conn, f"revenue_series_{granularity}_{group_by}", f"""
+        SELECT
+            r.Period,
+            {key_column} AS GroupKey,
+            SUM(r.Bookings) AS Bookings,
+            SUM(r.Confirmed) AS Confirmed,
+            SUM(r.Cancelled) AS Cancelled,
+            SUM(r.Revenue) AS Revenue,
+            SUM(r.Paid) AS Paid
+        FROM {table} r
+        {join}
+        WHERE r.Period >= %s AND r.Period < %s {hotel_filter}
+        GROUP BY r.Period, GroupKey
+        ORDER BY r.Period, GroupKey
+    """, tuple(params))
+
+    points = []
+    totals = {'bookings': 0, 'confirmed': 0, 'cancelled': 0, 'revenue': 0.0, 'paid': 0.0}
+    for row in rows:
+        point = {
+            'period': row['Period'].isoformat(),
+            'bookings': int(row['Bookings']),
+            'confirmed': int(row['Confirmed']),
+            'cancelled': int(row['Cancelled']),
+            'revenue': float(row['Revenue']),
+            'paid': float(row['Paid']),
+        }
+        if group_by == 'hotel':
+            point['hotelId'] = row['GroupKey']
+        elif group_by == 'location':
+            point['location'] = row['GroupKey']
+        for measure in totals:
+            totals[measure] += point[measure]
+        points.append(point)
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['paid'] = round(totals['paid'], 2)
+    return points, totals
+
+
+def merge(parts):
+    """One series from the (points, totals) of several shards
+    Points of the same period and group are added up.
+    """
+    if len(parts) == 1:
+        return parts[0]
+    merged = {}
+    totals = {'bookings': 0, 'confirmed': 0, 'cancelled': 0, 'revenue': 0.0, 'paid': 0.0}
+    for points, part_totals in parts:
+        for point in points:
+            key = (point['period'], point.get('hotelId'), point.get('location'))
+            current = merged.get(key)
+            if current is None:
+                merged[key] = dict(point)
+                continue
+            for measure in totals:
+                current[measure] += point[measure]
+        for measure in totals:
+            totals[measure] += part_totals[measure]
+    points = sorted(merged.values(),
+                    key=lambda point: (point['period'], point.get('hotelId') or 0, point.get('location') or ''))
+    for point in points:
+        point['revenue'] = round(point['revenue'], 2)
+        point['paid'] = round(point['paid'], 2)
+    totals['revenue'] = round(totals['revenue'], 2)
+    totals['paid'] = round(totals['paid'], 2)
+    return points, totals
@@ -0,0 +1,130 @@
+"""Result sets kept as the cursor's tuples under one shared header.
+
+The dict-per-row path (queries.fetch_all + jsonify) builds a dict with its
+own key references for every row, then jsonify walks all of them at once
+into one string. For the large cross-user reports (merged_report in app.py)
+queries.fetch_rowset() returns a RowSet instead, and render() serializes
+straight from it:
+
+    application/json       streamed CHUNK_ROWS rows at a time. The document
+                           is byte for byte what jsonify produces outside
+                           debug mode: rows as objects with sorted keys, or a
+                           header row followed by arrays with ?format=compact
+                           (no dicts at all)
+    application/msgpack    the same document as MessagePack, when the client
+                           prefers it (Accept) and the msgpack package is
+                           installed
+
+Dates and decimals are encoded the way Flask's JSON provider does, in both
+formats. benchmarks/rowset_memory.py compares time and peak memory with the
+dict path.
+"""
+import json
+
+from json_encoding import json_default
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+# Older clients still send the unregistered name
+MSGPACK_TYPES = (MSGPACK, 'application/x-msgpack')
+
+# Rows encoded per chunk; bounds the temporary objects of the object layout
+CHUNK_ROWS = 1000
+
+
+# jsonify's settings outside debug mode
+_encoder = json.JSONEncoder(default=json_default, sort_keys=True, separators=(',', ':'))
+
+
+class RowSet:
+    """Column names once; rows as tuples in that column order"""
+
+    __slots__ = ('columns', 'rows')
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+    @classmethod
+    def from_dicts(cls, dicts, columns):
+        return cls(columns, [tuple(row.get(column) for column in columns) for row in dicts])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, name):
+        """Every value of one column"""
+        index = self.columns.index(name)
+        return [row[index] for row in self.rows]
+
+    def project(self, columns):
+        """Only these columns, in this order"""
+        if tuple(columns) == self.columns:
+            return self
+        indexes = [self.columns.index(column) for column in columns]
+        return RowSet(columns, [tuple(row[index] for index in indexes) for row in self.rows])
+
+    def dicts(self):
+        return [dict(zip(self.columns, row)) for row in self.rows]
+
+    def _chunks(self, compact):
+        """Lists of at most CHUNK_ROWS rows: tuples, or dicts without compact"""
+        for start in range(0, len(self.rows), CHUNK_ROWS):
+            chunk = self.rows[start:start + CHUNK_ROWS]
+            yield chunk if compact else [dict(zip(self.columns, row)) for row in chunk]
+
+
+def wants_msgpack(accept):
+    """True when the request's Accept (werkzeug MIMEAccept) prefers MessagePack"""
+    if msgpack is None:
+        return False
+    # JSON first: */* and a missing header stay JSON
+    return accept.best_match((JSON,) + MSGPACK_TYPES, default=JSON) in MSGPACK_TYPES
+
+
+def json_chunks(envelope, key, rows, compact):
+    """Pieces of the JSON text of dict(envelope, **{key: rows})"""
+    yield '{'
+    for position, name in enumerate(sorted(list(envelope) + [key])):
+        yield (',' if position else '') + _encoder.encode(name) + ':'
+        if name != key:
+            yield _encoder.encode(envelope[name])
+            continue
+        yield '['
+        first = True
+        if compact:
+            yield _encoder.encode(list(rows.columns))
+            first = False
+        for chunk in rows._chunks(compact):
+            yield ('' if first else ',') + _encoder.encode(chunk)[1:-1]
+            first = False
+        yield ']'
+    yield '}'
+
+
+def msgpack_chunks(envelope, key, rows, compact):
+    """Pieces of the MessagePack encoding of the same document"""
+    packer = msgpack.Packer(default=json_default)
+    yield packer.pack_map_header(len(envelope) + 1)
+    for name in sorted(list(envelope) + [key]):
+        yield packer.pack(name)
+        if name != key:
+            yield packer.pack(envelope[name])
+            continue
+        yield packer.pack_array_header(len(rows) + (1 if compact else 0))
+        if compact:
+            yield packer.pack(list(rows.columns))
+        for chunk in rows._chunks(compact):
+            yield b''.join(packer.pack(row) for row in chunk)
+
+
+def render(envelope, key, rows, compact, accept):
+    """(mimetype, iterable body) of a response carrying a RowSet under key"""
+    if wants_msgpack(accept):
+        return MSGPACK, msgpack_chunks(envelope, key, rows, compact)
+    return JSON, json_chunks(envelope, key, rows, compact)
@@ -0,0 +1,352 @@
+"""Horizontal sharding of user-owned rows by UserID.
+
+Every shard is a complete travel database (same tables, triggers and
+procedures). The rows of a user -- User, Booking, Itinerary, Includes,
+PaymentTransaction, BookingAudit, SyncTombstone and the revenue rollups --
+live on that user's shard only. Catalog tables (Hotel, HotelRate, the
+standing Offers, Destination, Availability, Activity, Transport) are written
+on shard 0, the catalog shard, and copied to the other shards, so every
+shard joins its bookings to hotels and destinations (and prices stays)
+locally:
+
+    python shards.py sync-globals [--dry-run]
+
+Per-night hotel inventory (HotelNightInventory) exists once, on the catalog
+shard. Sessions on the other shards run with @inventory_remote set, which
+makes the booking inventory triggers stand down; app.py reserves and
+releases the nights on the catalog shard around those bookings instead.
+
+Ids are ranges, so an id names its shard without a directory lookup: shard
+i hands out User, Booking, Itinerary and PaymentTransaction ids in
+[i * SHARD_ID_RANGE + 1, (i + 1) * SHARD_ID_RANGE] (prepare() moves each
+table's AUTO_INCREMENT into the range). New users are placed by a hash of
+their email; users created before sharding was enabled keep their ids and
+stay on shard 0.
+
+Reports over all users run on every shard at once (fan_out) and merge the
+partial results: counts and sums are added, averages recomputed from those
+sums, ordered lists merged in the report's order.
+
+Configuration (environment variables):
+    DB_SHARDS             comma separated [host[:port]/]database list of the
+                          shards after shard 0 (shard 0 is DB_NAME on DB_HOST);
+                          unset = a single shard, nothing changes
+    SHARD_ID_RANGE        ids per shard (default 10000000)
+    SHARD_FANOUT_WORKERS  shard queries run in parallel (default: one per shard)
+
+Shards other than 0 use the primary credentials and have no replicas.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+import catalog_sync
+import circuit_breaker
+from db_router import DatabaseRouter
+
+ID_RANGE = int(os.environ.get('SHARD_ID_RANGE', 10000000))
+
+# Tables whose ids are handed out from the owning shard's range
+ID_TABLES = [
+    ('User', 'UserID'),
+    ('Booking', 'BookingID'),
+    ('Itinerary', 'ItineraryID'),
+    ('PaymentTransaction', 'TransactionID'),
+]
+
+# Catalog tables copied from shard 0 to the others, parents first
+GLOBAL_TABLES = [catalog_sync.HOTELS, catalog_sync.RATES, catalog_sync.OFFERS] + catalog_sync.TABLES
+
+# Seconds before a failed catalog copy is retried, doubled per failure up to the max
+COPY_RETRY_SECONDS = 1
+COPY_RETRY_MAX_SECONDS = 60
+
+# Set on every session of a non-catalog shard (see the inventory triggers)
+INVENTORY_REMOTE = "SET @inventory_remote = 1"
+
+
+class ShardError(ValueError):
+    """An id outside every configured shard's range (reported as a 404)"""
+
+
+class Shard:
+    """One shard database and the id range it owns"""
+
+    def __init__(self, index, router, id_range=ID_RANGE):
+        self.index = index
+        self.router = router
+        self.first_id = index * id_range + 1
+        self.last_id = (index + 1) * id_range
+
+    @property
+    def name(self):
+        return self.router.primary.config['database']
+
+    @property
+    def is_catalog(self):
+        return self.index == 0
+
+    def status(self):
+        return {
+            'index': self.index,
+            'database': self.name,
+            'host': self.router.primary.config['host'],
+            'firstId': self.first_id,
+            'lastId': self.last_id,
+            'catalog': self.is_catalog,
+        }
+
+
+class ShardMap:
+    """UserID (and entity id) to shard routing plus parallel fan-out"""
+
+    def __init__(self, shards, workers=None):
+        self.shards = shards
+        self.workers = workers or len(shards)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.fan_outs = 0
+        self.slowest = [0.0] * len(shards)   # seconds, per shard, since start
+        self._copy_pending = False
+        self._copy_running = False
+        self.copies = 0
+        self.copy_failures = 0
+        self.last_copy_error = None
+
+    @classmethod
+    def from_env(cls, catalog_router):
+        """Shard 0 is the app's own router; DB_SHARDS adds the others"""
+        shards = [Shard(0, catalog_router)]
+        base = catalog_router.primary.config
+        for index, spec in enumerate(filter(None, os.environ.get('DB_SHARDS', '').split(',')), start=1):
+            location, _, database = spec.strip().rpartition('/')
+            config = dict(base, database=database)
+            if location:
+                host, _, port = location.partition(':')
+                config['host'] = host
+                config['port'] = int(port) if port else 3306
+            config['init_command'] = INVENTORY_REMOTE
+            router = DatabaseRouter(config, pool_size=catalog_router.primary.pool_size)
+            # Pool names must be unique per process
+            router.primary.name = f"shard{index}"
+            shards.append(Shard(index, router))
+        workers = int(os.environ.get('SHARD_FANOUT_WORKERS', 0)) or None
+        return cls(shards, workers)
+
+    @property
+    def sharded(self):
+        return len(self.shards) > 1
+
+    @property
+    def catalog(self):
+        return self.shards[0]
+
+    # ---------------- routing ----------------
+
+    def for_id(self, entity_id):
+        """Shard owning a UserID, BookingID, ItineraryID or TransactionID"""
+        index = (int(entity_id) - 1) // ID_RANGE
+        if not 0 <= index < len(self.shards):
+            raise ShardError(f"No shard owns id {entity_id}")
+        return self.shards[index]
+
+    for_user = for_id
+
+    def for_new_user(self, email):
+        """Shard a new account is created on"""
+        digest = zlib.crc32(email.strip().lower().encode('utf-8'))
+        return self.shards[digest % len(self.shards)]
+
+    # ---------------- fan-out ----------------
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard')
+        return self._executor
+
+    def fan_out(self, fn, connect, shards=None, return_errors=False):
+        """[fn(shard, conn) for every shard], run concurrently, in shard order
+        connect(shard) opens the connection; it is closed afterwards. The
+        first failing shard's exception is raised (the others still run to
+        completion and close their connections); with return_errors it takes
+        that shard's place in the results instead.
+        """
+        shards = self.shards if shards is None else shards
+
+        def call(shard):
+            started = time.monotonic()
+            conn = connect(shard)
+            try:
+                return fn(shard, conn)
+            finally:
+                conn.close()
+                elapsed = time.monotonic() - started
+                if elapsed > self.slowest[shard.index]:
+                    self.slowest[shard.index] = elapsed
+
+        def run(shard):
+            if not return_errors:
+                return call(shard)
+            try:
+                return call(shard)
+            except Exception as err:
+                return err
+
+        with self._lock:
+            self.fan_outs += 1
+        if len(shards) == 1:
+            return [run(shards[0])]
+        futures = [self._get_executor().submit(run, shard) for shard in shards]
+        return [future.result() for future in futures]
+
+    # ---------------- maintenance ----------------
+
+    def prepare(self, cursor, shard):
+        """Move AUTO_INCREMENT of the id tables into the shard's range"""
+        if shard.is_catalog:
+            return
+        for table, key in ID_TABLES:
+            cursor.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")
+            (highest,) = cursor.fetchone()
+            if highest > shard.last_id:
+                print(f"Shard {shard.name}: {table}.{key} {highest} is past the shard's id range")
+            elif highest < shard.first_id:
+                cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {shard.first_id}")
+
+    def copy_globals(self, connect, dry_run=False):
+        """Make the catalog tables of every other shard equal to shard 0's"""
+        if not self.sharded:
+            return {}
+        source = connect(self.catalog)
+        try:
+            cursor = source.cursor(dictionary=True)
+            feed = {}
+            for spec in GLOBAL_TABLES:
+                cursor.execute(spec.select_sql())
+                feed[spec.feed_key] = cursor.fetchall()
+            cursor.close()
+            source.commit()
+        finally:
+            source.close()
+
+        targets = self.shards[1:]
+        summaries = self.fan_out(
+            lambda _shard, conn: catalog_sync.sync(conn, feed, prune=True, dry_run=dry_run, tables=GLOBAL_TABLES),
+            connect,
+            targets
+        )
+        return {shard.name: summary for shard, summary in zip(targets, summaries)}
+
+    def request_copy(self, connect):
+        """copy_globals in the background, after the caller's write is answered
+        Requests arriving while a copy runs are folded into one more copy. A
+        failed copy is retried with backoff until one succeeds; every copy
+        makes the shards equal to shard 0, so nothing is lost by coalescing.
+        """
+        if not self.sharded:
+            return
+        with self._lock:
+            self._copy_pending = True
+            if self._copy_running:
+                return
+            self._copy_running = True
+        threading.Thread(target=self._copy_loop, args=(connect,), name='catalog-copy', daemon=True).start()
+
+    def _copy_loop(self, connect):
+        delay = COPY_RETRY_SECONDS
+        while True:
+            with self._lock:
+                if not self._copy_pending:
+                    self._copy_running = False
+                    return
+                self._copy_pending = False
+            try:
+                self.copy_globals(connect)
+            except (mysql.connector.Error, circuit_breaker.DatabaseUnavailable,
+                    catalog_sync.CatalogSyncError) as err:
+                with self._lock:
+                    self._copy_pending = True
+                    self.copy_failures += 1
+                    self.last_copy_error = str(err)
+                print(f"Catalog copy to the shards failed, retrying in {delay}s: {err}")
+                time.sleep(delay)
+                delay = min(delay * 2, COPY_RETRY_MAX_SECONDS)
+                continue
+            delay = COPY_RETRY_SECONDS
+            with self._lock:
+                self.copies += 1
+                self.last_copy_error = None
+
+    def status(self):
+        return {
+            'sharded': self.sharded,
+            'idRange': ID_RANGE,
+            'fanOutWorkers': self.workers,
+            'fanOuts': self.fan_outs,
+            'catalogCopies': self.copies,
+            'catalogCopyPending': self._copy_pending or self._copy_running,
+            'catalogCopyFailures': self.copy_failures,
+            'lastCatalogCopyError': self.last_copy_error,
+            'shards': [
+                dict(shard.status(), slowestFanOutSeconds=round(self.slowest[shard.index], 4))
+                for shard in self.shards
+            ],
+        }
+
+
+# ============================================
+# MERGING PARTIAL RESULTS
+# ============================================
+
+def concat(parts):
+    return [row for part in parts for row in part]
+
+
+def merge_sorted(parts, key, reverse=False, limit=None):
+    """Rows of every shard in one order (each part already sorted by key)"""
+    rows = sorted(concat(parts), key=key, reverse=reverse)
+    return rows if limit is None else rows[:limit]
+
+
+def sum_by(parts, key, measures):
+    """One row per key; measures added up, other columns from the first shard"""
+    merged = {}
+    for part in parts:
+        for row in part:
+            current = merged.get(row[key])
+            if current is None:
+                merged[row[key]] = dict(row)
+                continue
+            for measure in measures:
+                current[measure] = (current[measure] or 0) + (row[measure] or 0)
+    return list(merged.values())
+
+
+def common_to_all(parts, key):
+    """Rows of the first part whose key appears in every part"""
+    keep = set.intersection(*[{row[key] for row in part} for part in parts])
+    return [row for row in parts[0] if row[key] in keep]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shard maintenance')
+    parser.add_argument('command', choices=['sync-globals', 'status'])
+    parser.add_argument('--dry-run', action='store_true', help='report changes without writing')
+    args = parser.parse_args()
+
+    # Same connection settings (and environment overrides) as the app
+    from app import shard_map, get_db_connection
+
+    if args.command == 'status':
+        print(json.dumps(shard_map.status(), indent=2))
+    else:
+        result = shard_map.copy_globals(lambda shard: get_db_connection(shard=shard), dry_run=args.dry_run)
+        print(json.dumps(result, indent=2, default=str))
@@ -0,0 +1,42 @@
+"""Change detection for in-memory caches built from database tables.
+
+Triggers created by app.py bump a per-table counter in the TableVersion
+table on every INSERT/UPDATE/DELETE of a watched table. A cache remembers the
+versions it was built from and asks a VersionWatcher whether they moved; the
+watcher reads TableVersion at most once per `min_interval` seconds, so the
+check costs one small primary-key read per interval rather than per request.
+This also lets caches in other worker processes notice writes made elsewhere.
+"""
+import threading
+import time
+
+import queries
+
+
+class VersionWatcher:
+    """Polls TableVersion for a fixed set of tables"""
+
+    def __init__(self, tables, min_interval=1.0):
+        self.tables = tuple(tables)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._versions = None
+        self._checked_at = 0.0
+
+    def current(self, conn):
+        """Return the versions of the watched tables as a tuple"""
+        now = time.monotonic()
+        if self._versions is not None and now - self._checked_at < self.min_interval:
+            return self._versions
+        rows = queries.fetch_all(conn, 'table_versions')
+        by_table = {row['TableName']: row['Version'] for row in rows}
+        versions = tuple(by_table.get(table, 0) for table in self.tables)
+        with self._lock:
+            self._versions = versions
+            self._checked_at = now
+        return versions
+
+    def expire(self):
+        """Force the next current() call to re-read TableVersion"""
+        with self._lock:
+            self._checked_at = 0.0
@@ -0,0 +1,382 @@
+"""In-memory transport graph and multi-leg route finder.
+
+Every Transport row is a directed edge from its OriginDestID to the DestID
+of its Availability, weighted by Transport.Cost. Rows without an origin are
+legs from the traveller's starting point (the virtual ORIGIN node).
+
+The graph is loaded once and then kept current incrementally: triggers
+created by app.py append the TransportID of every inserted, updated or
+deleted transport (including rows touched through Availability/Destination
+changes and cascades) to TransportChange, and the graph re-reads just those
+rows. The change log is polled at most once per `poll_interval` seconds and
+with an overlap window, so changes committed out of ChangeID order by
+concurrent transactions are still picked up. Updates build new maps and
+swap them in, so routes computed concurrently see a consistent snapshot.
+
+Routes use Dijkstra's algorithm with lexicographic weights: (cost, legs) for
+the cheapest route, (legs, cost) for the fewest legs. A* would need an
+admissible heuristic, and fares are not derived from any distance we store,
+so none exists; plain Dijkstra is what A* degenerates to here.
+"""
+import heapq
+import threading
+import time
+
+import queries
+
+# Virtual node for legs that have no OriginDestID (DestIDs start at 1)
+ORIGIN = 0
+
+MODES = ('cheapest', 'fewest')
+
+# Re-read changes logged this many seconds before the newest one seen
+CHANGE_OVERLAP_SECONDS = 10
+
+# TransportChange rows older than this are purged at startup (app.py); a
+# graph that has not polled for that long reloads from scratch
+CHANGE_LOG_RETENTION_HOURS = 24
+
+# Integer edge weights: cheapest = paise * LEG_SCALE + legs (fewer legs
+# break fare ties), fewest = legs * FARE_SCALE + paise
+LEG_SCALE = 1 << 12
+FARE_SCALE = 10 ** 13
+
+# Multi-stop visiting order is optimized exactly up to this many stops
+MAX_REORDER_STOPS = 9
+
+
+class RouteError(ValueError):
+    """Invalid routing parameters (reported to the client as a 400)"""
+
+
+class TransportGraph:
+    """Adjacency lists of transport legs, refreshed from TransportChange"""
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._edges = {}        # TransportID -> (from, to, cost, type, provider)
+        self._adjacency = {}    # from -> {TransportID: edge}
+        self._loaded = False
+        self._change_mark = None
+        self._seen_changes = set()
+        self._views = {}        # mode -> (edges map it was built from, view)
+        self._polled_at = 0.0
+        self._polled_wall = 0.0
+        self.full_loads = 0
+        self.incremental_updates = 0
+
+    # ---------------- maintenance ----------------
+
+    @staticmethod
+    def _edge(row):
+        return (
+            row['OriginDestID'] if row['OriginDestID'] is not None else ORIGIN,
+            row['DestID'],
+            float(row['Cost']),
+            row['Type'],
+            row['Provider'],
+        )
+
+    def _load(self, conn):
+        mark = queries.fetch_one(conn, 'transport_change_mark')
+        rows = queries.fetch_all(conn, 'transport_edges')
+        edges, adjacency = {}, {}
+        for row in rows:
+            edge = self._edge(row)
+            edges[row['TransportID']] = edge
+            adjacency.setdefault(edge[0], {})[row['TransportID']] = edge
+        self._edges, self._adjacency = edges, adjacency
+        self._change_mark = mark['LastChange']
+        self._seen_changes = set()
+        self._loaded = True
+        self.full_loads += 1
+
+    def _apply_changes(self, conn):
+        changes = queries.fetch_all(conn, 'transport_changes_since', (
+            self._change_mark, CHANGE_OVERLAP_SECONDS
+        ))
+        # Rows inside the overlap window come back on every poll
+        fresh = [row for row in changes if row['ChangeID'] not in self._seen_changes]
+        self._seen_changes = {row['ChangeID'] for row in changes}
+        if not fresh:
+            return
+        changed = sorted({row['TransportID'] for row in fresh})
+        placeholders = ', '.join(['%s'] * len(changed))
+        rows = queries.fetch_dynamic(conn, 'transport_edges_by_id', f"""
+            SELECT t.TransportID, t.OriginDestID, av.DestID, t.Cost, t.Type, t.Provider
+            FROM Transport t
+            JOIN Availability av ON t.AvailabilityID = av.AvailabilityID
+            WHERE t.TransportID IN ({placeholders})
+        """, tuple(changed))
+
+        # Copy-on-write: only the outgoing maps of touched nodes are copied
+        edges = dict(self._edges)
+        adjacency = dict(self._adjacency)
+        copied = set()
+
+        def outgoing(node):
+            if node not in copied:
+                adjacency[node] = dict(adjacency.get(node, {}))
+                copied.add(node)
+            return adjacency[node]
+
+        for transport_id in changed:
+            edge = edges.pop(transport_id, None)
+            if edge is not None:
+                outgoing(edge[0]).pop(transport_id, None)
+        for row in rows:
+            edge = self._edge(row)
+            edges[row['TransportID']] = edge
+            outgoing(edge[0])[row['TransportID']] = edge
+        for node in copied:
+            if not adjacency[node]:
+                del adjacency[node]
+
+        self._edges, self._adjacency = edges, adjacency
+        self._change_mark = max(self._change_mark or changes[0]['ChangedAt'],
+                                max(row['ChangedAt'] for row in changes))
+        self.incremental_updates += 1
+
+    def refresh(self, conn):
+        """Load the graph on first use, then apply logged changes"""
+        now = time.monotonic()
+        if self._loaded and now - self._polled_at < self.poll_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._polled_at < self.poll_interval:
+                return
+            stale = time.time() - self._polled_wall > CHANGE_LOG_RETENTION_HOURS * 3600 - 60
+            if not self._loaded or stale:
+                self._load(conn)
+            else:
+                self._apply_changes(conn)
+            self._polled_at = now
+            self._polled_wall = time.time()
+
+    def invalidate(self):
+        """Force a full reload on the next refresh()"""
+        with self._lock:
+            self._loaded = False
+
+    def status(self):
+        edges = self._edges
+        return {
+            'nodes': len({edge[0] for edge in edges.values()} | {edge[1] for edge in edges.values()}),
+            'edges': len(edges),
+            'fullLoads': self.full_loads,
+            'incrementalUpdates': self.incremental_updates,
+        }
+
+    # ---------------- routing ----------------
+
+    def _routing_view(self, edges, mode):
+        """Forward and reverse {node: [(neighbour, step weight, type, TransportID)]}
+        Weights are single integers so the heap compares plain ints: fares in
+        paise scaled above the leg count (cheapest), or legs scaled above the
+        fare (fewest). Built once per graph version and mode.
+        """
+        with self._lock:
+            cached = self._views.get(mode)
+            if cached is not None and cached[0] is edges:
+                return cached[1]
+        forward, reverse = {}, {}
+        for transport_id, (origin, to_node, cost, edge_type, _provider) in edges.items():
+            paise = int(round(cost * 100))
+            step = paise * LEG_SCALE + 1 if mode == 'cheapest' else FARE_SCALE + paise
+            forward.setdefault(origin, []).append((to_node, step, edge_type, transport_id))
+            reverse.setdefault(to_node, []).append((origin, step, edge_type, transport_id))
+        with self._lock:
+            self._views[mode] = (edges, (forward, reverse))
+        return forward, reverse
+
+    def shortest_paths(self, source, mode='cheapest', types=None, targets=None, view=None):
+        """Dijkstra from source; returns {node: (weight, previous TransportID)}
+        With targets, the search stops as soon as all of them are settled.
+        """
+        if mode not in MODES:
+            raise RouteError(f"mode must be one of: {', '.join(MODES)}")
+        if view is None:
+            view = self._routing_view(self._edges, mode)[0]
+        best = {source: (0, None)}
+        done = set()
+        heap = [(0, source)]
+        pending = set(targets) - {source} if targets else None
+        pop, push = heapq.heappop, heapq.heappush
+        while heap:
+            weight, node = pop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            if pending is not None:
+                pending.discard(node)
+                if not pending:
+                    break
+            for to_node, step, edge_type, transport_id in view.get(node, ()):
+                if types is not None and edge_type not in types:
+                    continue
+                candidate = weight + step
+                known = best.get(to_node)
+                if known is None or candidate < known[0]:
+                    best[to_node] = (candidate, transport_id)
+                    push(heap, (candidate, to_node))
+        return best
+
+    @staticmethod
+    def _bidirectional(source, target, edges, forward, reverse, types):
+        """Point-to-point Dijkstra searching from both ends
+        Returns the TransportIDs of the best path in travel order, or None.
+        """
+        if source == target:
+            return []
+        best = ({source: (0, None)}, {target: (0, None)})
+        done = (set(), set())
+        heaps = ([(0, source)], [(0, target)])
+        views = (forward, reverse)
+        pop, push = heapq.heappop, heapq.heappush
+        shortest, meeting = None, None
+        while heaps[0] and heaps[1]:
+            if shortest is not None and heaps[0][0][0] + heaps[1][0][0] >= shortest:
+                break
+            # Expand the side with the smaller frontier
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            weight, node = pop(heaps[side])
+            if node in done[side]:
+                continue
+            done[side].add(node)
+            mine, other = best[side], best[1 - side]
+            for neighbour, step, edge_type, transport_id in views[side].get(node, ()):
+                if types is not None and edge_type not in types:
+                    continue
+                candidate = weight + step
+                known = mine.get(neighbour)
+                if known is None or candidate < known[0]:
+                    mine[neighbour] = (candidate, transport_id)
+                    push(heaps[side], (candidate, neighbour))
+                    if neighbour in other:
+                        total = candidate + other[neighbour][0]
+                        if shortest is None or total < shortest:
+                            shortest, meeting = total, neighbour
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while best[0][node][1] is not None:
+            transport_id = best[0][node][1]
+            path.append(transport_id)
+            node = edges[transport_id][0]
+        path.reverse()
+        node = meeting
+        while best[1][node][1] is not None:
+            transport_id = best[1][node][1]
+            path.append(transport_id)
+            node = edges[transport_id][1]
+        return path
+
+    @staticmethod
+    def _path(edges, paths, target):
+        """TransportIDs leading to target in a shortest_paths() result"""
+        path = []
+        node = target
+        while paths[node][1] is not None:
+            path.append(paths[node][1])
+            node = edges[paths[node][1]][0]
+        path.reverse()
+        return path
+
+    def route(self, stops, mode='cheapest', types=None, optimize_order=False):
+        """Route through stops (DestIDs, ORIGIN allowed as the first stop)
+        Consecutive stops are joined with a bidirectional search. With
+        optimize_order, stops after the first are visited in the order with
+        the lowest total weight (exact Held-Karp over one-to-many searches).
+        Returns None when some stop cannot be reached.
+        """
+        if len(stops) < 2:
+            raise RouteError('At least two stops are required')
+        if mode not in MODES:
+            raise RouteError(f"mode must be one of: {', '.join(MODES)}")
+        types = set(types) if types else None
+        edges = self._edges
+        forward, reverse = self._routing_view(edges, mode)
+
+        order = list(stops)
+        pairs = list(zip(order, order[1:]))
+        if optimize_order and len(stops) > 2:
+            if len(stops) - 1 > MAX_REORDER_STOPS:
+                raise RouteError(f"Order optimization supports at most {MAX_REORDER_STOPS} stops after the first")
+            paths = {
+                stop: self.shortest_paths(stop, mode, types, targets=set(stops), view=forward)
+                for stop in set(stops)
+            }
+            order = self._best_order(stops, paths)
+            if order is None:
+                return None
+            hops = [
+                self._path(edges, paths[source], target)
+                for source, target in zip(order, order[1:])
+            ]
+        else:
+            hops = []
+            for source, target in pairs:
+                hop = self._bidirectional(source, target, edges, forward, reverse, types)
+                if hop is None:
+                    return None
+                hops.append(hop)
+
+        legs = []
+        for hop in hops:
+            for transport_id in hop:
+                origin, to_node, cost, edge_type, provider = edges[transport_id]
+                legs.append({
+                    'transportId': transport_id,
+                    'from': origin,
+                    'to': to_node,
+                    'type': edge_type,
+                    'provider': provider,
+                    'cost': cost,
+                })
+        return {
+            'stops': order,
+            'legs': legs,
+            'totalCost': round(sum(leg['cost'] for leg in legs), 2),
+            'legCount': len(legs),
+        }
+
+    @staticmethod
+    def _best_order(stops, paths):
+        start, rest = stops[0], [stop for stop in dict.fromkeys(stops[1:]) if stop != stops[0]]
+        size = len(rest)
+
+        # table[mask][last] = (weight, previous last)
+        table = [dict() for _ in range(1 << size)]
+        for index, stop in enumerate(rest):
+            if stop in paths[start]:
+                table[1 << index][index] = (paths[start][stop][0], None)
+        for mask in range(1, 1 << size):
+            for last, (weight, _previous) in table[mask].items():
+                reachable = paths[rest[last]]
+                for index, stop in enumerate(rest):
+                    if mask & (1 << index) or stop not in reachable:
+                        continue
+                    candidate = weight + reachable[stop][0]
+                    entry = table[mask | (1 << index)]
+                    if index not in entry or candidate < entry[index][0]:
+                        entry[index] = (candidate, last)
+
+        final = table[(1 << size) - 1]
+        if not final:
+            return None
+        last = min(final, key=lambda index: final[index][0])
+        order = []
+        mask = (1 << size) - 1
+        while last is not None:
+            order.append(rest[last])
+            previous = table[mask][last][1]
+            mask &= ~(1 << last)
+            last = previous
+        order.reverse()
+        return [start] + order
+
+
+transport_graph = TransportGraph()
@@ -12,9 +12,58 @@ DROP TRIGGER IF EXISTS UpdateUserBookingCount_INSERT;
 DROP TRIGGER IF EXISTS AuditBookingStatusChange;
 DROP TRIGGER IF EXISTS CreatePaymentOnBooking;
 DROP TRIGGER IF EXISTS PreventOverbooking;
+DROP TRIGGER IF EXISTS AdjustInventoryOnStatusChange;
+DROP TRIGGER IF EXISTS ReleaseInventoryOnDelete;
+DROP TRIGGER IF EXISTS SyncInventoryCapacity;
+DROP TRIGGER IF EXISTS HotelVersion_INSERT;
+DROP TRIGGER IF EXISTS HotelVersion_UPDATE;
+DROP TRIGGER IF EXISTS HotelVersion_DELETE;
+DROP TRIGGER IF EXISTS IncludesVersion_INSERT;
+DROP TRIGGER IF EXISTS IncludesVersion_UPDATE;
+DROP TRIGGER IF EXISTS IncludesVersion_DELETE;
+-- BookingVersion_* are retired (occupancy windows expire on a TTL)
+DROP TRIGGER IF EXISTS BookingVersion_INSERT;
+DROP TRIGGER IF EXISTS BookingVersion_UPDATE;
+DROP TRIGGER IF EXISTS BookingVersion_DELETE;
+DROP TRIGGER IF EXISTS HotelRateVersion_INSERT;
+DROP TRIGGER IF EXISTS HotelRateVersion_UPDATE;
+DROP TRIGGER IF EXISTS HotelRateVersion_DELETE;
+DROP TRIGGER IF EXISTS OffersVersion_INSERT;
+DROP TRIGGER IF EXISTS OffersVersion_UPDATE;
+DROP TRIGGER IF EXISTS OffersVersion_DELETE;
+DROP TRIGGER IF EXISTS LogTransportChange_INSERT;
+DROP TRIGGER IF EXISTS LogTransportChange_UPDATE;
+DROP TRIGGER IF EXISTS LogTransportChange_DELETE;
+DROP TRIGGER IF EXISTS LogAvailabilityTransportChange_UPDATE;
+DROP TRIGGER IF EXISTS LogAvailabilityTransportChange_DELETE;
+DROP TRIGGER IF EXISTS LogDestinationTransportChange_DELETE;
+DROP TRIGGER IF EXISTS LogHotelGeoChange_INSERT;
+DROP TRIGGER IF EXISTS LogHotelGeoChange_UPDATE;
+DROP TRIGGER IF EXISTS LogHotelGeoChange_DELETE;
+DROP TRIGGER IF EXISTS LogDestinationGeoChange_INSERT;
+DROP TRIGGER IF EXISTS LogDestinationGeoChange_UPDATE;
+DROP TRIGGER IF EXISTS LogDestinationGeoChange_DELETE;
+DROP TRIGGER IF EXISTS RevenueRollup_BookingInsert;
+DROP TRIGGER IF EXISTS RevenueRollup_BookingUpdate;
+DROP TRIGGER IF EXISTS RevenueRollup_BookingDelete;
+DROP TRIGGER IF EXISTS RevenueRollup_PaymentInsert;
+DROP TRIGGER IF EXISTS RevenueRollup_PaymentUpdate;
+DROP TRIGGER IF EXISTS RevenueRollup_PaymentDelete;
+DROP TRIGGER IF EXISTS SyncPaymentOwner;
+DROP TRIGGER IF EXISTS SyncTombstone_Booking;
+DROP TRIGGER IF EXISTS SyncTombstone_Itinerary;
+DROP TRIGGER IF EXISTS SyncTombstone_Payment;
+DROP TRIGGER IF EXISTS SyncTouchItinerary_INSERT;
+DROP TRIGGER IF EXISTS SyncTouchItinerary_UPDATE;
+DROP TRIGGER IF EXISTS SyncTouchItinerary_DELETE;
+
+DROP PROCEDURE IF EXISTS ReserveHotelNights;
+DROP PROCEDURE IF EXISTS ReleaseHotelNights;
+DROP PROCEDURE IF EXISTS AddRevenueRollup;
 
 DROP PROCEDURE IF EXISTS CreateNewBooking;
 DROP PROCEDURE IF EXISTS CancelBooking;
+DROP PROCEDURE IF EXISTS BulkCancelBookings;
 DROP PROCEDURE IF EXISTS GetBookingDetails;
 DROP PROCEDURE IF EXISTS GetDestinationItineraries;
 
@@ -25,6 +74,270 @@ DROP FUNCTION IF EXISTS IsDestinationPopular;
 -- Add TotalBookings column to User if it doesn't exist
 ALTER TABLE User ADD COLUMN TotalBookings INT DEFAULT 0;
 
+-- Rooms per hotel (every hotel starts as a single room)
+ALTER TABLE Hotel ADD COLUMN AvailableRooms INT DEFAULT 1;
+
+-- Minutes each activity takes (used by the day-wise scheduler)
+ALTER TABLE Activity ADD COLUMN Duration INT NOT NULL DEFAULT 120;
+
+-- Where a transport leg departs from (NULL = the traveller's starting point)
+ALTER TABLE Transport
+    ADD COLUMN OriginDestID INT NULL,
+    ADD FOREIGN KEY (OriginDestID) REFERENCES Destination(DestID) ON DELETE CASCADE ON UPDATE CASCADE;
+
+-- Change stamps for the delta sync API (/sync/user)
+ALTER TABLE Booking ADD COLUMN UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+ALTER TABLE Itinerary ADD COLUMN UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+ALTER TABLE Includes ADD COLUMN UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+
+-- Coordinates for the nearby-hotels index (NULL = not placed)
+ALTER TABLE Hotel
+    ADD COLUMN Latitude DECIMAL(9, 6) NULL,
+    ADD COLUMN Longitude DECIMAL(9, 6) NULL;
+ALTER TABLE Destination
+    ADD COLUMN Latitude DECIMAL(9, 6) NULL,
+    ADD COLUMN Longitude DECIMAL(9, 6) NULL;
+
+-- Sample hotels and destinations, placed at their cities
+UPDATE Hotel h
+JOIN (
+    SELECT 'Bengaluru' AS Location, 12.971599 AS Latitude, 77.594566 AS Longitude
+    UNION ALL SELECT 'Mumbai', 19.076090, 72.877426
+    UNION ALL SELECT 'New Delhi', 28.613939, 77.209023
+    UNION ALL SELECT 'Hyderabad', 17.385044, 78.486671
+    UNION ALL SELECT 'Chennai', 13.082680, 80.270721
+) city ON h.Location = city.Location
+SET h.Latitude = city.Latitude, h.Longitude = city.Longitude
+WHERE h.Latitude IS NULL;
+
+UPDATE Destination d
+JOIN (
+    SELECT 'Agra' AS Location, 27.175015 AS Latitude, 78.042155 AS Longitude
+    UNION ALL SELECT 'Goa', 15.299326, 74.123996
+    UNION ALL SELECT 'Kochi', 9.931233, 76.267304
+    UNION ALL SELECT 'Shimla', 31.104815, 77.173403
+    UNION ALL SELECT 'Mysore', 12.295810, 76.639381
+) city ON d.Location = city.Location
+SET d.Latitude = city.Latitude, d.Longitude = city.Longitude
+WHERE d.Latitude IS NULL;
+
+-- Offers without a BookingID are the hotels' discount rules (see pricing.py)
+ALTER TABLE Offers
+    MODIFY BookingID INT NULL,
+    ADD COLUMN DiscountPercent DECIMAL(5, 2) NULL,
+    ADD COLUMN ValidFrom DATE NULL,
+    ADD COLUMN ValidTo DATE NULL,
+    ADD COLUMN MinNights INT NOT NULL DEFAULT 0,
+    ADD COLUMN MinAdvanceDays INT NOT NULL DEFAULT 0,
+    ADD COLUMN WeekendOnly BOOLEAN NOT NULL DEFAULT FALSE,
+    ADD CHECK (DiscountPercent > 0 AND DiscountPercent < 100);
+
+-- Sample offers as standing rules: 20% off when booked 30+ days ahead,
+-- 15% off Friday and Saturday nights
+INSERT INTO Offers (HotelID, Description, Rating, DiscountPercent, MinNights, MinAdvanceDays, WeekendOnly)
+SELECT HotelID, Description, Rating, 20, 0, 30, FALSE
+FROM Offers
+WHERE Description LIKE 'Early bird discount%' AND BookingID IS NOT NULL;
+
+INSERT INTO Offers (HotelID, Description, Rating, DiscountPercent, MinNights, MinAdvanceDays, WeekendOnly)
+SELECT HotelID, Description, Rating, 15, 0, 0, TRUE
+FROM Offers
+WHERE Description LIKE 'Weekend getaway%' AND BookingID IS NOT NULL;
+
+-- Nightly rates overriding Hotel.PricePerNight
+CREATE TABLE IF NOT EXISTS HotelRate (
+    RateID INT PRIMARY KEY AUTO_INCREMENT,
+    HotelID INT NOT NULL,
+    Night DATE NOT NULL,
+    Price DECIMAL(10, 2) NOT NULL,
+    UNIQUE KEY uq_hotel_rate_night (HotelID, Night),
+    CHECK (Price >= 0),
+    FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- Sample season: Taj Hotel at 7000 over New Year's Eve week
+INSERT INTO HotelRate (HotelID, Night, Price)
+WITH RECURSIVE Nights (Night) AS (
+    SELECT DATE '2025-12-26'
+    UNION ALL
+    SELECT Night + INTERVAL 1 DAY FROM Nights WHERE Night + INTERVAL 1 DAY < DATE '2026-01-02'
+)
+SELECT 1, Night, 7000.00 FROM Nights
+ON DUPLICATE KEY UPDATE Price = 7000.00;
+
+-- TransportIDs touched by writes, read by the app's in-memory route graph
+CREATE TABLE IF NOT EXISTS TransportChange (
+    ChangeID BIGINT PRIMARY KEY AUTO_INCREMENT,
+    TransportID INT NOT NULL,
+    ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_transport_change_time (ChangedAt)
+);
+
+-- Hotels and destinations touched by writes, read by the app's geo index
+CREATE TABLE IF NOT EXISTS GeoChange (
+    ChangeID BIGINT PRIMARY KEY AUTO_INCREMENT,
+    TableName VARCHAR(20) NOT NULL,
+    EntityID INT NOT NULL,
+    ChangedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_geo_change_time (ChangedAt)
+);
+
+-- Stays turned away by PreventOverbooking, booked by the app when a
+-- cancellation frees their nights
+CREATE TABLE IF NOT EXISTS Waitlist (
+    WaitlistID INT PRIMARY KEY AUTO_INCREMENT,
+    UserID INT NOT NULL,
+    HotelID INT NOT NULL,
+    CheckInDate DATE NOT NULL,
+    CheckOutDate DATE NOT NULL,
+    Priority INT NOT NULL DEFAULT 0,
+    Status VARCHAR(20) NOT NULL DEFAULT 'Waiting',
+    BookingID INT NULL,
+    CreatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    INDEX idx_waitlist_status (Status, HotelID),
+    INDEX idx_waitlist_updated (UpdatedAt),
+    INDEX idx_waitlist_user (UserID, CreatedAt),
+    CHECK (CheckOutDate > CheckInDate),
+    CHECK (Status IN ('Waiting', 'Booking', 'Booked', 'Withdrawn', 'Expired')),
+    FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- Per-night room inventory, maintained by the booking triggers
+CREATE TABLE IF NOT EXISTS HotelNightInventory (
+    HotelID INT NOT NULL,
+    Night DATE NOT NULL,
+    Capacity INT NOT NULL,
+    Booked INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (HotelID, Night),
+    CHECK (Booked >= 0 AND Booked <= Capacity),
+    FOREIGN KEY (HotelID) REFERENCES Hotel(HotelID) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- Nights a cancellation on a shard other than 0 owes shard 0's inventory
+CREATE TABLE IF NOT EXISTS InventoryRelease (
+    ReleaseID BIGINT PRIMARY KEY AUTO_INCREMENT,
+    BookingID INT NOT NULL,
+    HotelID INT NOT NULL,
+    CheckInDate DATE NOT NULL,
+    CheckOutDate DATE NOT NULL,
+    CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- InventoryReleases already applied on shard 0
+CREATE TABLE IF NOT EXISTS InventoryReleased (
+    ShardIndex INT NOT NULL,
+    ReleaseID BIGINT NOT NULL,
+    ReleasedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ShardIndex, ReleaseID),
+    INDEX idx_inventory_released_time (ReleasedAt)
+);
+
+-- Nights reserved on shard 0 for a booking being made on another shard
+CREATE TABLE IF NOT EXISTS InventoryHold (
+    HoldID BIGINT PRIMARY KEY AUTO_INCREMENT,
+    UserID INT NOT NULL,
+    HotelID INT NOT NULL,
+    CheckInDate DATE NOT NULL,
+    CheckOutDate DATE NOT NULL,
+    CreatedAt TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_inventory_hold_time (CreatedAt)
+);
+
+-- Backfill inventory from the confirmed sample bookings
+INSERT INTO HotelNightInventory (HotelID, Night, Capacity, Booked)
+WITH RECURSIVE StayNights AS (
+    SELECT HotelID, CheckInDate AS Night, CheckOutDate
+    FROM Booking
+    WHERE BookingStatus = 'Confirmed' AND HotelID IS NOT NULL
+    UNION ALL
+    SELECT HotelID, DATE_ADD(Night, INTERVAL 1 DAY), CheckOutDate
+    FROM StayNights
+    WHERE DATE_ADD(Night, INTERVAL 1 DAY) < CheckOutDate
+)
+SELECT sn.HotelID, sn.Night, GREATEST(COALESCE(h.AvailableRooms, 1), COUNT(*)), COUNT(*)
+FROM StayNights sn
+JOIN Hotel h ON sn.HotelID = h.HotelID
+GROUP BY sn.HotelID, sn.Night, h.AvailableRooms;
+
+-- Change counters for tables cached in memory by the app
+CREATE TABLE IF NOT EXISTS TableVersion (
+    TableName VARCHAR(64) PRIMARY KEY,
+    Version BIGINT NOT NULL DEFAULT 0
+);
+
+-- Revenue rollups per (day, hotel) and (first day of month, hotel), kept
+-- current by the RevenueRollup_* triggers; HotelID 0 = booking without a hotel
+CREATE TABLE IF NOT EXISTS RevenueDaily (
+    Period DATE NOT NULL,
+    HotelID INT NOT NULL,
+    Bookings INT NOT NULL DEFAULT 0,
+    Confirmed INT NOT NULL DEFAULT 0,
+    Cancelled INT NOT NULL DEFAULT 0,
+    Revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    Paid DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (Period, HotelID),
+    INDEX idx_revenue_daily_hotel (HotelID, Period)
+);
+
+CREATE TABLE IF NOT EXISTS RevenueMonthly (
+    Period DATE NOT NULL,
+    HotelID INT NOT NULL,
+    Bookings INT NOT NULL DEFAULT 0,
+    Confirmed INT NOT NULL DEFAULT 0,
+    Cancelled INT NOT NULL DEFAULT 0,
+    Revenue DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    Paid DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (Period, HotelID),
+    INDEX idx_revenue_monthly_hotel (HotelID, Period)
+);
+
+-- Backfill the rollups from existing bookings and completed payments
+DELETE FROM RevenueDaily;
+DELETE FROM RevenueMonthly;
+
+INSERT INTO RevenueDaily (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+SELECT
+    DATE(BookingDate),
+    COALESCE(HotelID, 0),
+    COUNT(*),
+    SUM(BookingStatus = 'Confirmed'),
+    SUM(BookingStatus = 'Cancelled'),
+    SUM(IF(BookingStatus = 'Confirmed', TotalPrice, 0)),
+    0
+FROM Booking
+WHERE BookingDate IS NOT NULL
+GROUP BY DATE(BookingDate), COALESCE(HotelID, 0);
+
+INSERT INTO RevenueDaily (Period, HotelID, Paid)
+SELECT DATE(pt.TransactionDate), COALESCE(b.HotelID, 0), SUM(pt.Amount)
+FROM PaymentTransaction pt
+JOIN Booking b ON pt.BookingID = b.BookingID
+WHERE pt.PaymentStatus = 'Completed' AND pt.TransactionDate IS NOT NULL
+GROUP BY DATE(pt.TransactionDate), COALESCE(b.HotelID, 0)
+ON DUPLICATE KEY UPDATE Paid = VALUES(Paid);
+
+INSERT INTO RevenueMonthly (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+SELECT
+    DATE_SUB(Period, INTERVAL DAYOFMONTH(Period) - 1 DAY) AS Month,
+    HotelID,
+    SUM(Bookings),
+    SUM(Confirmed),
+    SUM(Cancelled),
+    SUM(Revenue),
+    SUM(Paid)
+FROM RevenueDaily
+GROUP BY Month, HotelID;
+
+-- Hotel search indexes (equality on Location, then range/sort column)
+CREATE INDEX idx_hotel_location_price ON Hotel (Location, PricePerNight, HotelID);
+CREATE INDEX idx_hotel_location_rating ON Hotel (Location, Rating, HotelID);
+CREATE INDEX idx_hotel_price ON Hotel (PricePerNight, HotelID);
+CREATE INDEX idx_hotel_rating ON Hotel (Rating, HotelID);
+
+-- Occupancy calendar: confirmed stays overlapping a date window
+CREATE INDEX idx_booking_status_dates ON Booking (BookingStatus, CheckInDate, CheckOutDate, HotelID, TotalPrice);
+
 -- Create audit table if not exists
 CREATE TABLE IF NOT EXISTS BookingAudit (
     AuditID INT PRIMARY KEY AUTO_INCREMENT,
@@ -43,23 +356,44 @@ CREATE TABLE IF NOT EXISTS PaymentTransaction (
     Amount DECIMAL(12, 2) NOT NULL,
     PaymentStatus VARCHAR(50) DEFAULT 'Pending' CHECK (PaymentStatus IN ('Pending', 'Completed', 'Failed')),
     TransactionDate TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UserID INT NULL,
+    UpdatedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
     FOREIGN KEY (BookingID) REFERENCES Booking(BookingID) ON DELETE CASCADE ON UPDATE CASCADE
 );
 
+-- Deleted bookings/itineraries/payments, kept for delta sync clients
+CREATE TABLE IF NOT EXISTS SyncTombstone (
+    TombstoneID BIGINT PRIMARY KEY AUTO_INCREMENT,
+    UserID INT NOT NULL,
+    EntityType VARCHAR(20) NOT NULL,
+    EntityID INT NOT NULL,
+    DeletedAt TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    INDEX idx_sync_tombstone_user (UserID, DeletedAt),
+    INDEX idx_sync_tombstone_time (DeletedAt)
+);
+
+-- Delta sync: a user's rows changed after a token
+CREATE INDEX idx_booking_user_updated ON Booking (UserID, UpdatedAt);
+CREATE INDEX idx_itinerary_user_updated ON Itinerary (UserID, UpdatedAt);
+CREATE INDEX idx_payment_user_updated ON PaymentTransaction (UserID, UpdatedAt);
+
 -- ============================================
 -- FUNCTIONS
 -- ============================================
 
--- FUNCTION 1: Calculate total booking cost based on hotel and dates
+-- FUNCTION 1: Calculate total booking cost based on hotel, dates, nightly
+-- rates and the best standing offer (not deterministic: offers depend on
+-- how far ahead the stay is booked)
 DELIMITER //
 CREATE FUNCTION CalculateBookingCost(p_HotelID INT, p_CheckInDate DATE, p_CheckOutDate DATE) 
 RETURNS DECIMAL(12, 2)
-DETERMINISTIC
+NOT DETERMINISTIC
 READS SQL DATA
 BEGIN
     DECLARE v_PricePerNight DECIMAL(10, 2);
     DECLARE v_NumberOfNights INT;
     DECLARE v_TotalCost DECIMAL(12, 2);
+    DECLARE v_Discount DECIMAL(12, 2);
     
     -- Get the price per night for the hotel
     SELECT PricePerNight INTO v_PricePerNight FROM Hotel WHERE HotelID = p_HotelID;
@@ -67,10 +401,42 @@ BEGIN
     -- Calculate number of nights
     SET v_NumberOfNights = DATEDIFF(p_CheckOutDate, p_CheckInDate);
     
-    -- Calculate total cost
-    SET v_TotalCost = v_PricePerNight * v_NumberOfNights;
+    IF v_PricePerNight IS NULL OR v_NumberOfNights <= 0 THEN
+        RETURN v_PricePerNight * v_NumberOfNights;
+    END IF;
     
-    RETURN v_TotalCost;
+    -- Every night at its HotelRate (else PricePerNight); each offer the stay
+    -- qualifies for takes DiscountPercent off its nights, the largest wins
+    WITH RECURSIVE StayNights (Night) AS (
+        SELECT p_CheckInDate
+        UNION ALL
+        SELECT Night + INTERVAL 1 DAY FROM StayNights WHERE Night + INTERVAL 1 DAY < p_CheckOutDate
+    ),
+    Priced AS (
+        SELECT n.Night, COALESCE(r.Price, v_PricePerNight) AS Price
+        FROM StayNights n
+        LEFT JOIN HotelRate r ON r.HotelID = p_HotelID AND r.Night = n.Night
+    )
+    SELECT
+        (SELECT SUM(Price) FROM Priced),
+        (SELECT COALESCE(MAX(OfferDiscount), 0)
+         FROM (
+             SELECT SUM(ROUND(p.Price * o.DiscountPercent / 100, 2)) AS OfferDiscount
+             FROM Offers o
+             JOIN Priced p
+               ON (o.ValidFrom IS NULL OR p.Night >= o.ValidFrom)
+              AND (o.ValidTo IS NULL OR p.Night <= o.ValidTo)
+              AND (NOT o.WeekendOnly OR DAYOFWEEK(p.Night) IN (6, 7))
+             WHERE o.HotelID = p_HotelID
+               AND o.BookingID IS NULL
+               AND o.DiscountPercent IS NOT NULL
+               AND v_NumberOfNights >= o.MinNights
+               AND DATEDIFF(p_CheckInDate, CURDATE()) >= o.MinAdvanceDays
+             GROUP BY o.OfferID
+         ) OfferDiscounts)
+    INTO v_TotalCost, v_Discount;
+    
+    RETURN v_TotalCost - v_Discount;
 END //
 DELIMITER ;
 
@@ -260,6 +626,186 @@ BEGIN
 END //
 DELIMITER ;
 
+-- PROCEDURE 5: Claim one room per night for a stay (called by triggers)
+DELIMITER //
+CREATE PROCEDURE ReserveHotelNights(
+    IN p_HotelID INT,
+    IN p_CheckInDate DATE,
+    IN p_CheckOutDate DATE
+)
+BEGIN
+    DECLARE v_Capacity INT;
+    DECLARE v_Night DATE;
+    
+    SELECT AvailableRooms INTO v_Capacity FROM Hotel WHERE HotelID = p_HotelID;
+    IF v_Capacity IS NULL OR v_Capacity < 1 THEN
+        SET v_Capacity = 1;
+    END IF;
+    
+    -- Materialise missing nights; locks are taken in night order
+    SET v_Night = p_CheckInDate;
+    WHILE v_Night < p_CheckOutDate DO
+        INSERT INTO HotelNightInventory (HotelID, Night, Capacity, Booked)
+        VALUES (p_HotelID, v_Night, v_Capacity, 0)
+        ON DUPLICATE KEY UPDATE Capacity = Capacity;
+        SET v_Night = DATE_ADD(v_Night, INTERVAL 1 DAY);
+    END WHILE;
+    
+    -- Claim one room on every night of the stay in a single statement
+    UPDATE HotelNightInventory
+    SET Booked = Booked + 1
+    WHERE HotelID = p_HotelID
+    AND Night >= p_CheckInDate AND Night < p_CheckOutDate
+    AND Booked < Capacity;
+    
+    -- Any full night fails the whole booking (the INSERT is rolled back)
+    IF ROW_COUNT() < DATEDIFF(p_CheckOutDate, p_CheckInDate) THEN
+        SIGNAL SQLSTATE '45000'
+        SET MESSAGE_TEXT = 'Hotel is not available for selected dates';
+    END IF;
+END //
+DELIMITER ;
+
+-- PROCEDURE 6: Give back the rooms of a stay (called by triggers)
+DELIMITER //
+CREATE PROCEDURE ReleaseHotelNights(
+    IN p_HotelID INT,
+    IN p_CheckInDate DATE,
+    IN p_CheckOutDate DATE
+)
+BEGIN
+    UPDATE HotelNightInventory
+    SET Booked = Booked - 1
+    WHERE HotelID = p_HotelID
+    AND Night >= p_CheckInDate AND Night < p_CheckOutDate
+    AND Booked > 0;
+END //
+DELIMITER ;
+
+-- PROCEDURE 7: Apply a delta to the daily and monthly revenue rollups (called by triggers)
+DELIMITER //
+CREATE PROCEDURE AddRevenueRollup(
+    IN p_Day DATE,
+    IN p_HotelID INT,
+    IN p_Bookings INT,
+    IN p_Confirmed INT,
+    IN p_Cancelled INT,
+    IN p_Revenue DECIMAL(14, 2),
+    IN p_Paid DECIMAL(14, 2)
+)
+BEGIN
+    IF p_Day IS NOT NULL THEN
+        INSERT INTO RevenueDaily (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+        VALUES (p_Day, COALESCE(p_HotelID, 0), p_Bookings, p_Confirmed, p_Cancelled, p_Revenue, p_Paid)
+        ON DUPLICATE KEY UPDATE
+            Bookings = Bookings + VALUES(Bookings),
+            Confirmed = Confirmed + VALUES(Confirmed),
+            Cancelled = Cancelled + VALUES(Cancelled),
+            Revenue = Revenue + VALUES(Revenue),
+            Paid = Paid + VALUES(Paid);
+        
+        INSERT INTO RevenueMonthly (Period, HotelID, Bookings, Confirmed, Cancelled, Revenue, Paid)
+        VALUES (DATE_SUB(p_Day, INTERVAL DAYOFMONTH(p_Day) - 1 DAY), COALESCE(p_HotelID, 0),
+                p_Bookings, p_Confirmed, p_Cancelled, p_Revenue, p_Paid)
+        ON DUPLICATE KEY UPDATE
+            Bookings = Bookings + VALUES(Bookings),
+            Confirmed = Confirmed + VALUES(Confirmed),
+            Cancelled = Cancelled + VALUES(Cancelled),
+            Revenue = Revenue + VALUES(Revenue),
+            Paid = Paid + VALUES(Paid);
+    END IF;
+END //
+DELIMITER ;
+
+-- PROCEDURE 8: Cancel every confirmed booking matching a hotel/date/user filter
+-- (NULL = no filter on that column; a booking matches when it has a night
+-- from p_FromDate through p_ToDate). One UPDATE, one audit INSERT joined to
+-- User, then one result row per matched booking.
+DELIMITER //
+CREATE PROCEDURE BulkCancelBookings(
+    IN p_HotelID INT,
+    IN p_FromDate DATE,
+    IN p_ToDate DATE,
+    IN p_UserID INT,
+    OUT p_Cancelled INT
+)
+BEGIN
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        SET @audit_bulk = NULL;
+        ROLLBACK;
+        DROP TEMPORARY TABLE IF EXISTS BulkCancelTarget;
+        RESIGNAL;
+    END;
+    
+    IF p_HotelID IS NULL AND p_FromDate IS NULL AND p_ToDate IS NULL AND p_UserID IS NULL THEN
+        SIGNAL SQLSTATE '45000'
+        SET MESSAGE_TEXT = 'Bulk cancellation needs a hotel, date or user filter';
+    END IF;
+    
+    DROP TEMPORARY TABLE IF EXISTS BulkCancelTarget;
+    CREATE TEMPORARY TABLE BulkCancelTarget (
+        BookingID INT PRIMARY KEY,
+        OldStatus VARCHAR(50)
+    ) ENGINE = MEMORY;
+    
+    START TRANSACTION;
+    
+    -- The INSERT ... SELECT locks the matched bookings until COMMIT
+    INSERT INTO BulkCancelTarget (BookingID, OldStatus)
+    SELECT BookingID, BookingStatus
+    FROM Booking
+    WHERE (p_HotelID IS NULL OR HotelID = p_HotelID)
+    AND (p_UserID IS NULL OR UserID = p_UserID)
+    AND (p_ToDate IS NULL OR CheckInDate <= p_ToDate)
+    AND (p_FromDate IS NULL OR CheckOutDate > p_FromDate);
+    
+    -- @audit_bulk: the app's AuditBookingStatusChange trigger stands down,
+    -- the audit rows are written below in one statement
+    SET @audit_bulk = 1;
+    UPDATE Booking b
+    JOIN BulkCancelTarget t ON t.BookingID = b.BookingID
+    SET b.BookingStatus = 'Cancelled'
+    WHERE t.OldStatus = 'Confirmed';
+    SET p_Cancelled = ROW_COUNT();
+    SET @audit_bulk = NULL;
+    
+    INSERT INTO BookingAudit (BookingID, ActionType, OldStatus, NewStatus, UserEmail)
+    SELECT t.BookingID, 'Status Change', t.OldStatus, 'Cancelled', u.Email
+    FROM BulkCancelTarget t
+    JOIN Booking b ON b.BookingID = t.BookingID
+    LEFT JOIN User u ON u.UserID = b.UserID
+    WHERE t.OldStatus = 'Confirmed';
+    
+    COMMIT;
+    
+    SELECT
+        b.BookingID,
+        b.UserID,
+        b.HotelID,
+        b.CheckInDate,
+        b.CheckOutDate,
+        b.TotalPrice,
+        b.BookingStatus,
+        b.BookingDate,
+        h.Name AS HotelName,
+        h.Location AS HotelLocation,
+        h.Rating AS HotelRating,
+        t.OldStatus,
+        CASE t.OldStatus
+            WHEN 'Confirmed' THEN 'Booking cancelled successfully'
+            WHEN 'Cancelled' THEN 'Booking is already cancelled'
+            ELSE CONCAT('Cannot cancel booking with status: ', t.OldStatus)
+        END AS Message
+    FROM BulkCancelTarget t
+    JOIN Booking b ON b.BookingID = t.BookingID
+    LEFT JOIN Hotel h ON h.HotelID = b.HotelID
+    ORDER BY b.BookingID;
+    
+    DROP TEMPORARY TABLE BulkCancelTarget;
+END //
+DELIMITER ;
+
 -- ============================================
 -- TRIGGERS
 -- ============================================
@@ -289,29 +835,412 @@ BEGIN
 END //
 DELIMITER ;
 
--- TRIGGER 3: Prevent overbooking by checking hotel availability on insert
+-- TRIGGER 3: Prevent overbooking by claiming a room on every night of the stay
+-- (triggers 3-5 stand down when @inventory_remote is set: sessions of a user
+-- shard other than shard 0, whose bookings claim nights on shard 0, see shards.py;
+-- their cancellations record the nights owed there in InventoryRelease)
 DELIMITER //
 CREATE TRIGGER PreventOverbooking
 BEFORE INSERT ON Booking
 FOR EACH ROW
 BEGIN
-    DECLARE v_ConflictCount INT;
+    IF @inventory_remote IS NULL
+       AND NEW.BookingStatus = 'Confirmed' AND NEW.HotelID IS NOT NULL THEN
+        CALL ReserveHotelNights(NEW.HotelID, NEW.CheckInDate, NEW.CheckOutDate);
+    END IF;
+END //
+DELIMITER ;
+
+-- TRIGGER 4: Release/claim room-nights when a booking is cancelled, confirmed or moved
+DELIMITER //
+CREATE TRIGGER AdjustInventoryOnStatusChange
+BEFORE UPDATE ON Booking
+FOR EACH ROW
+BEGIN
+    IF OLD.BookingStatus = 'Confirmed' AND OLD.HotelID IS NOT NULL
+       AND (NEW.BookingStatus <> 'Confirmed'
+            OR NOT (NEW.HotelID <=> OLD.HotelID)
+            OR NEW.CheckInDate <> OLD.CheckInDate
+            OR NEW.CheckOutDate <> OLD.CheckOutDate) THEN
+        IF @inventory_remote IS NULL THEN
+            CALL ReleaseHotelNights(OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+        ELSE
+            -- Owed to shard 0, applied there by the app (InventoryRelease)
+            INSERT INTO InventoryRelease (BookingID, HotelID, CheckInDate, CheckOutDate)
+            VALUES (OLD.BookingID, OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+        END IF;
+    END IF;
     
-    SELECT COUNT(*) INTO v_ConflictCount
-    FROM Booking
-    WHERE HotelID = NEW.HotelID
-    AND BookingStatus = 'Confirmed'
-    AND (
-        (CheckInDate < NEW.CheckOutDate AND CheckOutDate > NEW.CheckInDate)
+    IF @inventory_remote IS NULL
+       AND NEW.BookingStatus = 'Confirmed' AND NEW.HotelID IS NOT NULL
+       AND (OLD.BookingStatus <> 'Confirmed'
+            OR NOT (NEW.HotelID <=> OLD.HotelID)
+            OR NEW.CheckInDate <> OLD.CheckInDate
+            OR NEW.CheckOutDate <> OLD.CheckOutDate) THEN
+        CALL ReserveHotelNights(NEW.HotelID, NEW.CheckInDate, NEW.CheckOutDate);
+    END IF;
+END //
+DELIMITER ;
+
+-- TRIGGER 5: Release room-nights of a deleted confirmed booking
+DELIMITER //
+CREATE TRIGGER ReleaseInventoryOnDelete
+AFTER DELETE ON Booking
+FOR EACH ROW
+BEGIN
+    IF OLD.BookingStatus = 'Confirmed' AND OLD.HotelID IS NOT NULL THEN
+        IF @inventory_remote IS NULL THEN
+            CALL ReleaseHotelNights(OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+        ELSE
+            INSERT INTO InventoryRelease (BookingID, HotelID, CheckInDate, CheckOutDate)
+            VALUES (OLD.BookingID, OLD.HotelID, OLD.CheckInDate, OLD.CheckOutDate);
+        END IF;
+    END IF;
+END //
+DELIMITER ;
+
+-- TRIGGER 6: Apply room count changes to future nights
+DELIMITER //
+CREATE TRIGGER SyncInventoryCapacity
+AFTER UPDATE ON Hotel
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.AvailableRooms <=> OLD.AvailableRooms) THEN
+        UPDATE HotelNightInventory
+        SET Capacity = GREATEST(COALESCE(NEW.AvailableRooms, 1), Booked)
+        WHERE HotelID = NEW.HotelID AND Night >= CURDATE();
+    END IF;
+END //
+DELIMITER ;
+
+-- TRIGGERS 7-9: Bump the Hotel version so search facet caches rebuild
+CREATE TRIGGER HotelVersion_INSERT
+AFTER INSERT ON Hotel
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Hotel', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER HotelVersion_UPDATE
+AFTER UPDATE ON Hotel
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Hotel', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER HotelVersion_DELETE
+AFTER DELETE ON Hotel
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Hotel', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+-- TRIGGERS 7b-9b: Bump the Includes version so the recommender notices
+-- itinerary changes made by other app processes
+CREATE TRIGGER IncludesVersion_INSERT
+AFTER INSERT ON Includes
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Includes', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER IncludesVersion_UPDATE
+AFTER UPDATE ON Includes
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Includes', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER IncludesVersion_DELETE
+AFTER DELETE ON Includes
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Includes', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+-- TRIGGERS 7d-9e: Bump the HotelRate and Offers versions so the app's
+-- price book rebuilds
+CREATE TRIGGER HotelRateVersion_INSERT
+AFTER INSERT ON HotelRate
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('HotelRate', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER HotelRateVersion_UPDATE
+AFTER UPDATE ON HotelRate
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('HotelRate', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER HotelRateVersion_DELETE
+AFTER DELETE ON HotelRate
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('HotelRate', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER OffersVersion_INSERT
+AFTER INSERT ON Offers
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Offers', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER OffersVersion_UPDATE
+AFTER UPDATE ON Offers
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Offers', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+CREATE TRIGGER OffersVersion_DELETE
+AFTER DELETE ON Offers
+FOR EACH ROW
+INSERT INTO TableVersion (TableName, Version) VALUES ('Offers', 1)
+ON DUPLICATE KEY UPDATE Version = Version + 1;
+
+-- TRIGGERS 10-15: Log transport changes for the route graph (cascaded
+-- deletes do not fire triggers, so parents log their transports first)
+CREATE TRIGGER LogTransportChange_INSERT
+AFTER INSERT ON Transport
+FOR EACH ROW
+INSERT INTO TransportChange (TransportID) VALUES (NEW.TransportID);
+
+DELIMITER //
+CREATE TRIGGER LogTransportChange_UPDATE
+AFTER UPDATE ON Transport
+FOR EACH ROW
+BEGIN
+    INSERT INTO TransportChange (TransportID) VALUES (NEW.TransportID);
+    IF NEW.TransportID <> OLD.TransportID THEN
+        INSERT INTO TransportChange (TransportID) VALUES (OLD.TransportID);
+    END IF;
+END //
+DELIMITER ;
+
+CREATE TRIGGER LogTransportChange_DELETE
+AFTER DELETE ON Transport
+FOR EACH ROW
+INSERT INTO TransportChange (TransportID) VALUES (OLD.TransportID);
+
+DELIMITER //
+CREATE TRIGGER LogAvailabilityTransportChange_UPDATE
+AFTER UPDATE ON Availability
+FOR EACH ROW
+BEGIN
+    IF NEW.DestID <> OLD.DestID THEN
+        INSERT INTO TransportChange (TransportID)
+        SELECT TransportID FROM Transport WHERE AvailabilityID = NEW.AvailabilityID;
+    END IF;
+END //
+DELIMITER ;
+
+CREATE TRIGGER LogAvailabilityTransportChange_DELETE
+BEFORE DELETE ON Availability
+FOR EACH ROW
+INSERT INTO TransportChange (TransportID)
+SELECT TransportID FROM Transport WHERE AvailabilityID = OLD.AvailabilityID;
+
+CREATE TRIGGER LogDestinationTransportChange_DELETE
+BEFORE DELETE ON Destination
+FOR EACH ROW
+INSERT INTO TransportChange (TransportID)
+SELECT t.TransportID
+FROM Transport t
+JOIN Availability av ON t.AvailabilityID = av.AvailabilityID
+WHERE av.DestID = OLD.DestID OR t.OriginDestID = OLD.DestID;
+
+-- TRIGGERS 15b-15g: Log hotels and destinations whose indexed columns
+-- change for the nearby-hotels index
+CREATE TRIGGER LogHotelGeoChange_INSERT
+AFTER INSERT ON Hotel
+FOR EACH ROW
+INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', NEW.HotelID);
+
+DELIMITER //
+CREATE TRIGGER LogHotelGeoChange_UPDATE
+AFTER UPDATE ON Hotel
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.HotelID <=> OLD.HotelID AND NEW.Name <=> OLD.Name AND NEW.Location <=> OLD.Location
+            AND NEW.Rating <=> OLD.Rating AND NEW.PricePerNight <=> OLD.PricePerNight
+            AND NEW.Latitude <=> OLD.Latitude AND NEW.Longitude <=> OLD.Longitude) THEN
+        INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', NEW.HotelID);
+        IF NEW.HotelID <> OLD.HotelID THEN
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', OLD.HotelID);
+        END IF;
+    END IF;
+END //
+DELIMITER ;
+
+CREATE TRIGGER LogHotelGeoChange_DELETE
+AFTER DELETE ON Hotel
+FOR EACH ROW
+INSERT INTO GeoChange (TableName, EntityID) VALUES ('Hotel', OLD.HotelID);
+
+CREATE TRIGGER LogDestinationGeoChange_INSERT
+AFTER INSERT ON Destination
+FOR EACH ROW
+INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', NEW.DestID);
+
+DELIMITER //
+CREATE TRIGGER LogDestinationGeoChange_UPDATE
+AFTER UPDATE ON Destination
+FOR EACH ROW
+BEGIN
+    IF NOT (NEW.DestID <=> OLD.DestID AND NEW.Name <=> OLD.Name
+            AND NEW.Latitude <=> OLD.Latitude AND NEW.Longitude <=> OLD.Longitude) THEN
+        INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', NEW.DestID);
+        IF NEW.DestID <> OLD.DestID THEN
+            INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', OLD.DestID);
+        END IF;
+    END IF;
+END //
+DELIMITER ;
+
+CREATE TRIGGER LogDestinationGeoChange_DELETE
+AFTER DELETE ON Destination
+FOR EACH ROW
+INSERT INTO GeoChange (TableName, EntityID) VALUES ('Destination', OLD.DestID);
+
+-- TRIGGERS 16-21: Keep the revenue rollups current (booking create/cancel,
+-- any other booking change, payment status changes)
+DELIMITER //
+CREATE TRIGGER RevenueRollup_BookingInsert
+AFTER INSERT ON Booking
+FOR EACH ROW
+BEGIN
+    CALL AddRevenueRollup(
+        DATE(NEW.BookingDate), NEW.HotelID, 1,
+        NEW.BookingStatus = 'Confirmed', NEW.BookingStatus = 'Cancelled',
+        IF(NEW.BookingStatus = 'Confirmed', NEW.TotalPrice, 0), 0
+    );
+END //
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER RevenueRollup_BookingUpdate
+AFTER UPDATE ON Booking
+FOR EACH ROW
+BEGIN
+    IF NEW.BookingStatus <> OLD.BookingStatus
+       OR NEW.TotalPrice <> OLD.TotalPrice
+       OR NOT (NEW.HotelID <=> OLD.HotelID)
+       OR NOT (NEW.BookingDate <=> OLD.BookingDate) THEN
+        CALL AddRevenueRollup(
+            DATE(OLD.BookingDate), OLD.HotelID, -1,
+            -(OLD.BookingStatus = 'Confirmed'), -(OLD.BookingStatus = 'Cancelled'),
+            -IF(OLD.BookingStatus = 'Confirmed', OLD.TotalPrice, 0), 0
+        );
+        CALL AddRevenueRollup(
+            DATE(NEW.BookingDate), NEW.HotelID, 1,
+            NEW.BookingStatus = 'Confirmed', NEW.BookingStatus = 'Cancelled',
+            IF(NEW.BookingStatus = 'Confirmed', NEW.TotalPrice, 0), 0
+        );
+    END IF;
+END //
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER RevenueRollup_BookingDelete
+AFTER DELETE ON Booking
+FOR EACH ROW
+BEGIN
+    CALL AddRevenueRollup(
+        DATE(OLD.BookingDate), OLD.HotelID, -1,
+        -(OLD.BookingStatus = 'Confirmed'), -(OLD.BookingStatus = 'Cancelled'),
+        -IF(OLD.BookingStatus = 'Confirmed', OLD.TotalPrice, 0), 0
     );
+END //
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER RevenueRollup_PaymentInsert
+AFTER INSERT ON PaymentTransaction
+FOR EACH ROW
+BEGIN
+    DECLARE v_HotelID INT;
     
-    IF v_ConflictCount > 0 THEN
-        SIGNAL SQLSTATE '45000'
-        SET MESSAGE_TEXT = 'Hotel is not available for selected dates';
+    IF NEW.PaymentStatus = 'Completed' THEN
+        SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = NEW.BookingID;
+        CALL AddRevenueRollup(DATE(NEW.TransactionDate), v_HotelID, 0, 0, 0, 0, NEW.Amount);
+    END IF;
+END //
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER RevenueRollup_PaymentUpdate
+AFTER UPDATE ON PaymentTransaction
+FOR EACH ROW
+BEGIN
+    DECLARE v_HotelID INT;
+    
+    IF (OLD.PaymentStatus = 'Completed' OR NEW.PaymentStatus = 'Completed')
+       AND (NEW.PaymentStatus <> OLD.PaymentStatus
+            OR NEW.Amount <> OLD.Amount
+            OR NOT (NEW.TransactionDate <=> OLD.TransactionDate)) THEN
+        SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = NEW.BookingID;
+        IF OLD.PaymentStatus = 'Completed' THEN
+            CALL AddRevenueRollup(DATE(OLD.TransactionDate), v_HotelID, 0, 0, 0, 0, -OLD.Amount);
+        END IF;
+        IF NEW.PaymentStatus = 'Completed' THEN
+            CALL AddRevenueRollup(DATE(NEW.TransactionDate), v_HotelID, 0, 0, 0, 0, NEW.Amount);
+        END IF;
+    END IF;
+END //
+DELIMITER ;
+
+DELIMITER //
+CREATE TRIGGER RevenueRollup_PaymentDelete
+AFTER DELETE ON PaymentTransaction
+FOR EACH ROW
+BEGIN
+    DECLARE v_HotelID INT;
+    
+    IF OLD.PaymentStatus = 'Completed' THEN
+        SELECT HotelID INTO v_HotelID FROM Booking WHERE BookingID = OLD.BookingID;
+        CALL AddRevenueRollup(DATE(OLD.TransactionDate), v_HotelID, 0, 0, 0, 0, -OLD.Amount);
     END IF;
 END //
 DELIMITER ;
 
+-- TRIGGERS 22-28: Delta sync - payment owner, deletion tombstones, and
+-- itinerary touches when its destinations change
+CREATE TRIGGER SyncPaymentOwner
+BEFORE INSERT ON PaymentTransaction
+FOR EACH ROW
+SET NEW.UserID = (SELECT UserID FROM Booking WHERE BookingID = NEW.BookingID);
+
+CREATE TRIGGER SyncTombstone_Booking
+AFTER DELETE ON Booking
+FOR EACH ROW
+INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+VALUES (OLD.UserID, 'Booking', OLD.BookingID);
+
+CREATE TRIGGER SyncTombstone_Itinerary
+AFTER DELETE ON Itinerary
+FOR EACH ROW
+INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+VALUES (OLD.UserID, 'Itinerary', OLD.ItineraryID);
+
+DELIMITER //
+CREATE TRIGGER SyncTombstone_Payment
+AFTER DELETE ON PaymentTransaction
+FOR EACH ROW
+BEGIN
+    IF OLD.UserID IS NOT NULL THEN
+        INSERT INTO SyncTombstone (UserID, EntityType, EntityID)
+        VALUES (OLD.UserID, 'Payment', OLD.TransactionID);
+    END IF;
+END //
+DELIMITER ;
+
+CREATE TRIGGER SyncTouchItinerary_INSERT
+AFTER INSERT ON Includes
+FOR EACH ROW
+UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID = NEW.ItineraryID;
+
+CREATE TRIGGER SyncTouchItinerary_UPDATE
+AFTER UPDATE ON Includes
+FOR EACH ROW
+UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID IN (OLD.ItineraryID, NEW.ItineraryID);
+
+CREATE TRIGGER SyncTouchItinerary_DELETE
+AFTER DELETE ON Includes
+FOR EACH ROW
+UPDATE Itinerary SET UpdatedAt = CURRENT_TIMESTAMP(6) WHERE ItineraryID = OLD.ItineraryID;
+
 -- ============================================
 -- FUNCTION 1 TESTING
 -- ============================================
@@ -321,6 +1250,19 @@ SELECT CalculateBookingCost(1, '2025-01-15', '2025-01-20') AS 'Taj Hotel (5 nigh
 SELECT CalculateBookingCost(2, '2025-02-01', '2025-02-08') AS 'Radisson Blu (7 nights)';
 SELECT CalculateBookingCost(3, '2025-02-15', '2025-02-18') AS 'The Lalit (3 nights)';
 
+SELECT '*** FUNCTION 1: Nightly rates (Taj Hotel over New Year, 4 of 7 nights at 7000) ***' AS TEST;
+SELECT CalculateBookingCost(1, '2025-12-29', '2026-01-05') AS 'Taj Hotel (7 nights)';
+
+SELECT '*** FUNCTION 1: Standing offers (Taj early bird, Hyatt Regency weekend) ***' AS TEST;
+SELECT
+    h.HotelID,
+    h.Name,
+    h.PricePerNight * 7 AS ListPrice,
+    CalculateBookingCost(h.HotelID, CURDATE() + INTERVAL 60 DAY, CURDATE() + INTERVAL 67 DAY) AS BookedAheadPrice,
+    CalculateBookingCost(h.HotelID, CURDATE() + INTERVAL 1 DAY, CURDATE() + INTERVAL 8 DAY) AS LastMinutePrice
+FROM Hotel h
+WHERE h.HotelID IN (1, 4);
+
 -- ============================================
 -- FUNCTION 2 TESTING
 -- ============================================
@@ -381,6 +1323,33 @@ CALL GetBookingDetails(3);
 SELECT '*** PROCEDURE 4: GetDestinationItineraries (Taj Mahal - DestID 1) ***' AS TEST;
 CALL GetDestinationItineraries(1);
 
+-- ============================================
+-- PROCEDURE 8 TESTING
+-- ============================================
+
+SELECT '*** PROCEDURE 8: BulkCancelBookings (Hotel 5, nights 2025-04-01 to 2025-04-30) ***' AS TEST;
+CALL BulkCancelBookings(5, '2025-04-01', '2025-04-30', NULL, @BulkCancelled);
+SELECT @BulkCancelled AS BookingsCancelled;
+
+-- ============================================
+-- NEARBY HOTELS TESTING
+-- ============================================
+
+SELECT '*** Hotels by distance from Mysore Palace (DestID 5) ***' AS TEST;
+SELECT
+    h.HotelID,
+    h.Name,
+    h.Location,
+    ROUND(2 * 6371.0088 * ASIN(SQRT(
+        POWER(SIN(RADIANS(h.Latitude - d.Latitude) / 2), 2)
+        + COS(RADIANS(d.Latitude)) * COS(RADIANS(h.Latitude))
+          * POWER(SIN(RADIANS(h.Longitude - d.Longitude) / 2), 2)
+    )), 3) AS DistanceKm
+FROM Hotel h
+JOIN Destination d ON d.DestID = 5
+WHERE h.Latitude IS NOT NULL
+ORDER BY DistanceKm;
+
 -- ============================================
 -- TRIGGER RESULTS
 -- ============================================
@@ -0,0 +1,239 @@
+"""Budget-constrained trip optimizer.
+
+A plan is one hotel for the whole stay plus a subset of the candidate
+destinations. The hotels considered are the ones nearest to the candidate
+destinations (HOTELS_PER_DESTINATION each, from geo_index); only when none
+of the destinations has coordinates is every hotel a candidate base.
+Visiting a destination costs its Availability entry, a Transport option for
+that availability and (optionally) all of its activities. Plans are ranked by total rating (hotel Rating + the Rating of
+every destination visited, unrated destinations count as 3), cheaper plans
+first on ties, and the top K plans within the budget are returned.
+
+The search is a branch-and-bound over destination subsets. Hotels and the
+transport options are never looped over in Python: the cheapest option per
+destination is picked with one lexsort, and at every node all hotels are
+checked against the remaining budget as one NumPy comparison. A node is
+pruned once even its optimistic bound (every remaining affordable
+destination plus the best hotel) cannot beat the current K-th plan.
+"""
+import heapq
+import itertools
+from decimal import Decimal
+
+import numpy as np
+
+import queries
+
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 50
+MAX_DESTINATIONS = 20
+DEFAULT_DESTINATION_RATING = 3
+# Nearest hotels per candidate destination that may serve as the base
+HOTELS_PER_DESTINATION = 10
+
+
+class OptimizerError(ValueError):
+    """Invalid optimizer parameters (reported to the client as a 400)"""
+
+
+# ============================================
+# DATA LOADING
+# ============================================
+
+def _in_list(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def check_destinations(dest_ids):
+    if not dest_ids:
+        raise OptimizerError('destinations must list at least one DestID')
+    if len(dest_ids) > MAX_DESTINATIONS:
+        raise OptimizerError(f"At most {MAX_DESTINATIONS} candidate destinations are supported")
+
+
+def load_candidates(conn, dest_ids, transport_types=None, hotels=None):
+    """Fetch (hotels, destination options, activity totals) for dest_ids
+    hotels: the candidate Hotel rows when already chosen (app.optimizer_hotels);
+    None loads every hotel
+    """
+    check_destinations(dest_ids)
+    if hotels is None:
+        hotels = queries.fetch_all(conn, 'optimizer_hotels')
+
+    params = list(dest_ids)
+    type_filter = ''
+    if transport_types:
+        type_filter = f"AND t.Type IN ({_in_list(transport_types)})"
+        params.extend(transport_types)
+    options = queries.fetch_dynamic(conn, 'optimizer_destination_options', f"""
+        SELECT
+            d.DestID,
+            d.Name,
+            d.Rating,
+            av.AvailabilityID,
+            av.Cost AS AvailabilityCost,
+            t.TransportID,
+            t.Type,
+            t.Provider,
+            t.Cost AS TransportCost
+        FROM Destination d
+        JOIN Availability av ON d.DestID = av.DestID
+        JOIN Transport t ON av.AvailabilityID = t.AvailabilityID
+        WHERE d.DestID IN ({_in_list(dest_ids)}) {type_filter}
+    """, tuple(params))
+
+    activities = queries.fetch_dynamic(conn, 'optimizer_activity_costs', f"""
+        SELECT DestID, SUM(Cost) AS ActivityCost, COUNT(*) AS Activities
+        FROM Activity
+        WHERE DestID IN ({_in_list(dest_ids)})
+        GROUP BY DestID
+    """, tuple(dest_ids))
+
+    return hotels, options, activities
+
+
+# ============================================
+# OPTIMIZER
+# ============================================
+
+def _cheapest_options(options, activity_costs, include_activities):
+    """Reduce every destination's options to its cheapest one
+    Returns (per-destination rows, costs array, scores array) ordered by
+    score descending, cost ascending, which lets the search reach good
+    plans early and prune more.
+    """
+    dest_ids = np.array([row['DestID'] for row in options], dtype=np.int64)
+    costs = np.array(
+        [float(row['AvailabilityCost']) + float(row['TransportCost']) for row in options],
+        dtype=np.float64
+    )
+    if include_activities:
+        extra = {row['DestID']: float(row['ActivityCost']) for row in activity_costs}
+        costs += np.array([extra.get(row['DestID'], 0.0) for row in options], dtype=np.float64)
+
+    order = np.lexsort((costs, dest_ids))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = dest_ids[order][1:] != dest_ids[order][:-1]
+    picked = order[first]
+
+    scores = np.array(
+        [options[index]['Rating'] or DEFAULT_DESTINATION_RATING for index in picked],
+        dtype=np.int64
+    )
+    ranking = np.lexsort((costs[picked], -scores))
+    picked = picked[ranking]
+    return [options[index] for index in picked], costs[picked], scores[ranking]
+
+
+def optimize(hotels, options, activity_costs, budget, nights, top_k=DEFAULT_TOP_K,
+             include_activities=True, min_destinations=1):
+    """Return up to top_k plans, best first, plus search statistics"""
+    if budget is None or budget <= 0:
+        raise OptimizerError('budget must be positive')
+    if nights <= 0:
+        raise OptimizerError('checkOut must be after checkIn')
+    top_k = max(1, min(top_k or DEFAULT_TOP_K, MAX_TOP_K))
+    budget = float(budget)
+    activity_by_dest = {row['DestID']: row for row in activity_costs}
+
+    stats = {'options': len(options), 'hotels': len(hotels), 'nodes': 0, 'pruned': 0}
+    if not hotels:
+        return [], stats
+
+    # Hotels sorted by rating desc, cost asc: for any remaining budget the
+    # first affordable entries are the best hotels to pair with a subset
+    hotel_cost = np.array([float(row['PricePerNight']) * nights for row in hotels], dtype=np.float64)
+    hotel_rating = np.array([row['Rating'] or 0 for row in hotels], dtype=np.int64)
+    hotel_order = np.lexsort((hotel_cost, -hotel_rating))
+    hotel_cost = hotel_cost[hotel_order]
+    hotel_rating = hotel_rating[hotel_order]
+    min_hotel_cost = hotel_cost.min()
+    max_hotel_rating = int(hotel_rating.max())
+
+    if options:
+        dest_rows, dest_cost, dest_score = _cheapest_options(options, activity_costs, include_activities)
+    else:
+        dest_rows, dest_cost, dest_score = [], np.zeros(0), np.zeros(0, dtype=np.int64)
+    count = len(dest_rows)
+
+    best = []   # min-heap of (score, -cost, seq, hotel index, chosen)
+    sequence = itertools.count()
+
+    def worst():
+        return best[0] if len(best) == top_k else None
+
+    def record(score, spent, chosen):
+        room = budget - spent
+        affordable = np.flatnonzero(hotel_cost <= room)[:top_k]
+        for index in affordable:
+            total_score = score + int(hotel_rating[index])
+            total_cost = spent + float(hotel_cost[index])
+            entry = (total_score, -total_cost, next(sequence), int(index), chosen)
+            if len(best) < top_k:
+                heapq.heappush(best, entry)
+            elif (total_score, -total_cost) > best[0][:2]:
+                heapq.heapreplace(best, entry)
+            else:
+                # Hotels are in rank order, the rest cannot do better
+                break
+
+    def search(position, spent, score, chosen, extended):
+        # Only record a subset on the node that added its last destination;
+        # the "skip" branches below reach the same subset again
+        stats['nodes'] += 1
+        if extended and len(chosen) >= min_destinations:
+            record(score, spent, chosen)
+        if position == count:
+            return
+        room = budget - spent - min_hotel_cost
+        tail_cost = dest_cost[position:]
+        bound = score + int(dest_score[position:][tail_cost <= room].sum()) + max_hotel_rating
+        floor = worst()
+        if floor is not None and (bound < floor[0] or (bound == floor[0] and spent + min_hotel_cost >= -floor[1])):
+            stats['pruned'] += 1
+            return
+        cost = float(dest_cost[position])
+        if cost <= room:
+            search(position + 1, spent + cost, score + int(dest_score[position]), chosen + (position,), True)
+        search(position + 1, spent, score, chosen, False)
+
+    search(0, 0.0, 0, (), True)
+
+    plans = []
+    for total_score, negative_cost, _seq, hotel_index, chosen in sorted(best, reverse=True):
+        hotel = hotels[int(hotel_order[hotel_index])]
+        destinations = []
+        for position in chosen:
+            row = dest_rows[position]
+            activity = activity_by_dest.get(row['DestID'])
+            destinations.append({
+                'destId': row['DestID'],
+                'name': row['Name'],
+                'rating': row['Rating'],
+                'availabilityId': row['AvailabilityID'],
+                'availabilityCost': row['AvailabilityCost'],
+                'transport': {
+                    'transportId': row['TransportID'],
+                    'type': row['Type'],
+                    'provider': row['Provider'],
+                    'cost': row['TransportCost'],
+                },
+                'activityCost': activity['ActivityCost'] if activity and include_activities else Decimal(0),
+                'cost': round(float(dest_cost[position]), 2),
+            })
+        total_cost = round(-negative_cost, 2)
+        plans.append({
+            'score': total_score,
+            'totalCost': total_cost,
+            'remainingBudget': round(budget - total_cost, 2),
+            'hotel': {
+                'hotelId': hotel['HotelID'],
+                'name': hotel['Name'],
+                'location': hotel['Location'],
+                'rating': hotel['Rating'],
+                'pricePerNight': hotel['PricePerNight'],
+                'cost': round(float(hotel_cost[hotel_index]), 2),
+            },
+            'destinations': destinations,
+        })
+    return plans, stats
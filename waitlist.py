@@ -0,0 +1,433 @@
+"""Waitlist for stays that PreventOverbooking turned away.
+
+A waitlisted request (Waitlist table on the catalog shard, next to
+HotelNightInventory) is a user, a hotel and the nights [CheckInDate,
+CheckOutDate). Waiting requests are kept in memory in one interval treap
+per hotel, so when a cancellation frees some nights the requests that
+overlap them are found in O(log n + k) for k matches:
+
+    treap   binary search tree on (CheckInDate, WaitlistID) with random
+            heap priorities (expected O(log n) depth), every node holding
+            the latest CheckOutDate of its subtree. A subtree whose latest
+            check-out is not after the freed check-in cannot overlap and
+            is skipped, as is everything right of a node that checks in
+            after the freed check-out.
+
+The overlapping requests are ordered by WAITLIST_ORDER, checked against
+the hotel's night inventory (one query for all of them) and the ones that
+fit are booked through the normal create path (app.book_stay, so the
+PreventOverbooking trigger still has the last word).
+
+Bursts of cancellations are coalesced: while one request thread is
+allocating, the freed ranges of other cancellations are queued and that
+thread allocates them too before it returns; the others return at once.
+Every request is claimed with a conditional UPDATE (Waiting -> Booking)
+before it is booked, so workers in other processes never book the same
+request twice. A claim is handed back as soon as its booking fails for any
+reason; claims left behind by a crashed worker are handed back after
+CLAIM_TIMEOUT_MINUTES by the maintenance thread (app.py), which runs at
+startup and then periodically.
+
+The index follows the table through Waitlist.UpdatedAt: every poll (at
+most once per `poll_interval` seconds, with an overlap window) re-reads
+the rows changed since the newest stamp seen and inserts or removes them.
+
+Configuration (environment variables):
+    WAITLIST_ORDER   fifo | priority (default priority: higher Priority
+                     first, then first come first served)
+"""
+import os
+import random
+import threading
+import time
+from datetime import date, datetime
+
+import mysql.connector
+
+import queries
+
+WAITING = 'Waiting'
+BOOKING = 'Booking'
+BOOKED = 'Booked'
+WITHDRAWN = 'Withdrawn'
+EXPIRED = 'Expired'
+
+ORDERS = ('fifo', 'priority')
+ORDER = os.environ.get('WAITLIST_ORDER', 'priority')
+
+# Re-read rows stamped this many seconds before the newest one seen
+CHANGE_OVERLAP_SECONDS = 10
+
+# Requests stuck in Booking this long are put back in the queue
+CLAIM_TIMEOUT_MINUTES = 10
+
+MAX_NIGHTS = 30
+
+
+class WaitlistError(ValueError):
+    """Invalid waitlist request (reported to the client as a 400)"""
+
+
+def _day(value):
+    """date from a date, datetime or YYYY-MM-DD string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise WaitlistError('Dates must be YYYY-MM-DD') from None
+
+
+def check_stay(check_in, check_out):
+    """(check-in, check-out) as dates; WaitlistError unless a future stay"""
+    check_in, check_out = _day(check_in), _day(check_out)
+    if check_out <= check_in:
+        raise WaitlistError('checkOutDate must be after checkInDate')
+    if (check_out - check_in).days > MAX_NIGHTS:
+        raise WaitlistError(f'A waitlisted stay can be at most {MAX_NIGHTS} nights')
+    if check_in <= date.today():
+        raise WaitlistError('Only future stays can be waitlisted')
+    return check_in, check_out
+
+
+# ============================================
+# INTERVAL TREAP
+# ============================================
+
+class _Node:
+    __slots__ = ('key', 'end', 'weight', 'latest', 'left', 'right')
+
+    def __init__(self, key, end, weight):
+        self.key = key          # (check-in ordinal, WaitlistID)
+        self.end = end          # check-out ordinal
+        self.weight = weight    # heap priority: parents outweigh children
+        self.latest = end       # latest check-out in this subtree
+        self.left = None
+        self.right = None
+
+    def update(self):
+        latest = self.end
+        if self.left is not None and self.left.latest > latest:
+            latest = self.left.latest
+        if self.right is not None and self.right.latest > latest:
+            latest = self.right.latest
+        self.latest = latest
+
+
+def _split(node, key):
+    """(keys < key, keys >= key)"""
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.update()
+        return node, right
+    left, node.left = _split(node.left, key)
+    node.update()
+    return left, node
+
+
+def _merge(left, right):
+    """Join two treaps whose keys are all smaller on the left"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.weight > right.weight:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+class IntervalTreap:
+    """Half-open day intervals [start, end) keyed by (start, id)"""
+
+    def __init__(self, rng=None):
+        self._root = None
+        self._size = 0
+        self._random = (rng or random.Random()).random
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, start, end, entry_id):
+        key = (start, entry_id)
+        left, right = _split(self._root, key)
+        middle, right = _split(right, (start, entry_id + 1))
+        if middle is None:
+            self._size += 1
+        self._root = _merge(_merge(left, _Node(key, end, self._random())), right)
+
+    def remove(self, start, entry_id):
+        left, right = _split(self._root, (start, entry_id))
+        middle, right = _split(right, (start, entry_id + 1))
+        if middle is not None:
+            self._size -= 1
+        self._root = _merge(left, right)
+
+    def overlapping(self, start, end):
+        """ids of the intervals sharing at least one day with [start, end)"""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.latest <= start:
+                continue
+            stack.append(node.left)
+            if node.key[0] < end:
+                if node.end > start:
+                    found.append(node.key[1])
+                stack.append(node.right)
+        return found
+
+
+# ============================================
+# WAITLIST
+# ============================================
+
+class Waitlist:
+    """Waiting requests by hotel, refreshed from Waitlist.UpdatedAt"""
+
+    def __init__(self, order=ORDER, poll_interval=1.0):
+        if order not in ORDERS:
+            raise ValueError(f"WAITLIST_ORDER must be one of {', '.join(ORDERS)}")
+        self.order = order
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._trees = {}        # HotelID -> IntervalTreap
+        self._entries = {}      # WaitlistID -> waiting row
+        self._loaded = False
+        self._change_mark = None
+        self._polled_at = 0.0
+        # Freed (check-in, check-out) ranges per hotel not allocated yet
+        self._pending = {}
+        self._allocating = False
+        self.counters = {'joined': 0, 'allocations': 0, 'coalesced': 0, 'attempts': 0, 'booked': 0, 'expired': 0}
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    # ---------------- index ----------------
+
+    def _put(self, row):
+        """Insert, move or drop one row according to its Status (caller holds _lock)"""
+        entry_id = row['WaitlistID']
+        previous = self._entries.pop(entry_id, None)
+        if previous is not None:
+            self._trees[previous['HotelID']].remove(previous['CheckInDate'].toordinal(), entry_id)
+        if row['Status'] != WAITING:
+            return
+        entry = {
+            'WaitlistID': entry_id,
+            'UserID': row['UserID'],
+            'HotelID': row['HotelID'],
+            'CheckInDate': _day(row['CheckInDate']),
+            'CheckOutDate': _day(row['CheckOutDate']),
+            'Priority': row['Priority'] or 0,
+            'CreatedAt': row['CreatedAt'],
+        }
+        self._entries[entry_id] = entry
+        tree = self._trees.get(entry['HotelID'])
+        if tree is None:
+            tree = self._trees[entry['HotelID']] = IntervalTreap()
+        tree.insert(entry['CheckInDate'].toordinal(), entry['CheckOutDate'].toordinal(), entry_id)
+
+    def _load(self, conn):
+        mark = queries.fetch_one(conn, 'waitlist_change_mark')
+        rows = queries.fetch_all(conn, 'waitlist_waiting')
+        with self._lock:
+            self._trees = {}
+            self._entries = {}
+            for row in rows:
+                self._put(row)
+            self._change_mark = mark['LastChange']
+            self._loaded = True
+
+    def _apply_changes(self, conn):
+        # Rows in the overlap window come back every poll; _put is idempotent
+        rows = queries.fetch_all(conn, 'waitlist_changes_since', (self._change_mark, CHANGE_OVERLAP_SECONDS))
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                self._put(row)
+            self._change_mark = max(self._change_mark, max(row['UpdatedAt'] for row in rows))
+
+    def refresh(self, conn, force=False):
+        """Load the index on first use, then apply rows changed since the last poll"""
+        now = time.monotonic()
+        if self._loaded and not force and now - self._polled_at < self.poll_interval:
+            return
+        if not self._loaded:
+            self._load(conn)
+        else:
+            self._apply_changes(conn)
+        self._polled_at = now
+
+    def invalidate(self):
+        """Force a full reload on the next refresh()"""
+        with self._lock:
+            self._loaded = False
+
+    def candidates(self, hotel_id, ranges):
+        """Waiting requests for a hotel overlapping any freed range, in allocation order"""
+        with self._lock:
+            tree = self._trees.get(hotel_id)
+            if tree is None:
+                return []
+            ids = set()
+            for check_in, check_out in ranges:
+                ids.update(tree.overlapping(check_in.toordinal(), check_out.toordinal()))
+            entries = [self._entries[entry_id] for entry_id in ids]
+        if self.order == 'priority':
+            entries.sort(key=lambda entry: (-entry['Priority'], entry['CreatedAt'], entry['WaitlistID']))
+        else:
+            entries.sort(key=lambda entry: (entry['CreatedAt'], entry['WaitlistID']))
+        return entries
+
+    def status(self):
+        with self._lock:
+            return {
+                'order': self.order,
+                'waiting': len(self._entries),
+                'hotels': sum(1 for tree in self._trees.values() if len(tree)),
+                'pendingHotels': len(self._pending),
+                'counters': dict(self.counters),
+            }
+
+    # ---------------- writes ----------------
+
+    def join(self, conn, user_id, hotel_id, check_in, check_out, priority=0):
+        """Add a request (already validated with check_stay); returns its WaitlistID"""
+        result = queries.execute(conn, 'waitlist_insert', (user_id, hotel_id, check_in, check_out, priority))
+        conn.commit()
+        self._count('joined')
+        # Indexed by the next poll, like requests joined through other workers
+        self.refresh(conn, force=True)
+        return result.lastrowid
+
+    def withdraw(self, conn, waitlist_id, user_id):
+        """Take a waiting request off the list; False if it is not waiting"""
+        result = queries.execute(conn, 'waitlist_withdraw', (waitlist_id, user_id))
+        conn.commit()
+        self.refresh(conn, force=True)
+        return result.rowcount > 0
+
+    def return_stale_claims(self, conn):
+        """Put requests claimed more than CLAIM_TIMEOUT_MINUTES ago back in
+        the queue; returns how many
+        """
+        result = queries.execute(conn, 'waitlist_unclaim_stale', (CLAIM_TIMEOUT_MINUTES,))
+        conn.commit()
+        if result.rowcount > 0:
+            self.refresh(conn, force=True)
+        return result.rowcount
+
+    # ---------------- allocation ----------------
+
+    def freed(self, stays, connect, book):
+        """Nights of (hotel_id, check_in, check_out) stays became free: book
+        waiting requests that fit now. connect() opens a catalog shard
+        connection, book(user_id, hotel_id, check_in, check_out) is the
+        create path and returns (BookingID or 0, TotalPrice, message).
+
+        Returns the requests booked by this call; empty when another thread
+        is already allocating (it picks these nights up before it returns).
+        """
+        with self._lock:
+            for hotel_id, check_in, check_out in stays:
+                self._pending.setdefault(hotel_id, []).append((_day(check_in), _day(check_out)))
+            if not self._pending:
+                return []
+            if self._allocating:
+                self.counters['coalesced'] += 1
+                return []
+            self._allocating = True
+        booked = []
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._allocating = False
+                        return booked
+                    hotel_id, ranges = self._pending.popitem()
+                booked.extend(self._allocate(hotel_id, ranges, connect, book))
+        except BaseException:
+            with self._lock:
+                self._allocating = False
+            raise
+
+    def _allocate(self, hotel_id, ranges, connect, book):
+        conn = connect()
+        try:
+            self.refresh(conn, force=True)
+            entries = self.candidates(hotel_id, ranges)
+            if not entries:
+                return []
+            self._count('allocations')
+
+            expired = queries.execute(conn, 'waitlist_expire', (hotel_id,))
+            conn.commit()
+            if expired.rowcount > 0:
+                self._count('expired', expired.rowcount)
+            today = date.today()
+            entries = [entry for entry in entries if entry['CheckInDate'] > today]
+            if not entries:
+                return []
+
+            # Rooms left per night over every candidate stay, in one query
+            hotel = queries.fetch_one(conn, 'hotel_rooms', (hotel_id,))
+            if not hotel:
+                return []
+            rooms = hotel['AvailableRooms'] or 1
+            first = min(entry['CheckInDate'] for entry in entries)
+            last = max(entry['CheckOutDate'] for entry in entries)
+            rows = queries.fetch_all(conn, 'hotel_inventory_range', (hotel_id, first, last))
+            left = {row['Night'].toordinal(): row['Capacity'] - row['Booked'] for row in rows}
+
+            booked = []
+            for entry in entries:
+                nights = range(entry['CheckInDate'].toordinal(), entry['CheckOutDate'].toordinal())
+                if any(left.get(night, rooms) <= 0 for night in nights):
+                    continue
+                if queries.execute(conn, 'waitlist_claim', (entry['WaitlistID'],)).rowcount == 0:
+                    # Withdrawn, or claimed by another worker
+                    conn.commit()
+                    continue
+                conn.commit()
+                self._count('attempts')
+                booking_id = 0
+                try:
+                    booking_id, total_price, message = book(
+                        entry['UserID'], hotel_id, entry['CheckInDate'], entry['CheckOutDate']
+                    )
+                except mysql.connector.Error:
+                    # Taken in the meantime (PreventOverbooking): keep waiting
+                    pass
+                finally:
+                    # Only a booking keeps the claim; anything else raised by
+                    # book() (DatabaseUnavailable, ShardError, ...) hands it back
+                    if booking_id <= 0:
+                        queries.execute(conn, 'waitlist_unclaim', (entry['WaitlistID'],))
+                        conn.commit()
+                if booking_id <= 0:
+                    continue
+                queries.execute(conn, 'waitlist_booked', (booking_id, entry['WaitlistID']))
+                conn.commit()
+                for night in nights:
+                    left[night] = left.get(night, rooms) - 1
+                self._count('booked')
+                booked.append(dict(entry, BookingID=booking_id, TotalPrice=total_price, message=message))
+            self.refresh(conn, force=True)
+            return booked
+        finally:
+            conn.close()
+
+
+waitlist = Waitlist()